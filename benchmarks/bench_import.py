@@ -0,0 +1,48 @@
+"""
+Benchmarks startup time: `import toolchest_client`, importing a tool function, and the CLI's --help.
+
+Each measurement runs in a fresh interpreter, so nothing is cached in sys.modules.
+
+Usage::
+
+    python -m benchmarks.bench_import --repeat 10
+
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+STARTUP_COMMANDS = [
+    ("python (baseline)", [sys.executable, "-c", "pass"]),
+    ("import toolchest_client", [sys.executable, "-c", "import toolchest_client"]),
+    ("import kraken2", [sys.executable, "-c", "from toolchest_client import kraken2"]),
+    ("cli --help", [sys.executable, "-m", "toolchest_client.cli.cli", "--help"]),
+]
+
+
+def time_command(command, repeat):
+    elapsed_seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        elapsed_seconds.append(time.perf_counter() - start)
+    return elapsed_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    for name, command in STARTUP_COMMANDS:
+        elapsed_seconds = time_command(command, args.repeat)
+        print(
+            f"{name:>24}: median {statistics.median(elapsed_seconds) * 1000:.0f}ms, "
+            f"min {min(elapsed_seconds) * 1000:.0f}ms over {args.repeat} runs"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Benchmarks summarizing Kraken2 per-read output with `summarize_kraken2_output`, on a synthetic
+kraken2_output.txt with the given number of reads (paired, as written by `kraken2 --paired`).
+
+Usage::
+
+    python -m benchmarks.bench_kraken2 --num-reads 10000000
+
+"""
+import argparse
+import os
+import resource
+import tempfile
+import time
+
+import numpy as np
+
+from toolchest_client.files.kraken2 import summarize_kraken2_output
+
+# Number of reads generated per write, to bound memory while writing the synthetic output.
+WRITE_BATCH_SIZE = 1000000
+
+
+def write_synthetic_output(output_path, num_reads, num_taxa=5000):
+    rng = np.random.default_rng(0)
+    taxa = rng.integers(1, 3000000, size=num_taxa)
+    with open(output_path, "w") as output_file:
+        for batch_start in range(0, num_reads, WRITE_BATCH_SIZE):
+            batch_size = min(WRITE_BATCH_SIZE, num_reads - batch_start)
+            taxids = np.where(rng.random(batch_size) < 0.2, 0, taxa[rng.integers(0, num_taxa, size=batch_size)])
+            lengths = rng.integers(100, 151, size=(batch_size, 2))
+            output_file.writelines(
+                f"{'C' if taxid else 'U'}\tread{batch_start + index}\t{taxid}\t{length_1}|{length_2}\t"
+                f"{taxid}:116 |:| {taxid}:117\n"
+                for index, (taxid, (length_1, length_2)) in enumerate(zip(taxids.tolist(), lengths.tolist()))
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--num-reads", type=int, default=10000000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_path = os.path.join(temp_dir, "kraken2_output.txt")
+        write_synthetic_output(output_path, args.num_reads)
+        file_size = os.path.getsize(output_path)
+
+        start = time.perf_counter()
+        summary = summarize_kraken2_output(output_path)
+        seconds = time.perf_counter() - start
+        max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"{summary.num_reads} reads ({file_size / 1024 ** 2:.0f}MB, {len(summary.taxids)} taxa) "
+              f"summarized in {seconds:.2f}s ({file_size / 1024 ** 2 / seconds:.0f}MB/s), max RSS {max_rss_mb:.0f}MB")
+
+
+if __name__ == "__main__":
+    main()
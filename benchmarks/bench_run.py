@@ -0,0 +1,78 @@
+"""
+Benchmarks the phases of `Tool.run` end to end, as reported in `Output.metrics`. Runs are made against
+the local mock Toolchest API and S3 store in tests/util/mock_api.py, so results don't depend on the
+network or the real service.
+
+Inputs are synthetic sparse files, so they take no disk space or time to create. Uploaded bytes
+are discarded by the mock store unless --keep-uploads is given.
+
+Usage::
+
+    python -m benchmarks.bench_run --input-sizes 1GB 10GB 100GB --output-size 256MB
+
+"""
+import argparse
+import os
+import re
+import tempfile
+
+from tests.util.mock_api import MockToolchestServer
+
+SIZE_UNITS = {"B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3, "TB": 1024 ** 4}
+
+
+def parse_size(size):
+    """Parses a size like "1GB" or "512MB" into bytes."""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([KMGT]?B)", size.strip().upper())
+    if not match:
+        raise argparse.ArgumentTypeError(f"Invalid size: {size}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+PHASE_NAMES = ["prepare_inputs", "upload", "wait_for_job", "download", "unpack", "postflight"]
+
+
+def benchmark_run(input_size, temp_dir):
+    import toolchest_client
+
+    input_path = os.path.join(temp_dir, f"input_{input_size}.bin")
+    with open(input_path, "wb") as input_file:
+        input_file.truncate(input_size)  # sparse, so it's created instantly
+    output_path = os.path.join(temp_dir, f"output_{input_size}")
+
+    output = toolchest_client.test(inputs=input_path, output_path=output_path, log_level="WARNING")
+    os.remove(input_path)
+    phase_seconds = {phase_name: phase["seconds"] for phase_name, phase in output.metrics["phases"].items()}
+    phase_seconds["total"] = output.metrics["total_seconds"]
+    return phase_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input-sizes", nargs="+", type=parse_size, default=[parse_size("1GB")])
+    parser.add_argument("--output-size", type=parse_size, default=parse_size("64MB"))
+    parser.add_argument("--execution-seconds", type=float, default=0)
+    parser.add_argument("--keep-uploads", action="store_true", help="store uploaded bytes in the mock S3 store")
+    args = parser.parse_args()
+
+    server = MockToolchestServer(
+        execution_seconds=args.execution_seconds,
+        output_size_bytes=args.output_size,
+        discard_uploads=not args.keep_uploads,
+    )
+    with server, tempfile.TemporaryDirectory() as temp_dir:
+        os.environ.update(server.environ)
+        phase_names = PHASE_NAMES + ["total"]
+        print(f"{'input':>10} " + " ".join(f"{phase_name:>14}" for phase_name in phase_names) + f" {'upload MB/s':>12}")
+        for input_size in args.input_sizes:
+            server.request_counts.clear()
+            phase_seconds = benchmark_run(input_size, temp_dir)
+            upload_throughput = input_size / (1024 ** 2) / phase_seconds["upload"]
+            phase_columns = " ".join(f"{phase_seconds.get(phase_name, 0):>13.3f}s" for phase_name in phase_names)
+            print(f"{input_size / 1024 ** 3:>8.1f}GB {phase_columns} {upload_throughput:>12.1f}")
+            print(f"{'':>10} API requests: {sum(server.request_counts.values())} "
+                  f"({server.request_counts[('GET', 'get_status')]} status checks)")
+
+
+if __name__ == "__main__":
+    main()
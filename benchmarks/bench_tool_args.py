@@ -0,0 +1,75 @@
+"""
+Benchmarks tool_args validation, as done when batch-validating sample configs before submission.
+
+Usage::
+
+    python -m benchmarks.bench_tool_args --num-configs 10000
+
+"""
+import argparse
+import re
+import time
+
+from toolchest_client.tools.tool_args import TOOL_ARG_LISTS, VARIABLE_ARGS
+from toolchest_client.tools.tool_args_validator import get_tool_args_validator
+
+SAMPLE_CONFIGS = [
+    ("STAR", "--quantMode TranscriptomeSAM GeneCounts --scoreGap 1 --outFilterMultimapNmax 20 --twopassMode Basic"),
+    ("blastn", "-evalue 1e-5 -outfmt 6 qseqid sseqid pident -max_hsps 1 -word_size 11"),
+    ("kraken2", "--confidence 0.1 --minimum-base-quality 20 --use-names --paired"),
+    ("diamond_blastx", "--outfmt 6 qseqid sseqid evalue --evalue 0.001 --sensitive"),
+    ("salmon", "--validateMappings --gcBias --seqBias"),
+]
+
+
+def validate_with_regex(tool_name, tool_args):
+    """The previous per-token implementation, kept for comparison."""
+    whitelist = TOOL_ARG_LISTS[tool_name]["whitelist"]
+    blacklist = TOOL_ARG_LISTS[tool_name].get("blacklist", [])
+    sanitized_args = []
+    num_args_remaining_after_tag = 0
+    for arg in tool_args.split():
+        minimal_tag = re.sub(r"([^=]+)(=[^\s]+)", r"\1", arg)
+        tag_in_whitelist = minimal_tag in whitelist
+        if num_args_remaining_after_tag == 0 and tag_in_whitelist:
+            sanitized_args.append(arg)
+            num_args_remaining_after_tag = whitelist[minimal_tag]
+        elif num_args_remaining_after_tag == VARIABLE_ARGS:
+            sanitized_args.append(arg)
+            if tag_in_whitelist:
+                num_args_remaining_after_tag = whitelist[minimal_tag]
+        elif num_args_remaining_after_tag > 0:
+            sanitized_args.append(arg)
+            num_args_remaining_after_tag -= 1
+        elif minimal_tag in blacklist:
+            pass
+    return " ".join(sanitized_args)
+
+
+def validate_compiled(tool_name, tool_args):
+    return get_tool_args_validator(tool_name).validate(tool_args).tool_args
+
+
+def time_validation(validate_function, num_configs):
+    start = time.perf_counter()
+    for index in range(num_configs):
+        tool_name, tool_args = SAMPLE_CONFIGS[index % len(SAMPLE_CONFIGS)]
+        validate_function(tool_name, tool_args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--num-configs", type=int, default=10000)
+    args = parser.parse_args()
+
+    for name, validate_function in [("regex", validate_with_regex), ("compiled", validate_compiled)]:
+        elapsed_seconds = time_validation(validate_function, args.num_configs)
+        print(
+            f"{name:>10}: {args.num_configs} configs in {elapsed_seconds:.3f}s "
+            f"({elapsed_seconds / args.num_configs * 1e6:.1f} us/config)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+End-to-end runs against the local mock Toolchest API (tests/util/mock_api.py).
+These don't need network access or a Toolchest key, so they run with the unit tests.
+"""
+import gzip
+import os
+
+import pytest
+
+import toolchest_client as toolchest
+from tests.util.mock_api import MockToolchestServer, INPUT_BUCKET, OUTPUT_BUCKET
+from toolchest_client.api.exceptions import ToolchestKeyError
+from toolchest_client.api.status import Status
+from toolchest_client.files.transforms import LineFilter, Recompress
+
+# Larger than boto3's multipart threshold (8 MB), so the upload is split into parts
+MULTIPART_INPUT_SIZE = 9 * 1024 * 1024
+
+
+@pytest.fixture
+def mock_server(monkeypatch):
+    with MockToolchestServer() as server:
+        for name, value in server.environ.items():
+            monkeypatch.setenv(name, value)
+        yield server
+
+
+def test_mock_run(mock_server, tmp_path):
+    input_dir = tmp_path / "inputs"
+    input_dir.mkdir()
+    (input_dir / "small.txt").write_text("ACGT\n")
+    (input_dir / "large.bin").write_bytes(os.urandom(MULTIPART_INPUT_SIZE))
+    output_dir = tmp_path / "output"
+
+    output = toolchest.test(inputs=str(input_dir), output_path=str(output_dir))
+
+    assert output.last_status == Status.COMPLETE
+    assert (output_dir / "test_output.txt").read_text() == "success\n"
+    run = mock_server.runs[output.run_id]
+    assert {input_file["file_name"]: input_file["file_size"] for input_file in run.input_files} == {
+        "small.txt": 5,
+        "large.bin": MULTIPART_INPUT_SIZE,
+    }
+    assert run.status_history[-1] == Status.COMPLETE
+
+    phases = output.metrics["phases"]
+    assert list(phases) == ["prepare_inputs", "upload", "wait_for_job", "download", "unpack", "postflight"]
+    assert phases["upload"]["bytes"] == 5 + MULTIPART_INPUT_SIZE
+    assert phases["unpack"]["bytes"] == len("success\n")
+    assert "ready_to_transfer_to_client" in output.metrics["status_observed_at"]
+
+    # Outputs can be downloaded again by run ID
+    redownload_dir = tmp_path / "redownload"
+    toolchest.download(output_path=str(redownload_dir), run_id=output.run_id)
+    assert (redownload_dir / "test_output.txt").read_text() == "success\n"
+
+
+def test_mock_download_with_transforms(mock_server, tmp_path):
+    input_path = tmp_path / "input.txt"
+    input_path.write_text("ACGT\n")
+    output = toolchest.test(inputs=str(input_path), output_path=str(tmp_path / "output"))
+
+    # The output archive is unpacked and transformed as it's downloaded, so only the recompressed file is written
+    transformed_dir = tmp_path / "transformed"
+    output_file_path = output.download(
+        output_path=str(transformed_dir),
+        transforms=[LineFilter(pattern="success"), Recompress("bgzip")],
+    )
+    assert output_file_path == str(transformed_dir / "test_output.txt.gz")
+    assert os.listdir(transformed_dir) == ["test_output.txt.gz"]
+    with gzip.open(output_file_path, "rt") as output_file:
+        assert output_file.read() == "success\n"
+
+
+def test_mock_run_with_s3_input(mock_server, tmp_path):
+    input_path = tmp_path / "remote.fastq"
+    input_path.write_text("@read\nACGT\n+\nIIII\n")
+    mock_server.store.put_object(INPUT_BUCKET, "existing/remote.fastq", str(input_path))
+
+    output = toolchest.test(inputs=f"s3://{INPUT_BUCKET}/existing/remote.fastq", output_path=str(tmp_path / "output"))
+
+    assert output.last_status == Status.COMPLETE
+    run = mock_server.runs[output.run_id]
+    assert run.input_files[0]["s3_uri"] == f"s3://{INPUT_BUCKET}/existing/remote.fastq"
+    assert mock_server.request_counts[("POST", "s3_metadata")] == 1
+    assert mock_server.store.get_size(OUTPUT_BUCKET, run.output_object_name) > 0
+
+
+def test_mock_run_with_invalid_key(mock_server, monkeypatch, tmp_path):
+    monkeypatch.setenv("TOOLCHEST_KEY", "not-the-mock-key")
+    input_path = tmp_path / "input.txt"
+    input_path.write_text("ACGT\n")
+
+    with pytest.raises(ToolchestKeyError):
+        toolchest.test(inputs=str(input_path), output_path=str(tmp_path / "output"))
+
+
+def test_mock_run_spans(mock_server, monkeypatch, tmp_path):
+    pytest.importorskip("opentelemetry.sdk")
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+    from toolchest_client import tracing
+
+    exporter = InMemorySpanExporter()
+    tracer_provider = TracerProvider()
+    tracer_provider.add_span_processor(SimpleSpanProcessor(exporter))
+    monkeypatch.setattr(tracing, "_tracer", tracer_provider.get_tracer(tracing.TRACER_NAME))
+    monkeypatch.setattr(tracing, "_tracing_available", True)
+    input_path = tmp_path / "input.txt"
+    input_path.write_text("ACGT\n")
+
+    output = toolchest.test(inputs=str(input_path), output_path=str(tmp_path / "output"))
+
+    spans = exporter.get_finished_spans()
+    run_span = next(span for span in spans if span.name == "toolchest.run")
+    assert run_span.attributes["toolchest.run_id"] == output.run_id
+    assert run_span.attributes["toolchest.bytes"] == 5
+    span_names = {span.name for span in spans}
+    assert {"HTTP GET", "HTTP POST", "HTTP PUT", "toolchest.s3.upload", "toolchest.wait_for_job",
+            "toolchest.s3.download", "toolchest.unpack"} <= span_names
+    # Every span is part of the run's trace
+    assert {span.context.trace_id for span in spans} == {run_span.context.trace_id}
+
+
+def test_mock_run_progress_events(mock_server, tmp_path):
+    input_path = tmp_path / "large.bin"
+    input_path.write_bytes(os.urandom(MULTIPART_INPUT_SIZE))
+    events = []
+
+    output = toolchest.test(inputs=str(input_path), output_path=str(tmp_path / "output"), progress=events.append)
+
+    assert output.last_status == Status.COMPLETE
+    transfer_events = [event for event in events if event["event"] == "transfer"]
+    finished_transfers = {
+        (event["direction"], event["file_name"]): event["bytes_transferred"]
+        for event in transfer_events if event["done"]
+    }
+    assert finished_transfers[("upload", "large.bin")] == MULTIPART_INPUT_SIZE
+    assert ("download", "output.tar.gz") in finished_transfers
+
+
+def test_concurrent_runs_share_status_monitor(monkeypatch, tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    import threading
+    import time
+    from toolchest_client.api import status_monitor
+    from toolchest_client.api.query import Query
+
+    monkeypatch.setattr(status_monitor, "_status_monitor", status_monitor.StatusMonitor(
+        requests_per_second=5,
+        poll_interval_seconds=0.2,
+    ))
+    monitor_request_times = []
+    get_job_status = Query.get_job_status
+
+    def get_job_status_and_record_monitor_requests(self, *args, **kwargs):
+        if threading.current_thread().name == "toolchest-status-monitor":
+            monitor_request_times.append(time.monotonic())
+        return get_job_status(self, *args, **kwargs)
+
+    monkeypatch.setattr(Query, "get_job_status", get_job_status_and_record_monitor_requests)
+    input_path = tmp_path / "input.txt"
+    input_path.write_text("ACGT\n")
+    with MockToolchestServer(execution_seconds=1) as server:
+        for name, value in server.environ.items():
+            monkeypatch.setenv(name, value)
+
+        def run(index):
+            return toolchest.test(inputs=str(input_path), output_path=str(tmp_path / f"output_{index}"))
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            outputs = list(executor.map(run, range(4)))
+
+        assert all(output.last_status == Status.COMPLETE for output in outputs)
+        # Status requests of all runs are polled from one thread, at most 5 per second
+        assert len(monitor_request_times) >= len(outputs)
+        monitor_request_seconds = monitor_request_times[-1] - monitor_request_times[0]
+        assert len(monitor_request_times) <= 5 * monitor_request_seconds + 1
+
+
+def test_mock_watch_async_runs(monkeypatch, tmp_path):
+    from toolchest_client.api import status_monitor, watch
+
+    monkeypatch.setattr(status_monitor, "_status_monitor", status_monitor.StatusMonitor(
+        requests_per_second=20,
+        poll_interval_seconds=0.1,
+    ))
+    input_path = tmp_path / "input.txt"
+    input_path.write_text("ACGT\n")
+    with MockToolchestServer(execution_seconds=0.5) as server:
+        for name, value in server.environ.items():
+            monkeypatch.setenv(name, value)
+        runs = [toolchest.test(inputs=str(input_path), output_path=str(tmp_path), is_async=True) for _ in range(3)]
+        state_file = str(tmp_path / "watch.json")
+
+        outputs = toolchest.watch(runs, output_path=str(tmp_path / "output"), state_file=state_file)
+
+        for run in runs:
+            assert outputs[run.run_id] is run
+            with open(os.path.join(tmp_path, "output", run.run_id, "test_output.txt")) as output_file:
+                assert output_file.read() == "success\n"
+        # Everything is downloaded, so restarting the watcher doesn't request anything
+        monkeypatch.setattr(watch, "get_status", None)
+        assert set(toolchest.watch(state_file=state_file)) == {run.run_id for run in runs}
@@ -0,0 +1,79 @@
+"""
+Output streaming against the local mock streaming server (tests/util/mock_stream_server.py).
+These don't need network access, so they run with the unit tests.
+"""
+import pytest
+
+from tests.util.mock_stream_server import MockStreamServer
+from toolchest_client.api.streaming import StreamingClient
+
+LINES = [f"line {line_number}: {'é' * (line_number % 3)}\n" for line_number in range(20)]
+
+
+def get_streaming_client(stream_server, received, token=None):
+    streaming_client = StreamingClient(stream_to=received.append)
+    streaming_client.streaming_token = token or stream_server.token
+    streaming_client.streaming_ip_address = "127.0.0.1"
+    streaming_client.STREAMING_PORT = stream_server.port
+    streaming_client.RECONNECT_BASE_DELAY_SECONDS = 0.01
+    return streaming_client
+
+
+def test_stream_without_interruption():
+    received = []
+    with MockStreamServer(LINES) as stream_server:
+        streaming_client = get_streaming_client(stream_server, received)
+        streaming_client.stream()
+    assert "".join(received) == "".join(LINES)
+    assert stream_server.requested_offsets == [0]
+    assert streaming_client.num_reconnects == 0
+
+
+def test_stream_resumes_after_dropped_connections():
+    received = []
+    with MockStreamServer(LINES, drop_after=[5, 0, 7]) as stream_server:
+        streaming_client = get_streaming_client(stream_server, received)
+        streaming_client.stream()
+    assert "".join(received) == "".join(LINES)
+    offset_after_five_lines = len("".join(LINES[:5]).encode())
+    assert stream_server.requested_offsets[:3] == [0, offset_after_five_lines, offset_after_five_lines]
+    assert streaming_client.num_reconnects == 3
+    assert streaming_client.stream_offset == len("".join(LINES).encode())
+
+
+def test_stream_skips_replayed_output():
+    received = []
+    # resumes from the start of the line containing the requested offset
+    with MockStreamServer(LINES, drop_after=[3]) as stream_server:
+        streaming_client = get_streaming_client(stream_server, received)
+        streaming_client.stream_offset = 4  # as if part of the first line was already received
+        streaming_client.stream()
+    assert "".join(received) == "".join(LINES)[4:]
+
+
+def test_stream_without_resume_support():
+    received = []
+    with MockStreamServer(LINES, drop_after=[5], supports_resume=False) as stream_server:
+        streaming_client = get_streaming_client(stream_server, received)
+        streaming_client.stream()
+    # output can't be resumed, so the server's replay is received as new output
+    assert "".join(received) == "".join(LINES[:5] + LINES)
+
+
+def test_stream_gives_up_if_server_is_unreachable():
+    received = []
+    with MockStreamServer(LINES) as stream_server:
+        streaming_client = get_streaming_client(stream_server, received, token="invalid-token")
+        streaming_client.MAX_RECONNECT_ATTEMPTS = 2
+        with pytest.raises(RuntimeError):
+            streaming_client.stream()
+    assert received == []
+
+
+def test_stream_offsets_inside_characters_are_decoded():
+    streaming_client = StreamingClient(stream_to=lambda text: None)
+    # The first message ends in the middle of "é", then the whole line is replayed after reconnecting
+    position, first_text = streaming_client._skip_received_output(0, "hé".encode()[:2])
+    position, replayed_text = streaming_client._skip_received_output(0, "héllo\n".encode())
+    assert first_text + replayed_text == "héllo\n"
+    assert streaming_client.stream_offset == len("héllo\n".encode())
@@ -0,0 +1,336 @@
+"""
+A local stand-in for the Toolchest API, for tests and benchmarks that shouldn't hit the real service.
+
+Serves the routes used by the client (pipeline segment instances, input files, status,
+downloads, output streaming attributes, and S3 metadata), backed by a MockS3Server.
+Jobs "execute" by writing an output archive to the mock S3 store.
+
+Usage::
+
+    >>> with MockToolchestServer() as server:
+    ...     os.environ.update(server.environ)
+    ...     toolchest_client.test(inputs="./input.txt", output_path="./output/")
+
+"""
+from collections import Counter
+import gzip
+import io
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import re
+import tarfile
+import tempfile
+import threading
+import time
+import uuid
+
+from toolchest_client.api.status import Status
+from .mock_s3_store import MockS3Server, MockS3Store
+
+MOCK_API_KEY = "mock-toolchest-key"
+INPUT_BUCKET = "toolchest-mock-inputs"
+OUTPUT_BUCKET = "toolchest-mock-outputs"
+# Block of random bytes repeated to pad outputs, so that padding isn't trivially compressible.
+OUTPUT_PADDING_BLOCK = os.urandom(1024 * 1024)
+
+
+class MockRun:
+    """A pipeline segment instance created on the mock server."""
+
+    def __init__(self, run_id, create_body):
+        self.run_id = run_id
+        self.create_body = create_body
+        self.status = Status.INITIALIZED
+        self.status_history = [Status.INITIALIZED]
+        self.input_files = []  # dicts of registered input files
+        self.execution_started_at = None
+        self.output_object_name = None
+
+
+class MockToolchestServer:
+    """Serves a mock Toolchest API and a mock S3 store on localhost, in background threads.
+
+    :param execution_seconds: How long each job stays in the "executing" status.
+    :param output_size_bytes: Bytes of (incompressible) padding added to each job's output archive.
+    :param discard_uploads: If true, uploaded input bytes are counted but not stored.
+    :param api_key: Key accepted in the Authorization header.
+    """
+
+    def __init__(self, execution_seconds=0, output_size_bytes=0, discard_uploads=False, api_key=MOCK_API_KEY):
+        self.execution_seconds = execution_seconds
+        self.output_size_bytes = output_size_bytes
+        self.api_key = api_key
+        self.s3_server = MockS3Server(store=MockS3Store(discard_uploads=discard_uploads))
+        self.runs = dict()
+        self.request_counts = Counter()  # (method, route name) -> number of requests
+        self._input_file_run_ids = dict()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), MockApiRequestHandler)
+        self._server.daemon_threads = True
+        self._server.mock = self
+        self._thread = None
+
+    @property
+    def store(self):
+        return self.s3_server.store
+
+    @property
+    def api_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    @property
+    def environ(self):
+        """Environment variables that point the client at this server."""
+        return {
+            "TOOLCHEST_API_URL": self.api_url,
+            "TOOLCHEST_S3_ENDPOINT_URL": self.s3_server.endpoint_url,
+            "TOOLCHEST_KEY": self.api_key,
+        }
+
+    def start(self):
+        self.s3_server.start()
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self.s3_server.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def create_run(self, create_body):
+        run = MockRun(str(uuid.uuid4()), create_body)
+        with self._lock:
+            self.runs[run.run_id] = run
+        return run
+
+    def register_input_file(self, run, body):
+        file_id = str(uuid.uuid4())
+        input_file = dict(body, file_id=file_id, bucket=INPUT_BUCKET, object_name=f"{run.run_id}/{body['file_name']}")
+        with self._lock:
+            run.input_files.append(input_file)
+            self._input_file_run_ids[file_id] = run.run_id
+        return input_file
+
+    def get_input_file(self, file_id):
+        with self._lock:
+            run = self.runs[self._input_file_run_ids[file_id]]
+        return next(input_file for input_file in run.input_files if input_file["file_id"] == file_id)
+
+    def set_status(self, run, status):
+        with self._lock:
+            if status == Status.TRANSFERRED_FROM_CLIENT:
+                # Inputs are all in, so the job starts executing
+                run.execution_started_at = time.monotonic()
+                status = Status.EXECUTING
+            run.status = status
+            run.status_history.append(status)
+
+    def get_status(self, run):
+        with self._lock:
+            execution_is_over = time.monotonic() - (run.execution_started_at or 0) >= self.execution_seconds
+            job_is_finished = run.status == Status.EXECUTING and execution_is_over
+        if job_is_finished:
+            self._write_output(run)
+            with self._lock:
+                run.status = Status.READY_TO_TRANSFER_TO_CLIENT
+                run.status_history.append(run.status)
+        return run.status
+
+    def get_credentials(self, run):
+        # One set of temporary credentials per run, as the API would vend from STS
+        return {
+            "access_key_id": f"MOCK{run.run_id[:8].upper()}",
+            "secret_access_key": "mock-secret-access-key",
+            "session_token": f"mock-session-token-{run.run_id}",
+        }
+
+    def _write_output(self, run):
+        """Writes the job's output: a .tar.gz with the test tool's success file, plus optional padding."""
+        is_compressed = run.create_body.get("compress_output", True)
+        output_file_name = "output.tar.gz" if is_compressed else "output.txt"
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_path = os.path.join(temp_dir, output_file_name)
+            if is_compressed:
+                # Level 1 keeps output generation from dominating benchmarks of large outputs
+                with gzip.open(output_path, "wb", compresslevel=1) as gzip_file:
+                    with tarfile.open(fileobj=gzip_file, mode="w") as tar:
+                        self._add_to_tar(tar, "test_output.txt", io.BytesIO(b"success\n"), len(b"success\n"))
+                        if self.output_size_bytes:
+                            self._add_to_tar(tar, "output.bin", _PaddingReader(self.output_size_bytes),
+                                             self.output_size_bytes)
+            else:
+                with open(output_path, "wb") as output_file:
+                    output_file.write(b"success\n")
+            self.store.put_object(OUTPUT_BUCKET, f"{run.run_id}/{output_file_name}", output_path)
+        run.output_object_name = f"{run.run_id}/{output_file_name}"
+
+    @staticmethod
+    def _add_to_tar(tar, name, file_object, size):
+        tar_info = tarfile.TarInfo(name)
+        tar_info.size = size
+        tar_info.mtime = int(time.time())
+        tar.addfile(tar_info, file_object)
+
+
+class _PaddingReader:
+    """A file-like object that reads `size` bytes of repeated random padding."""
+
+    def __init__(self, size):
+        self.num_bytes_remaining = size
+
+    def read(self, size=-1):
+        if size < 0:
+            size = self.num_bytes_remaining
+        size = min(size, self.num_bytes_remaining, len(OUTPUT_PADDING_BLOCK))
+        self.num_bytes_remaining -= size
+        return OUTPUT_PADDING_BLOCK[:size]
+
+
+# Routes, in the form (method, route name, path regex).
+ROUTES = [
+    ("GET", "validate_key", re.compile(r"^/$")),
+    ("POST", "create_run", re.compile(r"^/pipeline-segment-instances$")),
+    ("PUT", "update_file_size",
+     re.compile(r"^/pipeline-segment-instances/input-files/(?P<file_id>[^/]+)/update-file-size$")),
+    ("POST", "register_input_file", re.compile(r"^/pipeline-segment-instances/(?P<run_id>[^/]+)/input-files$")),
+    ("POST", "docker_image", re.compile(r"^/pipeline-segment-instances/(?P<run_id>[^/]+)/docker-image$")),
+    ("GET", "get_status", re.compile(r"^/pipeline-segment-instances/(?P<run_id>[^/]+)/status$")),
+    ("PUT", "update_status", re.compile(r"^/pipeline-segment-instances/(?P<run_id>[^/]+)/status$")),
+    ("GET", "downloads", re.compile(r"^/pipeline-segment-instances/(?P<run_id>[^/]+)/downloads$")),
+    ("GET", "output_stream", re.compile(r"^/pipeline-segment-instances/(?P<run_id>[^/]+)/output-stream$")),
+    ("POST", "s3_metadata", re.compile(r"^/s3/metadata$")),
+    ("POST", "s3_metadata_batch", re.compile(r"^/s3/metadata/batch$")),
+]
+
+
+class MockApiRequestHandler(BaseHTTPRequestHandler):
+
+    @property
+    def mock(self):
+        return self.server.mock
+
+    def log_message(self, format, *args):
+        pass  # keeps test and benchmark output quiet
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def do_PUT(self):
+        self._handle()
+
+    def _send_json(self, status_code, body):
+        encoded_body = json.dumps(body).encode()
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded_body)))
+        self.end_headers()
+        self.wfile.write(encoded_body)
+
+    def _read_json(self):
+        content_length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(content_length)) if content_length else dict()
+
+    def _handle(self):
+        path = self.path.split("?")[0]
+        for method, route_name, path_regex in ROUTES:
+            match = path_regex.match(path)
+            if method == self.command and match:
+                break
+        else:
+            self._send_json(404, {"error": f"No route for {self.command} {path}"})
+            return
+
+        with self.mock._lock:
+            self.mock.request_counts[(method, route_name)] += 1
+        if self.headers.get("Authorization") != f"Key {self.mock.api_key}":
+            self._send_json(401, {"error": "Invalid API key"})
+            return
+
+        route_params = match.groupdict()
+        if "run_id" in route_params:
+            run = self.mock.runs.get(route_params.pop("run_id"))
+            if run is None:
+                self._send_json(404, {"error": "Run not found"})
+                return
+            route_params["run"] = run
+        getattr(self, f"_{route_name}")(**route_params)
+
+    def _validate_key(self):
+        self._send_json(200, {})
+
+    def _create_run(self):
+        create_body = self._read_json()
+        run = self.mock.create_run(create_body)
+        self._send_json(201, {
+            "id": run.run_id,
+            "database_name": create_body.get("database_name"),
+            "database_version": create_body.get("database_version"),
+        })
+
+    def _register_input_file(self, run):
+        input_file = self.mock.register_input_file(run, self._read_json())
+        response_body = {"file_id": input_file["file_id"]}
+        if not input_file.get("s3_uri"):
+            response_body.update(self.mock.get_credentials(run))
+            response_body.update(bucket=input_file["bucket"], object_name=input_file["object_name"])
+        self._send_json(201, response_body)
+
+    def _update_file_size(self, file_id):
+        input_file = self.mock.get_input_file(file_id)
+        input_file["file_size"] = self.mock.store.get_size(input_file["bucket"], input_file["object_name"])
+        self._send_json(200, {})
+
+    def _docker_image(self, run):
+        self._send_json(501, {"error": "Custom Docker images aren't supported by the mock server"})
+
+    def _get_status(self, run):
+        self._send_json(200, {"status": self.mock.get_status(run), "error_message": None})
+
+    def _update_status(self, run):
+        self.mock.set_status(run, Status(self._read_json()["status"]))
+        self._send_json(200, {})
+
+    def _downloads(self, run):
+        if run.output_object_name is None:
+            self._send_json(404, {"error": "Output not ready"})
+            return
+        self._send_json(200, [dict(
+            self.mock.get_credentials(run),
+            s3_uri=f"s3://{OUTPUT_BUCKET}/{run.output_object_name}",
+            bucket=OUTPUT_BUCKET,
+            object_name=run.output_object_name,
+            is_compressed=run.output_object_name.endswith(".tar.gz"),
+            primary_name=None,
+        )])
+
+    def _output_stream(self, run):
+        # Output streaming servers aren't mocked, so streaming never starts
+        self._send_json(200, {"server_setup_complete": False})
+
+    def _get_file_size(self, file_params):
+        return self.mock.store.get_size(file_params["bucket"], file_params["key"])
+
+    def _s3_metadata(self):
+        file_size = self._get_file_size(self._read_json())
+        if file_size is None:
+            self._send_json(403, {"error": "S3 file not accessible"})
+            return
+        self._send_json(200, {"file_size": file_size})
+
+    def _s3_metadata_batch(self):
+        file_sizes = [self._get_file_size(file_params) for file_params in self._read_json()["files"]]
+        if None in file_sizes:
+            self._send_json(403, {"error": "S3 file not accessible"})
+            return
+        self._send_json(200, {"files": [{"file_size": file_size} for file_size in file_sizes]})
@@ -0,0 +1,281 @@
+"""
+A local, S3-compatible object store for tests and benchmarks.
+
+Supports the subset of the S3 REST API (path-style addressing) used by boto3's
+managed transfers: PutObject, multipart uploads, HeadObject, and ranged GetObject.
+Request signatures are not checked.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from urllib.parse import parse_qs, unquote, urlparse
+from xml.sax.saxutils import escape
+
+# Size of the buffer used to stream request and response bodies.
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+S3_XML_NAMESPACE = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+
+class MockS3Store:
+    """Objects kept on disk in a temporary directory, keyed by (bucket, key).
+
+    :param root_dir: (optional) Directory for stored objects. Defaults to a new temporary directory.
+    :param discard_uploads: If true, uploaded bytes are counted but not written, so that uploads
+        of very large inputs don't need matching disk space. Discarded objects can't be read back.
+    """
+
+    def __init__(self, root_dir=None, discard_uploads=False):
+        self.root_dir = root_dir or tempfile.mkdtemp(prefix="toolchest-mock-s3-")
+        self.discard_uploads = discard_uploads
+        self.object_sizes = dict()  # (bucket, key) -> size in bytes
+        self._multipart_uploads = dict()  # upload ID -> (bucket, key, {part number: part path or size})
+        self._lock = threading.Lock()
+
+    def get_object_path(self, bucket, key):
+        return os.path.join(self.root_dir, "objects", bucket, key)
+
+    def get_size(self, bucket, key):
+        with self._lock:
+            return self.object_sizes.get((bucket, key))
+
+    def put_object(self, bucket, key, source_path):
+        """Stores the file at `source_path` as an object, e.g. an output written by a mock job."""
+        object_path = self.get_object_path(bucket, key)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        shutil.copyfile(source_path, object_path)
+        with self._lock:
+            self.object_sizes[(bucket, key)] = os.path.getsize(object_path)
+
+    def write_object(self, bucket, key, chunks):
+        """Writes an object from an iterable of byte chunks. Returns its size."""
+        size = self._write_chunks(self.get_object_path(bucket, key), chunks)
+        with self._lock:
+            self.object_sizes[(bucket, key)] = size
+        return size
+
+    def create_multipart_upload(self, bucket, key):
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._multipart_uploads[upload_id] = (bucket, key, dict())
+        return upload_id
+
+    def write_part(self, upload_id, part_number, chunks):
+        part_path = os.path.join(self.root_dir, "parts", upload_id, str(part_number))
+        size = self._write_chunks(part_path, chunks)
+        with self._lock:
+            self._multipart_uploads[upload_id][2][part_number] = size if self.discard_uploads else part_path
+        return size
+
+    def complete_multipart_upload(self, upload_id):
+        with self._lock:
+            bucket, key, parts = self._multipart_uploads.pop(upload_id)
+        part_numbers = sorted(parts)
+        if self.discard_uploads:
+            size = sum(parts[part_number] for part_number in part_numbers)
+        else:
+            object_path = self.get_object_path(bucket, key)
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            with open(object_path, "wb") as object_file:
+                for part_number in part_numbers:
+                    with open(parts[part_number], "rb") as part_file:
+                        shutil.copyfileobj(part_file, object_file, STREAM_CHUNK_SIZE)
+            shutil.rmtree(os.path.join(self.root_dir, "parts", upload_id), ignore_errors=True)
+            size = os.path.getsize(object_path)
+        with self._lock:
+            self.object_sizes[(bucket, key)] = size
+        return bucket, key
+
+    def abort_multipart_upload(self, upload_id):
+        with self._lock:
+            self._multipart_uploads.pop(upload_id, None)
+        shutil.rmtree(os.path.join(self.root_dir, "parts", upload_id), ignore_errors=True)
+
+    def cleanup(self):
+        shutil.rmtree(self.root_dir, ignore_errors=True)
+
+    def _write_chunks(self, path, chunks):
+        size = 0
+        if self.discard_uploads:
+            for chunk in chunks:
+                size += len(chunk)
+            return size
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                size += len(chunk)
+        return size
+
+
+class MockS3RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def store(self):
+        return self.server.store
+
+    def log_message(self, format, *args):
+        pass  # keeps test and benchmark output quiet
+
+    def _parse_path(self):
+        parsed_url = urlparse(self.path)
+        bucket, _, key = unquote(parsed_url.path).lstrip("/").partition("/")
+        query = {name: values[0] for name, values in parse_qs(parsed_url.query, keep_blank_values=True).items()}
+        return bucket, key, query
+
+    def _iter_body(self):
+        """Yields the request body in chunks, decoding aws-chunked bodies sent with checksum trailers."""
+        content_sha256 = self.headers.get("x-amz-content-sha256", "")
+        if "aws-chunked" in self.headers.get("Content-Encoding", "") or content_sha256.startswith("STREAMING-"):
+            while True:
+                chunk_size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if chunk_size == 0:
+                    # Skip trailing headers (e.g. checksums), which end with an empty line
+                    while self.rfile.readline().strip():
+                        pass
+                    return
+                yield from self._iter_bytes(chunk_size)
+                self.rfile.readline()  # CRLF after each chunk
+        else:
+            yield from self._iter_bytes(int(self.headers.get("Content-Length", 0)))
+
+    def _iter_bytes(self, num_bytes):
+        while num_bytes > 0:
+            chunk = self.rfile.read(min(num_bytes, STREAM_CHUNK_SIZE))
+            if not chunk:
+                return
+            num_bytes -= len(chunk)
+            yield chunk
+
+    def _send(self, status_code, body=b"", headers=None):
+        self.send_response(status_code)
+        for name, value in (headers or dict()).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _send_xml(self, root_tag, fields):
+        elements = "".join(f"<{name}>{escape(str(value))}</{name}>" for name, value in fields.items())
+        body = f'<?xml version="1.0" encoding="UTF-8"?><{root_tag} xmlns="{S3_XML_NAMESPACE}">{elements}</{root_tag}>'
+        self._send(200, body.encode(), {"Content-Type": "application/xml"})
+
+    def _send_error(self, status_code, code):
+        body = f'<?xml version="1.0" encoding="UTF-8"?><Error><Code>{code}</Code><Message>{code}</Message></Error>'
+        self._send(status_code, body.encode(), {"Content-Type": "application/xml"})
+
+    def do_PUT(self):
+        bucket, key, query = self._parse_path()
+        if "uploadId" in query:
+            self.store.write_part(query["uploadId"], int(query["partNumber"]), self._iter_body())
+        else:
+            self.store.write_object(bucket, key, self._iter_body())
+        self._send(200, headers={"ETag": f'"{uuid.uuid4().hex}"'})
+
+    def do_POST(self):
+        bucket, key, query = self._parse_path()
+        if "uploads" in query:
+            upload_id = self.store.create_multipart_upload(bucket, key)
+            self._send_xml("InitiateMultipartUploadResult", {"Bucket": bucket, "Key": key, "UploadId": upload_id})
+        elif "uploadId" in query:
+            for _ in self._iter_body():
+                pass  # parts are assembled in part number order, so the list of parts isn't needed
+            self.store.complete_multipart_upload(query["uploadId"])
+            self._send_xml("CompleteMultipartUploadResult", {
+                "Location": self.path, "Bucket": bucket, "Key": key, "ETag": f'"{uuid.uuid4().hex}-1"',
+            })
+        else:
+            self._send_error(400, "InvalidRequest")
+
+    def do_DELETE(self):
+        bucket, key, query = self._parse_path()
+        if "uploadId" in query:
+            self.store.abort_multipart_upload(query["uploadId"])
+        self._send(204)
+
+    def do_HEAD(self):
+        bucket, key, _ = self._parse_path()
+        size = self.store.get_size(bucket, key)
+        if size is None:
+            self._send_error(404, "NoSuchKey")
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(size))
+        self.send_header("ETag", '"mock"')
+        self.send_header("Last-Modified", "Thu, 01 Jan 2026 00:00:00 GMT")
+        self.end_headers()
+
+    def do_GET(self):
+        bucket, key, _ = self._parse_path()
+        size = self.store.get_size(bucket, key)
+        object_path = self.store.get_object_path(bucket, key)
+        if size is None or not os.path.exists(object_path):
+            self._send_error(404, "NoSuchKey")
+            return
+
+        start, end = 0, size - 1
+        range_header = self.headers.get("Range")
+        if range_header:
+            range_start, _, range_end = range_header.replace("bytes=", "").partition("-")
+            start = int(range_start)
+            end = min(int(range_end), size - 1) if range_end else size - 1
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("ETag", '"mock"')
+        self.end_headers()
+
+        with open(object_path, "rb") as object_file:
+            object_file.seek(start)
+            num_bytes_remaining = end - start + 1
+            while num_bytes_remaining > 0:
+                chunk = object_file.read(min(num_bytes_remaining, STREAM_CHUNK_SIZE))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                num_bytes_remaining -= len(chunk)
+
+
+class MockS3Server:
+    """Serves a MockS3Store over HTTP on localhost, in a background thread.
+
+    Usage::
+
+        >>> with MockS3Server() as s3_server:
+        ...     boto3.client("s3", endpoint_url=s3_server.endpoint_url, ...)
+
+    """
+
+    def __init__(self, store=None, port=0):
+        self.store = store or MockS3Store()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), MockS3RequestHandler)
+        self._server.daemon_threads = True
+        self._server.store = self.store
+        self._thread = None
+
+    @property
+    def endpoint_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self.store.cleanup()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
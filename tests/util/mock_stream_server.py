@@ -0,0 +1,116 @@
+"""
+A local websocket server that streams output like a Toolchest streaming server, for tests.
+
+Output is sent one line per message. Clients can resume from a byte offset by sending the
+X-Toolchest-Stream-Offset request header; the server replies with the offset it resumes from
+in the same response header. The connection is closed normally once all output is sent.
+"""
+import asyncio
+import base64
+from http import HTTPStatus
+import threading
+
+import websockets
+
+from toolchest_client.api.streaming import STREAM_OFFSET_HEADER
+
+
+class MockStreamServer:
+    """Serves `lines` of output over a websocket on localhost, in a background thread.
+
+    Usage::
+
+        >>> with MockStreamServer(["line 1\\n", "line 2\\n"], drop_after=[1]) as stream_server:
+        ...     streaming_client.STREAMING_PORT = stream_server.port
+
+    :param lines: Lines of output to stream.
+    :param token: Streaming token expected in the request's credentials.
+    :param drop_after: (optional) For each of the first connections, the number of lines sent
+        before the connection is dropped without a close frame, like a network failure.
+    :param supports_resume: If false, the server ignores the offset header and streams every
+        line from the start, like a server without resume support.
+    :param line_delay_seconds: Delay between lines.
+    """
+
+    def __init__(self, lines, token="streaming-token", drop_after=None, supports_resume=True,
+                 line_delay_seconds=0):
+        self.lines = [line.encode() for line in lines]
+        self.token = token
+        self.drop_after = list(drop_after or [])
+        self.supports_resume = supports_resume
+        self.line_delay_seconds = line_delay_seconds
+        self.requested_offsets = []  # offset header of each connection, or None
+        self.port = None
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._started = threading.Event()
+
+    def _get_start_line(self, requested_offset):
+        """Returns the index of the line to resume from, and its offset."""
+        offset = 0
+        for line_number, line in enumerate(self.lines):
+            if offset + len(line) > requested_offset:
+                return line_number, offset
+            offset += len(line)
+        return len(self.lines), offset
+
+    def _get_response_headers(self, path, request_headers):
+        requested_offset = request_headers.get(STREAM_OFFSET_HEADER)
+        if not self.supports_resume or requested_offset is None:
+            return {}
+        _, start_offset = self._get_start_line(int(requested_offset))
+        return {STREAM_OFFSET_HEADER: str(start_offset)}
+
+    async def _process_request(self, path, request_headers):
+        expected_credentials = base64.b64encode(f"toolchest:{self.token}".encode()).decode()
+        if request_headers.get("Authorization") != f"Basic {expected_credentials}":
+            return HTTPStatus.UNAUTHORIZED, [], b"Invalid streaming token\n"
+        return None
+
+    async def _handle(self, websocket, path=None):
+        requested_offset = websocket.request_headers.get(STREAM_OFFSET_HEADER)
+        self.requested_offsets.append(int(requested_offset) if requested_offset is not None else None)
+        start_line = 0
+        if self.supports_resume and requested_offset is not None:
+            start_line, _ = self._get_start_line(int(requested_offset))
+        drop_after = self.drop_after.pop(0) if self.drop_after else None
+
+        for num_lines_sent, line in enumerate(self.lines[start_line:]):
+            if drop_after is not None and num_lines_sent == drop_after:
+                websocket.transport.abort()
+                return
+            await websocket.send(line.decode())
+            if self.line_delay_seconds:
+                await asyncio.sleep(self.line_delay_seconds)
+        await websocket.close()
+
+    async def _serve(self):
+        self._server = await websockets.serve(
+            self._handle,
+            "127.0.0.1",
+            0,
+            process_request=self._process_request,
+            extra_headers=self._get_response_headers,
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._started.set()
+        await self._server.wait_closed()
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_until_complete, args=(self._serve(),), daemon=True)
+        self._thread.start()
+        self._started.wait(timeout=10)
+        return self
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._server.close)
+        self._thread.join(timeout=10)
+        self._loop.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
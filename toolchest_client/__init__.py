@@ -1,6 +1,5 @@
-import builtins
 from dotenv import load_dotenv, find_dotenv
-import functools
+import importlib
 
 from .logging import setup_logging
 
@@ -18,20 +17,46 @@ except importlib_metadata.PackageNotFoundError:
 # .env load must be before imports that use environment variables
 load_dotenv(find_dotenv(".env"))
 
-# specifying print flushing is necessary to support loading from R
-builtins.print = functools.partial(print, flush=True)
-
 # configure logger
 setup_logging()
 
-from toolchest_client.api.auth import get_key, set_key
-from toolchest_client.api.download import download
 from toolchest_client.api.exceptions import ToolchestException, DataLimitError, ToolchestJobError, \
     ToolchestDownloadError
-from toolchest_client.api.query import Query
 from toolchest_client.api.status import Status, get_status
 from toolchest_client.api.urls import get_api_url, set_api_url
-from .tools.api import add_database, alphafold, blastn, bowtie2, bracken, cellranger_count, centrifuge, clustalo, \
-    demucs, diamond_blastp, diamond_blastx, fastqc, humann3, jupyter, kallisto, kraken2, lastal5, lug, megahit, \
-    metaphlan, python3, rapsearch, rapsearch2, salmon, shi7, shogun_align, shogun_filter, STAR, test, transfer, \
-    unicycler, update_database
+
+# Everything else is imported on first use, so that `import toolchest_client` stays fast.
+# Tool modules pull in requests, and transfers pull in boto3, docker, and websockets.
+_TOOL_FUNCTION_NAMES = [
+    "add_database", "alphafold", "blastn", "bowtie2", "bracken", "cellranger_count", "centrifuge", "clustalo",
+    "demucs", "diamond_blastp", "diamond_blastx", "fastqc", "humann3", "jupyter", "kallisto", "kraken2", "lastal5",
+    "lug", "megahit", "metaphlan", "python3", "rapsearch", "rapsearch2", "salmon", "shi7", "shogun_align",
+    "shogun_filter", "STAR", "test", "transfer", "unicycler", "update_database",
+]
+_LAZY_ATTRIBUTE_MODULES = {
+    "get_key": "toolchest_client.api.auth",
+    "set_key": "toolchest_client.api.auth",
+    "download": "toolchest_client.api.download",
+    "Query": "toolchest_client.api.query",
+    "watch": "toolchest_client.api.watch",
+    **{tool_function_name: "toolchest_client.tools.api" for tool_function_name in _TOOL_FUNCTION_NAMES},
+}
+
+__all__ = [
+    "ToolchestException", "DataLimitError", "ToolchestJobError", "ToolchestDownloadError",
+    "Status", "get_status", "get_api_url", "set_api_url",
+    *_LAZY_ATTRIBUTE_MODULES,
+]
+
+
+def __getattr__(name):
+    module_name = _LAZY_ATTRIBUTE_MODULES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value  # later lookups skip __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTE_MODULES))
@@ -14,6 +14,7 @@ from requests.exceptions import HTTPError
 
 from toolchest_client.api.exceptions import ToolchestKeyError
 from toolchest_client.api.urls import get_api_url
+from toolchest_client.tracing import traced_request
 
 
 def get_key():
@@ -52,7 +53,8 @@ def set_key(key):
 def validate_key():
     """Validates Toolchest API key, retrieved from get_key()."""
 
-    validation_response = requests.get(
+    validation_response = traced_request(
+        requests.get,
         get_api_url(),
         headers=get_headers(),
     )
@@ -0,0 +1,199 @@
+"""
+toolchest_client.api.docker_push
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module pushes custom Docker images (for `lug` and `python3`) to the run's ECR repository.
+
+A push is skipped if the image was already pushed to the repository by this process, or if the
+repository's manifest for the tag – checked with one request to the registry's v2 API – is one the
+local image was pushed as. Otherwise, the push is handed to the Docker daemon, which checks each
+layer against the registry, skips layers that already exist, and uploads the missing ones
+concurrently. The push's progress events are reported per layer, with throughput.
+"""
+import threading
+import time
+
+from loguru import logger
+import requests
+from requests.exceptions import RequestException
+
+from toolchest_client.api.exceptions import ToolchestJobError
+from toolchest_client.tracing import traced_request
+
+ECR_USERNAME = "AWS"
+# Manifest types that Docker pushes, in order of preference
+MANIFEST_MEDIA_TYPES = (
+    "application/vnd.docker.distribution.manifest.v2+json",
+    "application/vnd.oci.image.manifest.v1+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+    "application/vnd.oci.image.index.v1+json",
+)
+MANIFEST_REQUEST_TIMEOUT_SECONDS = 10
+
+# (image ID, repository, tag) of images pushed by this process
+_pushed_images = set()
+_pushed_images_lock = threading.Lock()
+
+
+class DockerPushResult:
+    """Summary of a Docker image push.
+
+    :param image_reference: Reference of the pushed image, e.g. `registry/repository:tag`.
+    :param is_skipped: Whether the push was skipped, because the registry already had the image.
+    """
+
+    def __init__(self, image_reference, is_skipped=False):
+        self.image_reference = image_reference
+        self.is_skipped = is_skipped
+        self.pushed_layers = set()
+        self.existing_layers = set()  # layers that the registry already had, or mounted from another repository
+        self.pushed_bytes = 0
+        self.seconds = 0.0
+
+    def __repr__(self):
+        return str(self.__dict__)
+
+    @property
+    def bytes_per_second(self):
+        return self.pushed_bytes / self.seconds if self.seconds > 0 else 0.0
+
+    def format_summary(self):
+        if self.is_skipped:
+            return f"Docker image {self.image_reference} is already uploaded"
+        return (
+            f"Docker image uploaded: {len(self.pushed_layers)} layers pushed "
+            f"({self.pushed_bytes / 1e6:.1f} MB at {self.bytes_per_second / 1e6:.1f} MB/s), "
+            f"{len(self.existing_layers)} layers already uploaded"
+        )
+
+
+class _PushProgress:
+    """Tallies the Docker daemon's push progress events, and reports each layer's upload as a transfer."""
+
+    def __init__(self, result, progress_reporter=None):
+        self.result = result
+        self.progress_reporter = progress_reporter
+        self.layer_bytes = dict()  # layer ID -> bytes uploaded so far
+        self.layer_transfers = dict()  # layer ID -> TransferProgress, if progress is reported
+
+    def update(self, event):
+        if "errorDetail" in event:
+            raise ToolchestJobError(f"Failed to push image: {event['errorDetail'].get('message')}")
+        layer_id = event.get("id")
+        status = event.get("status", "")
+        if status == "Layer already exists" or status.startswith("Mounted from"):
+            self.result.existing_layers.add(layer_id)
+        elif status == "Pushing":
+            progress_detail = event.get("progressDetail") or {}
+            if "current" in progress_detail:
+                self._set_layer_bytes(layer_id, progress_detail["current"], progress_detail.get("total"))
+        elif status == "Pushed":
+            self.result.pushed_layers.add(layer_id)
+            transfer = self.layer_transfers.get(layer_id)
+            if transfer is not None:
+                self._set_layer_bytes(layer_id, transfer.total_bytes, transfer.total_bytes)
+
+    def close(self):
+        """Stops tracking the layers' transfers, including those of layers whose push failed."""
+        for transfer in self.layer_transfers.values():
+            if transfer is not None:
+                transfer.close()
+
+    def _set_layer_bytes(self, layer_id, num_bytes, total_bytes):
+        previous_bytes = self.layer_bytes.get(layer_id, 0)
+        if num_bytes <= previous_bytes:
+            return
+        self.layer_bytes[layer_id] = num_bytes
+        self.result.pushed_bytes += num_bytes - previous_bytes
+        if self.progress_reporter is None or not total_bytes:
+            return
+        if layer_id not in self.layer_transfers:
+            self.layer_transfers[layer_id] = self.progress_reporter.track_transfer(
+                "upload",
+                f"docker layer {layer_id}",
+                total_bytes,
+            )
+        transfer = self.layer_transfers[layer_id]
+        if transfer is not None:
+            transfer(min(num_bytes, total_bytes) - transfer.bytes_transferred)
+
+
+def push_docker_image(client, image, registry, repository, tag, password, progress_reporter=None):
+    """Pushes a local Docker image to `registry/repository:tag`, unless the registry already has it.
+    Returns a DockerPushResult.
+
+    :param client: docker.DockerClient connected to the local Docker daemon.
+    :param image: docker Image to push.
+    :param registry: Host name of the registry, e.g. `123456789012.dkr.ecr.us-east-1.amazonaws.com`.
+    :param repository: Name of the repository in the registry.
+    :param tag: Tag of the pushed image.
+    :param password: ECR password for the registry.
+    :param progress_reporter: (optional) ProgressReporter to which each layer's upload is reported.
+    """
+    repository_reference = f"{registry}/{repository}"
+    image_reference = f"{repository_reference}:{tag}"
+    pushed_image_key = (image.id, repository_reference, tag)
+    with _pushed_images_lock:
+        is_pushed = pushed_image_key in _pushed_images
+    if is_pushed or _is_in_registry(image, registry, repository, tag, password):
+        logger.debug(f"Skipping push of {image.id}, which is already in {image_reference}")
+        with _pushed_images_lock:
+            _pushed_images.add(pushed_image_key)
+        return DockerPushResult(image_reference, is_skipped=True)
+
+    result = DockerPushResult(image_reference)
+    push_progress = _PushProgress(result, progress_reporter)
+    started_at = time.monotonic()
+    client.login(username=ECR_USERNAME, password=password, registry=registry)
+    image.tag(repository_reference, tag=tag)
+    try:
+        for event in client.api.push(repository_reference, tag=tag, stream=True, decode=True):
+            push_progress.update(event)
+    finally:
+        push_progress.close()
+    result.seconds = time.monotonic() - started_at
+    with _pushed_images_lock:
+        _pushed_images.add(pushed_image_key)
+    return result
+
+
+def get_remote_manifest_digest(registry, repository, tag, password):
+    """Returns the digest of the manifest that `repository:tag` points to in the registry, or None if there's none.
+
+    :param registry: Host name of the registry.
+    :param repository: Name of the repository in the registry.
+    :param tag: Tag of the image.
+    :param password: ECR password for the registry.
+    """
+    response = traced_request(
+        requests.head,
+        f"https://{registry}/v2/{repository}/manifests/{tag}",
+        auth=(ECR_USERNAME, password),
+        headers={"Accept": ", ".join(MANIFEST_MEDIA_TYPES)},
+        timeout=MANIFEST_REQUEST_TIMEOUT_SECONDS,
+    )
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.headers.get("Docker-Content-Digest")
+
+
+def _is_in_registry(image, registry, repository, tag, password):
+    """Returns whether `repository:tag` in the registry is the local image, i.e. the manifest the tag points to is
+    one that the local image was pushed as. The Docker daemon records these as the image's repo digests.
+    """
+    repository_reference = f"{registry}/{repository}"
+    local_digests = {
+        repo_digest.split("@", 1)[1]
+        for repo_digest in image.attrs.get("RepoDigests") or []
+        if repo_digest.split("@", 1)[0] == repository_reference
+    }
+    if not local_digests:
+        return False
+    try:
+        remote_digest = get_remote_manifest_digest(registry, repository, tag, password)
+    except RequestException as err:
+        # The Docker daemon still skips the layers that the registry has
+        logger.debug(f"Unable to check for {repository_reference}:{tag} in the registry, pushing it: {err}")
+        return False
+    return remote_digest in local_digests
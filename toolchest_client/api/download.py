@@ -11,21 +11,25 @@ Query classes.
 import logging
 import os
 import sys
+import tarfile
 
-import boto3
-from botocore.exceptions import ClientError
 import requests
 from requests.exceptions import HTTPError
 
 from toolchest_client.api.auth import get_headers
 from toolchest_client.api.exceptions import ToolchestDownloadError
+from toolchest_client.api.metrics import RunMetrics
 from toolchest_client.api.urls import get_pipeline_segment_instances_url
 from toolchest_client.files import get_params_from_s3_uri, unpack_files
-from toolchest_client.files.s3 import DownloadTracker
+from toolchest_client.files.s3 import evict_s3_client, get_s3_client, is_expired_credentials_error
+from toolchest_client.files.transforms import iter_file_chunks, write_transformed_file
+from toolchest_client.progress import get_progress_reporter
+from toolchest_client.tracing import span, traced_request
 
 
 def download(output_path, s3_uri=None, pipeline_segment_instance_id=None, run_id=None,
-             output_file_keys=None, skip_decompression=False, output_type=None):
+             output_file_keys=None, skip_decompression=False, output_type=None, metrics=None, progress=None,
+             transforms=None):
     """Downloads output to `output_path`.
 
     One of `s3_uri`, `run_id`, or `output_file_keys` must
@@ -40,12 +44,22 @@ def download(output_path, s3_uri=None, pipeline_segment_instance_id=None, run_id
     :param pipeline_segment_instance_id: (Deprecated) Pipeline segment instance ID of the job
         producing the output you would like to download.
     :param run_id: ID of the job producing the output you would like to download.
+        If given with `output_file_keys`, it is used to get new access keys if they expire mid-download.
     :param output_file_keys: Access keys obtained from `get_download_details()`.
         Used internally.
     :param skip_decompression: Whether to skip decompression of the downloaded file archive.
     :param output_type: Output type of the produced output file. Used internally.
+    :param metrics: (optional) RunMetrics in which to record the download and unpack phases. Used internally.
+    :param progress: (optional) How download progress is reported: a ProgressReporter, a function called with
+        each progress event, or one of "tty", "json", or "none". See `toolchest_client.progress`.
+    :param transforms: (optional) List of OutputTransforms (see `toolchest_client.files.transforms`) applied to the
+        output files as they're downloaded. The output archive is unpacked as it streams in, and only the transformed
+        files are written. Returns the paths of the transformed files.
     """
 
+    # botocore is slow to import, so it's only imported when downloading
+    from botocore.exceptions import ClientError
+
     # pipeline_segment_instance_id as a param is deprecated, remove it as default value eventually
     pipeline_segment_instance_id = run_id or pipeline_segment_instance_id
 
@@ -60,6 +74,8 @@ def download(output_path, s3_uri=None, pipeline_segment_instance_id=None, run_id
         else:
             error_message = "Details of files to download were not provided."
             raise ToolchestDownloadError(error_message) from None
+    if transforms and skip_decompression:
+        raise ValueError("Outputs can't be transformed when skipping decompression.")
 
     # Create output directories if directory at output_path does not exist.
     output_path = os.path.abspath(os.path.expanduser(output_path))
@@ -72,34 +88,59 @@ def download(output_path, s3_uri=None, pipeline_segment_instance_id=None, run_id
     output_file_name = os.path.basename(output_file_keys["object_name"])
     output_file_path = "/".join([output_path, output_file_name])
 
-    try:
-        s3_client = boto3.client(
-            's3',
-            aws_access_key_id=output_file_keys["access_key_id"],
-            aws_secret_access_key=output_file_keys["secret_access_key"],
-            aws_session_token=output_file_keys["session_token"],
-        )
-        s3_client.download_file(
-            output_file_keys["bucket"],
-            output_file_keys["object_name"],
-            output_file_path,
-            Callback=DownloadTracker(s3_client, output_file_keys["bucket"], output_file_keys["object_name"])
-        )
-    except ClientError as err:
-        # TODO: output more detailed error message if write error encountered
-        error_message = f"{err} \n\nOutput download failed."
-        raise ToolchestDownloadError(error_message) from None
+    metrics = metrics or RunMetrics()
+    progress_reporter = get_progress_reporter(progress)
+    download_span_attributes = {
+        "toolchest.run_id": pipeline_segment_instance_id,
+        "s3.bucket": output_file_keys["bucket"],
+        "s3.key": output_file_keys["object_name"],
+    }
+    with metrics.phase("download") as download_phase, \
+            span("toolchest.s3.download", download_span_attributes) as download_span:
+        try:
+            try:
+                downloaded_paths, num_bytes = _download_output(
+                    output_file_keys, output_file_path, transforms, progress_reporter,
+                )
+            except ClientError as err:
+                if not is_expired_credentials_error(err):
+                    raise
+                evict_s3_client(output_file_keys)
+                if not pipeline_segment_instance_id:
+                    raise
+                # Temporary credentials expired mid-download, so the download is retried once with new ones
+                download_span.set_attribute("toolchest.retries", 1)
+                _, output_file_keys = get_download_details(pipeline_segment_instance_id)
+                downloaded_paths, num_bytes = _download_output(
+                    output_file_keys, output_file_path, transforms, progress_reporter,
+                )
+        except ClientError as err:
+            # TODO: output more detailed error message if write error encountered
+            error_message = f"{err} \n\nOutput download failed."
+            raise ToolchestDownloadError(error_message) from None
+        download_phase.add_bytes(num_bytes)
+        download_span.set_attribute("toolchest.bytes", download_phase.num_bytes)
 
+    if transforms:
+        return downloaded_paths[0] if len(downloaded_paths) == 1 else downloaded_paths
     if skip_decompression:
         return output_file_path
-    unpacked_output_file_paths = _unpack_output(output_file_path, output_file_keys["is_compressed"])
+    with metrics.phase("unpack") as unpack_phase, \
+            span("toolchest.unpack", {"toolchest.run_id": pipeline_segment_instance_id}) as unpack_span:
+        unpacked_output_file_paths = _unpack_output(output_file_path, output_file_keys["is_compressed"])
+        unpacked_paths = unpacked_output_file_paths
+        if isinstance(unpacked_paths, str):
+            unpacked_paths = [unpacked_paths]
+        unpack_phase.add_bytes(sum(os.path.getsize(path) for path in unpacked_paths))
+        unpack_span.set_attribute("toolchest.bytes", unpack_phase.num_bytes)
     return unpacked_output_file_paths
 
 
 def get_download_details(pipeline_segment_instance_id):
     """Gets S3 URI and access keys for downloading output of query task(s)."""
 
-    response = requests.get(
+    response = traced_request(
+        requests.get,
         "/".join([get_pipeline_segment_instances_url(), pipeline_segment_instance_id, "downloads"]),
         headers=get_headers(),
     )
@@ -124,6 +165,92 @@ def get_download_details(pipeline_segment_instance_id):
     return output_s3_uri, output_file_keys
 
 
+def _download_file(output_file_keys, output_file_path, progress_reporter):
+    """Downloads a single output file with a shared S3 client."""
+    s3_client = get_s3_client(output_file_keys)
+    if not progress_reporter.enabled:
+        s3_client.download_file(output_file_keys["bucket"], output_file_keys["object_name"], output_file_path)
+        return
+    # The file's size is only needed (and requested) if progress is reported
+    file_size = s3_client.head_object(
+        Bucket=output_file_keys["bucket"],
+        Key=output_file_keys["object_name"],
+    )["ContentLength"]
+    with progress_reporter.tracked_transfer(
+        "download",
+        os.path.basename(output_file_keys["object_name"]),
+        file_size,
+    ) as download_tracker:
+        s3_client.download_file(
+            output_file_keys["bucket"],
+            output_file_keys["object_name"],
+            output_file_path,
+            Callback=download_tracker,
+        )
+
+
+def _download_output(output_file_keys, output_file_path, transforms, progress_reporter):
+    """Downloads the output, transforming it if there are transforms. Returns the written paths and bytes downloaded."""
+    if transforms:
+        return _download_transformed_output(
+            output_file_keys, os.path.dirname(output_file_path), transforms, progress_reporter,
+        )
+    _download_file(output_file_keys, output_file_path, progress_reporter)
+    return [output_file_path], os.path.getsize(output_file_path)
+
+
+def _download_transformed_output(output_file_keys, output_path, transforms, progress_reporter):
+    """Streams a single output file from S3 through transforms, unpacking it first if it's an archive.
+    Returns the paths of the transformed files and the number of bytes downloaded."""
+    s3_client = get_s3_client(output_file_keys)
+    response = s3_client.get_object(Bucket=output_file_keys["bucket"], Key=output_file_keys["object_name"])
+    output_file_name = os.path.basename(output_file_keys["object_name"])
+    with progress_reporter.tracked_transfer("download", output_file_name, response["ContentLength"]) as tracker:
+        return _transform_output_stream(
+            _TrackedStream(response["Body"], tracker), output_file_keys["is_compressed"], output_file_name,
+            output_path, transforms,
+        )
+
+
+def _transform_output_stream(body, is_compressed, output_file_name, output_path, transforms):
+    """Transforms a streamed output file, unpacking it first if it's an archive.
+    Returns the paths of the transformed files and the number of bytes read."""
+    transformed_output_file_paths = []
+    try:
+        if is_compressed:
+            # Archive members are read in order as the archive streams in, without seeking
+            with tarfile.open(fileobj=body, mode="r|gz") as tar:
+                for member in tar:
+                    if not member.isfile():
+                        continue
+                    transformed_output_file_paths += write_transformed_file(
+                        member.name, iter_file_chunks(tar.extractfile(member)), output_path, transforms,
+                    )
+        else:
+            transformed_output_file_paths = write_transformed_file(
+                output_file_name, iter_file_chunks(body), output_path, transforms,
+            )
+    except (tarfile.TarError, ValueError) as err:
+        raise ToolchestDownloadError(f"Failed to transform output {output_file_name}: {err}") from err
+    return transformed_output_file_paths, body.num_bytes
+
+
+class _TrackedStream:
+    """Wraps a streamed S3 object body, counting the bytes read and reporting them to a progress tracker."""
+
+    def __init__(self, body, download_tracker=None):
+        self.body = body
+        self.download_tracker = download_tracker
+        self.num_bytes = 0
+
+    def read(self, size=-1):
+        data = self.body.read(size if size is not None and size >= 0 else None)
+        self.num_bytes += len(data)
+        if self.download_tracker is not None and data:
+            self.download_tracker(len(data))
+        return data
+
+
 def _unpack_output(compressed_output_archive_path, is_compressed):
     """After downloading, unpack files if needed"""
     try:
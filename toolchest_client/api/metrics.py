@@ -0,0 +1,112 @@
+"""
+toolchest_client.api.metrics
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides a RunMetrics object, which records how long each phase
+of a Toolchest run takes and how many bytes it handles.
+
+All timestamps are from `time.monotonic()`, so they can be compared with each
+other but not with wall-clock times.
+"""
+import contextlib
+import threading
+import time
+
+
+class PhaseMetrics:
+    """Timing and byte count of one phase of a run (e.g. "upload")."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started_at = time.monotonic()
+        self.ended_at = None
+        self.num_bytes = None
+
+    def __repr__(self):
+        return str(self.__dict__)
+
+    def add_bytes(self, num_bytes):
+        self.num_bytes = (self.num_bytes or 0) + num_bytes
+
+    @property
+    def seconds(self):
+        ended_at = self.ended_at if self.ended_at is not None else time.monotonic()
+        return ended_at - self.started_at
+
+    def to_dict(self):
+        return {
+            "started_at": self.started_at,
+            "ended_at": self.ended_at,
+            "seconds": self.seconds,
+            "bytes": self.num_bytes,
+        }
+
+
+class RunMetrics:
+    """Timings and byte counts for the phases of a run, along with when each job status was first seen.
+
+    Usage::
+
+        >>> metrics = RunMetrics()
+        >>> with metrics.phase("upload") as upload_phase:
+        ...     upload_phase.add_bytes(1024)
+        >>> metrics.to_dict()["phases"]["upload"]["bytes"]
+        1024
+
+    """
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.ended_at = None
+        self.phases = dict()  # phase name -> PhaseMetrics, in the order the phases started
+        self.status_observed_at = dict()  # job status -> when the client first saw it
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return str(self.to_dict())
+
+    @contextlib.contextmanager
+    def phase(self, name, num_bytes=None):
+        """Times the phase `name` while in the context. If a phase is repeated, the latest timing is kept.
+
+        :param name: Name of the phase (e.g. "upload").
+        :param num_bytes: (optional) Bytes handled by the phase, if known before it starts.
+        """
+        phase_metrics = PhaseMetrics(name)
+        if num_bytes is not None:
+            phase_metrics.add_bytes(num_bytes)
+        with self._lock:
+            self.phases.pop(name, None)
+            self.phases[name] = phase_metrics
+        try:
+            yield phase_metrics
+        finally:
+            phase_metrics.ended_at = time.monotonic()
+
+    def observe_status(self, status):
+        """Records when a job status was first seen.
+
+        :param status: A Status (or its string value).
+        """
+        status = getattr(status, "value", status)
+        with self._lock:
+            self.status_observed_at.setdefault(status, time.monotonic())
+
+    def finish(self):
+        self.ended_at = time.monotonic()
+
+    @property
+    def total_seconds(self):
+        ended_at = self.ended_at if self.ended_at is not None else time.monotonic()
+        return ended_at - self.started_at
+
+    def to_dict(self):
+        """Returns the metrics as a dict of plain values, e.g. for serializing as JSON."""
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "ended_at": self.ended_at,
+                "total_seconds": self.total_seconds,
+                "phases": {name: phase_metrics.to_dict() for name, phase_metrics in self.phases.items()},
+                "status_observed_at": dict(self.status_observed_at),
+            }
@@ -9,6 +9,7 @@ where the output file can be located.
 Note: The Output object does NOT represent the contents of any of the
 tool output files themselves.
 """
+import os
 
 from toolchest_client.api.download import download
 from toolchest_client.api.status import get_status as get_api_status
@@ -25,6 +26,7 @@ class Output:
     def __init__(self, s3_uri=None, output_path=None, run_id=None):
         self.tool_name = None
         self.tool_version = None
+        self.output_primary_name = None
         self.database_name = None
         self.database_version = None
         self.s3_uri = s3_uri
@@ -32,6 +34,7 @@ class Output:
         self.output_file_paths = None
         self.run_id = run_id
         self.last_status = None
+        self.metrics = None
 
     def __repr__(self):
         return str(self.__dict__)
@@ -49,11 +52,19 @@ class Output:
         self.output_path = output_path
         self.output_file_paths = output_file_paths
 
+    def set_metrics(self, metrics):
+        """Sets the timings and byte counts of each phase of the run, as a dict (see RunMetrics.to_dict)."""
+        self.metrics = metrics
+
     def set_tool(self, tool_name=None, tool_version=None):
         """Sets the tool name and tool version for ensuring versioning and reproducibility."""
         self.tool_name = tool_name
         self.tool_version = tool_version
 
+    def set_output_primary_name(self, output_primary_name=None):
+        """Sets the output_primary_name that the tool was run with, used to find its primary output file."""
+        self.output_primary_name = output_primary_name
+
     def set_database(self, database_name=None, database_version=None):
         """Sets the database name and database version for ensuring versioning and reproducibility.
 
@@ -62,7 +73,7 @@ class Output:
         self.database_name = database_name
         self.database_version = database_version
 
-    def download(self, output_path=None, output_dir=None, skip_decompression=False):
+    def download(self, output_path=None, output_dir=None, skip_decompression=False, progress=None, transforms=None):
         if not output_path:
             if not output_dir:
                 raise ValueError("Output destination directory (output_path) must be specified.")
@@ -73,6 +84,8 @@ class Output:
             s3_uri=self.s3_uri,
             run_id=self.run_id,
             skip_decompression=skip_decompression,
+            progress=progress,
+            transforms=transforms,
         )
         return self.output_file_paths
 
@@ -87,3 +100,104 @@ class Output:
             raise ValueError("Cannot get status on an output that has no run_id")
         self.refresh_status(**kwargs)
         return self.last_status
+
+    def get_output_file_path(self, file_name):
+        """Returns the local path of the output file named `file_name`, searching subdirectories of the output path.
+
+        :param file_name: Name of an output file (e.g. "kraken2_report.txt").
+        """
+        output_file_paths = self.output_file_paths
+        if isinstance(output_file_paths, str):
+            output_file_paths = [output_file_paths]
+        for output_file_path in output_file_paths or []:
+            if os.path.basename(output_file_path) == file_name:
+                return output_file_path
+        if self.output_path and os.path.isdir(self.output_path):
+            # Archives are often unpacked into subdirectories, e.g. "output/quant.sf"
+            for directory_path, directory_names, file_names in os.walk(self.output_path):
+                directory_names.sort()
+                if file_name in file_names:
+                    return os.path.join(directory_path, file_name)
+        raise FileNotFoundError(f"No local output file named {file_name}. Download the output first.")
+
+    def load_kraken2_report(self):
+        """Loads the Kraken2 report of a kraken2 run as typed columns. Requires NumPy (the `analysis` extra).
+        Returns a Kraken2Report (see toolchest_client.files.kraken2).
+        """
+        from toolchest_client.files.kraken2 import KRAKEN2_REPORT_FILE_NAME, load_kraken2_report
+
+        return load_kraken2_report(self.get_output_file_path(KRAKEN2_REPORT_FILE_NAME))
+
+    def iter_kraken2_output(self, **kwargs):
+        """Yields chunks of the per-read classifications of a kraken2 run as typed columns. Requires NumPy (the
+        `analysis` extra). See `toolchest_client.files.kraken2.iter_kraken2_output` for keyword arguments.
+        """
+        from toolchest_client.files.kraken2 import KRAKEN2_OUTPUT_FILE_NAME, iter_kraken2_output
+
+        return iter_kraken2_output(self.get_output_file_path(KRAKEN2_OUTPUT_FILE_NAME), **kwargs)
+
+    def summarize_kraken2_output(self, **kwargs):
+        """Counts the reads and bases assigned directly to each taxon by a kraken2 run. Requires NumPy (the
+        `analysis` extra). Returns a Kraken2OutputSummary (see toolchest_client.files.kraken2).
+        """
+        from toolchest_client.files.kraken2 import KRAKEN2_OUTPUT_FILE_NAME, summarize_kraken2_output
+
+        return summarize_kraken2_output(self.get_output_file_path(KRAKEN2_OUTPUT_FILE_NAME), **kwargs)
+
+    def iter_alignments(self, **kwargs):
+        """Yields chunks of the alignments of a blastn, diamond_blastp, diamond_blastx, rapsearch2, or lastal5 run
+        as typed columns. Requires NumPy (the `analysis` extra). The alignments file is found from the tool and its
+        output_primary_name.
+        See `toolchest_client.files.alignments.iter_alignments` for keyword arguments (e.g. `max_evalue`,
+        `min_identity`, and `best_hits`).
+        """
+        from toolchest_client.files.alignments import iter_alignments
+
+        return iter_alignments(self._get_alignments_file_path(), **kwargs)
+
+    def load_alignments(self, **kwargs):
+        """Loads the alignments of a blastn, diamond_blastp, diamond_blastx, rapsearch2, or lastal5 run as typed
+        columns. Requires NumPy (the `analysis` extra). Returns an Alignments (see toolchest_client.files.alignments).
+        See `toolchest_client.files.alignments.iter_alignments` for keyword arguments.
+        """
+        from toolchest_client.files.alignments import load_alignments
+
+        return load_alignments(self._get_alignments_file_path(), **kwargs)
+
+    def _get_alignments_file_path(self):
+        from toolchest_client.files.alignments import get_alignments_file_name
+
+        return self.get_output_file_path(get_alignments_file_name(self.tool_name, self.output_primary_name))
+
+    def get_sam_stats(self, **kwargs):
+        """Computes samtools flagstat-like statistics and per-reference counts of the SAM output of a STAR, bowtie2,
+        or shogun_align run, in one pass. Requires NumPy (the `analysis` extra). Returns a SamStats (see
+        toolchest_client.files.sam).
+        See `toolchest_client.files.sam.read_sam_stats` for keyword arguments.
+        """
+        from toolchest_client.files.sam import read_sam_stats
+
+        return read_sam_stats(self._get_sam_file_path(), **kwargs)
+
+    def filter_sam(self, filtered_output_path, exclude_flags=None, **kwargs):
+        """Writes the records of the SAM output of a STAR, bowtie2, or shogun_align run that pass filters to a new SAM
+        file, like `samtools view`. Requires NumPy (the `analysis` extra). Returns a SamStats of the unfiltered output.
+
+        :param filtered_output_path: Path to which the header and filtered records are written.
+        :param exclude_flags: (optional) Only write records with none of these FLAG bits set. Defaults to
+            unmapped reads (0x4).
+        See `toolchest_client.files.sam.read_sam_stats` for other keyword arguments.
+        """
+        from toolchest_client.files.sam import read_sam_stats, UNMAPPED
+
+        return read_sam_stats(
+            self._get_sam_file_path(),
+            filtered_output_path=filtered_output_path,
+            exclude_flags=UNMAPPED if exclude_flags is None else exclude_flags,
+            **kwargs,
+        )
+
+    def _get_sam_file_path(self):
+        from toolchest_client.files.sam import get_sam_file_name
+
+        return self.get_output_file_path(get_sam_file_name(self.tool_name, self.output_primary_name))
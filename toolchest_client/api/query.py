@@ -8,26 +8,26 @@ tools. These queries are handled by the Toolchest (server) API.
 from loguru import logger
 import os
 import sys
-import time
 from urllib.parse import urlparse
 
-import boto3
 import requests
-import docker
 from requests.exceptions import HTTPError
-from docker.errors import ImageNotFound, DockerException, APIError
 
 from toolchest_client.api.auth import get_headers
+from toolchest_client.api.docker_push import push_docker_image
 from toolchest_client.api.download import download, get_download_details
 from toolchest_client.api.exceptions import ToolchestJobError, ToolchestException, ToolchestDownloadError
+from toolchest_client.api.metrics import RunMetrics
 from toolchest_client.api.output import Output
+from toolchest_client.api.status_monitor import get_status_monitor
 from toolchest_client.api.streaming import StreamingClient
 from toolchest_client.api.urls import get_pipeline_segment_instances_url
-from toolchest_client.files import OutputType, path_is_s3_uri, path_is_http_url, path_is_accessible_ftp_url
-from toolchest_client.logging import get_log_level
+from toolchest_client.files import InputLocation, InputResolver, OutputType, path_is_s3_uri
+from toolchest_client.progress import get_progress_reporter
+from toolchest_client.tracing import set_attributes, span, traced_request
 from .instance_type import InstanceType
 from .status import Status, PrettyStatus
-from ..files.s3 import UploadTracker
+from ..files.s3 import get_s3_client
 
 
 class Query:
@@ -38,16 +38,28 @@ class Query:
 
     """
 
-    # Period (in seconds) between requests when waiting for job(s) to finish executing.
+    # Period (in seconds) between status display updates when waiting for job(s) to finish executing.
+    # Status requests themselves are sent by the StatusMonitor.
     WAIT_FOR_JOB_DELAY = 1
     # Max number of retries on status check timeouts.
     RETRY_STATUS_CHECK_LIMIT = 5
+    # Timeout (in seconds) of each status request, so that a stalled request doesn't hold up the
+    # StatusMonitor, which polls every query in the process from one thread.
+    STATUS_REQUEST_TIMEOUT_SECONDS = 10
 
     def __init__(self, is_async=False, pipeline_segment_instance_id=None,
-                 streaming_enabled=False):
+                 streaming_enabled=False, input_resolver=None, metrics=None, progress=None,
+                 stream_to=None):
         # Configure Toolchest API authorization.
         self.headers = get_headers()
 
+        # Reuses input classification (and remote metadata) from preflight, if given
+        self.input_resolver = input_resolver or InputResolver()
+        # Phase timings are shared with the Tool running this query, if given
+        self.metrics = metrics or RunMetrics()
+        # Reports transfer progress and job status (see toolchest_client.progress)
+        self.progress_reporter = get_progress_reporter(progress)
+
         if pipeline_segment_instance_id:
             self.pipeline_segment_instance_id = pipeline_segment_instance_id
             self.pipeline_segment_instance_url = "/".join([
@@ -78,7 +90,7 @@ class Query:
         self.output = Output()
 
         self.streaming_enabled = streaming_enabled
-        self.streaming_client = StreamingClient()
+        self.streaming_client = StreamingClient(stream_to=stream_to)
         self.streaming_asyncio_task = None
 
     def run_query(self, tool_name, tool_version, input_prefix_mapping,
@@ -147,6 +159,7 @@ class Query:
         self.mark_as_failed = True
 
         self.pipeline_segment_instance_id = create_content["id"]
+        set_attributes({"toolchest.run_id": self.pipeline_segment_instance_id})
         self.pipeline_segment_instance_url = "/".join([
             get_pipeline_segment_instances_url(),
             self.pipeline_segment_instance_id
@@ -165,14 +178,20 @@ class Query:
             tool_name=tool_name,
             tool_version=tool_version,
         )
+        self.output.set_output_primary_name(output_primary_name)
         self.output.set_database(
             database_name=create_content.get("database_name"),
             database_version=create_content.get("database_version"),
         )
 
         self._update_pretty_status(PrettyStatus.UPLOADING)
-        self._upload(input_files, input_prefix_mapping, input_is_compressed)
-        self._upload_docker_image(custom_docker_image_id)
+        with self.metrics.phase("upload") as upload_phase:
+            self._upload(input_files, input_prefix_mapping, input_is_compressed, upload_phase)
+        if custom_docker_image_id is not None:
+            with self.metrics.phase("upload_docker_image") as docker_upload_phase:
+                push_result = self._upload_docker_image(custom_docker_image_id)
+                if push_result is not None:
+                    docker_upload_phase.add_bytes(push_result.pushed_bytes)
         self._update_status(Status.TRANSFERRED_FROM_CLIENT)
 
         self._update_pretty_status(PrettyStatus.EXECUTING)
@@ -180,7 +199,12 @@ class Query:
         if self.is_async:
             return self.output
 
-        self._wait_for_job()
+        with self.metrics.phase("wait_for_job"), \
+                span("toolchest.wait_for_job", {"toolchest.run_id": self.pipeline_segment_instance_id}) as wait_span:
+            try:
+                self._wait_for_job()
+            finally:
+                wait_span.set_attribute("toolchest.retries", self.status_check_retries)
 
         self._download(output_path, output_type, skip_decompression)
 
@@ -229,7 +253,8 @@ class Query:
             "provider": provider,
         }
 
-        create_response = requests.post(
+        create_response = traced_request(
+            requests.post,
             get_pipeline_segment_instances_url(),
             headers=self.headers,
             json=create_body,
@@ -254,7 +279,8 @@ class Query:
             'update-file-size'
         ])
 
-        response = requests.put(
+        response = traced_request(
+            requests.put,
             update_file_size_url,
             headers=self.headers,
         )
@@ -270,15 +296,17 @@ class Query:
             'input-files'
         ])
         file_name = os.path.basename(input_file_path)
-        input_is_in_s3 = path_is_s3_uri(input_file_path)
-        input_is_http_url = path_is_http_url(input_file_path)
-        input_is_ftp_url = path_is_accessible_ftp_url(input_file_path)
+        input_location = self.input_resolver.get(input_file_path).location
+        input_is_in_s3 = input_location == InputLocation.S3
+        input_is_http_url = input_location == InputLocation.HTTP
+        input_is_ftp_url = input_location == InputLocation.FTP
         if input_is_http_url:
             url_path = urlparse(input_file_path).path
             file_name = os.path.basename(url_path)
         if input_is_in_s3:
             file_name = os.path.basename(input_file_path.rstrip("/"))
-        response = requests.post(
+        response = traced_request(
+            requests.post,
             register_input_file_url,
             headers=self.headers,
             json={
@@ -308,21 +336,22 @@ class Query:
                 "file_id": response_json.get('file_id'),
             }
 
-    def _upload(self, input_file_paths, input_prefix_mapping, input_is_compressed):
-        """Uploads the files at ``input_file_paths`` to Toolchest."""
+    def _upload(self, input_file_paths, input_prefix_mapping, input_is_compressed, upload_phase=None):
+        """Uploads the files at ``input_file_paths`` to Toolchest.
+        If given, the number of uploaded bytes is added to the PhaseMetrics ``upload_phase``.
+        """
 
         logger.debug("Starting to upload files")
         self._update_status(Status.TRANSFERRING_FROM_CLIENT)
 
+        self.input_resolver.resolve(input_file_paths)
         for file_path in input_file_paths:
-            input_is_in_s3 = path_is_s3_uri(file_path)
-            input_is_http_url = path_is_http_url(file_path)
-            input_is_ftp_url = path_is_accessible_ftp_url(file_path)
+            input_is_remote = self.input_resolver.get(file_path).is_remote
             input_prefix_details = input_prefix_mapping.get(file_path)
             input_prefix = input_prefix_details.get("prefix") if input_prefix_details else None
             input_order = input_prefix_details.get("order") if input_prefix_details else None
             # If the file is already in S3, there is no need to upload.
-            if input_is_in_s3 or input_is_http_url or input_is_ftp_url:
+            if input_is_remote:
                 # Registers the file in the internal DB.
                 self._register_input_file(
                     input_file_path=file_path,
@@ -340,19 +369,28 @@ class Query:
                 )
 
                 try:
-                    s3_client = boto3.client(
-                        's3',
-                        aws_access_key_id=input_file_keys["access_key_id"],
-                        aws_secret_access_key=input_file_keys["secret_access_key"],
-                        aws_session_token=input_file_keys["session_token"],
-                    )
-                    s3_client.upload_file(
-                        file_path,
-                        input_file_keys["bucket"],
-                        input_file_keys["object_name"],
-                        Callback=UploadTracker(file_path)
-                    )
+                    file_size = os.path.getsize(file_path)
+                    with span("toolchest.s3.upload", {
+                        "toolchest.run_id": self.pipeline_segment_instance_id,
+                        "toolchest.bytes": file_size,
+                        "s3.bucket": input_file_keys["bucket"],
+                        "s3.key": input_file_keys["object_name"],
+                    }):
+                        s3_client = get_s3_client(input_file_keys)
+                        with self.progress_reporter.tracked_transfer(
+                            "upload",
+                            os.path.basename(file_path),
+                            file_size,
+                        ) as upload_tracker:
+                            s3_client.upload_file(
+                                file_path,
+                                input_file_keys["bucket"],
+                                input_file_keys["object_name"],
+                                Callback=upload_tracker,
+                            )
                     self._update_file_size(input_file_keys["file_id"])
+                    if upload_phase:
+                        upload_phase.add_bytes(file_size)
                 except Exception as e:
                     self._update_status_to_failed(
                         f"{e} \n\nInput file upload failed for file at {file_path}.",
@@ -363,6 +401,10 @@ class Query:
     def _upload_docker_image(self, custom_docker_image_id):
         if custom_docker_image_id is None:
             return
+        # docker is slow to import, so it's only imported when pushing an image
+        import docker
+        from docker.errors import ImageNotFound, DockerException, APIError
+
         try:  # Try to get the image before creating a repository.
             client = docker.from_env()
             image = client.images.get(custom_docker_image_id)
@@ -377,7 +419,8 @@ class Query:
             'docker-image'
         ])
 
-        response = requests.post(
+        response = traced_request(
+            requests.post,
             register_input_file_url,
             headers=self.headers,
             json={
@@ -400,34 +443,20 @@ class Query:
         }
         try:
             registry = f"{aws_info['aws_account_id']}.dkr.ecr.{aws_info['region']}.amazonaws.com"
-            client.login(
-                username="AWS",
-                password=aws_info['ecr_session_password'],
-                registry=registry,
-            )
             docker_image_name_and_tag = custom_docker_image_id.split(':')
             docker_tag = docker_image_name_and_tag[1] if len(docker_image_name_and_tag) > 1 else 'latest'
-            image_id = f"{registry}/{aws_info['repository_name']}:{docker_tag}"
-            image.tag(image_id, docker_tag)
-            push_output = client.api.push(
-                image_id,
+            push_result = push_docker_image(
+                client,
+                image,
+                registry=registry,
+                repository=aws_info['repository_name'],
                 tag=docker_tag,
-                stream=True,
-                decode=True,
+                password=aws_info['ecr_session_password'],
+                progress_reporter=self.progress_reporter,
             )
-            counter = 0
-            for update in push_output:
-                if 'errorDetail' in update:
-                    raise ToolchestJobError("Failed to push image.")
-                # Print doesn't work on some consoles, like the JetBrains suite
-                if counter % 10 == 0:
-                    dots = '*' * (((counter // 10) % 10) + 1)
-                    sys.stdout.write(
-                        f"\rDocker image uploading ({dots})",
-                    )
-                    sys.stdout.flush()
-                counter += 1
-            logger.info("\rDocker image uploaded")
+            self.progress_reporter.clear()
+            logger.info(push_result.format_summary())
+            return push_result
         except APIError:
             raise EnvironmentError('Unable to access ECR at this time. '
                                    'Contact Toolchest support if this error persists')
@@ -444,7 +473,8 @@ class Query:
         Returns the response from the PUT request.
         """
 
-        response = requests.put(
+        response = traced_request(
+            requests.put,
             self.status_url,
             headers=self.headers,
             json={"status": new_status},
@@ -454,6 +484,7 @@ class Query:
         except HTTPError:
             logger.error("Job status update failed.", file=sys.stderr)
             self._raise_for_failed_response(response)
+        self.metrics.observe_status(new_status)
 
         self.output.refresh_status()
         return response
@@ -469,7 +500,8 @@ class Query:
 
         # Mark pipeline segment instance as failed
         if self.status_url:
-            requests.put(
+            traced_request(
+                requests.put,
                 self.status_url,
                 headers=self.headers,
                 json={"status": Status.FAILED, "error_message": error_message},
@@ -501,66 +533,57 @@ class Query:
                     )
                 raise ToolchestJobError(response_body["error"]) from None
 
-    def _pretty_print_query_status(self, dots):
-        """Prints output of each job, supporting one query-associated job.
+    def _report_query_status(self):
+        """Reports the status of the job, supporting one query-associated job.
 
-        Looks like: Running job (ID: 13a0f434-a19f-4a52-899a-42c85de9b97e) | Duration: 0:03:15 | Status: downloading
+        With the default reporter, looks like: Status: EXECUTING (***)
         """
-
-        # The below duration is for display only, this is a hacky way to truncate the microseconds
-
-        # Jupyter notebooks and Windows don't always support the canonical "clear-to-end-of-line" escape sequence
-        max_length = 120
-        status_message = f"Status: {self.pretty_status.name} ({dots}) "
-        # Not using logger here, because this is analogous to a progress bar – and logger doesn't respect \r
-        if get_log_level() in ["DEBUG", "INFO"]:
-            sys.stdout.write(
-                f"\r{status_message}".ljust(max_length),
-            )
-            sys.stdout.flush()
+        self.progress_reporter.report_status(self.pipeline_segment_instance_id, self.pretty_status)
 
     def _wait_for_job(self):
-        """Waits for query task(s) to finish executing."""
+        """Waits for query task(s) to finish executing.
+
+        Statuses are polled by the process-wide StatusMonitor, which rate-limits status
+        requests across all queries running in the process.
+        """
         status = self.get_job_status()
         logger.debug("Waiting for job to finish")
-        counter = 0
-        interval = 10
         logger.info(
             f"You can view the running job at https://dash.trytoolchest.com/runs/{self.pipeline_segment_instance_id}"
         )
 
-        while status not in [Status.READY_TO_TRANSFER_TO_CLIENT, Status.TERMINATED, Status.COMPLETE]:
-            try:
-                # Set up output streaming upon transition to executing
-                if status == Status.EXECUTING and self.streaming_client and not self.streaming_client.initialized:
-                    self._setup_streaming()
-                if self.streaming_client.ready_to_start and not self.streaming_client.stream_is_open:
-                    # Clear status message before pausing
-                    sys.stdout.write(
-                        "\r",
-                    )
-                    sys.stdout.flush()
-                    logger.info(
-                        "Pausing job status updates soon. Will resume once standard output streaming is complete."
-                    )
-                    self.streaming_client.stream()
-                if counter == interval - 1:
-                    status_response = self.get_job_status(return_error=True)
-                    status = status_response['status']
-                    if status == Status.FAILED:
-                        raise ToolchestJobError(status_response['error_message'])
-            except TimeoutError as err:
-                self.status_check_retries += 1
-                if self.status_check_retries > self.RETRY_STATUS_CHECK_LIMIT:
-                    raise ToolchestJobError("Status check timed out during execution, retry limit exceeded.") from err
-            counter = (counter + 1) % interval
-            if not self.streaming_client or not self.streaming_client.stream_is_open:
-                self._pretty_print_query_status('*' * (counter + 1))
-            time.sleep(self.WAIT_FOR_JOB_DELAY)
-        sys.stdout.write(
-            "\r",
-        )
-        sys.stdout.flush()
+        status_monitor = get_status_monitor()
+        status_monitor.watch(self, status=status)
+        try:
+            while status not in [Status.READY_TO_TRANSFER_TO_CLIENT, Status.TERMINATED, Status.COMPLETE]:
+                try:
+                    # Set up output streaming upon transition to executing
+                    if status == Status.EXECUTING and self.streaming_client and not self.streaming_client.initialized:
+                        self._setup_streaming()
+                    if self.streaming_client.ready_to_start and not self.streaming_client.stream_is_open:
+                        # Clear status message before pausing
+                        self.progress_reporter.clear()
+                        logger.info(
+                            "Pausing job status updates soon. Will resume once standard output streaming is complete."
+                        )
+                        self.streaming_client.stream()
+                    # Wakes up when the status changes, or after the delay to update the status display
+                    status_response = status_monitor.wait_for_status_change(self, timeout=self.WAIT_FOR_JOB_DELAY)
+                    if status_response is not None:
+                        status = status_response['status']
+                        if status == Status.FAILED:
+                            raise ToolchestJobError(status_response['error_message'])
+                except TimeoutError as err:
+                    self.status_check_retries += 1
+                    if self.status_check_retries > self.RETRY_STATUS_CHECK_LIMIT:
+                        raise ToolchestJobError(
+                            "Status check timed out during execution, retry limit exceeded."
+                        ) from err
+                if not self.streaming_client or not self.streaming_client.stream_is_open:
+                    self._report_query_status()
+        finally:
+            status_monitor.unwatch(self)
+        self.progress_reporter.clear()
         logger.info("Run finished")
 
     def _download(self, output_path, output_type, skip_decompression):
@@ -575,9 +598,12 @@ class Query:
                 self._update_status(Status.TRANSFERRING_TO_CLIENT)
                 self.unpacked_output_file_paths = download(
                     output_path=output_path,
+                    run_id=self.pipeline_segment_instance_id,
                     output_file_keys=output_file_keys,
                     output_type=output_type,
                     skip_decompression=skip_decompression,
+                    metrics=self.metrics,
+                    progress=self.progress_reporter,
                 )
                 self._update_status(Status.TRANSFERRED_TO_CLIENT)
         except ToolchestDownloadError as err:
@@ -595,12 +621,20 @@ class Query:
             )
 
     def get_job_status(self, return_error=False):
-        """Gets status of current job (tasks)."""
+        """Gets status of current job (tasks).
 
-        response = requests.get(
-            self.status_url,
-            headers=self.headers
-        )
+        Raises a TimeoutError if the status request times out, which is retried while waiting for the job.
+        """
+
+        try:
+            response = traced_request(
+                requests.get,
+                self.status_url,
+                headers=self.headers,
+                timeout=self.STATUS_REQUEST_TIMEOUT_SECONDS,
+            )
+        except requests.exceptions.Timeout as err:
+            raise TimeoutError(f"Status request timed out after {self.STATUS_REQUEST_TIMEOUT_SECONDS} seconds") from err
         try:
             response.raise_for_status()
         except HTTPError:
@@ -608,12 +642,16 @@ class Query:
             # Assumes a job has already been marked as failed if failure is detected after execution begins.
             self.mark_as_failed = False
             self._raise_for_failed_response(response)
+        response_json = response.json()
+        if response_json.get("status"):
+            self.metrics.observe_status(response_json["status"])
         if return_error:
-            return response.json()
-        return response.json()["status"]
+            return response_json
+        return response_json["status"]
 
     def _setup_streaming(self):
-        get_attrs_response = requests.get(
+        get_attrs_response = traced_request(
+            requests.get,
             self.streaming_attributes_url,
             headers=self.headers,
         )
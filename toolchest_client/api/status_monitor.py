@@ -0,0 +1,205 @@
+"""
+toolchest_client.api.status_monitor
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides a process-wide StatusMonitor, which polls the status of
+every waiting query from one background thread.
+
+Status requests for all queries share one token-bucket rate limiter, so running
+many jobs concurrently (e.g. from threads) stays within the API's rate guidance
+of one status request per second. Each waiting query is woken when its status
+changes.
+"""
+import threading
+import time
+
+from loguru import logger
+
+# Rate at which status requests are sent, across all queries in the process.
+STATUS_REQUESTS_PER_SECOND = 1.0
+# Minimum time (in seconds) between status requests for the same query.
+STATUS_POLL_INTERVAL_SECONDS = 10
+
+
+class TokenBucket:
+    """A thread-safe token-bucket rate limiter.
+
+    :param rate: Tokens added per second.
+    :param capacity: Maximum number of tokens, i.e. the largest burst allowed.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Takes a token, sleeping until one is available."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_seconds = (1 - self._tokens) / self.rate
+            time.sleep(wait_seconds)
+
+
+class _StatusWatch:
+    """Polling state of one query watched by a StatusMonitor."""
+
+    def __init__(self, query, lock, next_poll_at, on_status_change=None):
+        self.query = query
+        self.next_poll_at = next_poll_at
+        self.on_status_change = on_status_change
+        self.status = None
+        self.response = None
+        self.error = None
+        self.num_updates = 0  # incremented on each status change (or error)
+        self.num_updates_seen = 0
+        self.updated = threading.Condition(lock)
+
+    def __repr__(self):
+        return str(self.__dict__)
+
+
+class StatusMonitor:
+    """Polls the status of all watched queries from one background thread.
+
+    Usage::
+
+        >>> status_monitor = get_status_monitor()
+        >>> status_monitor.watch(query)
+        >>> status_response = status_monitor.wait_for_status_change(query, timeout=1)  # None if unchanged
+        >>> status_monitor.unwatch(query)
+        >>> # Or, to be called back on each status change:
+        >>> status_monitor.watch(query, on_status_change=lambda response, error: ...)
+
+    :param requests_per_second: Rate at which status requests are sent, across all watched queries.
+    :param poll_interval_seconds: Minimum time between status requests for the same query.
+    """
+
+    def __init__(self, requests_per_second=STATUS_REQUESTS_PER_SECOND,
+                 poll_interval_seconds=STATUS_POLL_INTERVAL_SECONDS):
+        self.poll_interval_seconds = poll_interval_seconds
+        self._rate_limiter = TokenBucket(requests_per_second)
+        self._watches = dict()  # query -> _StatusWatch
+        self._lock = threading.Lock()
+        self._watches_changed = threading.Condition(self._lock)
+        self._thread = None
+
+    def __len__(self):
+        return len(self._watches)
+
+    def watch(self, query, status=None, poll_now=False, on_status_change=None):
+        """Starts polling the status of `query`. Its first status request is sent after the poll interval.
+
+        :param query: A Query with a `get_job_status()` method.
+        :param status: (optional) The query's current status. Only changes from it are reported.
+        :param poll_now: Whether to send the first status request right away (still subject to the rate limit).
+        :param on_status_change: (optional) Function called with the status response and error (one of which is
+            None) on each status change or error, from the monitor's thread. It should return quickly.
+        """
+        with self._lock:
+            next_poll_at = time.monotonic() + (0 if poll_now else self.poll_interval_seconds)
+            watch = _StatusWatch(query, self._lock, next_poll_at, on_status_change)
+            watch.status = status
+            self._watches[query] = watch
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._poll, name="toolchest-status-monitor", daemon=True)
+                self._thread.start()
+            self._watches_changed.notify()
+
+    def unwatch(self, query):
+        """Stops polling the status of `query`."""
+        with self._lock:
+            self._watches.pop(query, None)
+            self._watches_changed.notify()
+
+    def wait_for_status_change(self, query, timeout=None):
+        """Waits for the status of a watched query to change.
+
+        Returns the status response (as returned by `query.get_job_status(return_error=True)`), or None
+        if the status didn't change within `timeout` seconds. Errors raised while getting the status are
+        raised here.
+
+        :param query: A watched Query.
+        :param timeout: (optional) Maximum time to wait, in seconds.
+        """
+        with self._lock:
+            watch = self._watches[query]
+            if not watch.updated.wait_for(lambda: watch.num_updates > watch.num_updates_seen, timeout):
+                return None
+            watch.num_updates_seen = watch.num_updates
+            error, watch.error = watch.error, None
+            if error is not None:
+                raise error
+            return watch.response
+
+    def _poll(self):
+        """Sends status requests for watched queries, each at most once per poll interval, until none are left."""
+        try:
+            self._poll_watches()
+        finally:
+            with self._lock:
+                # Lets the next watch start a new thread, even if this one stopped unexpectedly
+                if self._thread is threading.current_thread():
+                    self._thread = None
+
+    def _poll_watches(self):
+        while True:
+            with self._lock:
+                if not self._watches:
+                    self._thread = None
+                    return
+                watch = min(self._watches.values(), key=lambda next_watch: next_watch.next_poll_at)
+                wait_seconds = watch.next_poll_at - time.monotonic()
+                if wait_seconds > 0:
+                    # Woken early if a query is watched or unwatched
+                    self._watches_changed.wait(wait_seconds)
+                    continue
+
+            self._rate_limiter.acquire()
+            with self._lock:
+                if self._watches.get(watch.query) is not watch:
+                    continue  # unwatched while waiting for the rate limiter
+
+            response, error = None, None
+            try:
+                response = watch.query.get_job_status(return_error=True)
+            except Exception as err:
+                error = err
+
+            with self._lock:
+                watch.next_poll_at = time.monotonic() + self.poll_interval_seconds
+                if error is None and response["status"] == watch.status:
+                    continue
+                if error is None:
+                    watch.status = response["status"]
+                watch.response, watch.error = response, error
+                watch.num_updates += 1
+                watch.updated.notify_all()
+                is_watched = self._watches.get(watch.query) is watch
+            if is_watched and watch.on_status_change is not None:
+                try:
+                    watch.on_status_change(response, error)
+                except Exception as err:
+                    # A failing callback (e.g. of a watcher whose event loop has closed) can't stop other queries' polls
+                    logger.error(f"Status change callback failed: {err!r}")
+
+
+_status_monitor = None
+_status_monitor_lock = threading.Lock()
+
+
+def get_status_monitor():
+    """Returns the process-wide StatusMonitor."""
+    global _status_monitor
+    with _status_monitor_lock:
+        if _status_monitor is None:
+            _status_monitor = StatusMonitor()
+        return _status_monitor
@@ -0,0 +1,172 @@
+"""
+toolchest_client.api.stream_sinks
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides sinks for output streamed from a running tool: the console
+(the default), a file or rotating log, a user callback, or an async iterator.
+
+Sinks receive batches of streamed text from a background thread, so a slow sink
+doesn't block the connection receiving the stream.
+"""
+import abc
+import asyncio
+import os
+import sys
+import threading
+
+
+class StreamSink(abc.ABC):
+    """Base class of stream sinks. Subclasses implement `write()`."""
+
+    @abc.abstractmethod
+    def write(self, text):
+        """Writes a batch of streamed text."""
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class ConsoleSink(StreamSink):
+    """Writes streamed output to stdout (or another stream).
+
+    :param stream: (optional) Stream to write to. Defaults to stdout.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream
+
+    def write(self, text):
+        # Not using logger here, because streamed output is already formatted
+        (self.stream or sys.stdout).write(text)
+
+    def flush(self):
+        (self.stream or sys.stdout).flush()
+
+
+class FileSink(StreamSink):
+    """Appends streamed output to a file. If `max_bytes` is given, the file is rotated like a log:
+    when it would exceed `max_bytes`, it's renamed to `path.1` (and `path.1` to `path.2`, and so on).
+
+    :param path: Path of the file.
+    :param max_bytes: (optional) Maximum size of the file before it's rotated.
+    :param backup_count: Number of rotated files kept.
+    :param encoding: Encoding of the file.
+    """
+
+    def __init__(self, path, max_bytes=None, backup_count=5, encoding="utf-8"):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.encoding = encoding
+        self._file = None
+
+    def write(self, text):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = open(self.path, "a", encoding=self.encoding)
+        if self.max_bytes and self._file.tell() > 0 and self._file.tell() + len(text) > self.max_bytes:
+            self._rotate()
+        self._file.write(text)
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _rotate(self):
+        self._file.close()
+        for backup_number in range(self.backup_count - 1, 0, -1):
+            backup_path = f"{self.path}.{backup_number}"
+            if os.path.exists(backup_path):
+                os.replace(backup_path, f"{self.path}.{backup_number + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, "w", encoding=self.encoding)
+
+
+class CallbackSink(StreamSink):
+    """Calls a function with each batch of streamed text.
+
+    :param callback: Function called with each batch (a string).
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def write(self, text):
+        self.callback(text)
+
+
+class AsyncIteratorSink(StreamSink):
+    """Makes streamed output available as an async iterator, in the event loop it was created in.
+
+    Output streaming runs its own event loop, so the tool must be run in another thread::
+
+        >>> async def print_output():
+        ...     sink = AsyncIteratorSink()
+        ...     run = asyncio.get_running_loop().run_in_executor(None, lambda: toolchest.python3(
+        ...         script="script.py", stream_to=sink,
+        ...     ))
+        ...     async for text in sink:
+        ...         print(text, end="")
+        ...     await run
+
+    Iteration ends when the stream closes. If the iterating code falls behind by `max_batches`
+    batches, writing blocks until it catches up.
+
+    :param loop: (optional) Event loop in which the sink is iterated. Defaults to the running loop.
+    :param max_batches: Maximum number of batches held for the iterating code.
+    """
+
+    _END_OF_STREAM = object()
+
+    def __init__(self, loop=None, max_batches=1024):
+        self.loop = loop or asyncio.get_event_loop()
+        self._queue = asyncio.Queue(maxsize=max_batches)
+        self._closed = threading.Event()
+
+    def write(self, text):
+        self._put(text)
+
+    def close(self):
+        if not self._closed.is_set():
+            self._closed.set()
+            self._put(self._END_OF_STREAM)
+
+    def _put(self, item):
+        if self.loop.is_closed():
+            return
+        asyncio.run_coroutine_threadsafe(self._queue.put(item), self.loop).result()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        text = await self._queue.get()
+        if text is self._END_OF_STREAM:
+            raise StopAsyncIteration
+        return text
+
+
+def get_stream_sink(stream_to=None):
+    """Returns a StreamSink for the `stream_to` argument of a Toolchest function.
+
+    :param stream_to: (optional) A StreamSink; a path, to which output is appended; or a function,
+        which is called with each batch of output. Defaults to the console.
+    """
+    if stream_to is None:
+        return ConsoleSink()
+    if isinstance(stream_to, StreamSink):
+        return stream_to
+    if isinstance(stream_to, (str, os.PathLike)):
+        return FileSink(stream_to)
+    if callable(stream_to):
+        return CallbackSink(stream_to)
+    raise ValueError(f"Invalid stream destination: {stream_to}. Must be a StreamSink, path, or function.")
@@ -3,15 +3,96 @@ toolchest_client.api.streaming
 ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
 This module provides a StreamingClient object, used by Toolchest queries to
-receive and print output lines streamed from the Toolchest server.
+receive output lines streamed from the Toolchest server and pass them to a
+stream sink (by default, the console).
 """
 import asyncio
+import codecs
 from loguru import logger
+import random
 import ssl
 import sys
 
-import websockets
-from websockets.exceptions import ConnectionClosed
+from toolchest_client.tracing import span
+from .stream_sinks import get_stream_sink
+
+# Buffered output is written to the sink once it reaches this many characters...
+STREAM_FLUSH_SIZE = 64 * 1024
+# ... or once it's been buffered for this many seconds.
+STREAM_FLUSH_INTERVAL_SECONDS = 0.2
+# If the sink falls behind by this many characters, receiving pauses until it catches up.
+STREAM_MAX_BUFFERED_SIZE = 16 * 1024 * 1024
+# Header with the byte offset from which output is streamed, in requests (when reconnecting) and responses.
+STREAM_OFFSET_HEADER = "X-Toolchest-Stream-Offset"
+
+
+class StreamBuffer:
+    """Batches streamed output and writes it to a sink in a background thread.
+
+    Output is flushed to the sink when the buffer reaches `flush_size` characters, or when
+    output has been buffered for `flush_interval_seconds`. Writes happen off the event loop,
+    so a slow sink doesn't block receiving. If the sink falls behind by `max_buffered_size`
+    characters, `put()` waits for it to catch up, which slows down the stream from the server.
+
+    :param sink: StreamSink to which output is written.
+    :param flush_size: Buffer size (in characters) at which output is flushed.
+    :param flush_interval_seconds: Maximum time output is buffered before being flushed.
+    :param max_buffered_size: Buffer size (in characters) at which `put()` waits for the sink.
+    """
+
+    def __init__(self, sink, flush_size=STREAM_FLUSH_SIZE, flush_interval_seconds=STREAM_FLUSH_INTERVAL_SECONDS,
+                 max_buffered_size=STREAM_MAX_BUFFERED_SIZE):
+        self.sink = sink
+        self.flush_size = flush_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_buffered_size = max_buffered_size
+        self._chunks = []
+        self._buffered_size = 0
+        self._closed = False
+        self._flush_requested = asyncio.Event()
+        self._space_available = asyncio.Event()
+        self._space_available.set()
+
+    async def put(self, text):
+        """Adds streamed output to the buffer, waiting if the sink has fallen behind."""
+        if isinstance(text, bytes):
+            text = text.decode("utf-8", errors="replace")
+        while self._buffered_size >= self.max_buffered_size:
+            self._space_available.clear()
+            await self._space_available.wait()
+        self._chunks.append(text)
+        self._buffered_size += len(text)
+        if self._buffered_size >= self.flush_size:
+            self._flush_requested.set()
+
+    def close(self):
+        """Stops accepting output. `run()` returns once buffered output is written."""
+        self._closed = True
+        self._flush_requested.set()
+
+    async def run(self):
+        """Writes buffered output to the sink until the buffer is closed, then closes the sink."""
+        loop = asyncio.get_event_loop()
+        try:
+            while not self._closed or self._chunks:
+                try:
+                    await asyncio.wait_for(self._flush_requested.wait(), self.flush_interval_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                self._flush_requested.clear()
+                if not self._chunks:
+                    continue
+                text = "".join(self._chunks)
+                self._chunks = []
+                self._buffered_size = 0
+                self._space_available.set()
+                await loop.run_in_executor(None, self._write, text)
+        finally:
+            await loop.run_in_executor(None, self.sink.close)
+
+    def _write(self, text):
+        self.sink.write(text)
+        self.sink.flush()
 
 
 class StreamingClient:
@@ -19,9 +100,25 @@ class StreamingClient:
 
     Provides an interface to output lines streamed from the server.
 
+    If the connection drops, the client reconnects with exponential backoff and asks the server
+    to resume from the number of bytes already received (sent in the ``X-Toolchest-Stream-Offset``
+    request header). A server that supports resuming replies with the offset it resumes from, in
+    the same response header; any overlap with what was already received is skipped.
+
+    :param stream_to: (optional) Where streamed output is written: a StreamSink, a path, or a function.
+        Defaults to the console. See `toolchest_client.api.stream_sinks`.
     """
 
-    def __init__(self):
+    STREAMING_USERNAME = "toolchest"
+    STREAMING_PORT = 8765
+    # Max number of consecutive failed attempts to (re)connect.
+    MAX_RECONNECT_ATTEMPTS = 6
+    # Delay before the first reconnect attempt, doubled for each further attempt.
+    RECONNECT_BASE_DELAY_SECONDS = 0.5
+    RECONNECT_MAX_DELAY_SECONDS = 30
+
+    def __init__(self, stream_to=None):
+        self.sink = get_stream_sink(stream_to)
         self.ssl_context = None
         self.streaming_token = None
         self.streaming_ip_address = None
@@ -29,6 +126,10 @@ class StreamingClient:
         self.initialized = False
         self.ready_to_start = False
         self.stream_is_open = False
+        self.stream_offset = 0  # number of bytes of output received so far
+        self.num_reconnects = 0
+        # Decodes received bytes, holding back a character split across messages until the rest of it arrives
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
 
     def initialize_params(self, streaming_token, streaming_ip_address, streaming_tls_cert):
         self.streaming_token = streaming_token
@@ -41,33 +142,102 @@ class StreamingClient:
         self.ready_to_start = True
         self.initialized = True
 
+    def get_uri(self):
+        scheme = "wss" if self.ssl_context else "ws"
+        return (f"{scheme}://{self.STREAMING_USERNAME}:{self.streaming_token}"
+                f"@{self.streaming_ip_address}:{self.STREAMING_PORT}")
+
+    def get_reconnect_delay(self, num_failed_attempts):
+        """Returns the delay before the next reconnect attempt: exponential backoff with jitter."""
+        delay = min(self.RECONNECT_MAX_DELAY_SECONDS, self.RECONNECT_BASE_DELAY_SECONDS * 2 ** num_failed_attempts)
+        return delay / 2 + random.uniform(0, delay / 2)
+
     async def receive_stream(self):
-        streaming_username = "toolchest"
-        streaming_port = "8765"
-        uri = f"wss://{streaming_username}:{self.streaming_token}@{self.streaming_ip_address}:{streaming_port}"
+        # websockets is only imported when streaming
+        import websockets
+        from websockets.exceptions import ConnectionClosedError, ConnectionClosedOK, InvalidHandshake
+
         logger.info("Connecting to remote server for streaming...")
         sys.stdout.flush()
-        retry_count = 0
-        while True:
-            try:
-                async for websocket in websockets.connect(uri, ssl=self.ssl_context):
-                    logger.debug("Connected!")
-                    try:
+        # Output is passed to the sink through a buffer, so a slow sink doesn't block receiving
+        stream_buffer = StreamBuffer(self.sink)
+        buffer_task = asyncio.ensure_future(stream_buffer.run())
+        num_failed_attempts = 0
+        has_connected = False
+        try:
+            while True:
+                try:
+                    async with websockets.connect(
+                        self.get_uri(),
+                        ssl=self.ssl_context,
+                        extra_headers={STREAM_OFFSET_HEADER: str(self.stream_offset)},
+                    ) as websocket:
+                        logger.debug("Connected!")
+                        num_failed_attempts = 0
+                        if has_connected:
+                            self.num_reconnects += 1
+                        has_connected = True
+                        position = self._get_resume_position(websocket.response_headers)
                         self.stream_is_open = True
                         while self.stream_is_open:
                             stream_lines = await websocket.recv()
-                            # Not using logger here, because I couldn't get formatting right
-                            print(stream_lines, end="")
-                    except ConnectionClosed:
-                        self.stream_is_open = False
-                        logger.debug("\nConnection closed by server.")
+                            position, stream_lines = self._skip_received_output(position, stream_lines)
+                            if stream_lines:
+                                await stream_buffer.put(stream_lines)
+                except ConnectionClosedOK:
+                    self.stream_is_open = False
+                    logger.debug("\nConnection closed by server.")
+                    return
+                except (ConnectionClosedError, InvalidHandshake, OSError, asyncio.TimeoutError) as err:
+                    self.stream_is_open = False
+                    num_failed_attempts += 1
+                    if num_failed_attempts > self.MAX_RECONNECT_ATTEMPTS:
+                        if not has_connected:
+                            raise RuntimeError(
+                                "Can't connect to server. Try disabling output streaming and re-running."
+                            ) from err
+                        logger.warning("Lost connection to the output stream. The rest of the output won't be shown.")
                         return
-            except ConnectionRefusedError:
-                retry_count += 1
-                if retry_count > 3:
-                    raise RuntimeError("Can't connect to server. Try disabling output streaming and re-running.")
-                else:
-                    continue
+                    reconnect_delay = self.get_reconnect_delay(num_failed_attempts - 1)
+                    logger.debug(f"Output stream disconnected ({err}). Reconnecting in {reconnect_delay:.1f}s.")
+                    await asyncio.sleep(reconnect_delay)
+        finally:
+            remaining_text = self._decoder.decode(b"", final=True)
+            if remaining_text:
+                await stream_buffer.put(remaining_text)
+            stream_buffer.close()
+            await buffer_task
+
+    def _get_resume_position(self, response_headers):
+        """Returns the stream offset from which the server sends output on this connection."""
+        resume_offset = response_headers.get(STREAM_OFFSET_HEADER)
+        if resume_offset is None:
+            if self.stream_offset:
+                logger.warning("The streaming server can't resume output, so some output may be missing.")
+                self._decoder.reset()  # the output doesn't continue from a partly received character
+            return self.stream_offset
+        resume_offset = int(resume_offset)
+        if resume_offset > self.stream_offset:
+            logger.warning(f"{resume_offset - self.stream_offset} bytes of output were lost while reconnecting.")
+            self.stream_offset = resume_offset
+            self._decoder.reset()
+        return resume_offset
+
+    def _skip_received_output(self, position, stream_lines):
+        """Drops the part of a message that was already received before reconnecting.
+        Returns the stream offset after the message, and the new part of the message, decoded.
+
+        The offset is in bytes, so it can fall inside a multi-byte character. The bytes of the
+        character received before it are held by the decoder, and completed by the new part.
+        """
+        data = stream_lines.encode() if isinstance(stream_lines, str) else stream_lines
+        end_position = position + len(data)
+        if end_position <= self.stream_offset:
+            return end_position, None
+        if position < self.stream_offset:
+            data = data[self.stream_offset - position:]
+        self.stream_offset = end_position
+        return end_position, self._decoder.decode(data)
 
     def stream(self):
         self.ready_to_start = False
@@ -79,4 +249,5 @@ class StreamingClient:
         if loop and loop.is_running():
             raise ValueError("Output streaming cannot be enabled within a running asyncio event loop.")
         else:
-            asyncio.run(self.receive_stream())
+            with span("toolchest.stream", {"toolchest.streaming_ip_address": self.streaming_ip_address}):
+                asyncio.run(self.receive_stream())
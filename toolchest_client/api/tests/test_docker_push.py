@@ -0,0 +1,131 @@
+import pytest
+from requests.exceptions import ConnectionError
+
+from toolchest_client.api import docker_push
+from toolchest_client.api.docker_push import get_remote_manifest_digest, push_docker_image
+from toolchest_client.api.exceptions import ToolchestJobError
+from toolchest_client.progress import CallbackProgressReporter
+
+REGISTRY = "123456789012.dkr.ecr.us-east-1.amazonaws.com"
+REMOTE_DIGEST = "sha256:" + "a" * 64
+PUSH_EVENTS = [
+    {"status": "The push refers to repository [...]"},
+    {"status": "Preparing", "id": "layer1"},
+    {"status": "Preparing", "id": "layer2"},
+    {"status": "Layer already exists", "id": "layer2"},
+    {"status": "Pushing", "id": "layer1", "progressDetail": {"current": 512, "total": 2048}},
+    {"status": "Pushing", "id": "layer1", "progressDetail": {"current": 1536, "total": 2048}},
+    {"status": "Pushed", "id": "layer1"},
+    {"status": "Mounted from other-repository", "id": "layer3"},
+    {"status": "tag: digest: sha256:... size: 1234"},
+]
+
+
+class FakeImage:
+    def __init__(self, repo_digests=()):
+        self.id = "sha256:image"
+        self.attrs = {"RepoDigests": list(repo_digests)}
+        self.tags = []
+
+    def tag(self, repository, tag=None):
+        self.tags.append(f"{repository}:{tag}")
+
+
+class FakeDockerClient:
+    def __init__(self, push_events=PUSH_EVENTS):
+        self.push_events = push_events
+        self.pushes = []
+        self.api = self
+
+    def login(self, username, password, registry):
+        assert (username, registry) == ("AWS", REGISTRY)
+
+    def push(self, repository, tag=None, stream=False, decode=False):
+        self.pushes.append(f"{repository}:{tag}")
+        return iter(self.push_events)
+
+
+@pytest.fixture(autouse=True)
+def pushed_images(monkeypatch):
+    monkeypatch.setattr(docker_push, "_pushed_images", set())
+
+
+def push(client, image, **kwargs):
+    return push_docker_image(client, image, registry=REGISTRY, repository="repo", tag="v1", password="pw", **kwargs)
+
+
+def test_push_reports_layers_and_progress(monkeypatch):
+    events = []
+    client = FakeDockerClient()
+    image = FakeImage()
+    result = push(client, image, progress_reporter=CallbackProgressReporter(events.append, min_interval_seconds=0))
+    assert client.pushes == image.tags == [f"{REGISTRY}/repo:v1"]
+    assert result.pushed_layers == {"layer1"}
+    assert result.existing_layers == {"layer2", "layer3"}
+    # The layer's last progress event is short of its size, which is counted once it's pushed
+    assert result.pushed_bytes == 2048
+    assert [event["bytes_transferred"] for event in events] == [512, 1536, 2048]
+    assert events[-1]["file_name"] == "docker layer layer1" and events[-1]["done"]
+
+    # Pushes are cached per image and repository
+    assert push(client, image).is_skipped
+    assert len(client.pushes) == 1
+
+
+def test_push_is_skipped_if_the_registry_has_the_image(monkeypatch):
+    monkeypatch.setattr(docker_push, "get_remote_manifest_digest", lambda *args: REMOTE_DIGEST)
+    client = FakeDockerClient()
+    assert push(client, FakeImage([f"{REGISTRY}/repo@{REMOTE_DIGEST}"])).is_skipped
+    assert client.pushes == []
+    # An image pushed to another repository, or whose tag now points elsewhere, is pushed
+    docker_push._pushed_images.clear()
+    assert not push(client, FakeImage([f"{REGISTRY}/other@{REMOTE_DIGEST}"])).is_skipped
+    docker_push._pushed_images.clear()
+    monkeypatch.setattr(docker_push, "get_remote_manifest_digest", lambda *args: "sha256:" + "b" * 64)
+    assert not push(client, FakeImage([f"{REGISTRY}/repo@{REMOTE_DIGEST}"])).is_skipped
+    assert len(client.pushes) == 2
+
+
+def test_push_when_the_registry_is_unreachable(monkeypatch):
+    def get_remote_manifest_digest(*args):
+        raise ConnectionError()
+
+    monkeypatch.setattr(docker_push, "get_remote_manifest_digest", get_remote_manifest_digest)
+    client = FakeDockerClient()
+    assert not push(client, FakeImage([f"{REGISTRY}/repo@{REMOTE_DIGEST}"])).is_skipped
+    assert len(client.pushes) == 1
+
+
+def test_push_raises_push_errors():
+    reporter = CallbackProgressReporter(lambda event: None)
+    client = FakeDockerClient([
+        {"status": "Pushing", "id": "layer1", "progressDetail": {"current": 512, "total": 2048}},
+        {"errorDetail": {"message": "denied"}, "error": "denied"},
+    ])
+    with pytest.raises(ToolchestJobError, match="denied"):
+        push(client, FakeImage(), progress_reporter=reporter)
+    # The failed layer's transfer is no longer tracked
+    assert reporter._active_transfers == set()
+
+
+def test_get_remote_manifest_digest(monkeypatch):
+    class FakeResponse:
+        def __init__(self, status_code, headers=None):
+            self.status_code = status_code
+            self.headers = headers or {}
+
+        def raise_for_status(self):
+            assert self.status_code < 400
+
+    requests_made = []
+
+    def traced_request(request_function, url, **kwargs):
+        requests_made.append((request_function.__name__, url, kwargs["auth"]))
+        if url.endswith("/v1"):
+            return FakeResponse(200, {"Docker-Content-Digest": REMOTE_DIGEST})
+        return FakeResponse(404)
+
+    monkeypatch.setattr(docker_push, "traced_request", traced_request)
+    assert get_remote_manifest_digest(REGISTRY, "repo", "v1", "pw") == REMOTE_DIGEST
+    assert get_remote_manifest_digest(REGISTRY, "repo", "v2", "pw") is None
+    assert requests_made[0] == ("head", f"https://{REGISTRY}/v2/repo/manifests/v1", ("AWS", "pw"))
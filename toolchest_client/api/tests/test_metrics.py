@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from .. import metrics as metrics_module
+from ..metrics import RunMetrics
+from ..status import Status
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(metrics_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_phases(clock):
+    metrics = RunMetrics()
+    with metrics.phase("prepare_inputs", num_bytes=10):
+        clock[0] += 1
+    with metrics.phase("upload") as upload_phase:
+        upload_phase.add_bytes(5)
+        upload_phase.add_bytes(7)
+        clock[0] += 2
+    clock[0] += 3
+    metrics.finish()
+
+    metrics_dict = metrics.to_dict()
+    assert list(metrics_dict["phases"]) == ["prepare_inputs", "upload"]
+    assert metrics_dict["phases"]["prepare_inputs"] == {
+        "started_at": 100.0,
+        "ended_at": 101.0,
+        "seconds": 1.0,
+        "bytes": 10,
+    }
+    assert metrics_dict["phases"]["upload"]["seconds"] == 2.0
+    assert metrics_dict["phases"]["upload"]["bytes"] == 12
+    assert metrics_dict["total_seconds"] == 6.0
+    json.dumps(metrics_dict)  # serializable as a JSON log line
+
+
+def test_phase_ends_on_error(clock):
+    metrics = RunMetrics()
+    with pytest.raises(ValueError):
+        with metrics.phase("download"):
+            clock[0] += 1
+            raise ValueError()
+    assert metrics.phases["download"].ended_at == 101.0
+    assert metrics.phases["download"].num_bytes is None
+
+
+def test_status_observed_once(clock):
+    metrics = RunMetrics()
+    metrics.observe_status(Status.EXECUTING)
+    clock[0] += 5
+    metrics.observe_status("executing")
+    metrics.observe_status(Status.READY_TO_TRANSFER_TO_CLIENT)
+    assert metrics.to_dict()["status_observed_at"] == {"executing": 100.0, "ready_to_transfer_to_client": 105.0}
@@ -0,0 +1,20 @@
+import pytest
+import requests
+
+from toolchest_client.api.query import Query
+
+
+def test_status_request_timeouts_are_raised_as_timeout_errors(monkeypatch):
+    monkeypatch.setenv("TOOLCHEST_KEY", "key")
+    request_timeouts = []
+
+    def get(url, **kwargs):
+        request_timeouts.append(kwargs.get("timeout"))
+        raise requests.exceptions.ReadTimeout()
+
+    monkeypatch.setattr(requests, "get", get)
+    query = Query(is_async=True, pipeline_segment_instance_id="run-id")
+    # TimeoutErrors are retried while waiting for the job, rather than failing the run
+    with pytest.raises(TimeoutError):
+        query.get_job_status()
+    assert request_timeouts == [Query.STATUS_REQUEST_TIMEOUT_SECONDS]
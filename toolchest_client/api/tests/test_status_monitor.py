@@ -0,0 +1,116 @@
+import threading
+import time
+
+import pytest
+
+from toolchest_client.api.status import Status
+from toolchest_client.api.status_monitor import StatusMonitor, TokenBucket
+
+
+class FakeQuery:
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.num_requests = 0
+        self.lock = threading.Lock()
+
+    def get_job_status(self, return_error=False):
+        with self.lock:
+            self.num_requests += 1
+            status = self.statuses.pop(0) if len(self.statuses) > 1 else self.statuses[0]
+        if isinstance(status, Exception):
+            raise status
+        return {"status": status, "error_message": None}
+
+
+def test_token_bucket_limits_rate():
+    rate_limiter = TokenBucket(rate=50)
+    start = time.monotonic()
+    for _ in range(11):
+        rate_limiter.acquire()
+    assert time.monotonic() - start >= 0.19  # the first token is available immediately
+
+
+def test_wakes_on_status_change():
+    status_monitor = StatusMonitor(requests_per_second=100, poll_interval_seconds=0.01)
+    query = FakeQuery([Status.EXECUTING, Status.EXECUTING, Status.READY_TO_TRANSFER_TO_CLIENT])
+    status_monitor.watch(query, status=Status.EXECUTING)
+    status_response = status_monitor.wait_for_status_change(query, timeout=5)
+    assert status_response["status"] == Status.READY_TO_TRANSFER_TO_CLIENT
+    assert query.num_requests == 3
+    status_monitor.unwatch(query)
+
+
+def test_returns_none_without_change():
+    status_monitor = StatusMonitor(requests_per_second=100, poll_interval_seconds=0.01)
+    query = FakeQuery([Status.EXECUTING])
+    status_monitor.watch(query, status=Status.EXECUTING)
+    assert status_monitor.wait_for_status_change(query, timeout=0.1) is None
+    assert query.num_requests > 1
+    status_monitor.unwatch(query)
+
+
+def test_raises_status_errors_in_waiting_thread():
+    status_monitor = StatusMonitor(requests_per_second=100, poll_interval_seconds=0.01)
+    query = FakeQuery([TimeoutError("timed out"), Status.EXECUTING])
+    status_monitor.watch(query)
+    with pytest.raises(TimeoutError):
+        status_monitor.wait_for_status_change(query, timeout=5)
+    assert status_monitor.wait_for_status_change(query, timeout=5)["status"] == Status.EXECUTING
+    status_monitor.unwatch(query)
+
+
+def test_calls_back_on_status_change():
+    status_monitor = StatusMonitor(requests_per_second=100, poll_interval_seconds=60)
+    query = FakeQuery([Status.EXECUTING])
+    status_changes = []
+    status_changed = threading.Event()
+
+    def on_status_change(status_response, error):
+        status_changes.append((status_response["status"], error))
+        status_changed.set()
+
+    # The first status request is sent right away, rather than after the poll interval
+    status_monitor.watch(query, poll_now=True, on_status_change=on_status_change)
+    assert status_changed.wait(timeout=5)
+    assert status_changes == [(Status.EXECUTING, None)]
+    status_monitor.unwatch(query)
+
+
+def test_status_requests_are_rate_limited_across_queries():
+    status_monitor = StatusMonitor(requests_per_second=20, poll_interval_seconds=0)
+    queries = [FakeQuery([Status.EXECUTING]) for _ in range(50)]
+    for query in queries:
+        status_monitor.watch(query, status=Status.EXECUTING)
+    time.sleep(0.5)
+    for query in queries:
+        status_monitor.unwatch(query)
+    num_requests = sum(query.num_requests for query in queries)
+    assert 5 <= num_requests <= 12
+    # queries are polled in turn, so none are starved
+    assert max(query.num_requests for query in queries) == 1
+
+
+def test_polling_thread_exits_when_idle():
+    status_monitor = StatusMonitor(requests_per_second=100, poll_interval_seconds=0.01)
+    query = FakeQuery([Status.EXECUTING])
+    status_monitor.watch(query)
+    polling_thread = status_monitor._thread
+    status_monitor.unwatch(query)
+    polling_thread.join(timeout=5)
+    assert not polling_thread.is_alive()
+    assert len(status_monitor) == 0
+
+
+def test_failing_callback_does_not_stop_polling():
+    status_monitor = StatusMonitor(requests_per_second=100, poll_interval_seconds=0.01)
+    failing_query = FakeQuery([Status.EXECUTING])
+
+    def on_status_change(status_response, error):
+        raise RuntimeError("Event loop is closed")
+
+    status_monitor.watch(failing_query, poll_now=True, on_status_change=on_status_change)
+    query = FakeQuery([Status.EXECUTING, Status.READY_TO_TRANSFER_TO_CLIENT])
+    status_monitor.watch(query, status=Status.EXECUTING)
+    assert status_monitor.wait_for_status_change(query, timeout=5)["status"] == Status.READY_TO_TRANSFER_TO_CLIENT
+    status_monitor.unwatch(failing_query)
+    status_monitor.unwatch(query)
@@ -0,0 +1,127 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from toolchest_client.api.stream_sinks import (
+    AsyncIteratorSink, CallbackSink, ConsoleSink, FileSink, StreamSink, get_stream_sink,
+)
+from toolchest_client.api.streaming import StreamBuffer
+
+
+class SlowSink(StreamSink):
+    def __init__(self, write_seconds):
+        self.write_seconds = write_seconds
+        self.batches = []
+        self.closed = False
+
+    def write(self, text):
+        time.sleep(self.write_seconds)
+        self.batches.append(text)
+
+    def close(self):
+        self.closed = True
+
+
+def test_file_sink_rotates(tmp_path):
+    path = tmp_path / "logs" / "stream.log"
+    sink = FileSink(str(path), max_bytes=10, backup_count=2)
+    for text in ["aaaaaaaa\n", "bbbbbbbb\n", "cccccccc\n", "dddddddd\n"]:
+        sink.write(text)
+    sink.close()
+    assert path.read_text() == "dddddddd\n"
+    assert (tmp_path / "logs" / "stream.log.1").read_text() == "cccccccc\n"
+    assert (tmp_path / "logs" / "stream.log.2").read_text() == "bbbbbbbb\n"
+    assert not (tmp_path / "logs" / "stream.log.3").exists()
+
+
+def test_stream_buffer_batches_output():
+    sink = SlowSink(write_seconds=0)
+
+    async def stream():
+        stream_buffer = StreamBuffer(sink, flush_size=1024, flush_interval_seconds=0.05)
+        buffer_task = asyncio.ensure_future(stream_buffer.run())
+        for line_number in range(100):
+            await stream_buffer.put(f"line {line_number}\n")
+        await stream_buffer.put(b"bytes\n")
+        stream_buffer.close()
+        await buffer_task
+
+    asyncio.run(stream())
+    assert "".join(sink.batches) == "".join(f"line {line_number}\n" for line_number in range(100)) + "bytes\n"
+    assert len(sink.batches) < 10
+    assert sink.closed
+
+
+def test_slow_sink_does_not_block_receiving():
+    sink = SlowSink(write_seconds=0.2)
+
+    async def stream():
+        stream_buffer = StreamBuffer(sink, flush_size=10, flush_interval_seconds=0.01, max_buffered_size=10 ** 6)
+        buffer_task = asyncio.ensure_future(stream_buffer.run())
+        start = time.monotonic()
+        for _ in range(1000):
+            await stream_buffer.put("0123456789")
+        receive_seconds = time.monotonic() - start
+        stream_buffer.close()
+        await buffer_task
+        return receive_seconds
+
+    assert asyncio.run(stream()) < 0.2
+    assert len("".join(sink.batches)) == 10000
+
+
+def test_full_buffer_applies_backpressure():
+    sink = SlowSink(write_seconds=0.1)
+
+    async def stream():
+        stream_buffer = StreamBuffer(sink, flush_size=10, flush_interval_seconds=0.01, max_buffered_size=20)
+        buffer_task = asyncio.ensure_future(stream_buffer.run())
+        start = time.monotonic()
+        for _ in range(10):
+            await stream_buffer.put("0123456789")
+        receive_seconds = time.monotonic() - start
+        stream_buffer.close()
+        await buffer_task
+        return receive_seconds
+
+    assert asyncio.run(stream()) >= 0.2
+    assert len("".join(sink.batches)) == 100
+
+
+def test_async_iterator_sink():
+    async def consume():
+        sink = AsyncIteratorSink(max_batches=2)
+
+        def produce():
+            for batch_number in range(5):
+                sink.write(f"batch {batch_number}\n")
+            sink.close()
+
+        producer = threading.Thread(target=produce)
+        producer.start()
+        batches = [text async for text in sink]
+        await asyncio.get_running_loop().run_in_executor(None, producer.join)
+        return batches
+
+    assert asyncio.run(consume()) == [f"batch {batch_number}\n" for batch_number in range(5)]
+
+
+def test_get_stream_sink(tmp_path):
+    assert isinstance(get_stream_sink(), ConsoleSink)
+    assert isinstance(get_stream_sink(str(tmp_path / "stream.log")), FileSink)
+    assert isinstance(get_stream_sink(print), CallbackSink)
+    sink = CallbackSink(print)
+    assert get_stream_sink(sink) is sink
+    with pytest.raises(ValueError):
+        get_stream_sink(42)
+
+
+def test_stream_sinks_must_implement_write():
+    class IncompleteSink(StreamSink):
+        def flush(self):
+            pass
+
+    with pytest.raises(TypeError):
+        IncompleteSink()
@@ -0,0 +1,139 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from toolchest_client.api import status_monitor
+from toolchest_client.api.exceptions import ToolchestDownloadError, ToolchestJobError
+from toolchest_client.api.output import Output
+from toolchest_client.api.status import Status
+from toolchest_client.api.watch import watch
+
+
+class FakeToolchest:
+    """Serves scripted statuses per run and records downloads."""
+
+    def __init__(self, statuses, failing_downloads=()):
+        self.statuses = {run_id: list(run_statuses) for run_id, run_statuses in statuses.items()}
+        self.failing_downloads = set(failing_downloads)
+        self.status_requests = []
+        self.status_request_times = []
+        self.downloads = []
+        self.lock = threading.Lock()
+
+    def get_status(self, run_id, return_error=False):
+        with self.lock:
+            self.status_requests.append(run_id)
+            self.status_request_times.append(time.monotonic())
+            run_statuses = self.statuses[run_id]
+            status = run_statuses.pop(0) if len(run_statuses) > 1 else run_statuses[0]
+        if isinstance(status, Exception):
+            raise status
+        return {"status": status, "error_message": None}
+
+    def download(self, output_path, run_id=None, transforms=None):
+        with self.lock:
+            self.downloads.append(run_id)
+        if run_id in self.failing_downloads:
+            raise ToolchestDownloadError("Download failed.")
+        os.makedirs(output_path, exist_ok=True)
+        output_file_path = os.path.join(output_path, "output.txt")
+        with open(output_file_path, "w") as output_file:
+            output_file.write(run_id)
+        return output_file_path
+
+
+@pytest.fixture
+def fake_toolchest(monkeypatch):
+    def install(statuses, **kwargs):
+        toolchest = FakeToolchest(statuses, **kwargs)
+        monkeypatch.setattr("toolchest_client.api.watch.get_status", toolchest.get_status)
+        monkeypatch.setattr("toolchest_client.api.watch.download", toolchest.download)
+        # Statuses are polled by the process-wide StatusMonitor, which is made faster for tests
+        monkeypatch.setattr(status_monitor, "_status_monitor", status_monitor.StatusMonitor(
+            requests_per_second=1000,
+            poll_interval_seconds=0.01,
+        ))
+        return toolchest
+    return install
+
+
+def test_watch_downloads_runs_when_ready(tmp_path, fake_toolchest):
+    toolchest = fake_toolchest({
+        "run-1": [Status.EXECUTING, Status.READY_TO_TRANSFER_TO_CLIENT],
+        "run-2": [Status.READY_TO_TRANSFER_TO_CLIENT],
+        "run-3": [Status.EXECUTING, Status.FAILED],
+    })
+    run_1 = Output(run_id="run-1")
+    outputs = watch([run_1, "run-2", "run-3"], output_path=str(tmp_path))
+
+    assert outputs["run-1"] is run_1
+    assert run_1.output_path == str(tmp_path / "run-1")
+    assert open(run_1.output_file_paths[0]).read() == "run-1"
+    assert outputs["run-2"].last_status == Status.READY_TO_TRANSFER_TO_CLIENT
+    assert outputs["run-3"].last_status == Status.FAILED
+    assert outputs["run-3"].output_path is None
+    assert sorted(toolchest.downloads) == ["run-1", "run-2"]
+    # Finished runs aren't polled again
+    assert toolchest.status_requests.count("run-2") == 1
+
+
+def test_watch_shares_the_status_monitor_rate_limit(monkeypatch, tmp_path, fake_toolchest):
+    toolchest = fake_toolchest({
+        run_id: [Status.EXECUTING] * 3 + [Status.READY_TO_TRANSFER_TO_CLIENT] for run_id in ["run-1", "run-2"]
+    })
+    monkeypatch.setattr(status_monitor, "_status_monitor", status_monitor.StatusMonitor(
+        requests_per_second=20,
+        poll_interval_seconds=0,
+    ))
+    watch(["run-1", "run-2"], output_path=str(tmp_path))
+    assert len(toolchest.status_requests) == 8
+    # Status requests of all runs are sent by the StatusMonitor, at most 20 per second
+    request_seconds = toolchest.status_request_times[-1] - toolchest.status_request_times[0]
+    assert request_seconds >= 7 / 20 * 0.9
+    assert status_monitor.get_status_monitor()._watches == dict()
+
+
+def test_watch_resumes_from_state_file(tmp_path, fake_toolchest):
+    state_file = str(tmp_path / "watch.json")
+    toolchest = fake_toolchest({
+        "run-1": [Status.READY_TO_TRANSFER_TO_CLIENT],
+        "run-2": [Status.EXECUTING],
+    })
+    watch(["run-1", "run-2"], output_path=str(tmp_path), state_file=state_file, timeout=0.2)
+    with open(state_file) as state:
+        runs = {run["run_id"]: run for run in json.load(state)["runs"]}
+    assert runs["run-1"]["output_file_paths"] == [str(tmp_path / "run-1" / "output.txt")]
+    assert runs["run-2"]["status"] == Status.EXECUTING
+    assert runs["run-2"]["output_file_paths"] is None
+
+    # After a restart, only the unfinished run is watched
+    toolchest = fake_toolchest({"run-2": [ToolchestJobError("Out of memory.")]})
+    outputs = watch(state_file=state_file)
+    assert toolchest.status_requests == ["run-2"]
+    assert outputs["run-1"].output_file_paths == [str(tmp_path / "run-1" / "output.txt")]
+    with open(state_file) as state:
+        runs = {run["run_id"]: run for run in json.load(state)["runs"]}
+    assert runs["run-2"]["status"] == Status.FAILED
+    assert runs["run-2"]["error"] == "Out of memory."
+
+
+def test_watch_retries_failed_downloads_after_restart(tmp_path, fake_toolchest):
+    state_file = str(tmp_path / "watch.json")
+    fake_toolchest({"run-1": [Status.READY_TO_TRANSFER_TO_CLIENT]}, failing_downloads=["run-1"])
+    outputs = watch({"run-1": str(tmp_path / "custom")}, state_file=state_file)
+    assert outputs["run-1"].output_path is None
+
+    toolchest = fake_toolchest({"run-1": [Status.READY_TO_TRANSFER_TO_CLIENT]})
+    outputs = watch(state_file=state_file)
+    assert toolchest.downloads == ["run-1"]
+    assert outputs["run-1"].output_file_paths == [str(tmp_path / "custom" / "output.txt")]
+
+
+def test_watch_rejects_missing_runs_and_paths(tmp_path):
+    with pytest.raises(ValueError):
+        watch(state_file=str(tmp_path / "watch.json"))
+    with pytest.raises(ValueError):
+        watch(["run-1"])
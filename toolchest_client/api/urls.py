@@ -30,6 +30,18 @@ def get_s3_metadata_url():
     return S3_URL + "/metadata"
 
 
+def get_s3_metadata_batch_url():
+    """Retrieves the Toolchest API Route for S3 metadata of multiple files at once. Used internally."""
+    return get_s3_metadata_url() + "/batch"
+
+
+def get_s3_endpoint_url():
+    """Retrieves a custom S3 endpoint URL (env var TOOLCHEST_S3_ENDPOINT_URL), e.g. for an S3-compatible
+    store used in local testing. Returns None if not set, in which case AWS S3 is used.
+    """
+    return os.environ.get("TOOLCHEST_S3_ENDPOINT_URL") or None
+
+
 def set_api_url(custom_api_url=None):
     """Sets the Toolchest API URL (env var TOOLCHEST_API_URL) to the given value.
     If a URL is not provided, resets to the default Toolchest API URL.
@@ -0,0 +1,295 @@
+"""
+toolchest_client.api.watch
+~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides `watch`, which monitors many async runs from one event loop and
+downloads each run's output as soon as it's ready to transfer.
+
+Statuses are polled by the process-wide StatusMonitor, so status requests for watched
+runs share its rate limit with every other query in the process. Downloads (including
+unpacking) run in a thread pool, up to `max_concurrency` at a time, while the other
+runs are still being watched. The list of watched runs can be persisted to a JSON state file, so a
+restarted watcher (e.g. from cron) picks up where the last one left off.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+
+from loguru import logger
+
+from toolchest_client.api.download import download
+from toolchest_client.api.exceptions import ToolchestJobError
+from toolchest_client.api.output import Output
+from toolchest_client.api.status import get_status, Status
+from toolchest_client.api.status_monitor import get_status_monitor
+
+DEFAULT_MAX_CONCURRENCY = 4
+# Statuses of runs whose output can be downloaded
+DOWNLOADABLE_STATUSES = (
+    Status.READY_TO_TRANSFER_TO_CLIENT,
+    Status.TRANSFERRING_TO_CLIENT,
+    Status.TRANSFERRED_TO_CLIENT,
+    Status.COMPLETE,
+)
+FAILED_STATUSES = (Status.FAILED, Status.TERMINATED)
+STATE_FILE_VERSION = 1
+
+
+class WatchedRun:
+    """A run watched by `watch`, as saved in its state file.
+
+    :param run_id: ID of the run.
+    :param output_path: Directory to which the run's output is downloaded.
+    :param status: (optional) Last status seen.
+    :param output_file_paths: (optional) Paths of the downloaded output files, once downloaded.
+    :param error: (optional) Error message, if the run or its download failed.
+    """
+
+    def __init__(self, run_id, output_path, status=None, output_file_paths=None, error=None):
+        self.run_id = run_id
+        self.output_path = output_path
+        self.status = status
+        self.output_file_paths = output_file_paths
+        self.error = error
+
+    def __repr__(self):
+        return str(self.__dict__)
+
+    @property
+    def is_downloaded(self):
+        return self.output_file_paths is not None
+
+    @property
+    def is_finished(self):
+        """Whether the run has been downloaded or has failed, so it's no longer watched."""
+        return self.is_downloaded or self.status in FAILED_STATUSES
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, run_dict):
+        return cls(**run_dict)
+
+
+def watch(outputs=None, output_path=None, max_concurrency=DEFAULT_MAX_CONCURRENCY, state_file=None, **kwargs):
+    """Watches async runs, downloading each run's output as soon as it's ready. Returns once every run has been
+    downloaded or has failed (or `timeout` passes). Returns a dict of run IDs to Outputs, with the local paths of
+    downloaded output files.
+
+    Runs a new event loop, so it can't be called from a running one; use `watch_async` there instead.
+
+    Usage::
+
+        >>> runs = [toolchest.kraken2(..., is_async=True) for ... in samples]
+        >>> toolchest.watch(runs, output_path="./output", state_file="./watch.json")
+        >>> # After a restart, the runs in the state file are watched again (except those already downloaded)
+        >>> toolchest.watch(state_file="./watch.json")
+
+    :param outputs: (optional) Runs to watch: a list of Outputs (as returned by tools with `is_async=True`) or
+        run IDs, or a dict of Outputs or run IDs to the directory each run's output is downloaded to.
+    :param output_path: (optional) Directory under which each run's output is downloaded, in a subdirectory named
+        by its run ID. Required for runs without a directory of their own.
+    :param max_concurrency: Maximum number of outputs downloaded at once.
+    :param state_file: (optional) Path of a JSON file in which the watched runs and their progress are saved.
+        Runs already in the file are watched along with `outputs`, so watching survives restarts.
+    :param timeout: (optional) Maximum time to watch for, in seconds. Downloads in progress are finished.
+    :param transforms: (optional) Transforms applied to outputs as they're downloaded. See `download`.
+    """
+    return asyncio.run(watch_async(
+        outputs=outputs,
+        output_path=output_path,
+        max_concurrency=max_concurrency,
+        state_file=state_file,
+        **kwargs,
+    ))
+
+
+async def watch_async(outputs=None, output_path=None, max_concurrency=DEFAULT_MAX_CONCURRENCY, state_file=None,
+                      timeout=None, transforms=None):
+    """Coroutine version of `watch`, for use from a running event loop. Takes the same arguments."""
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1.")
+    runs = _load_state_file(state_file) if state_file else dict()
+    outputs_by_run_id = dict()
+    for output, run_output_path in _iter_outputs(outputs, output_path):
+        run_id = output.run_id
+        outputs_by_run_id[run_id] = output
+        if run_id not in runs:
+            runs[run_id] = WatchedRun(run_id, os.path.abspath(os.path.expanduser(run_output_path)))
+    if not runs:
+        raise ValueError("No runs to watch. Pass outputs, or a state_file with runs.")
+    _save_state_file(state_file, runs)
+
+    watcher = _Watcher(runs, state_file, max_concurrency, transforms)
+    await watcher.run(timeout)
+
+    for run in runs.values():
+        output = outputs_by_run_id.setdefault(run.run_id, Output(run_id=run.run_id))
+        output.last_status = run.status
+        if run.is_downloaded:
+            output.set_output_path(run.output_path, run.output_file_paths)
+    return outputs_by_run_id
+
+
+class _Watcher:
+    """Watches the statuses of unfinished runs with the StatusMonitor, and downloads their outputs."""
+
+    def __init__(self, runs, state_file, max_concurrency, transforms):
+        self.runs = runs
+        self.state_file = state_file
+        self.max_concurrency = max_concurrency
+        self.transforms = transforms
+        self.status_queries = dict()  # run ID -> _RunStatusQuery, of runs whose statuses are being polled
+        self.num_downloading = 0
+
+    async def run(self, timeout=None):
+        loop = asyncio.get_running_loop()
+        status_monitor = get_status_monitor()
+        # Status changes and finished downloads are sent here from the monitor's thread and the download tasks
+        events = asyncio.Queue()
+        download_tasks = set()
+        deadline = loop.time() + timeout if timeout is not None else None
+        for run in self.runs.values():
+            if not run.is_finished:
+                self._watch_status(status_monitor, run.run_id, events, loop)
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                    thread_name_prefix="toolchest-watch-download") as download_executor:
+                while self.status_queries or self.num_downloading:
+                    try:
+                        wait_seconds = max(0, deadline - loop.time()) if deadline is not None else None
+                        run_id, status_response, error = await asyncio.wait_for(events.get(), wait_seconds)
+                    except asyncio.TimeoutError:
+                        break
+                    if run_id not in self.status_queries:
+                        continue  # a finished download, or a status change reported after the run was unwatched
+                    if error is not None:
+                        status_response = self._get_error_status_response(run_id, error)
+                        if status_response is None:
+                            continue
+                    run = self.runs[run_id]
+                    self._update_status(run, status_response)
+                    if run.status in DOWNLOADABLE_STATUSES:
+                        status_monitor.unwatch(self.status_queries.pop(run_id))
+                        self.num_downloading += 1
+                        download_task = loop.create_task(self._download(run, download_executor, events))
+                        download_tasks.add(download_task)
+                        download_task.add_done_callback(download_tasks.discard)
+                    elif run.status in FAILED_STATUSES:
+                        status_monitor.unwatch(self.status_queries.pop(run_id))
+                # Downloads in progress are finished, even after a timeout
+                if download_tasks:
+                    await asyncio.gather(*download_tasks)
+        finally:
+            for status_query in self.status_queries.values():
+                status_monitor.unwatch(status_query)
+            self.status_queries.clear()
+
+    def _watch_status(self, status_monitor, run_id, events, loop):
+        def on_status_change(status_response, error):
+            loop.call_soon_threadsafe(events.put_nowait, (run_id, status_response, error))
+
+        status_query = _RunStatusQuery(run_id)
+        self.status_queries[run_id] = status_query
+        # The first status is reported even if it's the saved one, e.g. to retry a failed download
+        status_monitor.watch(status_query, poll_now=True, on_status_change=on_status_change)
+
+    @staticmethod
+    def _get_error_status_response(run_id, error):
+        """Returns the status response implied by an error getting a run's status, or None if it's retried."""
+        if isinstance(error, ToolchestJobError):
+            # Status requests for failed runs are rejected with the run's error
+            return {"status": Status.FAILED, "error_message": str(error)}
+        logger.warning(f"Failed to get the status of Toolchest run {run_id}, retrying: {error}")
+        return None
+
+    def _update_status(self, run, status_response):
+        status = status_response["status"]
+        if status == run.status:
+            return
+        run.status = status
+        if status in FAILED_STATUSES:
+            run.error = status_response.get("error_message") or f"Run {status}."
+            logger.warning(f"Toolchest run {run.run_id} {status}: {run.error}")
+        _save_state_file(self.state_file, self.runs)
+
+    async def _download(self, run, download_executor, events):
+        loop = asyncio.get_running_loop()
+        try:
+            output_file_paths = await loop.run_in_executor(
+                download_executor,
+                lambda: download(output_path=run.output_path, run_id=run.run_id, transforms=self.transforms),
+            )
+        except Exception as err:
+            # Downloads are retried when the watcher is restarted
+            run.error = f"Download failed: {err}"
+            logger.warning(f"Failed to download the output of Toolchest run {run.run_id}: {err}")
+        else:
+            if isinstance(output_file_paths, str):
+                output_file_paths = [output_file_paths]
+            run.output_file_paths, run.error = output_file_paths, None
+            logger.info(f"Downloaded the output of Toolchest run {run.run_id} to {run.output_path}")
+        finally:
+            self.num_downloading -= 1
+            _save_state_file(self.state_file, self.runs)
+            # Wakes the watcher, in case this was the last run
+            events.put_nowait((run.run_id, None, None))
+
+
+class _RunStatusQuery:
+    """Gets the status of a watched run, for the StatusMonitor."""
+
+    def __init__(self, run_id):
+        self.run_id = run_id
+
+    def __repr__(self):
+        return str(self.__dict__)
+
+    def get_job_status(self, return_error=False):
+        status_response = get_status(self.run_id, return_error=True)
+        if not status_response.get("status"):
+            raise ValueError(f"No status in response: {status_response}")
+        return status_response if return_error else status_response["status"]
+
+
+def _iter_outputs(outputs, output_path):
+    """Yields each output to watch (as an Output) and the directory its output is downloaded to."""
+    if outputs is None:
+        return
+    if isinstance(outputs, (str, Output)):
+        outputs = [outputs]
+    run_output_paths = outputs.values() if isinstance(outputs, dict) else [None] * len(outputs)
+    for output, run_output_path in zip(outputs, run_output_paths):
+        if isinstance(output, str):
+            output = Output(run_id=output)
+        if not output.run_id:
+            raise ValueError("Only outputs with run IDs can be watched.")
+        if run_output_path is None:
+            if output_path is None:
+                raise ValueError(f"No output_path given for run {output.run_id}.")
+            run_output_path = os.path.join(output_path, output.run_id)
+        yield output, run_output_path
+
+
+def _load_state_file(state_file):
+    if not os.path.exists(state_file):
+        return dict()
+    with open(state_file, "r") as state:
+        state_dict = json.load(state)
+    if state_dict.get("version") != STATE_FILE_VERSION:
+        raise ValueError(f"Unsupported watch state file version in {state_file}: {state_dict.get('version')}")
+    return {run_dict["run_id"]: WatchedRun.from_dict(run_dict) for run_dict in state_dict["runs"]}
+
+
+def _save_state_file(state_file, runs):
+    """Saves the watched runs to the state file, atomically, so it's intact if the watcher is stopped mid-write."""
+    if not state_file:
+        return
+    state_dir = os.path.dirname(os.path.abspath(state_file))
+    os.makedirs(state_dir, exist_ok=True)
+    temporary_state_file = f"{state_file}.tmp"
+    with open(temporary_state_file, "w") as state:
+        json.dump({"version": STATE_FILE_VERSION, "runs": [run.to_dict() for run in runs.values()]}, state, indent=2)
+    os.replace(temporary_state_file, state_file)
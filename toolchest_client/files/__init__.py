@@ -1,7 +1,9 @@
-from .general import assert_exists, check_file_size, files_in_path, sanity_check, compress_files_in_path, \
-    convert_input_params_to_prefix_mapping
+from .general import assert_exists, check_file_size, files_in_path, files_and_sizes_in_path, sanity_check, \
+    compress_files_in_path, convert_input_params_to_prefix_mapping, get_archive_path
 from .merge import concatenate_files, merge_sam_files
-from .s3 import assert_accessible_s3, get_s3_file_size, get_params_from_s3_uri, path_is_s3_uri
+from .s3 import assert_accessible_s3, get_s3_file_size, get_s3_file_sizes, get_params_from_s3_uri, path_is_s3_uri
 from .split import open_new_output_file, split_file_by_lines, split_paired_files_by_lines
+from .preflight import classify_path, InputLocation, InputResolver, ResolvedInput
 from .unpack import OutputType, unpack_files
-from .public_uris import get_url_with_protocol, path_is_http_url, path_is_accessible_ftp_url
+from .public_uris import get_url_with_protocol, get_uri_scheme, path_is_http_url, path_is_accessible_ftp_url, \
+    probe_http_url, get_ftp_url_file_size, get_ftp_url_file_sizes, FTPConnectionPool
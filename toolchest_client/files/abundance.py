@@ -0,0 +1,343 @@
+"""
+toolchest_client.files.abundance
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Functions for merging the per-sample outputs of batch kraken2, bracken, or
+metaphlan runs into one taxa × sample matrix. NumPy is an optional dependency
+(installed with the `analysis` extra), only needed by these functions.
+
+Samples are loaded one at a time and merged into a shared, sorted taxon index. The
+matrix is stored in compressed sparse row (CSR) form, since most taxa are absent
+from most samples.
+"""
+from itertools import chain
+import os
+
+from toolchest_client.files.kraken2 import KRAKEN2_REPORT_FILE_NAME, load_kraken2_report
+
+KRAKEN2 = "kraken2"
+BRACKEN = "bracken"
+METAPHLAN = "metaphlan"
+
+# Default names of each tool's output file with per-taxon abundances
+ABUNDANCE_FILE_NAMES = {
+    KRAKEN2: KRAKEN2_REPORT_FILE_NAME,
+    BRACKEN: "output.bracken",
+    METAPHLAN: "out.txt",
+}
+
+# Values that can be put in the matrix
+READS = "reads"
+ABUNDANCE = "abundance"
+
+BRACKEN_HEADER = "name\ttaxonomy_id\t"
+
+
+class SampleAbundances:
+    """Per-taxon values from one sample.
+
+    :param taxa: List of taxon keys: taxon IDs (as strings) for kraken2 and bracken, or clade names for metaphlan.
+    :param taxon_names: List of taxon names.
+    :param values: float64 array of values, e.g. read counts.
+    """
+
+    def __init__(self, taxa, taxon_names, values):
+        self.taxa = taxa
+        self.taxon_names = taxon_names
+        self.values = values
+
+    def __repr__(self):
+        return str(self.__dict__)
+
+    def __len__(self):
+        return len(self.taxa)
+
+
+class AbundanceMatrix:
+    """A taxa × sample matrix, stored in compressed sparse row (CSR) form.
+
+    The values of row (taxon) `i` are `data[indptr[i]:indptr[i + 1]]`, in the columns (samples)
+    `indices[indptr[i]:indptr[i + 1]]`. Taxa absent from a sample have a value of 0.
+
+    :param taxa: List of taxon keys, sorted. Row `i` is `taxa[i]`.
+    :param taxon_names: List of taxon names.
+    :param samples: List of sample names. Column `j` is `samples[j]`.
+    :param data: float64 array of non-zero values.
+    :param indices: int32 array of the column of each value.
+    :param indptr: int64 array of where each row starts in `data` and `indices`.
+    """
+
+    def __init__(self, taxa, taxon_names, samples, data, indices, indptr):
+        self.taxa = taxa
+        self.taxon_names = taxon_names
+        self.samples = samples
+        self.data = data
+        self.indices = indices
+        self.indptr = indptr
+
+    def __repr__(self):
+        return str(self.__dict__)
+
+    @property
+    def shape(self):
+        return len(self.taxa), len(self.samples)
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    def to_dense(self):
+        """Returns the matrix as a dense float64 array of shape (number of taxa, number of samples)."""
+        import numpy as np
+
+        dense = np.zeros(self.shape, dtype=np.float64)
+        rows = np.repeat(np.arange(len(self.taxa)), np.diff(self.indptr))
+        dense[rows, self.indices] = self.data
+        return dense
+
+    def to_scipy(self):
+        """Returns the matrix as a scipy.sparse.csr_matrix. Requires SciPy (the `analysis` extra)."""
+        # Only import scipy – an optional dependency – if converting to it
+        from scipy.sparse import csr_matrix
+
+        return csr_matrix((self.data, self.indices, self.indptr), shape=self.shape)
+
+    def get_sample(self, sample):
+        """Returns a dict of taxon key to value for the taxa present in `sample`."""
+        import numpy as np
+
+        column = self.samples.index(sample)
+        positions = np.flatnonzero(self.indices == column)
+        rows = np.searchsorted(self.indptr, positions, side="right") - 1
+        return {self.taxa[row]: value for row, value in zip(rows.tolist(), self.data[positions].tolist())}
+
+    def get_taxon(self, taxon):
+        """Returns a dense float64 array of the values of `taxon` in each sample."""
+        import numpy as np
+
+        row = self.taxa.index(str(taxon))
+        values = np.zeros(len(self.samples), dtype=np.float64)
+        start, end = self.indptr[row], self.indptr[row + 1]
+        values[self.indices[start:end]] = self.data[start:end]
+        return values
+
+    def save_npz(self, path):
+        """Saves the matrix to a compressed .npz file, which `load_abundance_matrix` loads.
+
+        The arrays are named like scipy.sparse.save_npz's, so `scipy.sparse.load_npz` also loads the values.
+        """
+        import numpy as np
+
+        np.savez_compressed(
+            path,
+            data=self.data,
+            indices=self.indices,
+            indptr=self.indptr,
+            format=np.array("csr"),
+            shape=np.array(self.shape),
+            taxa=np.array(self.taxa, dtype=str),
+            taxon_names=np.array(self.taxon_names, dtype=str),
+            samples=np.array(self.samples, dtype=str),
+        )
+
+    def to_parquet(self, path):
+        """Saves the matrix to a Parquet file in long form, with a row per non-zero value:
+        `taxon`, `taxon_name`, `sample`, and `value`. Requires pyarrow (the `analysis` extra).
+        """
+        # Only import pyarrow – an optional dependency – if writing Parquet
+        import numpy as np
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        rows = np.repeat(np.arange(len(self.taxa), dtype=np.int32), np.diff(self.indptr))
+        table = pa.table({
+            "taxon": pa.DictionaryArray.from_arrays(rows, pa.array(self.taxa, type=pa.string())),
+            "taxon_name": pa.DictionaryArray.from_arrays(rows, pa.array(self.taxon_names, type=pa.string())),
+            "sample": pa.DictionaryArray.from_arrays(self.indices, pa.array(self.samples, type=pa.string())),
+            "value": self.data,
+        })
+        pq.write_table(table, path)
+
+
+def build_abundance_matrix(outputs, value=READS, sample_names=None, file_format=None):
+    """Merges the outputs of kraken2, bracken, or metaphlan runs into one taxa × sample AbundanceMatrix.
+
+    Usage::
+
+        >>> outputs = [toolchest.bracken(kraken2_report=path, output_path=f"./{name}") for name, path in reports]
+        >>> matrix = build_abundance_matrix(outputs, sample_names=[name for name, _ in reports])
+        >>> matrix.save_npz("./abundances.npz")
+
+    :param outputs: List of downloaded Output objects, or paths of output files (kraken2_report.txt,
+        output.bracken, or MetaPhlAn's out.txt).
+    :param value: "reads", for read counts (each taxon's clade reads for kraken2, Bracken's re-estimated reads,
+        or MetaPhlAn's estimated reads, if run with `-t rel_ab_w_read_stats`); or "abundance", for relative
+        abundances (in percent).
+    :param sample_names: (optional) Name of each sample. Defaults to the name of each output's directory.
+    :param file_format: (optional) "kraken2", "bracken", or "metaphlan". Defaults to each output's tool, or
+        is detected from the file.
+    """
+    import numpy as np
+
+    if value not in (READS, ABUNDANCE):
+        raise ValueError(f"Invalid value: {value}. Must be \"{READS}\" or \"{ABUNDANCE}\".")
+    paths_and_formats = [_get_abundance_file(output, file_format) for output in outputs]
+    if sample_names is None:
+        sample_names = [os.path.basename(os.path.dirname(os.path.abspath(path))) for path, _ in paths_and_formats]
+    if len(sample_names) != len(paths_and_formats):
+        raise ValueError("The number of sample names must match the number of outputs.")
+    if len(set(sample_names)) != len(sample_names):
+        raise ValueError("Sample names must be unique. Pass them with sample_names.")
+
+    # Files are parsed in Python, which holds the GIL, so loading them on threads wouldn't be any faster
+    samples = [load_sample_abundances(path, path_file_format, value) for path, path_file_format in paths_and_formats]
+
+    # Merges the samples' taxa into one sorted index. Dict operations on whole samples at once are much
+    # faster than a lookup per taxon.
+    taxa = sorted(dict.fromkeys(chain.from_iterable(sample.taxa for sample in samples)))
+    taxon_rows = dict(zip(taxa, range(len(taxa))))
+    rows = np.fromiter(
+        map(taxon_rows.__getitem__, chain.from_iterable(sample.taxa for sample in samples)),
+        dtype=np.int64,
+        count=sum(len(sample) for sample in samples),
+    )
+    names_by_taxon = dict()
+    for sample in reversed(samples):  # the first sample with a taxon names it
+        names_by_taxon.update(zip(sample.taxa, sample.taxon_names))
+    taxon_names = [names_by_taxon[taxon] for taxon in taxa]
+    columns = np.repeat(np.arange(len(samples), dtype=np.int64), [len(sample) for sample in samples])
+    values = np.concatenate([sample.values for sample in samples]) if samples else np.zeros(0)
+
+    # Sums values repeated in a sample, then drops zeros
+    cells, cell_indices = np.unique(rows * len(samples) + columns, return_inverse=True)
+    data = np.bincount(cell_indices.reshape(-1), weights=values, minlength=len(cells))
+    is_non_zero = data != 0
+    cells, data = cells[is_non_zero], data[is_non_zero]
+    cell_rows = cells // max(len(samples), 1)
+    indptr = np.zeros(len(taxa) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(cell_rows, minlength=len(taxa)), out=indptr[1:])
+    return AbundanceMatrix(
+        taxa=taxa,
+        taxon_names=taxon_names,
+        samples=list(sample_names),
+        data=data.astype(np.float64),
+        indices=(cells % max(len(samples), 1)).astype(np.int32),
+        indptr=indptr,
+    )
+
+
+def load_abundance_matrix(path):
+    """Loads an AbundanceMatrix saved with `AbundanceMatrix.save_npz`."""
+    import numpy as np
+
+    with np.load(path, allow_pickle=False) as arrays:
+        return AbundanceMatrix(
+            taxa=arrays["taxa"].tolist(),
+            taxon_names=arrays["taxon_names"].tolist(),
+            samples=arrays["samples"].tolist(),
+            data=arrays["data"],
+            indices=arrays["indices"],
+            indptr=arrays["indptr"],
+        )
+
+
+def load_sample_abundances(path, file_format=None, value=READS):
+    """Loads the per-taxon values of one sample from a kraken2 report, Bracken output, or MetaPhlAn profile.
+
+    :param path: Path of the output file.
+    :param file_format: (optional) "kraken2", "bracken", or "metaphlan". Detected from the file by default.
+    :param value: "reads" or "abundance". See `build_abundance_matrix`.
+    """
+    file_format = file_format or detect_abundance_file_format(path)
+    if file_format == KRAKEN2:
+        return _load_kraken2_abundances(path, value)
+    if file_format == BRACKEN:
+        return _load_bracken_abundances(path, value)
+    if file_format == METAPHLAN:
+        return _load_metaphlan_abundances(path, value)
+    raise ValueError(f"Invalid file format: {file_format}. Must be one of {', '.join(ABUNDANCE_FILE_NAMES)}.")
+
+
+def detect_abundance_file_format(path):
+    """Returns "kraken2", "bracken", or "metaphlan", from the first line of the file at `path`."""
+    with open(path, "r") as abundance_file:
+        first_line = abundance_file.readline()
+    if first_line.startswith(BRACKEN_HEADER):
+        return BRACKEN
+    if first_line.startswith("#"):
+        return METAPHLAN
+    return KRAKEN2
+
+
+def _get_abundance_file(output, file_format):
+    """Returns the path and format of the abundance file of an Output (or path)."""
+    if isinstance(output, (str, os.PathLike)):
+        return os.fspath(output), file_format
+    file_format = file_format or (output.tool_name if output.tool_name in ABUNDANCE_FILE_NAMES else None)
+    if file_format:
+        return output.get_output_file_path(ABUNDANCE_FILE_NAMES[file_format]), file_format
+    for file_format, file_name in ABUNDANCE_FILE_NAMES.items():
+        try:
+            return output.get_output_file_path(file_name), file_format
+        except FileNotFoundError:
+            pass
+    raise FileNotFoundError(f"No kraken2, bracken, or metaphlan output found in {output.output_path}.")
+
+
+def _load_kraken2_abundances(path, value):
+    import numpy as np
+
+    report = load_kraken2_report(path)
+    values = report.clade_reads if value == READS else report.percentages
+    return SampleAbundances(
+        taxa=[str(taxid) for taxid in report.taxids.tolist()],
+        taxon_names=report.names,
+        values=values.astype(np.float64),
+    )
+
+
+def _load_bracken_abundances(path, value):
+    import numpy as np
+
+    taxa, taxon_names, values = [], [], []
+    with open(path, "r") as bracken_file:
+        header = bracken_file.readline().rstrip("\n").split("\t")
+        value_column = header.index("new_est_reads" if value == READS else "fraction_total_reads")
+        for line in bracken_file:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) != len(header):
+                continue
+            taxon_names.append(fields[0])
+            taxa.append(fields[1])
+            values.append(float(fields[value_column]))
+    values = np.array(values, dtype=np.float64)
+    if value == ABUNDANCE:
+        values *= 100  # Bracken's fractions, as percentages
+    return SampleAbundances(taxa=taxa, taxon_names=taxon_names, values=values)
+
+
+def _load_metaphlan_abundances(path, value):
+    import numpy as np
+
+    taxa, taxon_names, values = [], [], []
+    value_column = None
+    with open(path, "r") as metaphlan_file:
+        for line in metaphlan_file:
+            fields = line.rstrip("\n").split("\t")
+            if line.startswith("#"):
+                if fields[0] == "#clade_name":
+                    column_name = "estimated_number_of_reads_from_the_clade" if value == READS \
+                        else "relative_abundance"
+                    if column_name not in fields:
+                        raise ValueError(f"{path} has no {column_name} column. For read counts, run MetaPhlAn "
+                                         "with tool_args=\"-t rel_ab_w_read_stats\".")
+                    value_column = fields.index(column_name)
+                continue
+            if value_column is None or len(fields) <= value_column:
+                continue
+            taxa.append(fields[0])
+            taxon_names.append(fields[0].rsplit("|", 1)[-1])
+            values.append(float(fields[value_column]))
+    if value_column is None:
+        raise ValueError(f"Invalid MetaPhlAn output: {path} has no #clade_name header.")
+    return SampleAbundances(taxa=taxa, taxon_names=taxon_names, values=np.array(values, dtype=np.float64))
@@ -0,0 +1,409 @@
+"""
+toolchest_client.files.alignments
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Functions for reading the alignments (hits) output by blastn, diamond_blastp,
+diamond_blastx, rapsearch2, and lastal5 into typed NumPy arrays. NumPy is an
+optional dependency (installed with the `analysis` extra), only needed by these
+functions.
+
+Tabular output (BLAST's outfmt 6, DIAMOND's default format, and RAPSearch2's .m8
+file) and lastal's MAF output are read in chunks of lines. Each chunk is parsed
+into columns at once, then filtered and reduced to best hits, so outputs of tens of
+GB are processed in memory bounded by the chunk size.
+"""
+import gzip
+import math
+import os
+
+# Bytes of output parsed at a time.
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+
+TABULAR = "tabular"
+MAF = "maf"
+ALIGNMENT_FILE_FORMATS = (TABULAR, MAF)
+
+# Columns of BLAST's outfmt 6 (and DIAMOND's and RAPSearch2's tabular output) when none are specified
+BLAST_TABULAR_COLUMNS = (
+    "qseqid", "sseqid", "pident", "length", "mismatch", "gapopen",
+    "qstart", "qend", "sstart", "send", "evalue", "bitscore",
+)
+# Columns of alignments read from MAF. lastal reports raw scores rather than bit scores.
+MAF_COLUMNS = (
+    "qseqid", "sseqid", "pident", "length", "mismatch", "gapopen",
+    "qstart", "qend", "sstart", "send", "evalue", "score",
+)
+
+# Numeric outfmt 6 columns. Columns not listed here (e.g. "staxids") are read as strings.
+INTEGER_COLUMNS = (
+    "length", "mismatch", "gapopen", "gaps", "qstart", "qend", "sstart", "send", "qlen", "slen",
+    "nident", "positive", "qframe", "sframe", "frame", "score", "staxid",
+)
+FLOAT_COLUMNS = ("pident", "ppos", "evalue", "bitscore", "qcovs", "qcovhsp", "qcovus", "scovhsp")
+
+# Alignments are ranked by the first of these columns in the output when selecting best hits
+SCORE_COLUMNS = ("bitscore", "score", "evalue")
+
+# Name of each tool's alignment output when it's run with its default output_primary_name
+DEFAULT_ALIGNMENT_FILE_NAMES = {
+    "blastn": "blastn_results.out",
+    "diamond_blastp": "out_file.tsv",
+    "diamond_blastx": "out_file.tsv",
+    "diamond_blastx_parallel": "out_file.tsv",
+    "rapsearch2": "output.m8",
+    "lastal5": "out.maf",
+}
+
+# RAPSearch2 reports log10(e-value) by default, noted in its header
+LOG_EVALUE_FIELD = "log(e-value)"
+GAP = ord("-")
+
+
+class Alignments:
+    """Alignments (hits), as typed columns. Row `i` of each column is the `i`th alignment.
+
+    Columns are named as in BLAST's outfmt 6 (e.g. "qseqid", "pident", "evalue", "bitscore").
+    Query and subject IDs are object arrays of strings; other columns are int64 or float64 arrays.
+
+    :param columns: Dict of column names to arrays, in the order of the output's fields.
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __repr__(self):
+        return str(self.__dict__)
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __getitem__(self, column_name):
+        return self.columns[column_name]
+
+    @property
+    def column_names(self):
+        return list(self.columns)
+
+    def take(self, indices):
+        """Returns the alignments at `indices` (an array of row indices or a boolean mask)."""
+        return Alignments({name: column[indices] for name, column in self.columns.items()})
+
+    def get_row(self, index):
+        return {name: column[index] if column.dtype == object else column[index].item()
+                for name, column in self.columns.items()}
+
+    def to_dicts(self):
+        """Returns every alignment as a dict."""
+        return [self.get_row(index) for index in range(len(self))]
+
+
+def get_alignments_file_name(tool_name, output_primary_name=None):
+    """Returns the name of the alignments output by a tool.
+
+    :param tool_name: Name of the tool (e.g. "blastn", "rapsearch2").
+    :param output_primary_name: (optional) The output_primary_name the tool was run with.
+    """
+    if tool_name not in DEFAULT_ALIGNMENT_FILE_NAMES:
+        raise ValueError(
+            f"Can't read alignments output by {tool_name}. "
+            f"Supported tools: {', '.join(DEFAULT_ALIGNMENT_FILE_NAMES)}."
+        )
+    if not output_primary_name:
+        return DEFAULT_ALIGNMENT_FILE_NAMES[tool_name]
+    if tool_name == "rapsearch2" and not output_primary_name.endswith(".m8"):
+        # RAPSearch2's output_primary_name is the base name of its outputs (e.g. "output.m8" and "output.aln")
+        return f"{output_primary_name}.m8"
+    return output_primary_name
+
+
+def detect_alignments_file_format(alignments_path):
+    """Returns whether alignments are tabular (outfmt 6 / m8) or MAF, from the first alignment line."""
+    with _open_alignments(alignments_path) as alignments_file:
+        for line in alignments_file:
+            if line.startswith("#") or not line.strip():
+                continue
+            # Sequence IDs in tabular output can't contain spaces, so this only matches MAF's alignment lines
+            return MAF if line.startswith("a ") else TABULAR
+    return TABULAR
+
+
+def iter_alignments(alignments_path, columns=None, file_format=None, max_evalue=None, min_identity=None,
+                    best_hits=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yields Alignments read from tabular (outfmt 6 / m8) or MAF output, in chunks.
+
+    Filters and the best-hit reduction are applied to each chunk as it's read, so memory use is bounded by
+    `chunk_size` rather than the size of the output. Best hits are found among the alignments passing the filters.
+    They assume each query's alignments are written together, as BLAST, DIAMOND, RAPSearch2, and lastal do;
+    a query whose alignments are split across the output gets a best hit for each contiguous run.
+
+    Files ending in .gz are decompressed as they're read.
+
+    :param alignments_path: Path to the alignments.
+    :param columns: (optional) Names of the tabular output's columns, as a list or a BLAST outfmt string
+        (e.g. "6 qseqid sseqid pident evalue bitscore staxids"). Defaults to the 12 standard outfmt 6 columns.
+    :param file_format: (optional) "tabular" or "maf". Detected from the file if not given.
+    :param max_evalue: (optional) Only include alignments with e-values at most this.
+    :param min_identity: (optional) Only include alignments with percent identities (0-100) at least this.
+    :param best_hits: Whether to only include the highest-scoring alignment of each query.
+        Ties are broken by the order of the output.
+    :param chunk_size: Approximate number of bytes parsed per chunk. Bounds memory use.
+    """
+    import numpy as np
+
+    file_format = file_format or detect_alignments_file_format(alignments_path)
+    if file_format == MAF:
+        if columns is not None:
+            raise ValueError("Columns can't be specified for MAF alignments.")
+        chunks = _iter_maf_chunks(alignments_path, chunk_size)
+    elif file_format == TABULAR:
+        chunks = _iter_tabular_chunks(alignments_path, _get_column_names(columns), chunk_size)
+    else:
+        raise ValueError(f"Invalid file format: {file_format}. Must be one of {', '.join(ALIGNMENT_FILE_FORMATS)}.")
+
+    remaining_alignments = None
+    for alignments in chunks:
+        alignments = _filter_alignments(alignments, max_evalue, min_identity)
+        if best_hits and len(alignments):
+            if remaining_alignments is not None:
+                alignments = _concatenate_alignments([remaining_alignments, alignments])
+            # The last query's alignments may continue in the next chunk, so they're held back
+            is_other_query = alignments["qseqid"] != alignments["qseqid"][-1]
+            last_query_start = len(is_other_query) - int(np.argmax(is_other_query[::-1])) if is_other_query.any() else 0
+            remaining_alignments = alignments.take(slice(last_query_start, None))
+            alignments = _get_best_hits(alignments.take(slice(0, last_query_start)))
+        if len(alignments):
+            yield alignments
+    if remaining_alignments is not None:
+        yield _get_best_hits(remaining_alignments)
+
+
+def load_alignments(alignments_path, **kwargs):
+    """Reads alignments from tabular (outfmt 6 / m8) or MAF output into one Alignments.
+    See `iter_alignments` for keyword arguments. To bound memory use, filter them or select best hits.
+
+    :param alignments_path: Path to the alignments.
+    """
+    chunks = list(iter_alignments(alignments_path, **kwargs))
+    if not chunks:
+        file_format = kwargs.get("file_format") or detect_alignments_file_format(alignments_path)
+        column_names = MAF_COLUMNS if file_format == MAF else _get_column_names(kwargs.get("columns"))
+        return _get_empty_alignments(column_names)
+    return chunks[0] if len(chunks) == 1 else _concatenate_alignments(chunks)
+
+
+def _open_alignments(alignments_path):
+    if os.fspath(alignments_path).endswith(".gz"):
+        return gzip.open(alignments_path, "rt")
+    return open(alignments_path, "r")
+
+
+def _get_column_names(columns):
+    if columns is None:
+        return BLAST_TABULAR_COLUMNS
+    if isinstance(columns, str):
+        columns = columns.split()
+        if columns and columns[0].isdigit():
+            # e.g. "6 qseqid sseqid", as passed to BLAST's -outfmt
+            columns = columns[1:]
+        if columns and columns[0] == "std":
+            columns = list(BLAST_TABULAR_COLUMNS) + columns[1:]
+    return tuple(columns)
+
+
+def _get_column_dtype(column_name):
+    if column_name in INTEGER_COLUMNS:
+        return "i8"
+    if column_name in FLOAT_COLUMNS:
+        return "f8"
+    return "O"
+
+
+def _get_empty_alignments(column_names):
+    import numpy as np
+
+    return Alignments({name: np.zeros(0, dtype=_get_column_dtype(name)) for name in column_names})
+
+
+def _iter_line_chunks(alignments_path, chunk_size):
+    with _open_alignments(alignments_path) as alignments_file:
+        while True:
+            lines = alignments_file.readlines(chunk_size)
+            if not lines:
+                return
+            yield lines
+
+
+def _iter_tabular_chunks(alignments_path, column_names, chunk_size):
+    import numpy as np
+
+    dtype = [(name, _get_column_dtype(name)) for name in column_names]
+    is_log_evalue = False
+    for lines in _iter_line_chunks(alignments_path, chunk_size):
+        if any(line.startswith("#") for line in lines):
+            is_log_evalue = is_log_evalue or any(
+                line.startswith("#") and LOG_EVALUE_FIELD in line for line in lines
+            )
+            lines = [line for line in lines if not line.startswith("#")]
+        lines = [line for line in lines if line.strip()]
+        if not lines:
+            continue
+        try:
+            # Parses every field of the chunk at once
+            rows = np.loadtxt(lines, delimiter="\t", dtype=dtype, comments=None, ndmin=1)
+        except ValueError as err:
+            raise ValueError(f"Invalid tabular alignments {alignments_path}: {err}") from None
+        columns = {name: np.ascontiguousarray(rows[name]) for name in column_names}
+        if is_log_evalue and "evalue" in columns:
+            columns["evalue"] = np.power(10.0, columns["evalue"])
+        yield Alignments(columns)
+
+
+def _iter_maf_chunks(alignments_path, chunk_size):
+    remaining_lines = []
+    for lines in _iter_line_chunks(alignments_path, chunk_size):
+        lines = remaining_lines + lines
+        # The last alignment block may continue in the next chunk
+        last_block_start = len(lines)
+        for index in range(len(lines) - 1, -1, -1):
+            if lines[index].startswith("a"):
+                last_block_start = index
+                break
+        remaining_lines = lines[last_block_start:]
+        alignments = _parse_maf_lines(lines[:last_block_start], alignments_path)
+        if len(alignments):
+            yield alignments
+    alignments = _parse_maf_lines(remaining_lines, alignments_path)
+    if len(alignments):
+        yield alignments
+
+
+def _parse_maf_lines(lines, alignments_path):
+    """Parses MAF alignment blocks. Each block has an "a" line followed by the reference (subject) "s" line and the
+    query "s" line, as written by lastal."""
+    import numpy as np
+
+    scores, evalues, subject_rows, query_rows = [], [], [], []
+    block_rows = None
+    for line in lines:
+        if line.startswith("a"):
+            fields = dict(field.split("=", 1) for field in line.split()[1:] if "=" in field)
+            scores.append(float(fields.get("score", "nan")))
+            evalues.append(float(fields.get("E", "nan")))
+            block_rows = []
+        elif line.startswith("s") and block_rows is not None:
+            block_rows.append(line.split())
+            if len(block_rows) == 2:
+                subject_rows.append(block_rows[0])
+                query_rows.append(block_rows[1])
+                block_rows = None
+    if len(subject_rows) != len(scores):
+        raise ValueError(f"Invalid MAF alignments {alignments_path}: every block must have 2 sequences.")
+    if not scores:
+        return _get_empty_alignments(MAF_COLUMNS)
+    if any(len(row) != 7 for row in subject_rows) or any(len(row) != 7 for row in query_rows):
+        raise ValueError(f"Invalid MAF alignments {alignments_path}: every \"s\" line must have 7 fields.")
+
+    query_ids, query_starts, query_ends, query_texts = _parse_maf_sequences(query_rows)
+    subject_ids, subject_starts, subject_ends, subject_texts = _parse_maf_sequences(subject_rows)
+    lengths, matches, mismatches, gap_opens = _count_alignment_columns(query_texts, subject_texts)
+    identities = np.divide(100.0 * matches, lengths, out=np.zeros(len(lengths)), where=lengths != 0)
+    return Alignments({
+        "qseqid": query_ids,
+        "sseqid": subject_ids,
+        "pident": identities,
+        "length": lengths,
+        "mismatch": mismatches,
+        "gapopen": gap_opens,
+        "qstart": query_starts,
+        "qend": query_ends,
+        "sstart": subject_starts,
+        "send": subject_ends,
+        "evalue": np.array(evalues),
+        "score": np.array(scores).astype(np.int64) if not any(map(math.isnan, scores)) else np.array(scores),
+    })
+
+
+def _parse_maf_sequences(rows):
+    """Returns the IDs, 1-based start and end coordinates, and aligned texts of MAF "s" lines.
+    Like BLAST, coordinates on the reverse strand are given on the forward strand, with start > end."""
+    import numpy as np
+
+    ids = np.empty(len(rows), dtype=object)
+    ids[:] = [row[1] for row in rows]
+    # Fields are: s, name, start, size, strand, source size, text
+    starts, sizes, source_sizes = np.array([(row[2], row[3], row[5]) for row in rows], dtype=np.int64).T
+    is_reverse = np.array([row[4] == "-" for row in rows], dtype=bool)
+    forward_starts = np.where(is_reverse, source_sizes - starts, starts + 1)
+    forward_ends = np.where(is_reverse, source_sizes - starts - sizes + 1, starts + sizes)
+    return ids, forward_starts, forward_ends, [row[6] for row in rows]
+
+
+def _count_alignment_columns(query_texts, subject_texts):
+    """Returns the lengths, identical columns, mismatched columns, and gap openings of aligned texts,
+    computed over all alignments at once."""
+    import numpy as np
+
+    lengths = np.fromiter(map(len, query_texts), dtype=np.int64, count=len(query_texts))
+    starts = np.cumsum(lengths) - lengths
+    queries = np.frombuffer("".join(query_texts).upper().encode("ascii"), dtype=np.uint8)
+    subjects = np.frombuffer("".join(subject_texts).upper().encode("ascii"), dtype=np.uint8)
+    if len(queries) != len(subjects):
+        raise ValueError("Invalid MAF alignments: aligned texts must have the same length.")
+    query_gaps = queries == GAP
+    subject_gaps = subjects == GAP
+    is_aligned = ~(query_gaps | subject_gaps)
+    matches = np.add.reduceat(is_aligned & (queries == subjects), starts, dtype=np.int64)
+    mismatches = np.add.reduceat(is_aligned, starts, dtype=np.int64) - matches
+    gap_opens = np.zeros(len(lengths), dtype=np.int64)
+    for gaps in (query_gaps, subject_gaps):
+        previous_gaps = np.empty_like(gaps)
+        previous_gaps[1:] = gaps[:-1]
+        previous_gaps[starts] = False
+        gap_opens += np.add.reduceat(gaps & ~previous_gaps, starts, dtype=np.int64)
+    return lengths, matches, mismatches, gap_opens
+
+
+def _filter_alignments(alignments, max_evalue, min_identity):
+    if max_evalue is None and min_identity is None:
+        return alignments
+    mask = None
+    for column_name, value, is_max in (("evalue", max_evalue, True), ("pident", min_identity, False)):
+        if value is None:
+            continue
+        if column_name not in alignments.columns:
+            raise ValueError(f"Can't filter by {column_name}: the alignments don't have a {column_name} column.")
+        column_mask = alignments[column_name] <= value if is_max else alignments[column_name] >= value
+        mask = column_mask if mask is None else mask & column_mask
+    return alignments.take(mask)
+
+
+def _get_best_hits(alignments):
+    """Returns the highest-scoring alignment of each contiguous run of a query's alignments."""
+    import numpy as np
+
+    if not len(alignments):
+        return alignments
+    score_column = next((name for name in SCORE_COLUMNS if name in alignments.columns), None)
+    if score_column is None:
+        raise ValueError(f"Can't select best hits: the alignments need one of {', '.join(SCORE_COLUMNS)}.")
+    # Lower e-values are better, so they're negated
+    scores = -alignments[score_column] if score_column == "evalue" else alignments[score_column]
+    query_ids = alignments["qseqid"]
+    is_query_start = np.ones(len(query_ids), dtype=bool)
+    is_query_start[1:] = query_ids[1:] != query_ids[:-1]
+    query_starts = np.flatnonzero(is_query_start)
+    query_indices = np.cumsum(is_query_start) - 1
+    best_scores = np.maximum.reduceat(scores, query_starts)
+    candidates = np.flatnonzero(scores == best_scores[query_indices])
+    is_first_candidate = np.ones(len(candidates), dtype=bool)
+    is_first_candidate[1:] = query_indices[candidates[1:]] != query_indices[candidates[:-1]]
+    return alignments.take(candidates[is_first_candidate])
+
+
+def _concatenate_alignments(chunks):
+    import numpy as np
+
+    return Alignments({
+        name: np.concatenate([chunk[name] for chunk in chunks])
+        for name in chunks[0].columns
+    })
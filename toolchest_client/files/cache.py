@@ -0,0 +1,54 @@
+"""
+toolchest_client.files.cache
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+In-process caches for file metadata.
+"""
+from collections import OrderedDict
+import threading
+import time
+
+
+class TTLCache:
+    """A thread-safe, least-recently-used cache whose entries expire after a fixed time.
+
+    :param max_size: Maximum number of entries. The least recently used entry is evicted first.
+    :param ttl_seconds: Seconds after which an entry is no longer returned.
+    """
+
+    def __init__(self, max_size=4096, ttl_seconds=300):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,82 @@
+"""
+toolchest_client.files.chunks
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Functions for reading large text files in chunks of whole lines, and for parsing
+the numeric fields of a chunk with vectorized NumPy operations. They're shared by
+the parsers of tool output (e.g. Kraken2 per-read output and SAM).
+"""
+import gzip
+import mmap
+import os
+
+ZERO = ord("0")
+# Maximum digits parsed from a number, so that it fits in an int64
+MAX_UINT_DIGITS = 18
+
+
+def iter_line_chunks(path, chunk_size):
+    """Yields chunks of whole lines of a file, as bytes."""
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as gzip_file:
+            remainder = b""
+            while True:
+                data = gzip_file.read(chunk_size)
+                if not data:
+                    break
+                data = remainder + data
+                last_newline = data.rfind(b"\n")
+                if last_newline == -1:
+                    remainder = data
+                    continue
+                remainder = data[last_newline + 1:]
+                yield data[:last_newline + 1]
+            if remainder:
+                yield remainder
+        return
+
+    if os.path.getsize(path) == 0:
+        return
+    with open(path, "rb") as output_file, mmap.mmap(output_file.fileno(), 0, access=mmap.ACCESS_READ) as memory_map:
+        start = 0
+        file_size = len(memory_map)
+        while start < file_size:
+            end = min(start + chunk_size, file_size)
+            if end < file_size:
+                last_newline = memory_map.rfind(b"\n", start, end)
+                # If a line is longer than the chunk, the chunk is extended to the end of the line
+                end = last_newline + 1 if last_newline != -1 else _find_line_end(memory_map, end, file_size)
+            # Chunks are copied out of the memory map, so that no arrays reference it once it's closed
+            yield memory_map[start:end]
+            start = end
+
+
+def _find_line_end(memory_map, position, file_size):
+    newline = memory_map.find(b"\n", position)
+    return newline + 1 if newline != -1 else file_size
+
+
+def parse_leading_uints(buffer, starts, ends):
+    """Parses the unsigned integer at the start of each field buffer[starts[i]:ends[i]], vectorized across fields.
+
+    Returns an int64 array of values and an array of the number of digits parsed from each field.
+    """
+    import numpy as np
+
+    widths = ends - starts
+    values = np.zeros(len(widths), dtype=np.int64)
+    num_digits = np.zeros(len(widths), dtype=np.int64)
+    if len(widths) == 0:
+        return values, num_digits
+    # Longer numbers would overflow, and are treated as not numbers
+    max_width = min(int(widths.max()), MAX_UINT_DIGITS)
+    is_in_number = widths > 0
+    # Reads the j-th character of every field at once, accumulating digits until each field's first non-digit
+    for position in range(max_width):
+        digits = np.subtract(buffer.take(starts + position, mode="clip"), ZERO, dtype=np.uint8)
+        is_in_number &= (position < widths) & (digits < 10)
+        if not is_in_number.any():
+            break
+        values = np.where(is_in_number, values * 10 + digits, values)
+        num_digits += is_in_number
+    return values, num_digits
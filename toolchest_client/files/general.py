@@ -4,13 +4,19 @@ toolchest_client.files.general
 
 General file handling functions.
 """
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from loguru import logger
 import os
 import shutil
 
+from .preflight import InputLocation, InputResolver
 from .public_uris import get_url_with_protocol, path_is_http_url, path_is_accessible_ftp_url, \
     get_ftp_url_file_size
-from .s3 import assert_accessible_s3, get_s3_file_size, path_is_s3_uri
+from .s3 import get_s3_file_size, path_is_s3_uri
+from toolchest_client.tracing import span
+
+# Extension of archives written by shutil.make_archive with the "gztar" format.
+ARCHIVE_EXTENSION = ".tar.gz"
 
 
 def assert_exists(path, must_be_file=False, must_be_directory=False):
@@ -32,27 +38,31 @@ def assert_exists(path, must_be_file=False, must_be_directory=False):
         raise ValueError(f"Directory entry at {path} is not a directory")
 
 
-def check_file_size(file_path, max_size_bytes=None):
+def check_file_size(file_path, max_size_bytes=None, file_size_bytes=None):
     """Raises an error if the file is above the non-multipart upload limit for S3 (5GB)
 
     :param file_path: A path to a file.
     :type file_path: string
     :param max_size_bytes: Maximum number of bytes allowed for a file. Throws error if above limit.
     :type max_size_bytes: int | None
+    :param file_size_bytes: (optional) Already-known size of the file, e.g. from `files_and_sizes_in_path`.
+        If given, the size is not looked up again.
+    :type file_size_bytes: int | None
     """
-    if path_is_s3_uri(file_path):
-        # Get file size S3 metadata, via API.
-        # NOTE: If the file is already in S3, the size is checked as well to enforce an expected file size
-        file_size_bytes = get_s3_file_size(file_path)
-    elif path_is_http_url(file_path):
-        # Client does not track size for http inputs
-        file_size_bytes = 0
-    elif path_is_accessible_ftp_url(file_path):
-        # Get file size via a SIZE request
-        file_size_bytes = get_ftp_url_file_size(file_path)
-    else:
-        assert_exists(file_path, must_be_file=True)
-        file_size_bytes = os.stat(file_path).st_size
+    if file_size_bytes is None:
+        if path_is_s3_uri(file_path):
+            # Get file size S3 metadata, via API.
+            # NOTE: If the file is already in S3, the size is checked as well to enforce an expected file size
+            file_size_bytes = get_s3_file_size(file_path)
+        elif path_is_http_url(file_path):
+            # Client does not track size for http inputs
+            file_size_bytes = 0
+        elif path_is_accessible_ftp_url(file_path):
+            # Get file size via a SIZE request
+            file_size_bytes = get_ftp_url_file_size(file_path)
+        else:
+            assert_exists(file_path, must_be_file=True)
+            file_size_bytes = os.stat(file_path).st_size
 
     if max_size_bytes:
         if file_size_bytes >= max_size_bytes:
@@ -67,26 +77,46 @@ def files_in_path(files):
     :param files: A string or list of strings to files and directories.
     :type files: string | list
     """
+    return [file_path for file_path, _ in files_and_sizes_in_path(files)]
+
+
+def files_and_sizes_in_path(files, num_threads=None, resolver=None):
+    """Returns a list of (path, size in bytes) tuples for all files found within the provided input path(s).
+
+    Directories are walked with `os.scandir`, so file type checks use the directory entry instead of
+    extra syscalls per file. On high-latency filesystems (e.g. network mounts), directories can be
+    scanned concurrently by setting `num_threads` or the TOOLCHEST_FILE_SCAN_THREADS env var.
+
+    HTTP inputs are reported with a size of 0, as the client does not track size for HTTP inputs.
+
+    :param files: A string or list of strings to files and directories.
+    :type files: string | list
+    :param num_threads: (optional) Number of threads used to scan directories. Scans serially if unset or 1.
+    :type num_threads: int | None
+    :param resolver: (optional) InputResolver that caches how each path was classified, for reuse later in the run.
+    :type resolver: InputResolver | None
+    """
+    if num_threads is None:
+        num_threads = int(os.environ.get("TOOLCHEST_FILE_SCAN_THREADS") or 1)
+    if resolver is None:
+        resolver = InputResolver()
+
     # If it's a list, find all the files within all of the elements
     if isinstance(files, list):
+        # Remote inputs are checked concurrently up front, instead of one at a time below
+        resolver.resolve([sub_path for sub_path in files if isinstance(sub_path, str)])
         more_files = []
         for sub_path in files:
-            more_files.extend(files_in_path(sub_path))
+            more_files.extend(files_and_sizes_in_path(sub_path, num_threads=num_threads, resolver=resolver))
         return more_files
 
-    # If it's an S3 URI, treat it as a file
-    # Check if it is accessible from a worker node
-    if path_is_s3_uri(files):
-        assert_accessible_s3(files)
-        return [files]
-
-    # If it's an HTTP or HTTPS URL, treat it as a file
-    if path_is_http_url(files):
-        return [get_url_with_protocol(files)]
-
-    # If it's an FTP URL, treat it as a file
-    if path_is_accessible_ftp_url(files):
-        return [files]
+    # S3 URIs (checked to be accessible from a worker node), HTTP/HTTPS URLs, and FTP URLs are treated as files
+    resolved_input = resolver.get(files)
+    if resolved_input.location == InputLocation.HTTP:
+        # Client does not track size for http inputs
+        return [(get_url_with_protocol(files), 0)]
+    if resolved_input.is_remote:
+        return [(files, resolved_input.size)]
 
     # Path is local, expand ~ in path if present
     files = os.path.expanduser(files)
@@ -96,16 +126,84 @@ def files_in_path(files):
 
     # If it's a path to a single file, return a list containing just the path to that file
     if os.path.isfile(files):
-        return [files]
-
+        files_and_sizes = [(files, os.stat(files).st_size)]
     # If it's a directory, return a list of paths to all files in the directory
-    files_and_directories = os.listdir(files)
-    more_files = []
-    for sub_path in files_and_directories:
-        abs_sub_path = os.path.join(files, sub_path)
-        more_files.extend(files_in_path(abs_sub_path))
+    elif num_threads > 1:
+        files_and_sizes = _walk_directory_threaded(files, num_threads)
+    else:
+        files_and_sizes = _walk_directory(files)
 
-    return more_files
+    for file_path, file_size in files_and_sizes:
+        resolver.add(file_path, InputLocation.LOCAL, file_size)
+    return files_and_sizes
+
+
+def _scan_directory(directory):
+    """Lists a single directory level as (path, size) tuples. Subdirectories have a size of None.
+
+    :param directory: Path to a local directory.
+    """
+    entries = []
+    with os.scandir(directory) as directory_entries:
+        for entry in directory_entries:
+            # is_dir() and is_file() follow symlinks, matching os.path.isdir() and os.path.isfile()
+            if entry.is_dir():
+                entries.append((entry.path, None))
+            elif entry.is_file():
+                entries.append((entry.path, entry.stat().st_size))
+            else:
+                # Errors on broken symlinks; other special files (e.g. sockets) are skipped
+                assert_exists(entry.path)
+    return entries
+
+
+def _walk_directory(directory):
+    """Returns (path, size) tuples for all files within a local directory, walking depth-first."""
+    files_and_sizes = []
+    for entry_path, entry_size in _scan_directory(directory):
+        if entry_size is None:
+            files_and_sizes.extend(_walk_directory(entry_path))
+        else:
+            files_and_sizes.append((entry_path, entry_size))
+    return files_and_sizes
+
+
+def _walk_directory_threaded(directory, num_threads):
+    """Returns (path, size) tuples for all files within a local directory, scanning directories concurrently.
+
+    The result has the same order as `_walk_directory`.
+    """
+    listings = {}
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        pending = {executor.submit(_scan_directory, directory): directory}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                scanned_directory = pending.pop(future)
+                listings[scanned_directory] = future.result()
+                for entry_path, entry_size in listings[scanned_directory]:
+                    if entry_size is None:
+                        pending[executor.submit(_scan_directory, entry_path)] = entry_path
+
+    def flatten(listed_directory):
+        files_and_sizes = []
+        for entry_path, entry_size in listings[listed_directory]:
+            if entry_size is None:
+                files_and_sizes.extend(flatten(entry_path))
+            else:
+                files_and_sizes.append((entry_path, entry_size))
+        return files_and_sizes
+
+    return flatten(directory)
+
+
+def get_archive_path(file_path):
+    """Returns the path where `compress_files_in_path` writes the archive of a local path.
+
+    :param file_path: A string to a local file or directory.
+    """
+    temp_directory = os.environ.get("TOOLCHEST_TEMP_DIR") or "./temp_toolchest"
+    return f"{temp_directory}/{os.path.basename(file_path)}{ARCHIVE_EXTENSION}"
 
 
 def compress_files_in_path(file_path, retain_base_directory):
@@ -117,22 +215,24 @@ def compress_files_in_path(file_path, retain_base_directory):
     :param retain_base_directory: Sets whether the base directory of the path is retained.
     """
     assert_exists(file_path)
-    temp_directory = os.environ.get("TOOLCHEST_TEMP_DIR") or "./temp_toolchest"
+    archive_base_name = get_archive_path(file_path)[:-len(ARCHIVE_EXTENSION)]
 
     logger.debug(f"Creating an archive of all files in {file_path}...")
-    if os.path.isdir(file_path) and not retain_base_directory:
-        zip_location = shutil.make_archive(
-            base_name=f"{temp_directory}/{os.path.basename(file_path)}",
-            format="gztar",
-            root_dir=file_path
-        )
-    else:
-        zip_location = shutil.make_archive(
-            base_name=f"{temp_directory}/{os.path.basename(file_path)}",
-            format="gztar",
-            root_dir=os.path.dirname(file_path),
-            base_dir=os.path.basename(file_path)
-        )
+    with span("toolchest.compress", {"toolchest.file_path": file_path}) as compress_span:
+        if os.path.isdir(file_path) and not retain_base_directory:
+            zip_location = shutil.make_archive(
+                base_name=archive_base_name,
+                format="gztar",
+                root_dir=file_path
+            )
+        else:
+            zip_location = shutil.make_archive(
+                base_name=archive_base_name,
+                format="gztar",
+                root_dir=os.path.dirname(file_path),
+                base_dir=os.path.basename(file_path)
+            )
+        compress_span.set_attribute("toolchest.bytes", os.path.getsize(zip_location))
 
     return zip_location
 
@@ -0,0 +1,268 @@
+"""
+toolchest_client.files.humann_tables
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Local implementations of HUMAnN 3's lightweight table utilities (humann_join_tables,
+humann_renorm_table, humann_reduce_table, and humann_split_stratified_table).
+NumPy is an optional dependency (installed with the `analysis` extra), only
+needed by these functions.
+
+Tables are read in chunks of lines, and each chunk's values are parsed and
+transformed as a NumPy array, so large stratified tables are processed in bounded
+memory (except when joining, which holds the joined table).
+"""
+from itertools import islice
+import os
+
+# Lines of a table parsed at a time.
+DEFAULT_CHUNK_LINES = 100000
+
+# Features that aren't gene families or pathways. Stratified rows of these (e.g. "UNINTEGRATED|g__Bacteroides")
+# are also special.
+SPECIAL_FEATURES = ("UNMAPPED", "UNINTEGRATED", "UNGROUPED")
+
+# Sample names of un-normalized tables end with this, e.g. "sample1_Abundance-RPKs"
+RPKS_SUFFIX = "-RPKs"
+UNIT_SUFFIXES = {"cpm": "-CPM", "relab": "-RELAB"}
+UNIT_SCALES = {"cpm": 1e6, "relab": 1.0}
+
+REDUCE_FUNCTIONS = ("min", "max", "mean", "sum")
+
+# Values are written with up to 10 significant digits, like HUMAnN's default --output-max-decimals
+VALUE_FORMAT = "%.10g"
+
+
+def read_table_header(table_path):
+    """Returns the header of a HUMAnN table as a list, e.g. ["# Gene Family", "sample1_Abundance-RPKs"]."""
+    with open(table_path, "r") as table_file:
+        return table_file.readline().rstrip("\n").split("\t")
+
+
+def iter_table_chunks(table_path, chunk_lines=DEFAULT_CHUNK_LINES):
+    """Yields the rows of a HUMAnN table in chunks, as (list of features, float64 array of shape (rows, samples)).
+
+    :param table_path: Path to a tab-separated HUMAnN table. Its first line is the header.
+    :param chunk_lines: Number of lines parsed at a time. Bounds memory use.
+    """
+    import numpy as np
+
+    with open(table_path, "r") as table_file:
+        num_fields = len(table_file.readline().rstrip("\n").split("\t"))
+        while True:
+            lines = list(islice(table_file, chunk_lines))
+            if not lines:
+                return
+            lines = [line for line in lines if line != "\n"]
+            if not lines:
+                continue
+            if any(line.count("\t") != num_fields - 1 for line in lines):
+                raise ValueError(f"Invalid HUMAnN table {table_path}: every line must have {num_fields} fields.")
+            try:
+                # Parses every value of the chunk at once
+                values = np.loadtxt(lines, delimiter="\t", usecols=range(1, num_fields), ndmin=2, comments=None)
+            except ValueError as err:
+                raise ValueError(f"Invalid HUMAnN table {table_path}: {err}") from None
+            yield [line.partition("\t")[0] for line in lines], values
+
+
+def read_table(table_path):
+    """Reads a whole HUMAnN table. Returns its header, list of features, and float64 array of values."""
+    import numpy as np
+
+    header = read_table_header(table_path)
+    features, values = [], [np.zeros((0, len(header) - 1))]
+    for chunk_features, chunk_values in iter_table_chunks(table_path):
+        features.extend(chunk_features)
+        values.append(chunk_values)
+    return header, features, np.concatenate(values)
+
+
+def join_tables(input_paths, output_file_path, file_name=None, search_subdirectories=False):
+    """Joins HUMAnN tables on their features, like humann_join_tables. Features missing from a table are 0.
+
+    Features are sorted by name in the joined table.
+
+    :param input_paths: A directory of tables, or a list of paths to tables.
+    :param output_file_path: Path to which the joined table is written.
+    :param file_name: (optional) Only join tables with names containing this, e.g. "genefamilies".
+    :param search_subdirectories: Whether to also join tables in subdirectories of an input directory.
+    """
+    import numpy as np
+
+    table_paths = _get_table_paths(input_paths, file_name, search_subdirectories)
+    if not table_paths:
+        raise ValueError(f"No tables to join in {input_paths}.")
+    tables = [read_table(table_path) for table_path in table_paths]
+
+    features = sorted(set().union(*(table_features for _, table_features, _ in tables)))
+    feature_rows = dict(zip(features, range(len(features))))
+    header = [tables[0][0][0]]
+    joined_values = np.zeros((len(features), sum(table_values.shape[1] for _, _, table_values in tables)))
+    column = 0
+    for table_header, table_features, table_values in tables:
+        rows = np.fromiter(map(feature_rows.__getitem__, table_features), dtype=np.int64, count=len(table_features))
+        joined_values[rows, column:column + table_values.shape[1]] = table_values
+        column += table_values.shape[1]
+        header.extend(table_header[1:])
+    _write_table(output_file_path, header, [(features, joined_values)])
+    return output_file_path
+
+
+def renorm_table(input_path, output_file_path, units="cpm", mode="community", special=True,
+                 update_sample_names=False):
+    """Normalizes each sample of a HUMAnN table to relative abundance or copies per million, like
+    humann_renorm_table. The table is read twice: once to sum each sample, then to write normalized values.
+
+    :param input_path: Path to the table.
+    :param output_file_path: Path to which the normalized table is written.
+    :param units: "cpm" (copies per million) or "relab" (relative abundance, summing to 1).
+    :param mode: "community", to normalize all rows by each sample's total of unstratified rows; or
+        "levelwise", to normalize unstratified and stratified rows separately.
+    :param special: Whether to include special features (e.g. UNMAPPED). If false, they're removed.
+    :param update_sample_names: Whether to replace "-RPKs" at the end of sample names with the units.
+    """
+    import numpy as np
+
+    if units not in UNIT_SCALES:
+        raise ValueError(f"Invalid units: {units}. Must be one of {', '.join(UNIT_SCALES)}.")
+    if mode not in ("community", "levelwise"):
+        raise ValueError(f"Invalid mode: {mode}. Must be community or levelwise.")
+
+    header = read_table_header(input_path)
+    unstratified_totals = np.zeros(len(header) - 1)
+    stratified_totals = np.zeros(len(header) - 1)
+    for features, values in iter_table_chunks(input_path):
+        is_stratified, is_kept = _classify_features(features, special)
+        unstratified_totals += values[is_kept & ~is_stratified].sum(axis=0)
+        stratified_totals += values[is_kept & is_stratified].sum(axis=0)
+    if mode == "community":
+        stratified_totals = unstratified_totals
+    unstratified_scales = _get_scales(unstratified_totals, UNIT_SCALES[units])
+    stratified_scales = _get_scales(stratified_totals, UNIT_SCALES[units])
+
+    def iter_normalized_chunks():
+        for chunk_features, chunk_values in iter_table_chunks(input_path):
+            chunk_is_stratified, chunk_is_kept = _classify_features(chunk_features, special)
+            scales = np.where(chunk_is_stratified[:, None], stratified_scales, unstratified_scales)
+            kept_rows = np.flatnonzero(chunk_is_kept)
+            yield [chunk_features[row] for row in kept_rows.tolist()], chunk_values[kept_rows] * scales[kept_rows]
+
+    if update_sample_names:
+        header = header[:1] + [
+            sample_name[:-len(RPKS_SUFFIX)] + UNIT_SUFFIXES[units] if sample_name.endswith(RPKS_SUFFIX)
+            else sample_name
+            for sample_name in header[1:]
+        ]
+    _write_table(output_file_path, header, iter_normalized_chunks())
+    return output_file_path
+
+
+def reduce_table(input_path, output_file_path, function="max", sort_by=None):
+    """Reduces each row of a HUMAnN table to one value across samples, like humann_reduce_table.
+
+    :param input_path: Path to the table.
+    :param output_file_path: Path to which the reduced table is written.
+    :param function: "min", "max", "mean", or "sum".
+    :param sort_by: (optional) "name", to sort rows by feature; or "value", to sort by reduced value (descending).
+        Defaults to the order of the input table.
+    """
+    import numpy as np
+
+    if function not in REDUCE_FUNCTIONS:
+        raise ValueError(f"Invalid function: {function}. Must be one of {', '.join(REDUCE_FUNCTIONS)}.")
+    if sort_by not in (None, "name", "value"):
+        raise ValueError(f"Invalid sort_by: {sort_by}. Must be name or value.")
+    reduce = getattr(np, function)
+    header = read_table_header(input_path)[:1] + [function]
+    chunks = (
+        (features, reduce(values, axis=1, keepdims=True))
+        for features, values in iter_table_chunks(input_path)
+    )
+    if sort_by is not None:
+        features, values = [], []
+        for chunk_features, chunk_values in chunks:
+            features.extend(chunk_features)
+            values.append(chunk_values[:, 0])
+        values = np.concatenate(values) if values else np.zeros(0)
+        order = np.argsort(features, kind="stable") if sort_by == "name" else np.argsort(-values, kind="stable")
+        order = order.tolist()
+        chunks = [([features[row] for row in order], values[order][:, None])]
+    _write_table(output_file_path, header, chunks)
+    return output_file_path
+
+
+def split_stratified_table(input_path, output_dir):
+    """Splits a HUMAnN table into its stratified and unstratified rows, like humann_split_stratified_table.
+
+    Writes `<name>_stratified.tsv` and `<name>_unstratified.tsv` to `output_dir`, and returns their paths.
+
+    :param input_path: Path to the table.
+    :param output_dir: Directory to which the tables are written.
+    """
+    import numpy as np
+
+    os.makedirs(output_dir, exist_ok=True)
+    table_name = os.path.splitext(os.path.basename(input_path))[0]
+    stratified_path = os.path.join(output_dir, f"{table_name}_stratified.tsv")
+    unstratified_path = os.path.join(output_dir, f"{table_name}_unstratified.tsv")
+    header = read_table_header(input_path)
+    with open(stratified_path, "w") as stratified_file, open(unstratified_path, "w") as unstratified_file:
+        stratified_file.write("\t".join(header) + "\n")
+        unstratified_file.write("\t".join(header) + "\n")
+        for features, values in iter_table_chunks(input_path):
+            is_stratified, _ = _classify_features(features, special=True)
+            for table_file, rows in [(stratified_file, np.flatnonzero(is_stratified)),
+                                     (unstratified_file, np.flatnonzero(~is_stratified))]:
+                _write_rows(table_file, [features[row] for row in rows.tolist()], values[rows])
+    return [stratified_path, unstratified_path]
+
+
+def _get_table_paths(input_paths, file_name, search_subdirectories):
+    if isinstance(input_paths, (str, os.PathLike)) and os.path.isdir(input_paths):
+        table_paths = []
+        for directory_path, directory_names, file_names in os.walk(input_paths):
+            table_paths.extend(os.path.join(directory_path, name) for name in file_names)
+            if not search_subdirectories:
+                break
+    elif isinstance(input_paths, (str, os.PathLike)):
+        table_paths = [input_paths]
+    else:
+        table_paths = list(input_paths)
+    table_paths = [os.fspath(table_path) for table_path in table_paths]
+    if file_name:
+        table_paths = [table_path for table_path in table_paths if file_name in os.path.basename(table_path)]
+    return sorted(table_paths)
+
+
+def _classify_features(features, special):
+    """Returns whether each feature is stratified, and whether it's kept (i.e. not an excluded special feature)."""
+    import numpy as np
+
+    is_stratified = np.fromiter(("|" in feature for feature in features), dtype=bool, count=len(features))
+    if special:
+        return is_stratified, np.ones(len(features), dtype=bool)
+    is_special = np.fromiter(
+        (feature.split("|", 1)[0] in SPECIAL_FEATURES for feature in features), dtype=bool, count=len(features),
+    )
+    return is_stratified, ~is_special
+
+
+def _get_scales(totals, scale):
+    """Returns the factor by which each sample is multiplied to normalize it. Samples summing to 0 stay 0."""
+    import numpy as np
+
+    return np.divide(scale, totals, out=np.zeros_like(totals), where=totals != 0)
+
+
+def _write_table(output_file_path, header, chunks):
+    output_dir = os.path.dirname(os.path.abspath(output_file_path))
+    os.makedirs(output_dir, exist_ok=True)
+    with open(output_file_path, "w") as output_file:
+        output_file.write("\t".join(header) + "\n")
+        for features, values in chunks:
+            _write_rows(output_file, features, values)
+
+
+def _write_rows(output_file, features, values):
+    row_format = "%s\t" + "\t".join([VALUE_FORMAT] * values.shape[1]) + "\n"
+    output_file.writelines(row_format % (feature, *row) for feature, row in zip(features, values.tolist()))
@@ -0,0 +1,335 @@
+"""
+toolchest_client.files.kraken2
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Functions for loading Kraken2 reports and per-read classifications into typed
+NumPy arrays. NumPy is an optional dependency (installed with the `analysis`
+extra), only needed by these functions.
+
+The per-read output (often many GB) is read in chunks from a memory map, and each
+chunk is parsed with vectorized operations, so summarizing 100M reads takes seconds
+and memory is bounded by the chunk size.
+"""
+import re
+
+from toolchest_client.files.chunks import iter_line_chunks, parse_leading_uints
+
+KRAKEN2_REPORT_FILE_NAME = "kraken2_report.txt"
+KRAKEN2_OUTPUT_FILE_NAME = "kraken2_output.txt"
+
+# Bytes of per-read output parsed at a time.
+DEFAULT_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Taxon IDs given with --use-names, e.g. "Escherichia coli (taxid 562)"
+TAXID_WITH_NAME_REGEX = re.compile(rb"\(taxid (\d+)\)\s*$")
+
+TAB = ord("\t")
+NEWLINE = ord("\n")
+PIPE = ord("|")
+
+
+class Kraken2Report:
+    """A Kraken2 report, as typed columns. Row `i` of each column is the `i`th taxon in the report.
+
+    :param percentages: float32 array of the percentage of reads in each taxon's clade.
+    :param clade_reads: int64 array of reads assigned to each taxon's clade.
+    :param direct_reads: int64 array of reads assigned directly to each taxon.
+    :param ranks: List of rank codes (e.g. "U", "D", "S", "S1").
+    :param taxids: int32 array of taxon IDs.
+    :param names: List of scientific names.
+    :param depths: uint8 array of each taxon's depth in the report's tree (from its indentation).
+    :param minimizers: (optional) int64 array of minimizers, if the report includes minimizer data.
+    :param distinct_minimizers: (optional) int64 array of distinct minimizers, if included.
+    """
+
+    def __init__(self, percentages, clade_reads, direct_reads, ranks, taxids, names, depths,
+                 minimizers=None, distinct_minimizers=None):
+        self.percentages = percentages
+        self.clade_reads = clade_reads
+        self.direct_reads = direct_reads
+        self.ranks = ranks
+        self.taxids = taxids
+        self.names = names
+        self.depths = depths
+        self.minimizers = minimizers
+        self.distinct_minimizers = distinct_minimizers
+
+    def __repr__(self):
+        return str(self.__dict__)
+
+    def __len__(self):
+        return len(self.taxids)
+
+    @property
+    def num_unclassified_reads(self):
+        return int(self.clade_reads[self.taxids == 0].sum())
+
+    @property
+    def num_classified_reads(self):
+        return int(self.clade_reads[self.depths == 0].sum()) - self.num_unclassified_reads
+
+    def get_taxon(self, taxid):
+        """Returns the row for `taxid` as a dict, or None if it isn't in the report."""
+        rows = (self.taxids == taxid).nonzero()[0]
+        return self.get_row(rows[0]) if len(rows) else None
+
+    def get_row(self, index):
+        row = {
+            "percentage": float(self.percentages[index]),
+            "clade_reads": int(self.clade_reads[index]),
+            "direct_reads": int(self.direct_reads[index]),
+            "rank": self.ranks[index],
+            "taxid": int(self.taxids[index]),
+            "name": self.names[index],
+            "depth": int(self.depths[index]),
+        }
+        if self.minimizers is not None:
+            row["minimizers"] = int(self.minimizers[index])
+            row["distinct_minimizers"] = int(self.distinct_minimizers[index])
+        return row
+
+    def get_rank(self, rank):
+        """Returns the rows at `rank` (e.g. "S" for species, "G" for genus), sorted by clade reads (descending).
+
+        :param rank: A rank code. Sub-ranks (e.g. "S1") aren't included.
+        """
+        indices = [index for index, row_rank in enumerate(self.ranks) if row_rank == rank]
+        indices.sort(key=lambda index: -self.clade_reads[index])
+        return [self.get_row(index) for index in indices]
+
+    def to_dicts(self):
+        """Returns every row as a dict."""
+        return [self.get_row(index) for index in range(len(self))]
+
+
+class Kraken2ReadChunk:
+    """Per-read classifications from a chunk of Kraken2 output, as typed columns.
+
+    :param is_classified: bool array, true for classified ("C") reads.
+    :param taxids: int32 array of assigned taxon IDs (0 for unclassified reads).
+    :param lengths: uint32 array of read lengths. For paired reads, the sum of both mates' lengths.
+    :param mate_lengths: (optional) uint32 array of second mates' lengths (0 for unpaired reads).
+    :param read_ids: (optional) List of read IDs, if requested.
+    """
+
+    def __init__(self, is_classified, taxids, lengths, mate_lengths=None, read_ids=None):
+        self.is_classified = is_classified
+        self.taxids = taxids
+        self.lengths = lengths
+        self.mate_lengths = mate_lengths
+        self.read_ids = read_ids
+
+    def __repr__(self):
+        return str(self.__dict__)
+
+    def __len__(self):
+        return len(self.taxids)
+
+
+class Kraken2OutputSummary:
+    """Per-taxon read and base counts from Kraken2's per-read output.
+
+    :param taxids: int32 array of taxon IDs, sorted.
+    :param read_counts: int64 array of reads assigned directly to each taxon.
+    :param base_counts: int64 array of bases in reads assigned directly to each taxon.
+    :param num_reads: Total number of reads.
+    :param num_classified: Number of classified reads.
+    """
+
+    def __init__(self, taxids, read_counts, base_counts, num_reads, num_classified):
+        self.taxids = taxids
+        self.read_counts = read_counts
+        self.base_counts = base_counts
+        self.num_reads = num_reads
+        self.num_classified = num_classified
+
+    def __repr__(self):
+        return str(self.__dict__)
+
+    def to_dict(self):
+        """Returns a dict of taxon ID to number of reads assigned directly to it."""
+        return dict(zip(self.taxids.tolist(), self.read_counts.tolist()))
+
+
+def load_kraken2_report(report_path):
+    """Loads a Kraken2 report (e.g. kraken2_report.txt) into a Kraken2Report.
+
+    Reports with and without minimizer data (--report-minimizer-data) are supported.
+
+    :param report_path: Path to the report.
+    """
+    # Only import numpy – an optional dependency – if loading Kraken2 outputs
+    import numpy as np
+
+    with open(report_path, "r") as report_file:
+        lines = [line for line in report_file.read().split("\n") if line]
+    num_fields = lines[0].count("\t") + 1 if lines else 6
+    if num_fields not in (6, 8):
+        raise ValueError(f"Invalid Kraken2 report line in {report_path}: {lines[0]}")
+    for line in lines:
+        if line.count("\t") != num_fields - 1:
+            raise ValueError(f"Invalid Kraken2 report line in {report_path}: {line}")
+    # Splits every line at once, then takes every `num_fields`th field as a column
+    fields = "\t".join(lines).split("\t")
+    columns = [fields[column_index::num_fields] for column_index in range(num_fields)]
+    has_minimizers = num_fields == 8
+    if has_minimizers:
+        minimizers, distinct_minimizers = columns.pop(3), columns.pop(3)
+    percentages, clade_reads, direct_reads, ranks, taxids, indented_names = columns
+    names = [indented_name.lstrip(" ") for indented_name in indented_names]
+    # Each level of the taxonomy is indented by 2 spaces
+    depths = (np.array([len(name) for name in indented_names]) - np.array([len(name) for name in names])) // 2
+
+    return Kraken2Report(
+        percentages=np.array(list(map(float, percentages)), dtype=np.float32),
+        clade_reads=np.array(list(map(int, clade_reads)), dtype=np.int64),
+        direct_reads=np.array(list(map(int, direct_reads)), dtype=np.int64),
+        ranks=ranks,
+        taxids=np.array(list(map(int, taxids)), dtype=np.int32),
+        names=names,
+        depths=depths.astype(np.uint8),
+        minimizers=np.array(list(map(int, minimizers)), dtype=np.int64) if has_minimizers else None,
+        distinct_minimizers=np.array(list(map(int, distinct_minimizers)), dtype=np.int64) if has_minimizers else None,
+    )
+
+
+def iter_kraken2_output(output_path, chunk_size=DEFAULT_CHUNK_SIZE, include_read_ids=False):
+    """Yields Kraken2ReadChunks of per-read classifications from Kraken2 output (e.g. kraken2_output.txt).
+
+    Uncompressed files are memory-mapped; gzipped files (ending in .gz) are streamed.
+    Output written with --use-names is supported, but parsed more slowly.
+
+    :param output_path: Path to the per-read output.
+    :param chunk_size: Approximate number of bytes parsed per chunk. Bounds memory use.
+    :param include_read_ids: Whether to include read IDs, as a list of strings. Slower.
+    """
+    for data in iter_line_chunks(output_path, chunk_size):
+        chunk = _parse_read_chunk(data, include_read_ids)
+        if len(chunk):
+            yield chunk
+
+
+def summarize_kraken2_output(output_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Counts the reads and bases assigned directly to each taxon in Kraken2 output. Returns a Kraken2OutputSummary.
+
+    :param output_path: Path to the per-read output.
+    :param chunk_size: Approximate number of bytes parsed per chunk. Bounds memory use.
+    """
+    import numpy as np
+
+    chunk_taxids, chunk_read_counts, chunk_base_counts = [], [], []
+    num_reads = 0
+    num_classified = 0
+    for chunk in iter_kraken2_output(output_path, chunk_size=chunk_size):
+        num_reads += len(chunk)
+        num_classified += int(np.count_nonzero(chunk.is_classified))
+        taxids, inverse = np.unique(chunk.taxids, return_inverse=True)
+        chunk_taxids.append(taxids)
+        chunk_read_counts.append(np.bincount(inverse, minlength=len(taxids)))
+        chunk_base_counts.append(np.bincount(inverse, weights=chunk.lengths, minlength=len(taxids)))
+
+    if not chunk_taxids:
+        empty = np.zeros(0, dtype=np.int64)
+        return Kraken2OutputSummary(np.zeros(0, dtype=np.int32), empty, empty, 0, 0)
+
+    # Each chunk only has a few thousand distinct taxa, so combining them is cheap
+    taxids, inverse = np.unique(np.concatenate(chunk_taxids), return_inverse=True)
+    read_counts = np.bincount(inverse, weights=np.concatenate(chunk_read_counts), minlength=len(taxids))
+    base_counts = np.bincount(inverse, weights=np.concatenate(chunk_base_counts), minlength=len(taxids))
+    return Kraken2OutputSummary(
+        taxids=taxids.astype(np.int32),
+        read_counts=read_counts.astype(np.int64),
+        base_counts=base_counts.astype(np.int64),
+        num_reads=num_reads,
+        num_classified=num_classified,
+    )
+
+
+def _parse_read_chunk(data, include_read_ids):
+    """Parses whole lines of per-read output with vectorized operations. Returns a Kraken2ReadChunk."""
+    import numpy as np
+
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    field_tabs = _get_field_tabs(buffer)
+    line_starts = np.concatenate(([0], field_tabs[:-1, 4] + 1))
+
+    is_classified = buffer[line_starts] == ord("C")
+    taxids = _parse_taxids(buffer, field_tabs[:, 1] + 1, field_tabs[:, 2])
+    lengths, mate_lengths = _parse_lengths(buffer, field_tabs[:, 2] + 1, field_tabs[:, 3])
+    read_ids = None
+    if include_read_ids:
+        read_ids = [
+            data[read_id_start:read_id_end].decode()
+            for read_id_start, read_id_end in zip((field_tabs[:, 0] + 1).tolist(), field_tabs[:, 1].tolist())
+        ]
+    return Kraken2ReadChunk(
+        is_classified=is_classified,
+        taxids=taxids,
+        lengths=lengths,
+        mate_lengths=mate_lengths if np.any(mate_lengths) else None,
+        read_ids=read_ids,
+    )
+
+
+def _get_field_tabs(buffer):
+    """Returns an array with a row per line: the positions of its 4 tabs, then of its newline.
+
+    Each line has 5 tab-separated fields: C/U, read ID, taxon ID, length, and LCA mappings.
+    """
+    import numpy as np
+
+    if len(buffer) and buffer[-1] != NEWLINE:
+        buffer = np.append(buffer, np.uint8(NEWLINE))
+    # Tabs and newlines are the only characters below 11 in Kraken2 output, so one pass finds both
+    separators = np.flatnonzero(buffer <= NEWLINE)
+    if len(separators) % 5 == 0:
+        field_tabs = separators.reshape(-1, 5)
+        if np.all(buffer[field_tabs[:, :4]] == TAB) and np.all(buffer[field_tabs[:, 4]] == NEWLINE):
+            return field_tabs
+
+    # Slower path, for blank lines or other separators
+    newlines = np.flatnonzero(buffer == NEWLINE)
+    line_starts = np.concatenate(([0], newlines[:-1] + 1))
+    non_empty = newlines > line_starts
+    line_starts, newlines = line_starts[non_empty], newlines[non_empty]
+    tabs = np.flatnonzero(buffer == TAB)
+    first_tab_indices = np.searchsorted(tabs, line_starts)
+    if len(line_starts) and first_tab_indices[-1] + 3 >= len(tabs):
+        raise ValueError("Invalid Kraken2 output: expected 5 tab-separated fields per line.")
+    field_tabs = tabs[first_tab_indices[:, None] + np.arange(4)]
+    if np.any(field_tabs[:, 3] >= newlines):
+        raise ValueError("Invalid Kraken2 output: expected 5 tab-separated fields per line.")
+    return np.column_stack((field_tabs, newlines))
+
+
+def _parse_taxids(buffer, starts, ends):
+    import numpy as np
+
+    taxids, num_digits = parse_leading_uints(buffer, starts, ends)
+    for index in np.flatnonzero(num_digits != ends - starts).tolist():
+        # e.g. "Escherichia coli (taxid 562)" with --use-names
+        field = buffer[starts[index]:ends[index]].tobytes()
+        match = TAXID_WITH_NAME_REGEX.search(field)
+        if not match:
+            raise ValueError(f"Invalid taxon ID in Kraken2 output: {field.decode(errors='replace')}")
+        taxids[index] = int(match.group(1))
+    return taxids.astype(np.int32)
+
+
+def _parse_lengths(buffer, starts, ends):
+    """Parses read lengths, e.g. "150", or "150|148" for paired reads. Returns total and second mate lengths."""
+    import numpy as np
+
+    first_lengths, first_num_digits = parse_leading_uints(buffer, starts, ends)
+    pipes = starts + first_num_digits
+    is_paired = (pipes < ends) & (buffer.take(pipes, mode="clip") == PIPE)
+    mate_starts = np.where(is_paired, pipes + 1, ends)
+    mate_lengths, mate_num_digits = parse_leading_uints(buffer, mate_starts, ends)
+    is_valid = (first_num_digits > 0) & np.where(
+        is_paired,
+        (mate_num_digits > 0) & (mate_starts + mate_num_digits == ends),
+        pipes == ends,
+    )
+    if not np.all(is_valid):
+        raise ValueError("Invalid read length in Kraken2 output.")
+    return (first_lengths + mate_lengths).astype(np.uint32), mate_lengths.astype(np.uint32)
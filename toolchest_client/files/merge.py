@@ -6,8 +6,11 @@ Functions for merging files
 """
 
 import multiprocessing
+import os
 import shutil
 
+from toolchest_client.tracing import span
+
 
 def concatenate_files(input_file_paths, output_file_path):
     """Concatenates a list of files using shutil.
@@ -15,11 +18,13 @@ def concatenate_files(input_file_paths, output_file_path):
     :param input_file_paths: Paths to the files which are to be concatenated.
     :param output_file_path: Path to the merged output file.
     """
-    with open(output_file_path, "wb") as output_file:
-        for input_file_path in input_file_paths:
-            input_file = open(input_file_path, "rb")
-            shutil.copyfileobj(input_file, output_file)
-            input_file.close()
+    with span("toolchest.merge", {"toolchest.num_files": len(input_file_paths)}) as merge_span:
+        with open(output_file_path, "wb") as output_file:
+            for input_file_path in input_file_paths:
+                input_file = open(input_file_path, "rb")
+                shutil.copyfileobj(input_file, output_file)
+                input_file.close()
+        merge_span.set_attribute("toolchest.bytes", os.path.getsize(output_file_path))
 
 
 def merge_sam_files(input_file_paths, output_file_path):
@@ -41,13 +46,14 @@ def merge_sam_files(input_file_paths, output_file_path):
     # -c: combine headers when they exist in both files
     # -p: merge @PG IDs
     # --threads: number of threads
-    pysam.merge(
-        "-f",
-        "-u",
-        "-c",
-        "-p",
-        "--threads",
-        f"{num_cores}",
-        output_file_path,
-        *input_file_paths
-    )
+    with span("toolchest.merge", {"toolchest.num_files": len(input_file_paths), "toolchest.format": "sam"}):
+        pysam.merge(
+            "-f",
+            "-u",
+            "-c",
+            "-p",
+            "--threads",
+            f"{num_cores}",
+            output_file_path,
+            *input_file_paths
+        )
@@ -0,0 +1,165 @@
+"""
+toolchest_client.files.preflight
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Resolution of input paths before a run starts.
+
+Each input is classified (local, S3, HTTP, FTP) once, remote metadata is
+fetched concurrently, and the results are cached for the rest of the run.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+import threading
+
+from .public_uris import get_uri_scheme, probe_http_url, get_ftp_url_file_sizes, HTTP_URI_SCHEMES
+from .s3 import get_s3_file_sizes, path_is_s3_uri
+
+
+class InputLocation(Enum):
+    LOCAL = "local"
+    S3 = "s3"
+    HTTP = "http"
+    FTP = "ftp"
+
+
+def classify_path(path):
+    """Returns the InputLocation of a path from its syntax alone, without any network access.
+
+    Remote locations are not verified to be accessible; see InputResolver for that.
+
+    :param path: An input path.
+    """
+    if path_is_s3_uri(path):
+        return InputLocation.S3
+    scheme = get_uri_scheme(path)
+    if scheme in HTTP_URI_SCHEMES:
+        return InputLocation.HTTP
+    if scheme == "ftp":
+        return InputLocation.FTP
+    return InputLocation.LOCAL
+
+
+class ResolvedInput:
+    """An input path, where it is located, and its size (in bytes).
+
+    The size is None for local paths that have not been expanded yet (e.g. directories),
+    and for HTTP URLs where the server doesn't report a size.
+    """
+
+    def __init__(self, path, location, size=None):
+        self.path = path
+        self.location = location
+        self.size = size
+
+    def __repr__(self):
+        return f"ResolvedInput(path={self.path!r}, location={self.location}, size={self.size})"
+
+    @property
+    def is_remote(self):
+        return self.location != InputLocation.LOCAL
+
+
+class InputResolver:
+    """Classifies input paths and caches the results for the lifetime of a run.
+
+    :param max_workers: (optional) Maximum number of remote inputs resolved at the same time.
+    :param offline: If true, remote inputs are classified by syntax alone. They are not checked
+        to be accessible, and their sizes are unknown (None).
+
+    Usage::
+
+        >>> resolver = InputResolver()
+        >>> resolver.resolve(["s3://bucket/a.fastq", "./b.fastq"])
+        >>> resolver.get("s3://bucket/a.fastq").size
+
+    """
+
+    # Maximum number of remote inputs that are resolved at the same time.
+    MAX_WORKERS = 16
+
+    def __init__(self, max_workers=None, offline=False):
+        self.max_workers = max_workers or self.MAX_WORKERS
+        self.offline = offline
+        self._resolved = dict()
+        self._lock = threading.Lock()
+
+    def resolve(self, paths):
+        """Resolves all given paths, fetching remote metadata concurrently. Returns a list of ResolvedInputs.
+
+        :param paths: A path or list of paths.
+        """
+        if isinstance(paths, str):
+            paths = [paths]
+        unresolved_paths = list(dict.fromkeys(path for path in paths if path not in self._resolved))
+
+        paths_by_location = {location: [] for location in InputLocation}
+        for path in unresolved_paths:
+            paths_by_location[classify_path(path)].append(path)
+
+        # Local paths are classified without any network access
+        for path in paths_by_location[InputLocation.LOCAL]:
+            self.add(path, InputLocation.LOCAL)
+        if self.offline:
+            for location in [InputLocation.S3, InputLocation.HTTP, InputLocation.FTP]:
+                for path in paths_by_location[location]:
+                    self.add(path, location)
+            return [self._resolved[path] for path in paths]
+
+        self._resolve_s3_uris(paths_by_location[InputLocation.S3])
+        self._resolve_concurrently(self._resolve_http_url, paths_by_location[InputLocation.HTTP])
+        self._resolve_ftp_urls(paths_by_location[InputLocation.FTP])
+
+        return [self._resolved[path] for path in paths]
+
+    def get(self, path):
+        """Returns the ResolvedInput for a path, resolving it first if needed.
+
+        :param path: An input path.
+        """
+        resolved_input = self._resolved.get(path)
+        if resolved_input is None:
+            resolved_input = self.resolve(path)[0]
+        return resolved_input
+
+    def add(self, path, location, size=None):
+        """Records an already-resolved path (e.g. a local file found while walking a directory).
+
+        :param path: An input path.
+        :param location: The InputLocation of the path.
+        :param size: (optional) Size of the file, in bytes.
+        """
+        resolved_input = ResolvedInput(path, location, size)
+        with self._lock:
+            self._resolved[path] = resolved_input
+        return resolved_input
+
+    def _resolve_concurrently(self, resolve_function, paths):
+        if not paths:
+            return
+        if len(paths) == 1:
+            resolve_function(paths[0])
+            return
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(paths))) as executor:
+            # list() re-raises the first error, e.g. an S3 input that isn't accessible
+            list(executor.map(resolve_function, paths))
+
+    def _resolve_s3_uris(self, uris):
+        # Raises if any S3 input is not accessible by a worker node
+        for uri, file_size in get_s3_file_sizes(uris, max_workers=self.max_workers).items():
+            self.add(uri, InputLocation.S3, file_size)
+
+    def _resolve_http_url(self, url):
+        is_accessible, size = probe_http_url(url)
+        if not is_accessible:
+            # Inaccessible URLs are treated as local paths, which errors when the path is checked
+            return self.add(url, InputLocation.LOCAL)
+        return self.add(url, InputLocation.HTTP, size)
+
+    def _resolve_ftp_urls(self, urls):
+        # SIZE commands share pooled connections, so each FTP host only sees a few logins
+        ftp_file_sizes = get_ftp_url_file_sizes(urls, max_workers=self.max_workers)
+        for url, ftp_file_size in ftp_file_sizes.items():
+            if ftp_file_size and ftp_file_size > 0:
+                self.add(url, InputLocation.FTP, ftp_file_size)
+            else:
+                self.add(url, InputLocation.LOCAL)
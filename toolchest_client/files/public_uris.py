@@ -4,13 +4,26 @@ toolchest_client.files.public_uris
 
 Functions for handling files given by HTTP / HTTPS / FTP URIs.
 """
+import atexit
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import ftplib
 from ftplib import FTP
+import threading
 from urllib.parse import urlparse
 from urllib3.exceptions import LocationParseError
 
 import requests
 from requests.exceptions import HTTPError, InvalidURL, InvalidSchema
 
+HTTP_URI_SCHEMES = {"http", "https"}
+REMOTE_URI_SCHEMES = HTTP_URI_SCHEMES | {"ftp", "s3"}
+# Seconds to wait on a server when checking whether an HTTP URL is accessible.
+HTTP_PROBE_TIMEOUT_SECONDS = 30
+# Seconds to wait on an FTP server before giving up on a connection or command.
+FTP_TIMEOUT_SECONDS = 60
+
 
 def get_url_with_protocol(url):
     """Returns URL with `http://` prepended, if a protocol is not specified.
@@ -23,36 +36,171 @@ def get_url_with_protocol(url):
     return url
 
 
-def path_is_http_url(path):
-    """Returns whether the given path is an accessible URL by sending a GET request for the first byte.
+def get_uri_scheme(path):
+    """Returns the lowercased scheme of a URI (e.g. "https", "ftp", "s3"), without any network access.
+    Returns None for local paths, including Windows paths with a drive letter.
 
     :param path: An input path.
     """
+    scheme = urlparse(path).scheme.lower()
+    if scheme in REMOTE_URI_SCHEMES:
+        return scheme
+    return None
+
+
+def probe_http_url(url):
+    """Returns whether the given URL is accessible, and its size in bytes (None if the server doesn't report it).
+
+    Sends a HEAD request, falling back to a GET request for the first byte
+    for servers that don't support HEAD.
+
+    :param url: An HTTP or HTTPS URL.
+    """
     try:
-        response = requests.get(path, headers={"Range": "bytes=0-0"})
-        response.raise_for_status()
-        return len(response.content) == 1
+        response = requests.head(url, allow_redirects=True, timeout=HTTP_PROBE_TIMEOUT_SECONDS)
+        if response.ok:
+            content_length = response.headers.get("Content-Length")
+            return True, int(content_length) if content_length else None
+        with requests.get(url, headers={"Range": "bytes=0-0"}, stream=True,
+                          timeout=HTTP_PROBE_TIMEOUT_SECONDS) as response:
+            response.raise_for_status()
+            # Servers that honor the range request report the full size as "bytes 0-0/<size>"
+            content_range = response.headers.get("Content-Range", "")
+            total_size = content_range.rpartition("/")[2]
+            return True, int(total_size) if total_size.isdigit() else None
     except (InvalidURL, HTTPError, InvalidSchema, LocationParseError, UnicodeError, Exception):
+        return False, None
+
+
+def path_is_http_url(path):
+    """Returns whether the given path is an accessible HTTP or HTTPS URL.
+    Paths without an HTTP or HTTPS scheme are rejected without any network access.
+
+    :param path: An input path.
+    """
+    if get_uri_scheme(path) not in HTTP_URI_SCHEMES:
         return False
+    is_accessible, _ = probe_http_url(path)
+    return is_accessible
 
 
 def path_is_accessible_ftp_url(path):
-    """Returns whether the given path is an accessible URL by sending a HEAD request.
+    """Returns whether the given path is an accessible FTP URL by sending a SIZE command.
 
     :param path: An input path.
     """
-    if path.startswith("ftp://"):
+    if get_uri_scheme(path) == "ftp":
         file_size = get_ftp_url_file_size(path)
         return file_size > 0
     return False
 
 
-def get_ftp_url_file_size(url):
+class FTPConnectionPool:
+    """A pool of logged-in (anonymous) FTP connections, reused across requests to the same host.
+
+    Public mirrors (e.g. SRA / ENA) throttle logins, so connections are kept open and
+    the number of simultaneous connections to each host is bounded.
+    """
+
+    # Maximum number of simultaneous connections to a single host.
+    MAX_CONNECTIONS_PER_HOST = 4
+
+    def __init__(self, max_connections_per_host=None):
+        self.max_connections_per_host = max_connections_per_host or self.MAX_CONNECTIONS_PER_HOST
+        self._idle_connections = defaultdict(list)
+        self._host_semaphores = dict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self, host):
+        """Yields a logged-in connection to the host, returning it to the pool afterwards.
+        Blocks while the host already has the maximum number of connections in use.
+
+        :param host: Host (netloc) of an FTP server.
+        """
+        with self._get_host_semaphore(host):
+            ftp = self._get_idle_connection(host) or self._connect(host)
+            try:
+                yield ftp
+            except ftplib.error_perm:
+                # The server refused the command (e.g. a missing file), but the connection is still usable
+                self._release(host, ftp)
+                raise
+            except BaseException:
+                ftp.close()
+                raise
+            else:
+                self._release(host, ftp)
+
+    def close(self):
+        """Closes all idle connections."""
+        with self._lock:
+            idle_connections = [ftp for connections in self._idle_connections.values() for ftp in connections]
+            self._idle_connections.clear()
+        for ftp in idle_connections:
+            ftp.close()
+
+    def _get_host_semaphore(self, host):
+        with self._lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.BoundedSemaphore(self.max_connections_per_host)
+            return self._host_semaphores[host]
+
+    def _get_idle_connection(self, host):
+        with self._lock:
+            if self._idle_connections[host]:
+                return self._idle_connections[host].pop()
+        return None
+
+    def _release(self, host, ftp):
+        with self._lock:
+            self._idle_connections[host].append(ftp)
+
+    @staticmethod
+    def _connect(host):
+        ftp = FTP(host, timeout=FTP_TIMEOUT_SECONDS)
+        ftp.login()
+        # Some servers only allow SIZE in binary mode
+        ftp.voidcmd("TYPE I")
+        return ftp
+
+
+_ftp_connection_pool = FTPConnectionPool()
+atexit.register(_ftp_connection_pool.close)
+
+
+def get_ftp_url_file_size(url, connection_pool=None):
     """Returns file size of an accessible FTP URL, via SIZE command.
 
+    Connections are reused from a per-host pool. A pooled connection that was closed
+    by the server is replaced with a new connection once.
+
     :param url: An input URL.
+    :param connection_pool: (optional) FTPConnectionPool to use. Defaults to a shared pool.
     """
+    connection_pool = connection_pool or _ftp_connection_pool
     parsed_url = urlparse(url)
-    with FTP(parsed_url.netloc) as ftp:
-        ftp.login()
-        return ftp.size(parsed_url.path)
+    for attempt in range(2):
+        try:
+            with connection_pool.connection(parsed_url.netloc) as ftp:
+                return ftp.size(parsed_url.path)
+        except (ftplib.error_temp, EOFError, ConnectionError):
+            if attempt:
+                raise
+
+
+def get_ftp_url_file_sizes(urls, max_workers=16, connection_pool=None):
+    """Returns a dict of FTP URLs to file sizes, sending SIZE commands concurrently.
+
+    Concurrency to each host is bounded by the connection pool.
+
+    :param urls: A list of FTP URLs.
+    :param max_workers: Maximum number of SIZE commands in flight, across all hosts.
+    :param connection_pool: (optional) FTPConnectionPool to use. Defaults to a shared pool.
+    """
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        return dict()
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as executor:
+        file_sizes = executor.map(lambda url: get_ftp_url_file_size(url, connection_pool=connection_pool), urls)
+        return dict(zip(urls, file_sizes))
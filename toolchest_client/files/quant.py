@@ -0,0 +1,309 @@
+"""
+toolchest_client.files.quant
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Functions for aggregating the per-sample transcript quantifications of salmon
+(quant.sf) or kallisto (abundance.tsv) runs into transcript × sample and gene ×
+sample matrices, like tximport. NumPy is an optional dependency (installed with
+the `analysis` extra), only needed by these functions.
+
+All samples share one transcript index, so each sample's values are parsed in
+parallel straight into a column of preallocated arrays, and gene-level summaries
+are computed with whole-matrix NumPy operations.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+SALMON = "salmon"
+KALLISTO = "kallisto"
+
+# Default names of each tool's per-sample quantification file
+QUANT_FILE_NAMES = {
+    SALMON: "quant.sf",
+    KALLISTO: "abundance.tsv",
+}
+
+# Names of the transcript name, effective length, TPM, and count columns in each tool's quantification file
+QUANT_COLUMNS = {
+    SALMON: ("Name", "EffectiveLength", "TPM", "NumReads"),
+    KALLISTO: ("target_id", "eff_length", "tpm", "est_counts"),
+}
+
+# Names of the transcript column in the headers of tx2gene files
+TX2GENE_HEADER_NAMES = ("transcript", "transcript_id", "tx_id", "txname", "tx_name", "target_id", "name")
+
+# Ways counts are computed (see tximport's countsFromAbundance)
+COUNTS_FROM_ABUNDANCE = ("no", "scaled_tpm", "length_scaled_tpm")
+
+
+class QuantMatrices:
+    """Transcript- or gene-level quantifications of many samples, as NumPy arrays of shape (features, samples).
+
+    :param names: List of transcript (or gene) names. Row `i` is `names[i]`.
+    :param samples: List of sample names. Column `j` is `samples[j]`.
+    :param tpm: float64 array of abundances, in transcripts per million.
+    :param counts: float64 array of estimated read counts.
+    :param lengths: float64 array of effective lengths.
+    """
+
+    def __init__(self, names, samples, tpm, counts, lengths):
+        self.names = names
+        self.samples = samples
+        self.tpm = tpm
+        self.counts = counts
+        self.lengths = lengths
+
+    def __repr__(self):
+        return str(self.__dict__)
+
+    @property
+    def shape(self):
+        return len(self.names), len(self.samples)
+
+    def get_counts(self, counts_from_abundance="no"):
+        """Returns counts, optionally computed from abundances like tximport's countsFromAbundance.
+
+        :param counts_from_abundance: "no", for the estimated counts; "scaled_tpm", for TPM scaled to each
+            sample's library size; or "length_scaled_tpm", for TPM times the average effective length across
+            samples, scaled to each sample's library size.
+        """
+        import numpy as np
+
+        if counts_from_abundance not in COUNTS_FROM_ABUNDANCE:
+            raise ValueError(f"Invalid counts_from_abundance: {counts_from_abundance}. "
+                             f"Must be one of {', '.join(COUNTS_FROM_ABUNDANCE)}.")
+        if counts_from_abundance == "no":
+            return self.counts
+        abundances = self.tpm
+        if counts_from_abundance == "length_scaled_tpm":
+            abundances = self.tpm * self.lengths.mean(axis=1, keepdims=True)
+        abundance_totals = abundances.sum(axis=0)
+        scales = np.divide(self.counts.sum(axis=0), abundance_totals, out=np.zeros_like(abundance_totals),
+                           where=abundance_totals != 0)
+        return abundances * scales
+
+    def summarize_to_genes(self, tx2gene, ignore_transcript_version=False):
+        """Summarizes transcripts to genes, like tximport. Returns gene-level QuantMatrices, with genes sorted.
+
+        Gene TPM and counts are the sums of their transcripts'. Gene lengths are the averages of their transcripts'
+        effective lengths, weighted by TPM (or unweighted, in samples where the gene's TPM is 0).
+
+        :param tx2gene: A dict of transcript name to gene name, or the path to a tab- or comma-separated file of
+            transcript and gene names (see `load_tx2gene`).
+        :param ignore_transcript_version: Whether to strip versions (e.g. ".1" in "ENST00000456328.1") from
+            transcript names before looking them up.
+        """
+        import numpy as np
+
+        if not isinstance(tx2gene, dict):
+            tx2gene = load_tx2gene(tx2gene)
+        names = self.names
+        if ignore_transcript_version:
+            tx2gene = {_strip_version(transcript): gene for transcript, gene in tx2gene.items()}
+            names = [_strip_version(name) for name in names]
+        missing_names = [name for name in names if name not in tx2gene]
+        if missing_names:
+            raise ValueError(f"{len(missing_names)} transcripts (e.g. {missing_names[0]}) are missing from tx2gene.")
+
+        genes = sorted(set(map(tx2gene.__getitem__, names)))
+        gene_rows = dict(zip(genes, range(len(genes))))
+        transcript_gene_rows = np.fromiter(
+            (gene_rows[tx2gene[name]] for name in names), dtype=np.int64, count=len(names),
+        )
+        # Sorts transcripts by gene. Then the `i`th transcripts of every gene are summed at once, for each `i` up to
+        # the most transcripts a gene has; adding whole rows is much faster than reducing along columns.
+        order = np.argsort(transcript_gene_rows, kind="stable")
+        gene_starts = np.searchsorted(transcript_gene_rows[order], np.arange(len(genes)))
+        num_transcripts = np.diff(np.append(gene_starts, len(names)))
+
+        def sum_by_gene(values):
+            gene_values = values[order[gene_starts]]
+            for transcript_index in range(1, int(num_transcripts.max(initial=0))):
+                genes_with_transcript = np.flatnonzero(num_transcripts > transcript_index)
+                transcript_rows = order[gene_starts[genes_with_transcript] + transcript_index]
+                gene_values[genes_with_transcript] += values[transcript_rows]
+            return gene_values
+
+        gene_tpm = sum_by_gene(self.tpm)
+        weighted_lengths = sum_by_gene(self.tpm * self.lengths)
+        mean_lengths = sum_by_gene(self.lengths) / num_transcripts[:, None]
+        gene_lengths = np.divide(weighted_lengths, gene_tpm, out=mean_lengths, where=gene_tpm != 0)
+        return QuantMatrices(
+            names=genes,
+            samples=list(self.samples),
+            tpm=gene_tpm,
+            counts=sum_by_gene(self.counts),
+            lengths=gene_lengths,
+        )
+
+    def save_npz(self, path):
+        """Saves the matrices to a compressed .npz file, which `load_quant_matrices` loads."""
+        import numpy as np
+
+        np.savez_compressed(
+            path,
+            names=np.array(self.names, dtype=str),
+            samples=np.array(self.samples, dtype=str),
+            tpm=self.tpm,
+            counts=self.counts,
+            lengths=self.lengths,
+        )
+
+    def to_parquet(self, path, value="counts"):
+        """Saves one matrix to a Parquet file, with a `name` column and a column per sample. Requires pyarrow
+        (the `analysis` extra).
+
+        :param path: Path of the file.
+        :param value: "counts", "tpm", or "lengths".
+        """
+        # Only import pyarrow – an optional dependency – if writing Parquet
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if value not in ("counts", "tpm", "lengths"):
+            raise ValueError(f"Invalid value: {value}. Must be counts, tpm, or lengths.")
+        values = getattr(self, value)
+        columns = {"name": pa.array(self.names, type=pa.string())}
+        columns.update((sample, values[:, column]) for column, sample in enumerate(self.samples))
+        pq.write_table(pa.table(columns), path)
+
+
+def load_quantifications(outputs, sample_names=None, file_format=None, max_workers=8):
+    """Loads the transcript quantifications of salmon or kallisto runs into transcript-level QuantMatrices.
+
+    All samples must be quantified against the same transcriptome index.
+
+    Usage::
+
+        >>> outputs = [toolchest.salmon(read_one=path, output_path=f"./{name}") for name, path in fastqs]
+        >>> transcripts = load_quantifications(outputs)
+        >>> genes = transcripts.summarize_to_genes("./tx2gene.tsv")
+        >>> genes.save_npz("./genes.npz")
+
+    :param outputs: List of downloaded Output objects, or paths of quantification files (quant.sf or
+        abundance.tsv).
+    :param sample_names: (optional) Name of each sample. Defaults to the name of each output's directory.
+    :param file_format: (optional) "salmon" or "kallisto". Defaults to each output's tool, or is detected from
+        the file.
+    :param max_workers: Maximum number of files loaded at once.
+    """
+    import numpy as np
+
+    quant_files = [_get_quant_file(output, file_format) for output in outputs]
+    if sample_names is None:
+        sample_names = [sample_name for _, _, sample_name in quant_files]
+    if len(sample_names) != len(quant_files):
+        raise ValueError("The number of sample names must match the number of outputs.")
+    if len(set(sample_names)) != len(sample_names):
+        raise ValueError("Sample names must be unique. Pass them with sample_names.")
+    if not quant_files:
+        raise ValueError("No outputs to load.")
+
+    # The first sample's transcripts are the index into which every sample is loaded
+    first_path, first_file_format, _ = quant_files[0]
+    names, first_values = read_quant_file(first_path, first_file_format)
+    name_rows = dict(zip(names, range(len(names))))
+    tpm, counts, lengths = (np.empty((len(names), len(quant_files))) for _ in range(3))
+
+    def load_sample(column):
+        path, sample_file_format, _ = quant_files[column]
+        sample_transcripts, values = (names, first_values) if column == 0 else read_quant_file(path, sample_file_format)
+        rows = slice(None)
+        if sample_transcripts != names:
+            # Rows are matched by name, in case a sample's transcripts are in a different order
+            if len(sample_transcripts) != len(names) or not all(map(name_rows.__contains__, sample_transcripts)):
+                raise ValueError(f"{path} has different transcripts than {first_path}. All samples must be "
+                                 "quantified against the same index.")
+            rows = np.fromiter(map(name_rows.__getitem__, sample_transcripts), dtype=np.int64, count=len(names))
+        lengths[rows, column], tpm[rows, column], counts[rows, column] = values.T
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(quant_files))) as executor:
+        list(executor.map(load_sample, range(len(quant_files))))
+    return QuantMatrices(names=names, samples=list(sample_names), tpm=tpm, counts=counts, lengths=lengths)
+
+
+def read_quant_file(path, file_format=None):
+    """Reads a salmon or kallisto quantification file.
+
+    Returns the list of transcript names, and a float64 array of their effective lengths, TPM, and counts
+    (one row per transcript).
+
+    :param path: Path to quant.sf or abundance.tsv.
+    :param file_format: (optional) "salmon" or "kallisto". Detected from the header by default.
+    """
+    import numpy as np
+
+    with open(path, "r") as quant_file:
+        header = quant_file.readline().rstrip("\n").split("\t")
+        file_format = file_format or _detect_quant_file_format(header, path)
+        try:
+            column_indices = [header.index(column) for column in QUANT_COLUMNS[file_format]]
+        except ValueError:
+            raise ValueError(f"Invalid {file_format} quantification file {path}: unexpected header.") from None
+        lines = quant_file.readlines()
+
+    values = np.loadtxt(lines, delimiter="\t", usecols=column_indices[1:], ndmin=2, comments=None)
+    if column_indices[0] == 0:
+        names = [line.partition("\t")[0] for line in lines]
+    else:
+        names = [line.split("\t")[column_indices[0]] for line in lines]
+    return names, values.reshape(len(names), 3)
+
+
+def load_tx2gene(path):
+    """Loads a transcript-to-gene mapping from a tab- or comma-separated file, with transcript names in its first
+    column and gene names in its second, like tximport's tx2gene. A header line (e.g. "transcript_id,gene_id") is
+    skipped.
+    """
+    tx2gene = dict()
+    with open(path, "r") as tx2gene_file:
+        for line_number, line in enumerate(tx2gene_file):
+            fields = line.rstrip("\n").replace(",", "\t").split("\t")
+            if len(fields) < 2 or not fields[0]:
+                continue
+            if line_number == 0 and fields[0].lower() in TX2GENE_HEADER_NAMES:
+                continue
+            tx2gene[fields[0]] = fields[1]
+    return tx2gene
+
+
+def load_quant_matrices(path):
+    """Loads QuantMatrices saved with `QuantMatrices.save_npz`."""
+    import numpy as np
+
+    with np.load(path, allow_pickle=False) as arrays:
+        return QuantMatrices(
+            names=arrays["names"].tolist(),
+            samples=arrays["samples"].tolist(),
+            tpm=arrays["tpm"],
+            counts=arrays["counts"],
+            lengths=arrays["lengths"],
+        )
+
+
+def _detect_quant_file_format(header, path):
+    for file_format, columns in QUANT_COLUMNS.items():
+        if header and header[0] == columns[0]:
+            return file_format
+    raise ValueError(f"{path} is not a salmon (quant.sf) or kallisto (abundance.tsv) quantification file.")
+
+
+def _get_quant_file(output, file_format):
+    """Returns the path, format, and default sample name of the quantification file of an Output (or path)."""
+    if isinstance(output, (str, os.PathLike)):
+        path = os.path.abspath(os.fspath(output))
+        return path, file_format, os.path.basename(os.path.dirname(path))
+    sample_name = os.path.basename(os.path.normpath(output.output_path or ""))
+    file_format = file_format or (output.tool_name if output.tool_name in QUANT_FILE_NAMES else None)
+    if file_format:
+        return output.get_output_file_path(QUANT_FILE_NAMES[file_format]), file_format, sample_name
+    for file_format, file_name in QUANT_FILE_NAMES.items():
+        try:
+            return output.get_output_file_path(file_name), file_format, sample_name
+        except FileNotFoundError:
+            pass
+    raise FileNotFoundError(f"No salmon or kallisto output found in {output.output_path}.")
+
+
+def _strip_version(transcript_name):
+    return transcript_name.rsplit(".", 1)[0]
@@ -4,9 +4,10 @@ toolchest_client.files.s3
 
 Functions for handling files in AWS S3 buckets.
 """
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from loguru import logger
 import math
-import os.path
 import sys
 import threading
 
@@ -15,17 +16,36 @@ from requests.exceptions import HTTPError
 
 from toolchest_client.api.auth import get_headers
 from toolchest_client.api.exceptions import ToolchestS3AccessError
-from toolchest_client.api.urls import get_s3_metadata_url
-from toolchest_client.logging import get_log_level
+from toolchest_client.api.urls import get_s3_endpoint_url, get_s3_metadata_url, get_s3_metadata_batch_url
+from toolchest_client.tracing import traced_request
+from .cache import TTLCache
+
+# Maximum number of URIs sent in one batched S3 metadata request.
+S3_METADATA_BATCH_SIZE = 100
+# Status codes returned by API servers that don't support batched S3 metadata requests.
+BATCH_NOT_SUPPORTED_STATUS_CODES = {404, 405, 501}
+
+# Sizes of S3 files that were found to be accessible, keyed by URI.
+_s3_file_size_cache = TTLCache(max_size=4096, ttl_seconds=300)
+# Whether the API supports batched S3 metadata requests. None until the first batched request.
+_batch_metadata_supported = None
+
+# Maximum number of S3 clients kept for reuse. Each set of transfer credentials gets its own client.
+S3_CLIENT_CACHE_SIZE = 32
+# Maximum number of connections each S3 client keeps open (botocore's default is 10).
+S3_MAX_POOL_CONNECTIONS = 50
+# Error codes returned by S3 when temporary (STS) credentials have expired.
+EXPIRED_CREDENTIALS_ERROR_CODES = {"ExpiredToken", "ExpiredTokenException", "RequestExpired", "TokenRefreshRequired"}
 
 
 def assert_accessible_s3(uri):
     """Raises an error if the given S3 URI is not accessible by a worker node.
+    Returns the size (in bytes) of the file, if accessible.
 
     :param uri: An S3 URI.
     """
     try:
-        get_s3_file_size(uri)
+        return get_s3_file_size(uri)
     except ToolchestS3AccessError as err:
         raise err from None
 
@@ -34,10 +54,17 @@ def get_s3_file_size(uri):
     """Returns the size (in bytes) of a file in S3 that is accessible
     from the worker node.
 
+    Sizes are cached in-process for a few minutes, keyed by URI.
+
     :param uri: An S3 URI.
     """
+    file_size = _s3_file_size_cache.get(uri)
+    if file_size is not None:
+        return file_size
+
     params = get_params_from_s3_uri(uri)
-    response = requests.post(
+    response = traced_request(
+        requests.post,
         get_s3_metadata_url(),
         headers=get_headers(),
         json=params,
@@ -49,7 +76,78 @@ def get_s3_file_size(uri):
         logger.error(error_message, file=sys.stderr)
         raise ToolchestS3AccessError(error_message) from None
 
-    return response.json()["file_size"]
+    file_size = response.json()["file_size"]
+    _s3_file_size_cache.set(uri, file_size)
+    return file_size
+
+
+def get_s3_file_sizes(uris, max_workers=16):
+    """Returns a dict of S3 URIs to the sizes (in bytes) of files that are accessible from the worker node.
+    Raises an error if any file is not accessible.
+
+    Uncached URIs are sent to the API in batches. If the API doesn't support batched
+    requests, URIs are instead sent concurrently, one per request.
+
+    :param uris: A list of S3 URIs.
+    :param max_workers: Maximum number of concurrent requests, if the API doesn't support batched requests.
+    """
+    global _batch_metadata_supported
+    uris = list(dict.fromkeys(uris))
+    file_sizes = {uri: _s3_file_size_cache.get(uri) for uri in uris}
+    uncached_uris = [uri for uri, file_size in file_sizes.items() if file_size is None]
+
+    if len(uncached_uris) > 1 and _batch_metadata_supported is not False:
+        for batch_start in range(0, len(uncached_uris), S3_METADATA_BATCH_SIZE):
+            batch_uris = uncached_uris[batch_start:batch_start + S3_METADATA_BATCH_SIZE]
+            batch_file_sizes = _get_s3_file_sizes_batch(batch_uris)
+            if batch_file_sizes is None:
+                _batch_metadata_supported = False
+                break
+            _batch_metadata_supported = True
+            file_sizes.update(batch_file_sizes)
+        uncached_uris = [uri for uri in uncached_uris if file_sizes[uri] is None]
+
+    if len(uncached_uris) == 1:
+        file_sizes[uncached_uris[0]] = get_s3_file_size(uncached_uris[0])
+    elif uncached_uris:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(uncached_uris))) as executor:
+            file_sizes.update(zip(uncached_uris, executor.map(get_s3_file_size, uncached_uris)))
+
+    return file_sizes
+
+
+def _get_s3_file_sizes_batch(uris):
+    """Returns a dict of S3 URIs to file sizes from one batched metadata request,
+    or None if the API doesn't support batched requests.
+
+    :param uris: A list of S3 URIs.
+    """
+    response = traced_request(
+        requests.post,
+        get_s3_metadata_batch_url(),
+        headers=get_headers(),
+        json={"files": [get_params_from_s3_uri(uri) for uri in uris]},
+    )
+    if response.status_code in BATCH_NOT_SUPPORTED_STATUS_CODES:
+        return None
+    try:
+        response.raise_for_status()
+    except HTTPError:
+        error_message = "Given S3 inputs cannot be accessed by Toolchest."
+        logger.error(error_message, file=sys.stderr)
+        raise ToolchestS3AccessError(error_message) from None
+
+    # Results are returned in the same order as the request
+    file_sizes = dict()
+    for uri, file_metadata in zip(uris, response.json()["files"]):
+        file_size = file_metadata.get("file_size")
+        if file_size is None:
+            error_message = f"Given S3 input cannot be accessed by Toolchest: {uri}"
+            logger.error(error_message, file=sys.stderr)
+            raise ToolchestS3AccessError(error_message) from None
+        _s3_file_size_cache.set(uri, file_size)
+        file_sizes[uri] = file_size
+    return file_sizes
 
 
 def get_params_from_s3_uri(uri):
@@ -112,55 +210,136 @@ def pretty_print_file_size(num_bytes):
     :param num_bytes size of file in bytes
     """
     pretty_abbreviation = ["B", "KB", "MB", "GB", "TB"]
+    if num_bytes < 1:
+        return f"{num_bytes:.1f}B"
     abbreviation_index = math.floor(math.log(num_bytes, 1024))
     return f"{(num_bytes / (1024 ** abbreviation_index)):.1f}{pretty_abbreviation[abbreviation_index]}"
 
 
-def pretty_status_print(filename, seen_so_far, size, percentage):
-    # This doesn't format well as a progress bar with the logger, but we want to hide unless at DEBUG level
-    print(
-        "\r{}  {} of {} ({:.2f}%)".format(
-            filename,
-            pretty_print_file_size(seen_so_far),
-            pretty_print_file_size(size),
-            percentage
-        ).ljust(100),  # pads right end with spaces to flush carriage return
-        end="",
-        flush=True,
-    )
-    if percentage == 100.00:  # Adds newline at end of upload
-        print(flush=True)
+class S3ClientCache:
+    """A thread-safe cache of S3 clients, keyed by (access key ID, session token, region, endpoint URL).
 
+    All clients are created from one shared boto3 session, so botocore service models are
+    only loaded once. Clients are configured for concurrent transfers with a larger
+    connection pool and TCP keepalive.
 
-class UploadTracker:
-    def __init__(self, file_path):
-        self._filename = os.path.basename(file_path)
-        self._size = float(os.path.getsize(file_path))  # tracker only used for local files
-        self._seen_so_far = 0
+    :param max_size: Maximum number of clients. The least recently used client is evicted first.
+    :param max_pool_connections: Maximum number of connections kept open by each client.
+    """
+
+    def __init__(self, max_size=S3_CLIENT_CACHE_SIZE, max_pool_connections=S3_MAX_POOL_CONNECTIONS):
+        self.max_size = max_size
+        self.max_pool_connections = max_pool_connections
+        self._clients = OrderedDict()
+        self._session = None
         self._lock = threading.Lock()
 
-    def __call__(self, bytes_amount):
-        # To simplify we'll assume this is hooked up
-        # to a single filename.
-        with self._lock:
-            self._seen_so_far += bytes_amount
-            percentage = round((self._seen_so_far / self._size) * 100, 2)
-            if get_log_level() == "DEBUG":
-                pretty_status_print(self._filename, self._seen_so_far, self._size, percentage)
+    def __len__(self):
+        return len(self._clients)
 
+    def get_client(self, access_key_id, secret_access_key, session_token, region_name=None, endpoint_url=None):
+        """Returns an S3 client for the given credentials, creating it if needed.
 
-class DownloadTracker:
-    def __init__(self, client, bucket, object_name):
-        self._filename = os.path.basename(object_name)
-        self._size = client.head_object(Bucket=bucket, Key=object_name)['ContentLength']
-        self._seen_so_far = 0
-        self._lock = threading.Lock()
+        :param access_key_id: AWS access key ID.
+        :param secret_access_key: AWS secret access key.
+        :param session_token: AWS session token, for temporary credentials.
+        :param region_name: (optional) AWS region of the bucket.
+        :param endpoint_url: (optional) URL of an S3-compatible store to use instead of AWS S3.
+        """
+        key = (access_key_id, session_token, region_name, endpoint_url)
+        with self._lock:
+            s3_client = self._clients.get(key)
+            if s3_client is None:
+                # Sessions aren't thread-safe, so clients are created while holding the lock
+                s3_client = self._get_session().client(
+                    "s3",
+                    aws_access_key_id=access_key_id,
+                    aws_secret_access_key=secret_access_key,
+                    aws_session_token=session_token,
+                    region_name=region_name,
+                    endpoint_url=endpoint_url,
+                    config=self._get_client_config(endpoint_url),
+                )
+                self._clients[key] = s3_client
+                while len(self._clients) > self.max_size:
+                    self._clients.popitem(last=False)
+            self._clients.move_to_end(key)
+            return s3_client
+
+    def evict(self, access_key_id, session_token, region_name=None, endpoint_url=None):
+        """Removes the client for the given credentials, e.g. after they have expired."""
+        with self._lock:
+            self._clients.pop((access_key_id, session_token, region_name, endpoint_url), None)
 
-    def __call__(self, bytes_amount):
-        # To simplify we'll assume this is hooked up
-        # to a single filename.
+    def clear(self):
         with self._lock:
-            self._seen_so_far += bytes_amount
-            percentage = round((self._seen_so_far / self._size) * 100, 2)
-            if get_log_level() == "DEBUG":
-                pretty_status_print(self._filename, self._seen_so_far, self._size, percentage)
+            self._clients.clear()
+
+    def _get_session(self):
+        # boto3 is slow to import, so it's only imported when a client is needed
+        import boto3
+
+        if self._session is None:
+            self._session = boto3.session.Session()
+        return self._session
+
+    def _get_client_config(self, endpoint_url=None):
+        from botocore.config import Config
+
+        client_config = {
+            "max_pool_connections": self.max_pool_connections,
+            "retries": {"max_attempts": 5, "mode": "standard"},
+        }
+        if endpoint_url:
+            # S3-compatible stores don't generally support virtual-hosted bucket names
+            client_config["s3"] = {"addressing_style": "path"}
+        try:
+            return Config(tcp_keepalive=True, **client_config)
+        except TypeError:
+            # tcp_keepalive was added in botocore 1.27
+            return Config(**client_config)
+
+
+_s3_client_cache = S3ClientCache()
+
+
+def get_s3_client(file_keys, region_name=None):
+    """Returns a shared S3 client for the credentials in `file_keys`.
+    Uses the S3-compatible store at TOOLCHEST_S3_ENDPOINT_URL instead of AWS S3, if set.
+
+    :param file_keys: Dict with the "access_key_id", "secret_access_key", and "session_token"
+        returned when registering an input file or getting download details.
+    :param region_name: (optional) AWS region of the bucket.
+    """
+    return _s3_client_cache.get_client(
+        file_keys["access_key_id"],
+        file_keys["secret_access_key"],
+        file_keys["session_token"],
+        region_name=region_name,
+        endpoint_url=get_s3_endpoint_url(),
+    )
+
+
+def evict_s3_client(file_keys, region_name=None):
+    """Stops reusing the S3 client for the credentials in `file_keys`, e.g. after they have expired.
+
+    :param file_keys: Dict with the "access_key_id" and "session_token" used to get the client.
+    :param region_name: (optional) AWS region of the bucket.
+    """
+    _s3_client_cache.evict(
+        file_keys["access_key_id"],
+        file_keys["session_token"],
+        region_name=region_name,
+        endpoint_url=get_s3_endpoint_url(),
+    )
+
+
+def is_expired_credentials_error(err):
+    """Returns whether an error raised by an S3 client was caused by expired temporary credentials.
+
+    :param err: An exception raised by boto3.
+    """
+    response = getattr(err, "response", None)
+    if not isinstance(response, dict):
+        return False
+    return response.get("Error", {}).get("Code") in EXPIRED_CREDENTIALS_ERROR_CODES
@@ -0,0 +1,321 @@
+"""
+toolchest_client.files.sam
+~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Functions for computing samtools flagstat-like statistics of SAM files (e.g. the
+output of STAR, bowtie2, and shogun_align) and filtering them, without samtools.
+NumPy is an optional dependency (installed with the `analysis` extra), only
+needed by these functions.
+
+SAM files are read in large chunks of lines. The fields needed for statistics and
+filtering (FLAG, RNAME, MAPQ, and RNEXT) are located and parsed for every record of
+a chunk at once, so memory is bounded by the chunk size.
+"""
+import os
+
+from toolchest_client.files.chunks import iter_line_chunks, parse_leading_uints
+
+# Bytes of SAM parsed at a time.
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+
+# SAM output of each tool
+SAM_FILE_NAMES = {
+    "STAR": "Aligned.out.sam",
+    "bowtie2": "bowtie2_output.sam",
+    "shogun_align": "alignment.bowtie2.sam",
+}
+
+# FLAG bits
+PAIRED = 0x1
+PROPER_PAIR = 0x2
+UNMAPPED = 0x4
+MATE_UNMAPPED = 0x8
+REVERSE = 0x10
+MATE_REVERSE = 0x20
+READ1 = 0x40
+READ2 = 0x80
+SECONDARY = 0x100
+QC_FAIL = 0x200
+DUPLICATE = 0x400
+SUPPLEMENTARY = 0x800
+
+# Counters of samtools flagstat, with their labels in its output
+FLAGSTAT_COUNTERS = (
+    ("total", "in total (QC-passed reads + QC-failed reads)"),
+    ("primary", "primary"),
+    ("secondary", "secondary"),
+    ("supplementary", "supplementary"),
+    ("duplicates", "duplicates"),
+    ("primary_duplicates", "primary duplicates"),
+    ("mapped", "mapped"),
+    ("primary_mapped", "primary mapped"),
+    ("paired", "paired in sequencing"),
+    ("read1", "read1"),
+    ("read2", "read2"),
+    ("properly_paired", "properly paired"),
+    ("with_itself_and_mate_mapped", "with itself and mate mapped"),
+    ("singletons", "singletons"),
+    ("with_mate_mapped_to_different_chr", "with mate mapped to a different chr"),
+    ("with_mate_mapped_to_different_chr_mapq5", "with mate mapped to a different chr (mapQ>=5)"),
+)
+# Counters shown as a percentage of another counter by samtools flagstat
+FLAGSTAT_PERCENTAGES = {
+    "mapped": "total",
+    "primary_mapped": "primary",
+    "properly_paired": "paired",
+    "singletons": "paired",
+}
+
+TAB = ord("\t")
+NEWLINE = ord("\n")
+AT = ord("@")
+EQUALS = ord("=")
+# Tabs in a record before the RNEXT field ends
+NUM_STATS_FIELD_TABS = 7
+# Tabs in a record with the 11 mandatory fields
+MIN_RECORD_TABS = 10
+
+
+class SamStats:
+    """samtools flagstat-like statistics of a SAM file, and the number of reads mapped to each reference.
+
+    :param qc_passed: Dict of flagstat counters (see FLAGSTAT_COUNTERS) for records that passed QC.
+    :param qc_failed: Dict of flagstat counters for records that failed QC (FLAG 0x200).
+    :param reference_counts: Dict of reference names to the number of primary alignments mapped to them, in the order
+        of the header's @SQ lines. References without @SQ lines follow.
+    """
+
+    def __init__(self, qc_passed, qc_failed, reference_counts):
+        self.qc_passed = qc_passed
+        self.qc_failed = qc_failed
+        self.reference_counts = reference_counts
+
+    def __repr__(self):
+        return str(self.__dict__)
+
+    @property
+    def mapping_rate(self):
+        """Fraction of primary QC-passed reads that are mapped (0 if there are none)."""
+        return self.qc_passed["primary_mapped"] / self.qc_passed["primary"] if self.qc_passed["primary"] else 0.0
+
+    def to_dict(self):
+        return {
+            "qc_passed": dict(self.qc_passed),
+            "qc_failed": dict(self.qc_failed),
+            "reference_counts": dict(self.reference_counts),
+        }
+
+    def format_flagstat(self):
+        """Returns the statistics formatted like the output of samtools flagstat."""
+        lines = []
+        for counter, label in FLAGSTAT_COUNTERS:
+            line = f"{self.qc_passed[counter]} + {self.qc_failed[counter]} {label}"
+            if counter in FLAGSTAT_PERCENTAGES:
+                percentages = [
+                    _format_percentage(counts[counter], counts[FLAGSTAT_PERCENTAGES[counter]])
+                    for counts in (self.qc_passed, self.qc_failed)
+                ]
+                line += f" ({percentages[0]} : {percentages[1]})"
+            lines.append(line)
+        return "\n".join(lines) + "\n"
+
+
+def get_sam_file_name(tool_name, output_primary_name=None):
+    """Returns the name of the SAM file output by a tool.
+
+    :param tool_name: Name of the tool (e.g. "STAR", "bowtie2", "shogun_align").
+    :param output_primary_name: (optional) The output_primary_name the tool was run with.
+    """
+    if output_primary_name and output_primary_name.endswith(".sam"):
+        return output_primary_name
+    if tool_name not in SAM_FILE_NAMES:
+        raise ValueError(f"Can't find the SAM output of {tool_name}. Supported tools: {', '.join(SAM_FILE_NAMES)}.")
+    return SAM_FILE_NAMES[tool_name]
+
+
+def read_sam_stats(sam_path, filtered_output_path=None, include_flags=0, exclude_flags=0, min_mapq=0,
+                   chunk_size=DEFAULT_CHUNK_SIZE):
+    """Computes samtools flagstat-like statistics and per-reference counts of a SAM file in one pass, optionally
+    writing the records that pass filters (like `samtools view -f -F -q`) to a new SAM file. Returns a SamStats.
+
+    Statistics are of every record in the input, not only those written to the filtered output.
+    Files ending in .gz are decompressed as they're read.
+
+    :param sam_path: Path to the SAM file.
+    :param filtered_output_path: (optional) Path to which the header and filtered records are written.
+    :param include_flags: Only write records with all of these FLAG bits set (e.g. `PROPER_PAIR`).
+    :param exclude_flags: Only write records with none of these FLAG bits set (e.g. `UNMAPPED | SECONDARY`).
+    :param min_mapq: Only write records with a mapping quality at least this.
+    :param chunk_size: Approximate number of bytes parsed per chunk. Bounds memory use.
+    """
+    import numpy as np
+
+    counts = np.zeros((len(FLAGSTAT_COUNTERS), 2), dtype=np.int64)
+    reference_counts = {}
+    filtered_output_file = None
+    if filtered_output_path is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(filtered_output_path)), exist_ok=True)
+        filtered_output_file = open(filtered_output_path, "wb")
+    try:
+        for data in iter_line_chunks(os.fspath(sam_path), chunk_size):
+            filtered_data = _process_sam_chunk(
+                data, counts, reference_counts, filtered_output_file is not None, include_flags, exclude_flags,
+                min_mapq,
+            )
+            if filtered_output_file is not None:
+                filtered_output_file.write(filtered_data)
+    finally:
+        if filtered_output_file is not None:
+            filtered_output_file.close()
+
+    counter_names = [counter for counter, _ in FLAGSTAT_COUNTERS]
+    return SamStats(
+        qc_passed=dict(zip(counter_names, counts[:, 0].tolist())),
+        qc_failed=dict(zip(counter_names, counts[:, 1].tolist())),
+        reference_counts=reference_counts,
+    )
+
+
+def _process_sam_chunk(data, counts, reference_counts, is_filtered, include_flags, exclude_flags, min_mapq):
+    """Adds the flagstat counters and per-reference counts of a chunk of whole SAM lines to `counts` and
+    `reference_counts`. If `is_filtered`, returns the chunk's header lines and records that pass the filters."""
+    import numpy as np
+
+    if not data.endswith(b"\n"):
+        data += b"\n"
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    newlines = np.flatnonzero(buffer == NEWLINE)
+    line_starts = np.concatenate(([0], newlines[:-1] + 1))
+    is_empty = newlines == line_starts
+    is_header = ~is_empty & (buffer[line_starts] == AT)
+    is_record = ~is_empty & ~is_header
+    for line_start, line_end in zip(line_starts[is_header].tolist(), newlines[is_header].tolist()):
+        # Only @SQ lines are parsed in Python. There's a header line per reference, not per read.
+        if data.startswith(b"@SQ\t", line_start):
+            _add_header_reference(data[line_start:line_end], reference_counts)
+
+    record_starts, record_ends = line_starts[is_record], newlines[is_record]
+    field_tabs = _get_field_tabs(buffer, record_starts, record_ends)
+    flags, flag_digits = parse_leading_uints(buffer, field_tabs[:, 0] + 1, field_tabs[:, 1])
+    mapqs, mapq_digits = parse_leading_uints(buffer, field_tabs[:, 3] + 1, field_tabs[:, 4])
+    if np.any(flag_digits != field_tabs[:, 1] - field_tabs[:, 0] - 1):
+        raise ValueError("Invalid SAM: FLAG must be an integer.")
+    if np.any(mapq_digits != field_tabs[:, 4] - field_tabs[:, 3] - 1):
+        raise ValueError("Invalid SAM: MAPQ must be an integer.")
+
+    _add_flagstat_counts(counts, buffer, flags, mapqs, field_tabs)
+    is_primary_mapped = (flags & (UNMAPPED | SECONDARY | SUPPLEMENTARY)) == 0
+    _add_reference_counts(
+        reference_counts, buffer, field_tabs[is_primary_mapped, 1] + 1, field_tabs[is_primary_mapped, 2],
+    )
+
+    if not is_filtered:
+        return None
+    is_kept = is_header.copy()
+    is_kept[is_record] = (
+        ((flags & include_flags) == include_flags) & ((flags & exclude_flags) == 0) & (mapqs >= min_mapq)
+    )
+    # Selects the bytes of kept lines (including their newlines) at once
+    return buffer[np.repeat(is_kept, newlines - line_starts + 1)].tobytes()
+
+
+def _get_field_tabs(buffer, record_starts, record_ends):
+    """Returns an array with a row per record: the positions of the tabs ending its first 7 fields (QNAME to RNEXT)."""
+    import numpy as np
+
+    tabs = np.flatnonzero(buffer == TAB)
+    first_tab_indices = np.searchsorted(tabs, record_starts)
+    last_tab_indices = first_tab_indices + MIN_RECORD_TABS - 1
+    if len(record_starts) and (
+        last_tab_indices[-1] >= len(tabs) or np.any(tabs.take(last_tab_indices, mode="clip") >= record_ends)
+    ):
+        raise ValueError("Invalid SAM: every record must have at least 11 tab-separated fields.")
+    return tabs[first_tab_indices[:, None] + np.arange(NUM_STATS_FIELD_TABS)]
+
+
+def _add_flagstat_counts(counts, buffer, flags, mapqs, field_tabs):
+    """Adds the flagstat counters of records, as samtools flagstat counts them, to the (counter, QC-failed) array."""
+    import numpy as np
+
+    def has(flag):
+        return (flags & flag) != 0
+
+    is_secondary = has(SECONDARY)
+    is_supplementary = has(SUPPLEMENTARY) & ~is_secondary
+    is_primary = ~is_secondary & ~is_supplementary
+    is_mapped = ~has(UNMAPPED)
+    is_paired = is_primary & has(PAIRED)
+    is_pair_mapped = is_paired & is_mapped & ~has(MATE_UNMAPPED)
+    is_different_chr = is_pair_mapped & _is_mate_on_different_reference(buffer, field_tabs, is_pair_mapped)
+    masks = {
+        "total": np.ones(len(flags), dtype=bool),
+        "primary": is_primary,
+        "secondary": is_secondary,
+        "supplementary": is_supplementary,
+        "duplicates": has(DUPLICATE),
+        "primary_duplicates": is_primary & has(DUPLICATE),
+        "mapped": is_mapped,
+        "primary_mapped": is_primary & is_mapped,
+        "paired": is_paired,
+        "read1": is_paired & has(READ1),
+        "read2": is_paired & has(READ2),
+        "properly_paired": is_paired & has(PROPER_PAIR) & is_mapped,
+        "with_itself_and_mate_mapped": is_pair_mapped,
+        "singletons": is_paired & is_mapped & has(MATE_UNMAPPED),
+        "with_mate_mapped_to_different_chr": is_different_chr,
+        "with_mate_mapped_to_different_chr_mapq5": is_different_chr & (mapqs >= 5),
+    }
+    is_qc_failed = has(QC_FAIL).astype(np.int64)
+    for index, (counter, _) in enumerate(FLAGSTAT_COUNTERS):
+        counts[index] += np.bincount(is_qc_failed[masks[counter]], minlength=2)
+
+
+def _is_mate_on_different_reference(buffer, field_tabs, is_candidate):
+    """Returns whether each candidate record's RNEXT names a different reference than its RNAME."""
+    import numpy as np
+
+    rnext_starts, rnext_ends = field_tabs[:, 5] + 1, field_tabs[:, 6]
+    # RNEXT is usually "=" for mates on the same reference
+    is_equals = (rnext_ends - rnext_starts == 1) & (buffer.take(rnext_starts, mode="clip") == EQUALS)
+    is_different = np.zeros(len(field_tabs), dtype=bool)
+    candidates = np.flatnonzero(is_candidate & ~is_equals)
+    if len(candidates):
+        rnames = _get_field_keys(buffer, field_tabs[candidates, 1] + 1, field_tabs[candidates, 2])
+        rnexts = _get_field_keys(buffer, rnext_starts[candidates], rnext_ends[candidates])
+        is_different[candidates] = rnames != rnexts
+    return is_different
+
+
+def _get_field_keys(buffer, starts, ends):
+    """Returns fields buffer[starts[i]:ends[i]] as a fixed-width bytes array, copied at once."""
+    import numpy as np
+
+    widths = ends - starts
+    width = max(int(widths.max()), 1) if len(widths) else 1
+    offsets = np.arange(width)
+    matrix = buffer.take(starts[:, None] + offsets, mode="clip")
+    # Bytes past the end of each field are zeroed, and dropped by the bytes dtype
+    matrix[offsets >= widths[:, None]] = 0
+    return np.ascontiguousarray(matrix).view(f"S{width}").ravel()
+
+
+def _add_reference_counts(reference_counts, buffer, starts, ends):
+    import numpy as np
+
+    if not len(starts):
+        return
+    reference_names, indices = np.unique(_get_field_keys(buffer, starts, ends), return_inverse=True)
+    for reference_name, count in zip(reference_names.tolist(), np.bincount(indices.ravel()).tolist()):
+        reference_name = reference_name.decode()
+        reference_counts[reference_name] = reference_counts.get(reference_name, 0) + count
+
+
+def _add_header_reference(line, reference_counts):
+    for field in line.decode().split("\t")[1:]:
+        if field.startswith("SN:"):
+            reference_counts.setdefault(field[3:], 0)
+            return
+
+
+def _format_percentage(count, total):
+    return f"{100 * count / total:.2f}%" if total else "N/A"
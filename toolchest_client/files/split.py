@@ -9,6 +9,8 @@ import os
 import pathlib
 import re
 
+from toolchest_client.tracing import span
+
 
 def open_new_output_file(
         current_split_number,
@@ -37,6 +39,19 @@ def split_file_by_lines(input_file_path, num_lines_in_group=4, max_bytes=4.5 * 1
     :param num_lines_in_group: Number of contiguous lines which cannot be split from one another.
     :param max_bytes: Maximum size of each new file.
     """
+    # The span isn't set as current, as it stays open while the caller handles each yielded split
+    with span("toolchest.split", {"toolchest.file_path": input_file_path}, set_current=False) as split_span:
+        num_splits = 0
+        for split in _split_file_by_lines(input_file_path, num_lines_in_group, max_bytes):
+            num_splits += 1
+            yield split
+        split_span.set_attributes({
+            "toolchest.bytes": os.path.getsize(input_file_path),
+            "toolchest.num_splits": num_splits,
+        })
+
+
+def _split_file_by_lines(input_file_path, num_lines_in_group, max_bytes):
     logger.debug(f"Creating file splits for {input_file_path}...")
     file_extension = pathlib.Path(input_file_path).suffix
     if file_extension not in [".fastq", ".fasta", ".fa", ".fq", ".fna"]:
@@ -0,0 +1,101 @@
+import pytest
+
+from toolchest_client.api.output import Output
+from toolchest_client.files.abundance import build_abundance_matrix, detect_abundance_file_format, \
+    load_abundance_matrix, load_sample_abundances
+
+np = pytest.importorskip("numpy")
+
+KRAKEN2_REPORT = (
+    " 25.00\t1\t1\tU\t0\tunclassified\n"
+    " 75.00\t3\t0\tR\t1\troot\n"
+    " 50.00\t2\t2\tS\t562\t    Escherichia coli\n"
+)
+
+BRACKEN_OUTPUT = (
+    "name\ttaxonomy_id\ttaxonomy_lvl\tkraken_assigned_reads\tadded_reads\tnew_est_reads\tfraction_total_reads\n"
+    "Escherichia coli\t562\tS\t2\t3\t5\t0.50000\n"
+    "Staphylococcus aureus\t1280\tS\t4\t1\t5\t0.50000\n"
+)
+
+METAPHLAN_OUTPUT = (
+    "#mpa_v30_CHOCOPhlAn_201901\n"
+    "#clade_name\tNCBI_tax_id\trelative_abundance\tadditional_species\n"
+    "k__Bacteria\t2\t100.0\t\n"
+    "k__Bacteria|p__Firmicutes\t2|1239\t60.0\t\n"
+    "k__Bacteria|p__Proteobacteria\t2|1224\t40.0\t\n"
+)
+
+
+def write_output(tmp_path, sample_name, file_name, contents):
+    sample_path = tmp_path / sample_name
+    sample_path.mkdir()
+    (sample_path / file_name).write_text(contents)
+    return str(sample_path / file_name)
+
+
+def test_detect_abundance_file_format(tmp_path):
+    assert detect_abundance_file_format(write_output(tmp_path, "a", "kraken2_report.txt", KRAKEN2_REPORT)) == "kraken2"
+    assert detect_abundance_file_format(write_output(tmp_path, "b", "output.bracken", BRACKEN_OUTPUT)) == "bracken"
+    assert detect_abundance_file_format(write_output(tmp_path, "c", "out.txt", METAPHLAN_OUTPUT)) == "metaphlan"
+
+
+def test_load_sample_abundances(tmp_path):
+    bracken_path = write_output(tmp_path, "a", "output.bracken", BRACKEN_OUTPUT)
+    assert load_sample_abundances(bracken_path).values.tolist() == [5, 5]
+    assert load_sample_abundances(bracken_path, value="abundance").values.tolist() == [50, 50]
+    metaphlan_sample = load_sample_abundances(write_output(tmp_path, "b", "out.txt", METAPHLAN_OUTPUT),
+                                              value="abundance")
+    assert metaphlan_sample.taxon_names == ["k__Bacteria", "p__Firmicutes", "p__Proteobacteria"]
+    with pytest.raises(ValueError):
+        load_sample_abundances(str(tmp_path / "b" / "out.txt"))  # no read counts without read stats
+
+
+def test_build_abundance_matrix(tmp_path):
+    paths = [
+        write_output(tmp_path, "sample1", "kraken2_report.txt", KRAKEN2_REPORT),
+        write_output(tmp_path, "sample2", "output.bracken", BRACKEN_OUTPUT),
+        write_output(tmp_path, "sample3", "kraken2_report.txt", " 100.00\t0\t0\tU\t0\tunclassified\n"),
+    ]
+    matrix = build_abundance_matrix(paths)
+    assert matrix.samples == ["sample1", "sample2", "sample3"]
+    assert matrix.taxa == ["0", "1", "1280", "562"]
+    assert matrix.taxon_names[matrix.taxa.index("562")] == "Escherichia coli"
+    assert matrix.shape == (4, 3)
+    assert matrix.nnz == 5  # sample3's zero isn't stored
+    assert matrix.to_dense().tolist() == [[1, 0, 0], [3, 0, 0], [0, 5, 0], [2, 5, 0]]
+    assert matrix.get_sample("sample2") == {"1280": 5, "562": 5}
+    assert matrix.get_taxon(562).tolist() == [2, 5, 0]
+
+
+def test_build_abundance_matrix_from_outputs(tmp_path):
+    outputs = []
+    for sample_name in ["sample1", "sample2"]:
+        write_output(tmp_path, sample_name, "out.txt", METAPHLAN_OUTPUT)
+        output = Output(output_path=str(tmp_path / sample_name))
+        output.set_tool(tool_name="metaphlan")
+        outputs.append(output)
+    matrix = build_abundance_matrix(outputs, value="abundance", sample_names=["a", "b"])
+    assert matrix.samples == ["a", "b"]
+    assert matrix.get_taxon("k__Bacteria|p__Firmicutes").tolist() == [60, 60]
+    with pytest.raises(ValueError):
+        build_abundance_matrix(outputs, sample_names=["a", "a"])
+
+
+def test_save_and_load_npz(tmp_path):
+    matrix = build_abundance_matrix([write_output(tmp_path, "sample1", "output.bracken", BRACKEN_OUTPUT)])
+    matrix.save_npz(str(tmp_path / "abundances.npz"))
+    loaded_matrix = load_abundance_matrix(str(tmp_path / "abundances.npz"))
+    assert loaded_matrix.taxa == matrix.taxa
+    assert loaded_matrix.taxon_names == ["Staphylococcus aureus", "Escherichia coli"]
+    assert loaded_matrix.samples == ["sample1"]
+    assert loaded_matrix.to_dense().tolist() == matrix.to_dense().tolist()
+
+
+def test_to_parquet(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    matrix = build_abundance_matrix([write_output(tmp_path, "sample1", "output.bracken", BRACKEN_OUTPUT)])
+    matrix.to_parquet(str(tmp_path / "abundances.parquet"))
+    table = pq.read_table(str(tmp_path / "abundances.parquet"))
+    assert table.column("value").to_pylist() == [5, 5]
+    assert table.column("sample").to_pylist() == ["sample1", "sample1"]
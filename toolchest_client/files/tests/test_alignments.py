@@ -0,0 +1,123 @@
+import gzip
+
+import pytest
+
+from toolchest_client.api.output import Output
+from toolchest_client.files.alignments import get_alignments_file_name, iter_alignments, load_alignments, MAF
+
+np = pytest.importorskip("numpy")
+
+BLAST_TABULAR = (
+    "read1\tsubj1\t99.5\t200\t1\t0\t1\t200\t11\t210\t1e-100\t370\n"
+    "read1\tsubj2\t80.0\t150\t30\t0\t1\t150\t150\t1\t1e-20\t120\n"
+    "read1\tsubj3\t99.0\t200\t2\t0\t1\t200\t1\t200\t1e-100\t370\n"
+    "read2\tsubj1\t70.0\t100\t30\t1\t1\t100\t1\t100\t0.01\t40.5\n"
+    "read3\tsubj4\t95.0\t100\t5\t0\t1\t100\t1\t100\t1e-30\t150\n"
+    "read3\tsubj2\t97.0\t100\t3\t0\t1\t100\t1\t100\t1e-35\t160\n"
+)
+
+RAPSEARCH2_M8 = (
+    "# RAPSearch2 version 2.24\n"
+    "# Fields: Query\tSubject\tidentity\taln-len\tmismatch\tgap-openings\tq.start\tq.end\ts.start\ts.end\t"
+    "log(e-value)\tbit-score\n"
+    "read1\tsubj1\t90.0\t50\t5\t0\t1\t150\t1\t50\t-10.0\t100.0\n"
+    "read1\tsubj2\t60.0\t50\t20\t0\t1\t150\t1\t50\t-2.0\t30.0\n"
+)
+
+LASTAL_MAF = (
+    "# LAST version 1256\n"
+    "#\n"
+    "a score=40 EG2=1e-05 E=1e-10\n"
+    "s chr1   100 10 + 1000 ACGT-ACGTAC\n"
+    "s read1    0 11 + 11   ACGTTACGTTC\n"
+    "\n"
+    "a score=20 EG2=0.1 E=1e-03\n"
+    "s chr2    0 8 + 500 acgtacgt\n"
+    "s read1   2 6 - 20  ACG--CGT\n"
+    "\n"
+)
+
+
+def write_alignments(tmp_path, file_name, contents):
+    path = tmp_path / file_name
+    if file_name.endswith(".gz"):
+        with gzip.open(path, "wt") as alignments_file:
+            alignments_file.write(contents)
+    else:
+        path.write_text(contents)
+    return str(path)
+
+
+def test_load_tabular_alignments(tmp_path):
+    alignments = load_alignments(write_alignments(tmp_path, "blastn_results.out.gz", BLAST_TABULAR))
+    assert len(alignments) == 6
+    assert alignments["qseqid"].tolist() == ["read1"] * 3 + ["read2", "read3", "read3"]
+    assert alignments["sstart"].dtype == np.int64
+    assert alignments["evalue"][3] == 0.01
+    assert alignments.get_row(1)["send"] == 1
+
+
+def test_filter_and_select_best_hits(tmp_path):
+    path = write_alignments(tmp_path, "blastn_results.out", BLAST_TABULAR)
+    best_hits = load_alignments(path, best_hits=True)
+    # Ties are broken by order
+    assert best_hits["sseqid"].tolist() == ["subj1", "subj1", "subj2"]
+    filtered_best_hits = load_alignments(path, best_hits=True, max_evalue=1e-10, min_identity=96)
+    assert list(zip(filtered_best_hits["qseqid"], filtered_best_hits["sseqid"])) == [
+        ("read1", "subj1"), ("read3", "subj2"),
+    ]
+
+
+def test_best_hits_across_chunks(tmp_path):
+    path = write_alignments(tmp_path, "blastn_results.out", BLAST_TABULAR)
+    # Each chunk is about one line, so every query's alignments span several chunks
+    chunks = list(iter_alignments(path, best_hits=True, chunk_size=1))
+    assert sum(len(chunk) for chunk in chunks) == 3
+    assert [chunk["qseqid"].tolist() for chunk in chunks] == [["read1"], ["read2"], ["read3"]]
+    assert chunks[2]["sseqid"].tolist() == ["subj2"]
+
+
+def test_custom_columns(tmp_path):
+    path = write_alignments(tmp_path, "out_file.tsv", "read1\tsubj1\t1e-5\t50.2\t562;561\n")
+    alignments = load_alignments(path, columns="6 qseqid sseqid evalue bitscore staxids")
+    assert alignments.column_names == ["qseqid", "sseqid", "evalue", "bitscore", "staxids"]
+    assert alignments["staxids"].tolist() == ["562;561"]
+    with pytest.raises(ValueError):
+        load_alignments(path)  # The default columns don't match
+
+
+def test_rapsearch2_log_evalues(tmp_path):
+    path = write_alignments(tmp_path, "output.m8", RAPSEARCH2_M8)
+    alignments = load_alignments(path, max_evalue=1e-5)
+    assert alignments["sseqid"].tolist() == ["subj1"]
+    assert alignments["evalue"].tolist() == pytest.approx([1e-10])
+
+
+def test_load_maf_alignments(tmp_path):
+    alignments = load_alignments(write_alignments(tmp_path, "out.maf", LASTAL_MAF))
+    assert alignments.get_row(0) == {
+        "qseqid": "read1", "sseqid": "chr1", "pident": pytest.approx(900 / 11), "length": 11, "mismatch": 1,
+        "gapopen": 1, "qstart": 1, "qend": 11, "sstart": 101, "send": 110, "evalue": 1e-10, "score": 40,
+    }
+    # Lowercase letters match, and coordinates on the reverse strand are reversed
+    assert alignments.get_row(1)["pident"] == 75.0
+    assert alignments["qstart"][1] == 18 and alignments["qend"][1] == 13
+    best_hits = load_alignments(write_alignments(tmp_path, "out.maf", LASTAL_MAF), best_hits=True)
+    assert best_hits["score"].tolist() == [40]
+
+
+def test_maf_blocks_across_chunks(tmp_path):
+    path = write_alignments(tmp_path, "out.maf", LASTAL_MAF)
+    chunks = list(iter_alignments(path, file_format=MAF, chunk_size=1))
+    assert [chunk["sseqid"].tolist() for chunk in chunks] == [["chr1"], ["chr2"]]
+
+
+def test_output_loads_alignments(tmp_path):
+    write_alignments(tmp_path, "base.m8", RAPSEARCH2_M8)
+    output = Output(output_path=str(tmp_path))
+    output.set_tool(tool_name="rapsearch2")
+    output.set_output_primary_name("base")
+    assert output.load_alignments(best_hits=True)["sseqid"].tolist() == ["subj1"]
+    assert get_alignments_file_name("diamond_blastx") == "out_file.tsv"
+    with pytest.raises(ValueError):
+        get_alignments_file_name("kraken2")
@@ -0,0 +1,36 @@
+import gzip
+
+import pytest
+
+from toolchest_client.files.chunks import iter_line_chunks, parse_leading_uints
+
+LINES = b"first line\nsecond\na much longer third line\nlast"
+
+
+@pytest.mark.parametrize("chunk_size", [1, 8, 1024])
+def test_iter_line_chunks(tmp_path, chunk_size):
+    path = tmp_path / "lines.txt"
+    path.write_bytes(LINES)
+    gzipped_path = tmp_path / "lines.txt.gz"
+    gzipped_path.write_bytes(gzip.compress(LINES))
+    for chunk_path in [path, gzipped_path]:
+        chunks = list(iter_line_chunks(str(chunk_path), chunk_size))
+        assert b"".join(chunks) == LINES
+        assert all(chunk.endswith(b"\n") for chunk in chunks[:-1])
+
+
+def test_iter_line_chunks_of_empty_file(tmp_path):
+    path = tmp_path / "empty.txt"
+    path.write_bytes(b"")
+    assert list(iter_line_chunks(str(path), 1024)) == []
+
+
+def test_parse_leading_uints():
+    np = pytest.importorskip("numpy")
+    data = b"562\t12x\t\tname\t" + b"9" * 20
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    starts = np.array([0, 4, 8, 9, 14])
+    ends = np.array([3, 7, 8, 13, len(data)])
+    values, num_digits = parse_leading_uints(buffer, starts, ends)
+    assert values.tolist() == [562, 12, 0, 0, int("9" * 18)]
+    assert num_digits.tolist() == [3, 2, 0, 0, 18]
@@ -3,7 +3,8 @@ import pathlib
 
 import pytest
 
-from .. import assert_exists, check_file_size, files_in_path, sanity_check, convert_input_params_to_prefix_mapping
+from .. import assert_exists, check_file_size, files_in_path, files_and_sizes_in_path, sanity_check, \
+    convert_input_params_to_prefix_mapping
 
 THIS_FILE_PATH = os.path.normpath(pathlib.Path(__file__).parent.resolve())
 
@@ -33,6 +34,37 @@ def test_files_in_path():
     os.removedirs(sub_dir)
 
 
+def test_files_and_sizes_in_path():
+    tmp_dir = f"{THIS_FILE_PATH}/tmp_sizes"
+    sub_dir = f"{tmp_dir}/sub_dir"
+    nested_dir = f"{sub_dir}/nested_dir"
+    file_contents = {
+        f"{tmp_dir}/tmp1": "a",
+        f"{sub_dir}/tmp2": "bb",
+        f"{nested_dir}/tmp3": "ccc",
+    }
+    os.makedirs(nested_dir, exist_ok=True)
+    for file, contents in file_contents.items():
+        with open(file, "w") as f:
+            f.write(contents)
+    expected = sorted((os.path.normpath(file), len(contents)) for file, contents in file_contents.items())
+
+    serial_result = files_and_sizes_in_path(tmp_dir)
+    threaded_result = files_and_sizes_in_path(tmp_dir, num_threads=4)
+    assert sorted((os.path.normpath(path), size) for path, size in serial_result) == expected
+    assert threaded_result == serial_result
+
+    for file in file_contents:
+        os.remove(file)
+    os.removedirs(nested_dir)
+
+
+def test_file_size_already_known():
+    with pytest.raises(ValueError):
+        check_file_size(f"{THIS_FILE_PATH}/data/bogus_file_path", max_size_bytes=100, file_size_bytes=1000)
+    assert check_file_size(f"{THIS_FILE_PATH}/data/bogus_file_path", file_size_bytes=10) == 10
+
+
 def test_file_too_large():
     with pytest.raises(ValueError):
         check_file_size(f"{THIS_FILE_PATH}/data/eight_line.fastq", max_size_bytes=100)
@@ -0,0 +1,91 @@
+import pytest
+
+from toolchest_client.files.humann_tables import iter_table_chunks, join_tables, read_table, reduce_table, \
+    renorm_table, split_stratified_table
+
+np = pytest.importorskip("numpy")
+
+GENE_FAMILIES = (
+    "# Gene Family\tsample1_Abundance-RPKs\tsample2_Abundance-RPKs\n"
+    "UNMAPPED\t100\t0\n"
+    "UniRef90_A\t60\t10\n"
+    "UniRef90_A|g__Bacteroides\t40\t10\n"
+    "UniRef90_A|unclassified\t20\t0\n"
+    "UniRef90_B\t40\t30\n"
+    "UniRef90_B|g__Bacteroides\t40\t30\n"
+)
+
+
+@pytest.fixture
+def table_path(tmp_path):
+    path = tmp_path / "genefamilies.tsv"
+    path.write_text(GENE_FAMILIES)
+    return str(path)
+
+
+def test_iter_table_chunks(table_path):
+    chunks = list(iter_table_chunks(table_path, chunk_lines=4))
+    assert [len(features) for features, _ in chunks] == [4, 2]
+    assert chunks[1][0] == ["UniRef90_B", "UniRef90_B|g__Bacteroides"]
+    assert chunks[1][1].tolist() == [[40, 30], [40, 30]]
+
+
+def test_iter_table_chunks_rejects_invalid_lines(tmp_path):
+    path = tmp_path / "invalid.tsv"
+    path.write_text("# Gene Family\tsample1\nUniRef90_A\t1\t2\n")
+    with pytest.raises(ValueError):
+        list(iter_table_chunks(str(path)))
+
+
+def test_renorm_table_community(table_path, tmp_path):
+    output_path = str(tmp_path / "renormed.tsv")
+    renorm_table(table_path, output_path, units="relab", update_sample_names=True)
+    header, features, values = read_table(output_path)
+    assert header == ["# Gene Family", "sample1_Abundance-RELAB", "sample2_Abundance-RELAB"]
+    # Normalized by the unstratified totals (200 and 40), including UNMAPPED
+    assert values[features.index("UNMAPPED")].tolist() == [0.5, 0]
+    assert values[features.index("UniRef90_A|g__Bacteroides")].tolist() == [0.2, 0.25]
+
+
+def test_renorm_table_levelwise_without_special_features(table_path, tmp_path):
+    output_path = str(tmp_path / "renormed.tsv")
+    renorm_table(table_path, output_path, units="cpm", mode="levelwise", special=False)
+    header, features, values = read_table(output_path)
+    assert header[1] == "sample1_Abundance-RPKs"
+    assert "UNMAPPED" not in features
+    assert values[features.index("UniRef90_A")].tolist() == [600000, 250000]
+    assert values[features.index("UniRef90_A|unclassified")].tolist() == [200000, 0]
+
+
+def test_reduce_table(table_path, tmp_path):
+    output_path = str(tmp_path / "reduced.tsv")
+    reduce_table(table_path, output_path, function="sum", sort_by="value")
+    header, features, values = read_table(output_path)
+    assert header == ["# Gene Family", "sum"]
+    assert features[:2] == ["UNMAPPED", "UniRef90_A"]
+    assert values[:, 0].tolist() == [100, 70, 70, 70, 50, 20]
+
+
+def test_join_tables(tmp_path):
+    tables_path = tmp_path / "tables"
+    tables_path.mkdir()
+    (tables_path / "sample1_genefamilies.tsv").write_text("# Gene Family\tsample1\nUniRef90_B\t2\nUNMAPPED\t1\n")
+    (tables_path / "sample2_genefamilies.tsv").write_text("# Gene Family\tsample2\nUniRef90_A\t3\nUNMAPPED\t4\n")
+    (tables_path / "sample2_pathabundance.tsv").write_text("# Pathway\tsample2\nPWY-1\t5\n")
+    output_path = str(tmp_path / "joined.tsv")
+    join_tables(str(tables_path), output_path, file_name="genefamilies")
+    assert open(output_path).read() == (
+        "# Gene Family\tsample1\tsample2\n"
+        "UNMAPPED\t1\t4\n"
+        "UniRef90_A\t0\t3\n"
+        "UniRef90_B\t2\t0\n"
+    )
+
+
+def test_split_stratified_table(table_path, tmp_path):
+    stratified_path, unstratified_path = split_stratified_table(table_path, str(tmp_path / "split"))
+    assert stratified_path.endswith("genefamilies_stratified.tsv")
+    assert read_table(stratified_path)[1] == [
+        "UniRef90_A|g__Bacteroides", "UniRef90_A|unclassified", "UniRef90_B|g__Bacteroides",
+    ]
+    assert read_table(unstratified_path)[1] == ["UNMAPPED", "UniRef90_A", "UniRef90_B"]
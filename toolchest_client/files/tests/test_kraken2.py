@@ -0,0 +1,127 @@
+import gzip
+
+import pytest
+
+from toolchest_client.api.output import Output
+from toolchest_client.files.kraken2 import iter_kraken2_output, load_kraken2_report, summarize_kraken2_output
+
+np = pytest.importorskip("numpy")
+
+REPORT = (
+    " 25.00\t1\t1\tU\t0\tunclassified\n"
+    " 75.00\t3\t0\tR\t1\troot\n"
+    " 75.00\t3\t0\tD\t2\t  Bacteria\n"
+    " 50.00\t2\t2\tS\t562\t    Escherichia coli\n"
+    " 25.00\t1\t1\tS\t1280\t    Staphylococcus aureus\n"
+)
+
+READS = [
+    ("U", "read1", "0", "150", "0:116"),
+    ("C", "read2", "562", "150", "562:116"),
+    ("C", "read3", "562", "148|151", "562:114 |:| 562:117"),
+    ("C", "read4", "1280", "99", "1280:65"),
+]
+
+
+def write_output(path, reads, use_names=False):
+    with open(path, "w") as output_file:
+        for flag, read_id, taxid, length, lca in reads:
+            if use_names:
+                taxid = f"Some taxon name ({taxid}) (taxid {taxid})"
+            output_file.write("\t".join([flag, read_id, taxid, length, lca]) + "\n")
+
+
+def test_load_kraken2_report(tmp_path):
+    report_path = tmp_path / "kraken2_report.txt"
+    report_path.write_text(REPORT)
+    report = load_kraken2_report(str(report_path))
+    assert len(report) == 5
+    assert report.taxids.dtype == np.int32
+    assert report.depths.tolist() == [0, 0, 1, 2, 2]
+    assert report.names[3] == "Escherichia coli"
+    assert report.num_unclassified_reads == 1
+    assert report.num_classified_reads == 3
+    assert [row["taxid"] for row in report.get_rank("S")] == [562, 1280]
+    assert report.get_taxon(1280)["clade_reads"] == 1
+    assert report.get_taxon(9606) is None
+    assert report.minimizers is None
+
+
+def test_load_kraken2_report_with_minimizers(tmp_path):
+    report_path = tmp_path / "kraken2_report.txt"
+    report_path.write_text(" 25.00\t1\t1\t10\t5\tU\t0\tunclassified\n 75.00\t3\t0\t100\t50\tR\t1\troot\n")
+    report = load_kraken2_report(str(report_path))
+    assert report.minimizers.tolist() == [10, 100]
+    assert report.get_taxon(1) == {
+        "percentage": 75.0, "clade_reads": 3, "direct_reads": 0, "rank": "R", "taxid": 1, "name": "root",
+        "depth": 0, "minimizers": 100, "distinct_minimizers": 50,
+    }
+
+
+def test_load_kraken2_report_rejects_invalid_lines(tmp_path):
+    report_path = tmp_path / "kraken2_report.txt"
+    # The total number of fields is a multiple of 6, but the lines have 5 and 7 fields
+    report_path.write_text(" 25.00\t1\t1\tU\tunclassified\n 75.00\t3\t0\tR\t1\t1\troot\n")
+    with pytest.raises(ValueError, match="root"):
+        load_kraken2_report(str(report_path))
+    report_path.write_text(" 25.00\t1\t1\tU\t0\n")
+    with pytest.raises(ValueError):
+        load_kraken2_report(str(report_path))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 40, 1024])
+def test_iter_kraken2_output(tmp_path, chunk_size):
+    output_path = tmp_path / "kraken2_output.txt"
+    write_output(output_path, READS)
+    chunks = list(iter_kraken2_output(str(output_path), chunk_size=chunk_size, include_read_ids=True))
+    assert chunks[0].taxids.dtype == np.int32
+    assert chunks[0].lengths.dtype == np.uint32
+    assert chunks[0].is_classified.dtype == bool
+    assert np.concatenate([chunk.taxids for chunk in chunks]).tolist() == [0, 562, 562, 1280]
+    assert np.concatenate([chunk.lengths for chunk in chunks]).tolist() == [150, 150, 299, 99]
+    assert np.concatenate([chunk.is_classified for chunk in chunks]).tolist() == [False, True, True, True]
+    assert sum((chunk.read_ids for chunk in chunks), []) == ["read1", "read2", "read3", "read4"]
+
+
+def test_iter_kraken2_output_with_names_and_gzip(tmp_path):
+    output_path = tmp_path / "kraken2_output.txt"
+    write_output(output_path, READS, use_names=True)
+    gzipped_output_path = tmp_path / "kraken2_output.txt.gz"
+    gzipped_output_path.write_bytes(gzip.compress(output_path.read_bytes()))
+    for path in [output_path, gzipped_output_path]:
+        chunks = list(iter_kraken2_output(str(path), chunk_size=50))
+        assert np.concatenate([chunk.taxids for chunk in chunks]).tolist() == [0, 562, 562, 1280]
+
+
+def test_iter_kraken2_output_without_trailing_newline(tmp_path):
+    output_path = tmp_path / "kraken2_output.txt"
+    output_path.write_text("C\tread1\t562\t150\t562:116\nC\tread2\t1280\t99\t1280:65")
+    chunk, = iter_kraken2_output(str(output_path))
+    assert chunk.taxids.tolist() == [562, 1280]
+
+
+def test_iter_kraken2_output_rejects_invalid_lines(tmp_path):
+    output_path = tmp_path / "kraken2_output.txt"
+    output_path.write_text("C\tread1\t562\n")
+    with pytest.raises(ValueError):
+        list(iter_kraken2_output(str(output_path)))
+
+
+def test_summarize_kraken2_output(tmp_path):
+    output_path = tmp_path / "kraken2_output.txt"
+    write_output(output_path, READS * 100)
+    summary = summarize_kraken2_output(str(output_path), chunk_size=256)
+    assert summary.num_reads == 400
+    assert summary.num_classified == 300
+    assert summary.to_dict() == {0: 100, 562: 200, 1280: 100}
+    assert summary.base_counts.tolist() == [15000, 44900, 9900]
+
+
+def test_output_loads_kraken2_files(tmp_path):
+    (tmp_path / "kraken2_report.txt").write_text(REPORT)
+    write_output(tmp_path / "kraken2_output.txt", READS)
+    output = Output(output_path=str(tmp_path))
+    assert output.load_kraken2_report().get_taxon(562)["clade_reads"] == 2
+    assert output.summarize_kraken2_output().to_dict() == {0: 1, 562: 2, 1280: 1}
+    with pytest.raises(FileNotFoundError):
+        Output(output_path=str(tmp_path / "missing")).load_kraken2_report()
@@ -0,0 +1,37 @@
+import os
+import pathlib
+
+from .. import files_and_sizes_in_path, InputLocation, InputResolver
+from .. import s3
+
+THIS_FILE_PATH = os.path.normpath(pathlib.Path(__file__).parent.resolve())
+EIGHT_LINE_FASTQ_PATH = f"{THIS_FILE_PATH}/data/eight_line.fastq"
+
+
+def test_resolve_local_file():
+    resolver = InputResolver()
+    resolved_input = resolver.get(EIGHT_LINE_FASTQ_PATH)
+    assert resolved_input.location == InputLocation.LOCAL
+    assert not resolved_input.is_remote
+
+
+def test_resolve_s3_uris_once(monkeypatch):
+    s3_lookups = []
+
+    def fake_get_s3_file_size(uri):
+        s3_lookups.append(uri)
+        return 123
+
+    monkeypatch.setattr(s3, "_batch_metadata_supported", False)
+    monkeypatch.setattr(s3, "get_s3_file_size", fake_get_s3_file_size)
+    uris = [f"s3://toolchest-fake-bucket/file_{index}.fastq" for index in range(20)]
+    resolver = InputResolver()
+
+    files_and_sizes = files_and_sizes_in_path(uris + [EIGHT_LINE_FASTQ_PATH], resolver=resolver)
+    resolver.resolve(uris)
+    for uri in uris:
+        assert resolver.get(uri).location == InputLocation.S3
+
+    assert sorted(s3_lookups) == sorted(uris)
+    assert files_and_sizes[:len(uris)] == [(uri, 123) for uri in uris]
+    assert files_and_sizes[-1] == (EIGHT_LINE_FASTQ_PATH, os.stat(EIGHT_LINE_FASTQ_PATH).st_size)
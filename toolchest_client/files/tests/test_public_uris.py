@@ -0,0 +1,82 @@
+import requests
+
+from .. import classify_path, get_uri_scheme, path_is_http_url, InputLocation
+from .. import public_uris
+
+
+def test_uri_schemes():
+    assert get_uri_scheme("https://example.com/file.fastq") == "https"
+    assert get_uri_scheme("HTTP://example.com/file.fastq") == "http"
+    assert get_uri_scheme("ftp://ftp.sra.ebi.ac.uk/vol1/file.fastq.gz") == "ftp"
+    assert get_uri_scheme("./data/file.fastq") is None
+    assert get_uri_scheme("C:\\data\\file.fastq") is None
+
+
+def test_classify_path():
+    assert classify_path("s3://bucket/file.fastq") == InputLocation.S3
+    assert classify_path("https://example.com/file.fastq") == InputLocation.HTTP
+    assert classify_path("ftp://ftp.sra.ebi.ac.uk/vol1/file.fastq.gz") == InputLocation.FTP
+    assert classify_path("~/file.fastq") == InputLocation.LOCAL
+
+
+def test_local_path_is_not_probed(monkeypatch):
+    def fail_on_request(*args, **kwargs):
+        raise AssertionError("Local paths should not be sent over the network")
+
+    monkeypatch.setattr(requests, "head", fail_on_request)
+    monkeypatch.setattr(requests, "get", fail_on_request)
+    assert not path_is_http_url("./data/file.fastq")
+
+
+def test_http_probe_falls_back_to_ranged_get(monkeypatch):
+    class FakeResponse:
+        def __init__(self, status_code, headers):
+            self.status_code = status_code
+            self.ok = status_code < 400
+            self.headers = headers
+
+        def raise_for_status(self):
+            if not self.ok:
+                raise requests.exceptions.HTTPError()
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            pass
+
+    monkeypatch.setattr(requests, "head", lambda *args, **kwargs: FakeResponse(405, {}))
+    monkeypatch.setattr(
+        requests, "get", lambda *args, **kwargs: FakeResponse(206, {"Content-Range": "bytes 0-0/1234"})
+    )
+    assert public_uris.probe_http_url("https://example.com/file.fastq") == (True, 1234)
+
+
+def test_ftp_connections_are_pooled(monkeypatch):
+    logins = []
+
+    class FakeFTP:
+        def __init__(self, host, timeout=None):
+            self.host = host
+
+        def login(self):
+            logins.append(self.host)
+
+        def voidcmd(self, command):
+            pass
+
+        def size(self, path):
+            return len(path)
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(public_uris, "FTP", FakeFTP)
+    connection_pool = public_uris.FTPConnectionPool(max_connections_per_host=2)
+    urls = [f"ftp://ftp.example.org/vol1/{'x' * index}" for index in range(1, 21)]
+
+    file_sizes = public_uris.get_ftp_url_file_sizes(urls, connection_pool=connection_pool)
+
+    assert file_sizes == {url: len(public_uris.urlparse(url).path) for url in urls}
+    assert 1 <= len(logins) <= 2
+    connection_pool.close()
@@ -0,0 +1,93 @@
+import pytest
+
+from toolchest_client.api.output import Output
+from toolchest_client.files.quant import load_quant_matrices, load_quantifications, load_tx2gene, read_quant_file
+
+np = pytest.importorskip("numpy")
+
+SALMON_QUANT = (
+    "Name\tLength\tEffectiveLength\tTPM\tNumReads\n"
+    "ENST1.1\t1000\t800\t500000\t40\n"
+    "ENST2.1\t2000\t1800\t250000\t45\n"
+    "ENST3.2\t500\t300\t250000\t7.5\n"
+)
+
+KALLISTO_ABUNDANCE = (
+    "target_id\tlength\teff_length\test_counts\ttpm\n"
+    "ENST3.2\t500\t300\t15\t0\n"
+    "ENST1.1\t1000\t800\t0\t0\n"
+    "ENST2.1\t2000\t1800\t90\t1000000\n"
+)
+
+TX2GENE = "transcript_id,gene_id\nENST1,GENE1\nENST2,GENE1\nENST3,GENE2\n"
+
+
+def write_quant_file(tmp_path, sample_name, file_name, contents):
+    sample_path = tmp_path / sample_name / "output"
+    sample_path.mkdir(parents=True)
+    (sample_path / file_name).write_text(contents)
+    return str(sample_path / file_name)
+
+
+def test_read_quant_file(tmp_path):
+    names, values = read_quant_file(write_quant_file(tmp_path, "sample1", "abundance.tsv", KALLISTO_ABUNDANCE))
+    assert names == ["ENST3.2", "ENST1.1", "ENST2.1"]
+    assert values.tolist() == [[300, 0, 15], [800, 0, 0], [1800, 1000000, 90]]
+
+
+def test_load_quantifications_from_outputs(tmp_path):
+    write_quant_file(tmp_path, "sample1", "quant.sf", SALMON_QUANT)
+    write_quant_file(tmp_path, "sample2", "abundance.tsv", KALLISTO_ABUNDANCE)
+    outputs = [Output(output_path=str(tmp_path / "sample1")), Output(output_path=str(tmp_path / "sample2"))]
+    outputs[1].set_tool(tool_name="kallisto")
+    transcripts = load_quantifications(outputs)
+    assert transcripts.samples == ["sample1", "sample2"]
+    assert transcripts.names == ["ENST1.1", "ENST2.1", "ENST3.2"]
+    # sample2's transcripts are in a different order, so they're matched by name
+    assert transcripts.counts.tolist() == [[40, 0], [45, 90], [7.5, 15]]
+    assert transcripts.lengths[:, 1].tolist() == [800, 1800, 300]
+
+
+def test_load_quantifications_rejects_different_indexes(tmp_path):
+    paths = [
+        write_quant_file(tmp_path, "sample1", "quant.sf", SALMON_QUANT),
+        write_quant_file(tmp_path, "sample2", "quant.sf", SALMON_QUANT.replace("ENST3.2", "ENST4.1")),
+    ]
+    with pytest.raises(ValueError):
+        load_quantifications(paths, sample_names=["a", "b"])
+
+
+def test_summarize_to_genes(tmp_path):
+    transcripts = load_quantifications([
+        write_quant_file(tmp_path, "sample1", "quant.sf", SALMON_QUANT),
+        write_quant_file(tmp_path, "sample2", "abundance.tsv", KALLISTO_ABUNDANCE),
+    ], sample_names=["sample1", "sample2"])
+    tx2gene_path = tmp_path / "tx2gene.csv"
+    tx2gene_path.write_text(TX2GENE)
+    assert load_tx2gene(str(tx2gene_path)) == {"ENST1": "GENE1", "ENST2": "GENE1", "ENST3": "GENE2"}
+    with pytest.raises(ValueError):
+        transcripts.summarize_to_genes(str(tx2gene_path))  # versions aren't ignored
+
+    genes = transcripts.summarize_to_genes(str(tx2gene_path), ignore_transcript_version=True)
+    assert genes.names == ["GENE1", "GENE2"]
+    assert genes.counts.tolist() == [[85, 90], [7.5, 15]]
+    assert genes.tpm.tolist() == [[750000, 1000000], [250000, 0]]
+    # Weighted by TPM, or a plain average where the gene's TPM is 0
+    assert genes.lengths[0].tolist() == pytest.approx([(500000 * 800 + 250000 * 1800) / 750000, 1800])
+    assert genes.lengths[1].tolist() == [300, 300]
+
+
+def test_get_counts_from_abundance(tmp_path):
+    transcripts = load_quantifications([write_quant_file(tmp_path, "sample1", "quant.sf", SALMON_QUANT)])
+    assert transcripts.get_counts().tolist() == [[40], [45], [7.5]]
+    assert transcripts.get_counts("scaled_tpm")[:, 0].tolist() == pytest.approx([46.25, 23.125, 23.125])
+    assert transcripts.get_counts("length_scaled_tpm").sum() == pytest.approx(92.5)
+
+
+def test_save_and_load_npz(tmp_path):
+    transcripts = load_quantifications([write_quant_file(tmp_path, "sample1", "quant.sf", SALMON_QUANT)])
+    transcripts.save_npz(str(tmp_path / "transcripts.npz"))
+    loaded_transcripts = load_quant_matrices(str(tmp_path / "transcripts.npz"))
+    assert loaded_transcripts.names == transcripts.names
+    assert loaded_transcripts.samples == ["output"]
+    assert loaded_transcripts.tpm.tolist() == transcripts.tpm.tolist()
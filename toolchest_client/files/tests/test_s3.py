@@ -1,6 +1,9 @@
 import pytest
+from requests.exceptions import HTTPError
 
-from .. import assert_accessible_s3, get_s3_file_size, get_params_from_s3_uri
+from .. import assert_accessible_s3, get_s3_file_size, get_s3_file_sizes, get_params_from_s3_uri
+from .. import cache, s3
+from ..cache import TTLCache
 from ...api.exceptions import ToolchestS3AccessError
 
 EXAMPLE_FASTQ_SIZE = 48468258
@@ -36,3 +39,96 @@ def test_fake_s3_file():
 @pytest.mark.integration
 def test_s3_file_size():
     assert get_s3_file_size(EXAMPLE_FASTQ_URI) == EXAMPLE_FASTQ_SIZE
+
+
+class FakeResponse:
+    def __init__(self, status_code, json_body=None):
+        self.status_code = status_code
+        self._json_body = json_body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPError()
+
+    def json(self):
+        return self._json_body
+
+
+def test_batched_s3_file_sizes(monkeypatch):
+    requested_batches = []
+
+    def fake_post(url, headers=None, json=None):
+        requested_batches.append(json["files"])
+        return FakeResponse(200, {"files": [{"file_size": len(params["key"])} for params in json["files"]]})
+
+    monkeypatch.setattr(s3, "_batch_metadata_supported", None)
+    monkeypatch.setattr(s3, "_s3_file_size_cache", TTLCache())
+    monkeypatch.setattr(s3.requests, "post", fake_post)
+    uris = [f"s3://toolchest-fake-bucket/{'x' * index}" for index in range(1, s3.S3_METADATA_BATCH_SIZE + 11)]
+
+    file_sizes = get_s3_file_sizes(uris)
+    assert file_sizes == {uri: len(get_params_from_s3_uri(uri)["key"]) for uri in uris}
+    assert len(requested_batches) == 2
+
+    # Sizes are cached, so asking again sends no requests
+    assert get_s3_file_sizes(uris) == file_sizes
+    assert get_s3_file_size(uris[0]) == 1
+    assert len(requested_batches) == 2
+
+
+def test_s3_file_sizes_without_batch_support(monkeypatch):
+    def fake_post(url, headers=None, json=None):
+        if url.endswith("/batch"):
+            return FakeResponse(404)
+        return FakeResponse(200, {"file_size": 42})
+
+    monkeypatch.setattr(s3, "_batch_metadata_supported", None)
+    monkeypatch.setattr(s3, "_s3_file_size_cache", TTLCache())
+    monkeypatch.setattr(s3.requests, "post", fake_post)
+    uris = [f"s3://toolchest-fake-bucket/file_{index}.fastq" for index in range(5)]
+
+    assert get_s3_file_sizes(uris) == {uri: 42 for uri in uris}
+    assert s3._batch_metadata_supported is False
+
+
+def test_ttl_cache_expiry_and_eviction(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    ttl_cache = TTLCache(max_size=2, ttl_seconds=10)
+    ttl_cache.set("a", 1)
+    ttl_cache.set("b", 2)
+    assert ttl_cache.get("a") == 1
+    ttl_cache.set("c", 3)  # evicts "b", the least recently used entry
+    assert ttl_cache.get("b") is None
+    now[0] = 11.0
+    assert ttl_cache.get("a") is None
+
+
+def test_s3_client_cache_reuses_clients():
+    pytest.importorskip("boto3")
+    client_cache = s3.S3ClientCache(max_size=2)
+    file_keys = {"access_key_id": "AKIAFAKE1", "secret_access_key": "fake-secret", "session_token": "token-1"}
+
+    s3_client = client_cache.get_client(**file_keys, region_name="us-east-1")
+    assert client_cache.get_client(**file_keys, region_name="us-east-1") is s3_client
+    assert s3_client.meta.config.max_pool_connections == s3.S3_MAX_POOL_CONNECTIONS
+
+    # New credentials get a new client, and the least recently used client is evicted
+    client_cache.get_client("AKIAFAKE2", "fake-secret", "token-2", region_name="us-east-1")
+    client_cache.get_client("AKIAFAKE3", "fake-secret", "token-3", region_name="us-east-1")
+    assert len(client_cache) == 2
+    assert client_cache.get_client(**file_keys, region_name="us-east-1") is not s3_client
+
+    client_cache.evict("AKIAFAKE1", "token-1", region_name="us-east-1")
+    assert len(client_cache) == 1
+
+
+def test_is_expired_credentials_error():
+    botocore_exceptions = pytest.importorskip("botocore.exceptions")
+
+    def client_error(code):
+        return botocore_exceptions.ClientError({"Error": {"Code": code, "Message": ""}}, "GetObject")
+
+    assert s3.is_expired_credentials_error(client_error("ExpiredToken"))
+    assert not s3.is_expired_credentials_error(client_error("AccessDenied"))
+    assert not s3.is_expired_credentials_error(ValueError())
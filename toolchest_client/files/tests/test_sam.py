@@ -0,0 +1,86 @@
+import gzip
+
+import pytest
+
+from toolchest_client.api.output import Output
+from toolchest_client.files.sam import read_sam_stats, SECONDARY, UNMAPPED
+
+np = pytest.importorskip("numpy")
+
+HEADER = "@HD\tVN:1.6\n@SQ\tSN:chr1\tLN:1000\n@SQ\tSN:chr2\tLN:1000\n@SQ\tSN:chr3\tLN:1000\n"
+RECORDS = [
+    "r1\t99\tchr1\t100\t60\t4M\t=\t200\t104\tACGT\tIIII",
+    "r1\t147\tchr1\t200\t60\t4M\t=\t100\t-104\tACGT\tIIII",
+    "r2\t65\tchr1\t100\t60\t4M\tchr2\t300\t0\tACGT\tIIII",
+    "r2\t129\tchr2\t300\t3\t4M\tchr1\t100\t0\tACGT\tIIII",
+    "r3\t73\tchr2\t500\t60\t4M\t=\t500\t0\tACGT\tIIII\tNH:i:1",
+    "r3\t133\tchr2\t500\t0\t*\t=\t500\t0\tACGT\tIIII",
+    "r4\t4\t*\t0\t0\t*\t*\t0\t0\tACGT\tIIII",
+    "r5\t256\tchr1\t700\t0\t4M\t*\t0\t0\t*\t*",
+    "r6\t2048\tchr2\t800\t60\t2M2S\t*\t0\t0\tACGT\tIIII",
+    "r7\t512\tchr1\t100\t60\t4M\t*\t0\t0\tACGT\tIIII",
+    "r8\t1024\tchr1\t100\t60\t4M\t*\t0\t0\tACGT\tIIII",
+]
+SAM = HEADER + "\n".join(RECORDS) + "\n"
+
+
+@pytest.fixture
+def sam_path(tmp_path):
+    path = tmp_path / "Aligned.out.sam"
+    path.write_text(SAM)
+    return str(path)
+
+
+def test_read_sam_stats(sam_path):
+    stats = read_sam_stats(sam_path)
+    assert stats.qc_passed == {
+        "total": 10, "primary": 8, "secondary": 1, "supplementary": 1, "duplicates": 1, "primary_duplicates": 1,
+        "mapped": 8, "primary_mapped": 6, "paired": 6, "read1": 3, "read2": 3, "properly_paired": 2,
+        "with_itself_and_mate_mapped": 4, "singletons": 1, "with_mate_mapped_to_different_chr": 2,
+        "with_mate_mapped_to_different_chr_mapq5": 1,
+    }
+    assert stats.qc_failed["total"] == stats.qc_failed["primary_mapped"] == 1
+    # Primary alignments, in header order
+    assert stats.reference_counts == {"chr1": 5, "chr2": 2, "chr3": 0}
+    assert stats.mapping_rate == 0.75
+    flagstat_lines = stats.format_flagstat().splitlines()
+    assert flagstat_lines[0] == "10 + 1 in total (QC-passed reads + QC-failed reads)"
+    assert flagstat_lines[6] == "8 + 1 mapped (80.00% : 100.00%)"
+    assert flagstat_lines[13] == "1 + 0 singletons (16.67% : N/A)"
+
+
+def test_read_sam_stats_in_chunks(tmp_path, sam_path):
+    gzipped_path = tmp_path / "Aligned.out.sam.gz"
+    with gzip.open(gzipped_path, "wt") as sam_file:
+        sam_file.write(SAM)
+    stats = read_sam_stats(str(gzipped_path), chunk_size=50)
+    assert stats.to_dict() == read_sam_stats(sam_path).to_dict()
+
+
+def test_filter_sam(tmp_path, sam_path):
+    filtered_path = str(tmp_path / "filtered" / "mapped.sam")
+    stats = read_sam_stats(sam_path, filtered_path, exclude_flags=UNMAPPED | SECONDARY, min_mapq=5, chunk_size=100)
+    assert stats.qc_passed["total"] == 10
+    with open(filtered_path) as filtered_file:
+        filtered_lines = filtered_file.read().splitlines()
+    assert filtered_lines[:4] == HEADER.splitlines()
+    assert [line.split("\t")[0] for line in filtered_lines[4:]] == ["r1", "r1", "r2", "r3", "r6", "r7", "r8"]
+    assert filtered_lines[7] == RECORDS[4]
+
+
+def test_read_sam_stats_rejects_invalid_records(tmp_path):
+    path = tmp_path / "invalid.sam"
+    path.write_text(HEADER + "r1\t99\tchr1\t100\n")
+    with pytest.raises(ValueError):
+        read_sam_stats(str(path))
+    path.write_text(HEADER + RECORDS[0].replace("\t99\t", "\tx\t") + "\n")
+    with pytest.raises(ValueError):
+        read_sam_stats(str(path))
+
+
+def test_output_filters_sam(tmp_path, sam_path):
+    output = Output(output_path=str(tmp_path))
+    output.set_tool(tool_name="STAR")
+    assert output.get_sam_stats().qc_passed["primary_mapped"] == 6
+    output.filter_sam(str(tmp_path / "mapped.sam"))
+    assert len(open(tmp_path / "mapped.sam").read().splitlines()) == 4 + 9
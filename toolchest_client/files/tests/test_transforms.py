@@ -0,0 +1,101 @@
+import gzip
+import io
+import zlib
+
+import pytest
+
+from toolchest_client.files.transforms import apply_transforms, ColumnProjection, LineFilter, Recompress, \
+    SplitByColumn, write_transformed_file
+
+KRAKEN2_OUTPUT = (
+    b"C\tread1\t562\t150|150\t562:10\n"
+    b"U\tread2\t0\t150|150\t0:10\n"
+    b"C\tread3\t1280\t150|150\t1280:10\n"
+)
+
+
+def transform_bytes(data, transforms, file_name="kraken2_output.txt", chunk_size=7):
+    """Transforms `data` in small chunks, so that lines are split across chunks. Returns bytes by file name."""
+    chunks = [(file_name, data[index:index + chunk_size]) for index in range(0, len(data), chunk_size)]
+    transformed = {}
+    for transformed_file_name, transformed_data in apply_transforms(chunks, transforms):
+        transformed[transformed_file_name] = transformed.get(transformed_file_name, b"") + transformed_data
+    return transformed
+
+
+def test_line_filter_and_column_projection():
+    transformed = transform_bytes(KRAKEN2_OUTPUT, [
+        LineFilter(lambda line: line.startswith(b"C")),
+        ColumnProjection([1, 2]),
+    ])
+    assert transformed == {"kraken2_output.txt": b"read1\t562\nread3\t1280\n"}
+    assert transform_bytes(KRAKEN2_OUTPUT, [LineFilter(pattern=r"\t0\t", invert=True), ColumnProjection([1])]) == {
+        "kraken2_output.txt": b"read1\nread3\n",
+    }
+    with pytest.raises(ValueError):
+        LineFilter()
+
+
+def test_transforms_only_apply_to_matching_files():
+    transformed = transform_bytes(KRAKEN2_OUTPUT, [LineFilter(pattern="^U", file_names="*.tsv")])
+    assert transformed == {"kraken2_output.txt": KRAKEN2_OUTPUT}
+
+
+def test_split_by_column():
+    data = b"# header\nsample1\t1\nsample2\t2\nsample1\t3\n"
+    transformed = transform_bytes(data, [SplitByColumn(0)], file_name="output/counts.tsv")
+    assert transformed == {
+        "output/counts.sample1.tsv": b"# header\nsample1\t1\nsample1\t3\n",
+        "output/counts.sample2.tsv": b"# header\nsample2\t2\n",
+    }
+
+
+def test_recompress_gzip():
+    transformed = transform_bytes(KRAKEN2_OUTPUT, [Recompress()])
+    assert gzip.decompress(transformed["kraken2_output.txt.gz"]) == KRAKEN2_OUTPUT
+
+
+def test_recompress_bgzip(monkeypatch):
+    monkeypatch.setattr("toolchest_client.files.transforms.BGZF_BLOCK_SIZE", 32)
+    compressed_data = transform_bytes(KRAKEN2_OUTPUT, [Recompress("bgzip")])["kraken2_output.txt.gz"]
+    # BGZF is valid multi-member gzip
+    assert gzip.decompress(compressed_data) == KRAKEN2_OUTPUT
+    # Each block records its size, so blocks can be found without decompressing
+    block_sizes = []
+    position = 0
+    while position < len(compressed_data):
+        assert compressed_data[position + 12:position + 14] == b"BC"
+        block_size = int.from_bytes(compressed_data[position + 16:position + 18], "little") + 1
+        block_sizes.append(block_size)
+        zlib.decompressobj(-zlib.MAX_WBITS).decompress(compressed_data[position + 18:position + block_size - 8])
+        position += block_size
+    assert len(block_sizes) == 4  # 3 blocks of data, then the EOF block
+    assert position == len(compressed_data)
+
+
+def test_recompress_zstd():
+    zstandard = pytest.importorskip("zstandard")
+    compressed_data = transform_bytes(KRAKEN2_OUTPUT, [Recompress("zstd")])["kraken2_output.txt.zst"]
+    assert zstandard.ZstdDecompressor().decompressobj().decompress(compressed_data) == KRAKEN2_OUTPUT
+
+
+def test_write_transformed_file(tmp_path):
+    paths = write_transformed_file(
+        "output/kraken2_output.txt", iter([KRAKEN2_OUTPUT]), str(tmp_path),
+        [LineFilter(pattern="^C"), SplitByColumn(2), Recompress()],
+    )
+    assert sorted(path[len(str(tmp_path)):] for path in paths) == [
+        "/output/kraken2_output.1280.txt.gz", "/output/kraken2_output.562.txt.gz",
+    ]
+    with gzip.open(tmp_path / "output" / "kraken2_output.562.txt.gz") as split_file:
+        assert split_file.read() == KRAKEN2_OUTPUT.splitlines(keepends=True)[0]
+    with pytest.raises(ValueError):
+        write_transformed_file("../outside.txt", iter([b"x"]), str(tmp_path), [Recompress()])
+
+
+def test_write_transformed_file_streams_chunks(tmp_path):
+    # The transforms are applied to each chunk as it's read
+    stream = io.BytesIO(KRAKEN2_OUTPUT * 1000)
+    chunks = iter(lambda: stream.read(1000), b"")
+    [path] = write_transformed_file("kraken2_output.txt", chunks, str(tmp_path), [LineFilter(pattern="^U")])
+    assert open(path, "rb").read() == b"U\tread2\t0\t150|150\t0:10\n" * 1000
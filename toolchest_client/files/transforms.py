@@ -0,0 +1,345 @@
+"""
+toolchest_client.files.transforms
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Transforms applied to output files as they're downloaded, before they're written to
+disk. Large outputs (e.g. kraken2_output.txt) can be filtered, projected, split, and
+recompressed as their bytes arrive, without being written uncompressed first.
+
+A transform receives a stream of (file name, bytes) pairs and yields a new stream.
+Transforms are chained, so a file can be filtered, split into a file per sample, and
+each of those compressed. Built-in transforms are provided for lines and columns of
+text outputs, and for gzip, BGZF (bgzip), and zstd compression. Custom transforms
+subclass OutputTransform (or LineTransform, for transforms of whole lines).
+"""
+import fnmatch
+import os
+import re
+import struct
+import zlib
+
+# Bytes read from a downloaded file at a time.
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+
+GZIP = "gzip"
+BGZIP = "bgzip"
+ZSTD = "zstd"
+COMPRESSION_SUFFIXES = {GZIP: ".gz", BGZIP: ".gz", ZSTD: ".zst"}
+
+# Uncompressed bytes per BGZF block. Blocks are at most 64 KiB compressed, so this leaves room for
+# incompressible data, as in htslib.
+BGZF_BLOCK_SIZE = 0xff00
+# The empty block marking the end of a BGZF file
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+class OutputTransform:
+    """Base class of output transforms. Subclasses override `start`, `transform`, and optionally `finish`.
+
+    :param file_names: (optional) Glob patterns (e.g. "kraken2_output.txt" or "*.tsv") of the files transformed.
+        Other files pass through unchanged. Defaults to every file.
+    """
+
+    def __init__(self, file_names=None):
+        if isinstance(file_names, str):
+            file_names = [file_names]
+        self.file_names = file_names
+
+    def __repr__(self):
+        return str(self.__dict__)
+
+    def __call__(self, stream):
+        """Transforms a stream of (file name, bytes) pairs, yielding (file name, bytes) pairs."""
+        states = {}
+        for file_name, data in stream:
+            if not self.applies_to(file_name):
+                yield file_name, data
+                continue
+            if file_name not in states:
+                states[file_name] = self.start(file_name)
+            yield from self.transform(states[file_name], file_name, data)
+        for file_name, state in states.items():
+            yield from self.finish(state, file_name)
+
+    def applies_to(self, file_name):
+        if self.file_names is None:
+            return True
+        base_name = os.path.basename(file_name)
+        return any(
+            fnmatch.fnmatchcase(file_name, pattern) or fnmatch.fnmatchcase(base_name, pattern)
+            for pattern in self.file_names
+        )
+
+    def start(self, file_name):
+        """Returns the state kept while transforming the file `file_name` (e.g. a compressor)."""
+        return None
+
+    def transform(self, state, file_name, data):
+        """Yields (file name, bytes) pairs transformed from the next bytes of the file `file_name`."""
+        yield file_name, data
+
+    def finish(self, state, file_name):
+        """Yields any remaining (file name, bytes) pairs once all of the file `file_name` has been transformed."""
+        return iter(())
+
+
+class LineTransform(OutputTransform):
+    """Base class of transforms of whole lines. Subclasses override `transform_lines`.
+    Bytes are buffered until a line ends, so lines split across downloaded chunks are transformed whole."""
+
+    def start(self, file_name):
+        return [b""]
+
+    def transform(self, state, file_name, data):
+        data = state[0] + data
+        last_newline = data.rfind(b"\n")
+        state[0] = data[last_newline + 1:]
+        if last_newline != -1:
+            yield from self.transform_lines(file_name, data[:last_newline].split(b"\n"))
+
+    def finish(self, state, file_name):
+        if state[0]:
+            yield from self.transform_lines(file_name, [state[0]])
+
+    def transform_lines(self, file_name, lines):
+        """Yields (file name, bytes) pairs transformed from complete lines (without their newlines)."""
+        yield file_name, b"".join(line + b"\n" for line in lines)
+
+
+class LineFilter(LineTransform):
+    """Keeps the lines of files that match a predicate or pattern.
+
+    Usage::
+
+        >>> # Keeps only classified reads of Kraken2's per-read output
+        >>> LineFilter(lambda line: line.startswith(b"C"), file_names="kraken2_output.txt")
+
+    :param predicate: (optional) Function called with each line (as bytes, without its newline), returning whether
+        it's kept.
+    :param pattern: (optional) Regular expression (str or bytes) searched for in each line. Lines with a match are
+        kept.
+    :param invert: Whether to instead remove the lines that match.
+    :param keep_comments: Whether to keep lines starting with "#" or "@" (e.g. headers) regardless of the filter.
+    :param file_names: (optional) Glob patterns of the files filtered.
+    """
+
+    def __init__(self, predicate=None, pattern=None, invert=False, keep_comments=False, file_names=None):
+        super().__init__(file_names=file_names)
+        if (predicate is None) == (pattern is None):
+            raise ValueError("Exactly one of predicate or pattern must be given.")
+        if pattern is not None:
+            pattern = re.compile(pattern.encode() if isinstance(pattern, str) else pattern)
+            predicate = pattern.search
+        self.predicate = predicate
+        self.invert = invert
+        self.keep_comments = keep_comments
+
+    def transform_lines(self, file_name, lines):
+        predicate, invert, keep_comments = self.predicate, self.invert, self.keep_comments
+        kept_lines = [
+            line for line in lines
+            if (keep_comments and line.startswith((b"#", b"@"))) or bool(predicate(line)) != invert
+        ]
+        if kept_lines:
+            yield file_name, b"\n".join(kept_lines) + b"\n"
+
+
+class ColumnProjection(LineTransform):
+    """Keeps columns of delimited text files, in the given order.
+
+    :param columns: Indices (0-based) of the columns kept. Lines with fewer columns raise a ValueError.
+    :param delimiter: Column delimiter. Defaults to tabs.
+    :param file_names: (optional) Glob patterns of the files projected.
+    """
+
+    def __init__(self, columns, delimiter=b"\t", file_names=None):
+        super().__init__(file_names=file_names)
+        if not columns:
+            raise ValueError("At least one column must be kept.")
+        self.columns = list(columns)
+        self.delimiter = delimiter.encode() if isinstance(delimiter, str) else delimiter
+
+    def transform_lines(self, file_name, lines):
+        delimiter, columns = self.delimiter, self.columns
+        try:
+            projected_lines = [delimiter.join([fields[column] for column in columns])
+                               for fields in (line.split(delimiter) for line in lines)]
+        except IndexError:
+            raise ValueError(f"Lines of {file_name} must have at least {max(columns) + 1} columns.") from None
+        yield file_name, b"\n".join(projected_lines) + b"\n"
+
+
+class SplitByColumn(LineTransform):
+    """Splits delimited text files into a file per value of a column (e.g. a sample ID).
+
+    The files are named with the value before the original file's extension, e.g. "counts.sample1.tsv".
+    Lines starting with "#" are copied to every split file that's written after them.
+
+    :param column: Index (0-based) of the column to split by.
+    :param delimiter: Column delimiter. Defaults to tabs.
+    :param file_names: (optional) Glob patterns of the files split.
+    """
+
+    def __init__(self, column, delimiter=b"\t", file_names=None):
+        super().__init__(file_names=file_names)
+        self.column = column
+        self.delimiter = delimiter.encode() if isinstance(delimiter, str) else delimiter
+
+    def start(self, file_name):
+        return [b"", [], set()]  # remaining bytes, comment lines, and split files written to
+
+    def transform(self, state, file_name, data):
+        for split_file_name, split_data in super().transform(state, file_name, data):
+            yield from self._add_comments(state, split_file_name, split_data)
+
+    def finish(self, state, file_name):
+        for split_file_name, split_data in super().finish(state, file_name):
+            yield from self._add_comments(state, split_file_name, split_data)
+
+    def transform_lines(self, file_name, lines):
+        lines_by_value = {}
+        for line in lines:
+            if line.startswith(b"#"):
+                lines_by_value.setdefault(None, []).append(line)
+                continue
+            fields = line.split(self.delimiter, self.column + 1)
+            if len(fields) <= self.column:
+                raise ValueError(f"Lines of {file_name} must have at least {self.column + 1} columns.")
+            lines_by_value.setdefault(fields[self.column], []).append(line)
+        for value, value_lines in lines_by_value.items():
+            yield self._get_split_file_name(file_name, value), b"\n".join(value_lines) + b"\n"
+
+    def _add_comments(self, state, split_file_name, data):
+        if split_file_name is None:
+            state[1].append(data)
+            return
+        if split_file_name not in state[2]:
+            state[2].add(split_file_name)
+            data = b"".join(state[1]) + data
+        yield split_file_name, data
+
+    def _get_split_file_name(self, file_name, value):
+        if value is None:
+            return None
+        value = re.sub(r"[^\w.-]", "_", value.decode(errors="replace"))
+        directory_name, base_name = os.path.split(file_name)
+        stem, extension = os.path.splitext(base_name)
+        return os.path.join(directory_name, f"{stem}.{value}{extension}")
+
+
+class Recompress(OutputTransform):
+    """Compresses files with gzip, BGZF (bgzip, for files indexed by tabix or samtools), or zstd,
+    adding the compression's suffix (e.g. ".gz") to their names. zstd needs the `zstandard` package
+    (the `zstd` extra).
+
+    :param compression: "gzip", "bgzip", or "zstd".
+    :param level: (optional) Compression level. Defaults to 6 for gzip and BGZF, and 3 for zstd.
+    :param file_names: (optional) Glob patterns of the files compressed.
+    """
+
+    def __init__(self, compression=GZIP, level=None, file_names=None):
+        super().__init__(file_names=file_names)
+        if compression not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"Invalid compression: {compression}. Must be one of {', '.join(COMPRESSION_SUFFIXES)}.")
+        if compression == ZSTD:
+            # Only import zstandard – an optional dependency – if zstd compression is used
+            import zstandard  # noqa: F401
+        self.compression = compression
+        self.level = level
+
+    def start(self, file_name):
+        if self.compression == GZIP:
+            return zlib.compressobj(6 if self.level is None else self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        if self.compression == BGZIP:
+            return _BgzfCompressor(6 if self.level is None else self.level)
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=3 if self.level is None else self.level).compressobj()
+
+    def transform(self, state, file_name, data):
+        compressed_data = state.compress(data)
+        if compressed_data:
+            yield file_name + COMPRESSION_SUFFIXES[self.compression], compressed_data
+
+    def finish(self, state, file_name):
+        yield file_name + COMPRESSION_SUFFIXES[self.compression], state.flush()
+
+
+class _BgzfCompressor:
+    """Compresses bytes into BGZF blocks: gzip members of at most 64 KiB, each with its compressed size in an
+    extra field, so that they can be decompressed independently."""
+
+    def __init__(self, level):
+        self.level = level
+        self.buffer = b""
+
+    def compress(self, data):
+        self.buffer += data
+        num_full_blocks = len(self.buffer) // BGZF_BLOCK_SIZE
+        blocks = [
+            self._compress_block(self.buffer[index * BGZF_BLOCK_SIZE:(index + 1) * BGZF_BLOCK_SIZE])
+            for index in range(num_full_blocks)
+        ]
+        self.buffer = self.buffer[num_full_blocks * BGZF_BLOCK_SIZE:]
+        return b"".join(blocks)
+
+    def flush(self):
+        last_block = self._compress_block(self.buffer) if self.buffer else b""
+        self.buffer = b""
+        return last_block + BGZF_EOF
+
+    def _compress_block(self, data):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        compressed_data = compressor.compress(data) + compressor.flush()
+        # Header: gzip magic, deflate, FEXTRA flag, no mtime, XFL, unknown OS, and the "BC" extra subfield,
+        # which holds the size of the whole block minus 1
+        header = struct.pack(
+            "<4BI2BH2BHH", 0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, ord("B"), ord("C"), 2, len(compressed_data) + 25,
+        )
+        return header + compressed_data + struct.pack("<2I", zlib.crc32(data), len(data))
+
+
+def apply_transforms(stream, transforms):
+    """Chains transforms over a stream of (file name, bytes) pairs.
+
+    :param stream: Iterable of (file name, bytes) pairs.
+    :param transforms: List of OutputTransforms, applied in order.
+    """
+    for transform in transforms:
+        stream = transform(stream)
+    return stream
+
+
+def write_transformed_file(file_name, chunks, output_dir, transforms):
+    """Transforms the chunks of bytes of a file and writes the result to `output_dir`. Returns the written paths.
+
+    :param file_name: Name of the file, relative to `output_dir` (e.g. "output/quant.sf").
+    :param chunks: Iterable of the file's bytes.
+    :param output_dir: Directory to which transformed files are written.
+    :param transforms: List of OutputTransforms, applied in order.
+    """
+    output_dir = os.path.abspath(output_dir)
+    output_files = {}
+    try:
+        for output_file_name, data in apply_transforms(((file_name, chunk) for chunk in chunks), transforms):
+            output_file = output_files.get(output_file_name)
+            if output_file is None:
+                output_file_path = os.path.abspath(os.path.join(output_dir, output_file_name))
+                if os.path.commonpath([output_dir, output_file_path]) != output_dir:
+                    raise ValueError(f"Transformed file {output_file_name} is outside of {output_dir}.")
+                os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
+                output_file = output_files[output_file_name] = open(output_file_path, "wb")
+            output_file.write(data)
+    finally:
+        for output_file in output_files.values():
+            output_file.close()
+    return [output_file.name for output_file in output_files.values()]
+
+
+def iter_file_chunks(file_object, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yields the bytes of a file object, `chunk_size` bytes at a time."""
+    while True:
+        data = file_object.read(chunk_size)
+        if not data:
+            return
+        yield data
@@ -0,0 +1,291 @@
+"""
+toolchest_client.progress
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Progress reporting for file transfers and job status.
+
+A ProgressReporter receives progress events as dicts, e.g.::
+
+    {"event": "transfer", "direction": "upload", "file_name": "reads.fastq", "bytes_transferred": 1048576,
+     "total_bytes": 4194304, "percentage": 25.0, "bytes_per_second": 52428800.0,
+     "aggregate_bytes_per_second": 157286400.0, "done": False}
+    {"event": "status", "run_id": "13a0f434-...", "status": "executing"}
+
+Transfer callbacks (called by boto3 for every chunk) only add to a byte count. Events are built
+at most once per ``min_interval_seconds`` for each transfer, plus once when it finishes, so
+percentages and throughput – including the aggregate throughput of concurrent transfers – are
+computed off the hot path. If a reporter is disabled, no transfer callback is registered at all.
+"""
+import abc
+import contextlib
+import json
+import sys
+import threading
+import time
+
+from toolchest_client.logging import get_log_level
+
+# Default minimum time (in seconds) between events for one transfer, or between repeated status events.
+DEFAULT_MIN_INTERVAL_SECONDS = 1.0
+
+
+class TransferProgress:
+    """Byte count of one file transfer. Instances are passed to boto3 as the transfer ``Callback``.
+
+    :param reporter: ProgressReporter to which progress events are sent.
+    :param direction: "upload" or "download".
+    :param file_name: Name of the transferred file, for display.
+    :param total_bytes: Size of the transferred file in bytes.
+    """
+
+    def __init__(self, reporter, direction, file_name, total_bytes):
+        self.reporter = reporter
+        self.direction = direction
+        self.file_name = file_name
+        self.total_bytes = total_bytes
+        self.bytes_transferred = 0
+        self.started_at = time.monotonic()
+        self.done = False
+        self._next_report_at = self.started_at
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return str(self.__dict__)
+
+    def __call__(self, bytes_amount):
+        now = time.monotonic()
+        with self._lock:
+            self.bytes_transferred += bytes_amount
+            if self.done or (now < self._next_report_at and self.bytes_transferred < self.total_bytes):
+                return
+            self.done = self.bytes_transferred >= self.total_bytes
+            self._next_report_at = now + self.reporter.min_interval_seconds
+        self.reporter.report_transfer(self)
+
+    def close(self):
+        """Stops tracking the transfer, e.g. if it failed partway through. Finished transfers stop on their own."""
+        self.reporter.untrack_transfer(self)
+
+
+class ProgressReporter(abc.ABC):
+    """Base class of progress reporters. Subclasses implement `emit()`, which is called with each event.
+
+    :param min_interval_seconds: Minimum time between events for one transfer, or between
+        status events for a run whose status hasn't changed.
+    """
+
+    enabled = True
+
+    def __init__(self, min_interval_seconds=DEFAULT_MIN_INTERVAL_SECONDS):
+        self.min_interval_seconds = min_interval_seconds
+        self._active_transfers = set()
+        self._last_status_events = dict()  # run ID -> (status, time of the last status event)
+        self._lock = threading.Lock()
+
+    def track_transfer(self, direction, file_name, total_bytes):
+        """Returns a TransferProgress to pass as a boto3 transfer ``Callback``, or None if this reporter is disabled.
+
+        :param direction: "upload" or "download".
+        :param file_name: Name of the transferred file, for display.
+        :param total_bytes: Size of the transferred file in bytes.
+        """
+        if not self.enabled:
+            return None
+        transfer = TransferProgress(self, direction, file_name, total_bytes)
+        with self._lock:
+            self._active_transfers.add(transfer)
+        return transfer
+
+    @contextlib.contextmanager
+    def tracked_transfer(self, direction, file_name, total_bytes):
+        """Like `track_transfer`, but in a context: the transfer stops being tracked on leaving the context, even if
+        it failed partway through.
+        """
+        transfer = self.track_transfer(direction, file_name, total_bytes)
+        try:
+            yield transfer
+        finally:
+            if transfer is not None:
+                transfer.close()
+
+    def untrack_transfer(self, transfer):
+        """Stops tracking `transfer`, so it's no longer counted in the aggregate throughput of active transfers."""
+        with self._lock:
+            self._active_transfers.discard(transfer)
+
+    def report_transfer(self, transfer):
+        """Emits a transfer event for `transfer`. Called by TransferProgress, at most once per interval."""
+        now = time.monotonic()
+        with self._lock:
+            active_transfers = list(self._active_transfers)
+            if transfer.done:
+                self._active_transfers.discard(transfer)
+        aggregate_started_at = min(active.started_at for active in active_transfers + [transfer])
+        aggregate_bytes = sum(active.bytes_transferred for active in active_transfers if active is not transfer)
+        aggregate_bytes += transfer.bytes_transferred
+        self.emit({
+            "event": "transfer",
+            "direction": transfer.direction,
+            "file_name": transfer.file_name,
+            "bytes_transferred": transfer.bytes_transferred,
+            "total_bytes": transfer.total_bytes,
+            "percentage": round(transfer.bytes_transferred / transfer.total_bytes * 100, 2)
+            if transfer.total_bytes else 100.0,
+            "bytes_per_second": _get_rate(transfer.bytes_transferred, now - transfer.started_at),
+            "aggregate_bytes_per_second": _get_rate(aggregate_bytes, now - aggregate_started_at),
+            "done": transfer.done,
+        })
+
+    def report_status(self, run_id, status):
+        """Emits a status event, unless the run's status is unchanged and was reported within the interval.
+
+        :param run_id: ID of the run.
+        :param status: Current (pretty) status of the run.
+        """
+        status = getattr(status, "value", status)
+        now = time.monotonic()
+        with self._lock:
+            last_status, last_reported_at = self._last_status_events.get(run_id, (None, None))
+            if status == last_status and now - last_reported_at < self.min_interval_seconds:
+                return
+            self._last_status_events[run_id] = (status, now)
+        self.emit({"event": "status", "run_id": run_id, "status": status})
+
+    def clear(self):
+        """Clears any in-place output (e.g. a status line) before other output is written."""
+        pass
+
+    @abc.abstractmethod
+    def emit(self, event):
+        """Handles a progress event (a dict)."""
+
+
+class NoOpProgressReporter(ProgressReporter):
+    """Reports nothing. Transfers aren't tracked at all."""
+
+    enabled = False
+
+    def emit(self, event):
+        pass
+
+
+class TTYProgressReporter(ProgressReporter):
+    """Writes progress to a terminal, rewriting the current line in place.
+
+    :param stream: (optional) Stream to write to. Defaults to stdout.
+    :param show_transfers: Whether to show transfer progress.
+    :param show_status: Whether to show the status of running jobs.
+    :param min_interval_seconds: Minimum time between redraws.
+    """
+
+    # Jupyter notebooks and Windows don't always support the canonical "clear-to-end-of-line" escape sequence,
+    # so lines are padded with spaces instead
+    LINE_LENGTH = 120
+
+    def __init__(self, stream=None, show_transfers=True, show_status=True, min_interval_seconds=0.2):
+        super().__init__(min_interval_seconds=min_interval_seconds)
+        self.stream = stream
+        self.show_transfers = show_transfers
+        self.show_status = show_status
+        self.enabled = show_transfers or show_status
+        self._num_status_events = 0
+
+    def track_transfer(self, direction, file_name, total_bytes):
+        if not self.show_transfers:
+            return None
+        return super().track_transfer(direction, file_name, total_bytes)
+
+    def report_status(self, run_id, status):
+        if self.show_status:
+            super().report_status(run_id, status)
+
+    def clear(self):
+        self._write("\r")
+
+    def emit(self, event):
+        if event["event"] == "transfer":
+            # Only import pretty_print_file_size here, as the s3 module reports its progress through this one
+            from toolchest_client.files.s3 import pretty_print_file_size
+
+            line = "\r{}  {} of {} ({:.2f}%)".format(
+                event["file_name"],
+                pretty_print_file_size(event["bytes_transferred"]),
+                pretty_print_file_size(event["total_bytes"]),
+                event["percentage"],
+            )
+            self._write(line.ljust(self.LINE_LENGTH) + ("\n" if event["done"] else ""))
+        elif event["event"] == "status":
+            self._num_status_events += 1
+            dots = "*" * ((self._num_status_events - 1) % 10 + 1)
+            status_name = event["status"].upper() if event["status"] else ""
+            self._write(f"\rStatus: {status_name} ({dots}) ".ljust(self.LINE_LENGTH))
+
+    def _write(self, text):
+        # Not using logger here, because this is a progress bar – and logger doesn't respect \r
+        stream = self.stream or sys.stdout
+        stream.write(text)
+        stream.flush()
+
+
+class JSONLinesProgressReporter(ProgressReporter):
+    """Writes each progress event as a line of JSON, e.g. for log collectors.
+
+    :param stream: (optional) Stream to write to. Defaults to stderr.
+    :param min_interval_seconds: Minimum time between events for one transfer or run.
+    """
+
+    def __init__(self, stream=None, min_interval_seconds=5.0):
+        super().__init__(min_interval_seconds=min_interval_seconds)
+        self.stream = stream
+
+    def emit(self, event):
+        stream = self.stream or sys.stderr
+        stream.write(json.dumps(event) + "\n")
+        stream.flush()
+
+
+class CallbackProgressReporter(ProgressReporter):
+    """Calls a function with each progress event.
+
+    The function is called from transfer threads, so it should return quickly.
+
+    :param callback: Function called with each event (a dict).
+    :param min_interval_seconds: Minimum time between events for one transfer or run.
+    """
+
+    def __init__(self, callback, min_interval_seconds=DEFAULT_MIN_INTERVAL_SECONDS):
+        super().__init__(min_interval_seconds=min_interval_seconds)
+        self.callback = callback
+
+    def emit(self, event):
+        self.callback(event)
+
+
+PROGRESS_REPORTER_NAMES = {
+    "tty": TTYProgressReporter,
+    "json": JSONLinesProgressReporter,
+    "none": NoOpProgressReporter,
+}
+
+
+def get_progress_reporter(progress=None):
+    """Returns a ProgressReporter for the `progress` argument of a Toolchest function.
+
+    :param progress: (optional) A ProgressReporter; a function, which is called with each progress event;
+        or one of "tty", "json", or "none". By default, job status is shown at the DEBUG and INFO
+        log levels, and transfer progress at the DEBUG log level.
+    """
+    if progress is None:
+        log_level = get_log_level()
+        return TTYProgressReporter(show_transfers=log_level == "DEBUG", show_status=log_level in ["DEBUG", "INFO"])
+    if isinstance(progress, ProgressReporter):
+        return progress
+    if isinstance(progress, str) and progress.lower() in PROGRESS_REPORTER_NAMES:
+        return PROGRESS_REPORTER_NAMES[progress.lower()]()
+    if callable(progress):
+        return CallbackProgressReporter(progress)
+    raise ValueError(f"Invalid progress reporter: {progress}. Valid names are: {list(PROGRESS_REPORTER_NAMES)}")
+
+
+def _get_rate(num_bytes, seconds):
+    return num_bytes / seconds if seconds > 0 else 0.0
@@ -0,0 +1,49 @@
+import subprocess
+import sys
+
+import pytest
+
+import toolchest_client
+
+HEAVY_MODULES = ["boto3", "botocore", "docker", "websockets", "pysam"]
+
+
+def get_modules_loaded_by(statement):
+    # Runs in a fresh interpreter, as the test session may have already imported these modules
+    output = subprocess.run(
+        [sys.executable, "-c", f"import sys\n{statement}\nprint(' '.join(sys.modules))"],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    return set(output.split())
+
+
+def test_import_does_not_load_heavy_modules():
+    loaded_modules = get_modules_loaded_by("import toolchest_client")
+    assert "toolchest_client" in loaded_modules
+    assert loaded_modules.isdisjoint(HEAVY_MODULES)
+
+
+def test_tool_function_does_not_load_heavy_modules():
+    loaded_modules = get_modules_loaded_by("from toolchest_client import kraken2")
+    assert "toolchest_client.tools.api" in loaded_modules
+    assert loaded_modules.isdisjoint(HEAVY_MODULES)
+
+
+def test_lazy_attributes():
+    from toolchest_client.api.download import download
+    from toolchest_client.api.query import Query
+    from toolchest_client.tools.api import kraken2, STAR
+
+    assert toolchest_client.download is download
+    assert toolchest_client.Query is Query
+    assert toolchest_client.kraken2 is kraken2
+    assert toolchest_client.STAR is STAR
+    assert "kraken2" in dir(toolchest_client)
+    assert set(toolchest_client.__all__) <= set(dir(toolchest_client))
+
+
+def test_unknown_attribute():
+    with pytest.raises(AttributeError, match="not_a_tool"):
+        toolchest_client.not_a_tool
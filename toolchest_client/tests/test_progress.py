@@ -0,0 +1,116 @@
+import io
+import json
+import threading
+
+import pytest
+
+from toolchest_client import progress
+from toolchest_client.api.status import PrettyStatus
+
+
+def test_transfer_events_are_throttled():
+    events = []
+    reporter = progress.CallbackProgressReporter(events.append, min_interval_seconds=60)
+    transfer = reporter.track_transfer("upload", "reads.fastq", 1000)
+    for _ in range(99):
+        transfer(10)
+    assert len(events) == 1  # the first callback, then nothing until the interval passes
+    transfer(10)
+    assert len(events) == 2
+    assert events[-1]["done"] is True
+    assert events[-1]["percentage"] == 100.0
+    assert events[-1]["bytes_transferred"] == 1000
+
+
+def test_aggregate_throughput_across_transfers():
+    events = []
+    reporter = progress.CallbackProgressReporter(events.append, min_interval_seconds=0)
+    first_transfer = reporter.track_transfer("upload", "a.fastq", 100)
+    second_transfer = reporter.track_transfer("upload", "b.fastq", 100)
+    first_transfer(50)
+    second_transfer(100)
+    assert events[-1]["aggregate_bytes_per_second"] > events[-1]["bytes_per_second"]
+    first_transfer(50)  # second transfer is done, so it's no longer aggregated
+    assert events[-1]["aggregate_bytes_per_second"] == pytest.approx(events[-1]["bytes_per_second"], rel=0.1)
+
+
+def test_failed_transfers_stop_being_tracked():
+    events = []
+    reporter = progress.CallbackProgressReporter(events.append, min_interval_seconds=0)
+    with pytest.raises(OSError):
+        with reporter.tracked_transfer("upload", "a.fastq", 100) as failed_transfer:
+            failed_transfer(50)
+            raise OSError("Connection reset")
+    with reporter.tracked_transfer("upload", "b.fastq", 100) as transfer:
+        transfer(100)
+    # The failed transfer isn't counted in the aggregate throughput of later transfers
+    assert events[-1]["aggregate_bytes_per_second"] == events[-1]["bytes_per_second"]
+    assert reporter._active_transfers == set()
+
+
+def test_progress_reporters_must_implement_emit():
+    class IncompleteProgressReporter(progress.ProgressReporter):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteProgressReporter()
+
+
+def test_concurrent_callbacks_report_done_once():
+    events = []
+    reporter = progress.CallbackProgressReporter(events.append, min_interval_seconds=60)
+    transfer = reporter.track_transfer("download", "output.tar.gz", 8 * 10000)
+    threads = [threading.Thread(target=lambda: [transfer(1) for _ in range(10000)]) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert transfer.bytes_transferred == 8 * 10000
+    assert [event["done"] for event in events].count(True) == 1
+
+
+def test_disabled_reporter_tracks_nothing():
+    assert progress.NoOpProgressReporter().track_transfer("upload", "reads.fastq", 100) is None
+    tty_reporter = progress.TTYProgressReporter(show_transfers=False, show_status=True)
+    assert tty_reporter.track_transfer("upload", "reads.fastq", 100) is None
+
+
+def test_status_events_only_repeat_after_interval():
+    events = []
+    reporter = progress.CallbackProgressReporter(events.append, min_interval_seconds=60)
+    reporter.report_status("run-id", PrettyStatus.UPLOADING)
+    reporter.report_status("run-id", PrettyStatus.UPLOADING)
+    reporter.report_status("run-id", PrettyStatus.EXECUTING)
+    assert events == [
+        {"event": "status", "run_id": "run-id", "status": "uploading"},
+        {"event": "status", "run_id": "run-id", "status": "executing"},
+    ]
+
+
+def test_json_lines_reporter():
+    stream = io.StringIO()
+    reporter = progress.JSONLinesProgressReporter(stream=stream)
+    reporter.track_transfer("upload", "reads.fastq", 10)(10)
+    event = json.loads(stream.getvalue())
+    assert event["file_name"] == "reads.fastq"
+    assert event["done"] is True
+
+
+def test_tty_reporter():
+    stream = io.StringIO()
+    reporter = progress.TTYProgressReporter(stream=stream)
+    reporter.report_status("run-id", PrettyStatus.EXECUTING)
+    assert stream.getvalue().startswith("\rStatus: EXECUTING (*)")
+    reporter.track_transfer("upload", "reads.fastq", 2048)(2048)
+    assert "reads.fastq  2.0KB of 2.0KB (100.00%)" in stream.getvalue()
+    assert stream.getvalue().endswith("\n")
+
+
+def test_get_progress_reporter():
+    assert isinstance(progress.get_progress_reporter("json"), progress.JSONLinesProgressReporter)
+    assert isinstance(progress.get_progress_reporter(print), progress.CallbackProgressReporter)
+    assert not progress.get_progress_reporter("none").enabled
+    reporter = progress.NoOpProgressReporter()
+    assert progress.get_progress_reporter(reporter) is reporter
+    with pytest.raises(ValueError):
+        progress.get_progress_reporter("bar")
@@ -0,0 +1,63 @@
+import pytest
+
+from toolchest_client import tracing
+
+
+class FakeResponse:
+    status_code = 204
+
+
+def get(url, **kwargs):
+    # named like requests.get, as the HTTP method is taken from the function name
+    return FakeResponse()
+
+
+@pytest.fixture
+def span_exporter(monkeypatch):
+    pytest.importorskip("opentelemetry.sdk")
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+    exporter = InMemorySpanExporter()
+    tracer_provider = TracerProvider()
+    tracer_provider.add_span_processor(SimpleSpanProcessor(exporter))
+    monkeypatch.setattr(tracing, "_tracer", tracer_provider.get_tracer(tracing.TRACER_NAME))
+    monkeypatch.setattr(tracing, "_tracing_available", True)
+    return exporter
+
+
+def test_no_op_without_opentelemetry(monkeypatch):
+    monkeypatch.setattr(tracing, "_tracer", None)
+    monkeypatch.setattr(tracing, "_tracing_available", False)
+
+    with tracing.span("toolchest.test", {"toolchest.bytes": 1}) as current_span:
+        assert current_span is tracing.NO_OP_SPAN
+        current_span.set_attribute("toolchest.retries", 1)
+    tracing.set_attributes({"toolchest.run_id": "run"})
+    assert tracing.traced_request(get, "http://localhost/").status_code == 204
+
+
+def test_span_attributes():
+    assert tracing.get_span_attributes({"a": None, "b": 1, "c": "c", "d": ["x"], "e": True}) == {
+        "b": 1,
+        "c": "c",
+        "d": "['x']",
+        "e": True,
+    }
+
+
+def test_spans(span_exporter):
+    with tracing.span("toolchest.run", {"toolchest.tool_name": "test", "toolchest.run_id": None}):
+        tracing.set_attributes({"toolchest.run_id": "run"})
+        tracing.traced_request(get, "http://localhost/status")
+        with pytest.raises(ValueError):
+            with tracing.span("toolchest.split", set_current=False):
+                raise ValueError("bad split")
+
+    spans = {finished_span.name: finished_span for finished_span in span_exporter.get_finished_spans()}
+    assert dict(spans["toolchest.run"].attributes) == {"toolchest.tool_name": "test", "toolchest.run_id": "run"}
+    assert spans["HTTP GET"].attributes["http.status_code"] == 204
+    assert spans["HTTP GET"].parent.span_id == spans["toolchest.run"].context.span_id
+    assert spans["toolchest.split"].events[0].name == "exception"
+    assert not spans["toolchest.split"].status.is_ok
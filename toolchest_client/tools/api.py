@@ -15,6 +15,7 @@ from toolchest_client.files import path_is_s3_uri, convert_input_params_to_prefi
 from toolchest_client.tools import AlphaFold, BLASTN, Bowtie2, Bracken, CellRangerCount, Centrifuge, ClustalO, Demucs, \
     DiamondBlastp, DiamondBlastx, FastQC, HUMAnN3, Jupyter, Kallisto, Kraken2, Lastal5, Lug, MetaPhlAn, Megahit, \
     Python3, Rapsearch2, Salmon, Shi7, ShogunAlign, ShogunFilter, STARInstance, Transfer, Test, Unicycler
+from toolchest_client.tools import humann
 from toolchest_client.tools.humann import HUMAnN3Mode
 
 
@@ -476,7 +477,7 @@ def fastqc(inputs, output_path=None, tool_args="", contaminants="", adapters="",
 
 
 def humann3(inputs, output_path=None, tool_args="", mode=HUMAnN3Mode.HUMANN,
-            taxonomic_profile=None, input_pathways=None, output_primary_name=None, **kwargs):
+            taxonomic_profile=None, input_pathways=None, output_primary_name=None, run_locally=False, **kwargs):
     """Runs HUMAnN 3 via Toolchest.
 
     Uses the ChocoPhlAn and UniRef databases packaged with HUMAnN.
@@ -491,6 +492,10 @@ provided.
     :param input_pathways: (optional) Path to input pathways from a standard humann run for use with
 "humann_unpack_pathways".
     :param output_primary_name: (optional) The name of the output file if the mode outputs a file.
+    :param run_locally: (optional) Whether to run table utility modes (join, renorm, reduce, and split stratified
+tables) locally, which skips uploading, queueing, and downloading. True runs them locally (or raises an error if they
+can't be), and None runs them locally if their inputs are local and small enough, and NumPy is installed. Defaults to
+False, which always runs on Toolchest.
 
     Note: Paired-end inputs should be concatenated and passed in as a single input file before
     running HUMAnN 3.
@@ -521,6 +526,16 @@ provided.
                        'Removing output_primary_name to continue execution.')
         output_primary_name = None
 
+    # Local runs only take the inputs, output, and utility arguments
+    unsupported_local_arguments = [name for name, value in kwargs.items() if name != "is_async"]
+    if taxonomic_profile is not None:
+        unsupported_local_arguments.append("taxonomic_profile")
+    if input_pathways is not None:
+        unsupported_local_arguments.append("input_pathways")
+    if humann.should_run_locally(mode, inputs, output_path, tool_args, run_locally, kwargs.get("is_async", False),
+                                 unsupported_local_arguments):
+        return humann.run_locally(mode, inputs, output_path, output_primary_name, tool_args)
+
     tool_args = " ".join([mode.value[0], tool_args])
     input_prefix_mapping = {
         inputs: {
@@ -4,12 +4,25 @@ toolchest_client.tools.humann
 
 This is the HUMAnN implementation of the Tool class.
 """
+import argparse
 from enum import Enum
+import os
+import shlex
 
-from toolchest_client.files import OutputType
+from loguru import logger
+
+from toolchest_client.api.exceptions import ToolchestException
+from toolchest_client.api.output import Output
+from toolchest_client.files import OutputType, path_is_s3_uri
 
 from . import Tool
 
+HUMANN3_VERSION = "3.1.1"
+
+# Utility modes run locally (with run_locally=None) if their inputs total at most this many bytes.
+# Larger tables are still processed in bounded memory, but local disk or CPU may be slower than Toolchest's.
+LOCAL_MAX_INPUT_BYTES = 2 * 1024 * 1024 * 1024
+
 
 class HUMAnN3(Tool):
     """
@@ -18,7 +31,7 @@ class HUMAnN3(Tool):
     def __init__(self, tool_args, inputs, output_primary_name, input_prefix_mapping, output_path, **kwargs):
         super().__init__(
             tool_name="humann3",
-            tool_version="3.1.1",  # todo: allow version to be set by the user
+            tool_version=HUMANN3_VERSION,  # todo: allow version to be set by the user
             database_name="humann3_protein_uniref90_diamond",
             database_version="1",
             tool_args=tool_args,
@@ -43,3 +56,149 @@ class HUMAnN3Mode(Enum):
     HUMANN_RENAME_TABLE = ("humann_rename_table", True)
     HUMANN_SPLIT_STRATIFIED_TABLE = ("humann_split_stratified_table", False)
     HUMANN_UNPACK_PATHWAYS = ("humann_unpack_pathways", True)
+
+
+class _ToolArgsParser(argparse.ArgumentParser):
+    """Parses the tool_args of a utility mode run locally, raising ValueError instead of exiting on errors."""
+
+    def error(self, message):
+        raise ValueError(message)
+
+
+def _get_local_tool_args_parser(mode):
+    parser = _ToolArgsParser(prog=mode.value[0], add_help=False)
+    if mode == HUMAnN3Mode.HUMANN_JOIN_TABLES:
+        parser.add_argument("--file_name")
+        parser.add_argument("-s", "--search-subdirectories", action="store_true")
+    elif mode == HUMAnN3Mode.HUMANN_RENORM_TABLE:
+        parser.add_argument("-u", "--units", choices=["cpm", "relab"], default="cpm")
+        parser.add_argument("-m", "--mode", choices=["community", "levelwise"], default="community")
+        parser.add_argument("-s", "--special", choices=["y", "n"], default="y")
+        parser.add_argument("-p", "--update-snames", action="store_true")
+    elif mode == HUMAnN3Mode.HUMANN_REDUCE_TABLE:
+        parser.add_argument("--function", choices=["min", "max", "mean", "sum"], required=True)
+        parser.add_argument("--sort-by", choices=["name", "value"])
+    return parser
+
+
+# Utility modes that can run locally, without a round trip to Toolchest
+LOCAL_HUMANN3_MODES = [
+    HUMAnN3Mode.HUMANN_JOIN_TABLES,
+    HUMAnN3Mode.HUMANN_REDUCE_TABLE,
+    HUMAnN3Mode.HUMANN_RENORM_TABLE,
+    HUMAnN3Mode.HUMANN_SPLIT_STRATIFIED_TABLE,
+]
+
+
+def get_local_run_blocker(mode, inputs, output_path, tool_args, is_async=False, unsupported_arguments=()):
+    """Returns why a humann3 utility mode can't run locally, or None if it can.
+
+    :param mode: The HUMAnN3Mode.
+    :param inputs: Path to the input table, or directory of tables.
+    :param output_path: Path to the output directory.
+    :param tool_args: Arguments of the utility.
+    :param is_async: Whether the run is async.
+    :param unsupported_arguments: Names of the arguments given to humann3 that local runs don't support.
+    """
+    if mode not in LOCAL_HUMANN3_MODES:
+        return f"{mode.value[0]} can only run on Toolchest"
+    if is_async:
+        return "async runs can only run on Toolchest"
+    if unsupported_arguments:
+        return f"{', '.join(sorted(unsupported_arguments))} can't be used locally"
+    if not isinstance(output_path, str) or path_is_s3_uri(output_path):
+        return "output_path must be a local directory"
+    if not isinstance(inputs, str) or not os.path.exists(inputs):
+        return "inputs must be a local file or directory"
+    try:
+        # Only import numpy – an optional dependency – if running utilities locally
+        import numpy  # noqa: F401
+    except ImportError:
+        return "running locally requires NumPy (the analysis extra)"
+    try:
+        _get_local_tool_args_parser(mode).parse_args(shlex.split(tool_args))
+    except ValueError as err:
+        return f"tool_args aren't supported locally ({err})"
+    return None
+
+
+def get_input_size(inputs):
+    """Returns the total size of a file, or of the files in a directory."""
+    if os.path.isfile(inputs):
+        return os.path.getsize(inputs)
+    return sum(
+        os.path.getsize(os.path.join(directory_path, file_name))
+        for directory_path, _, file_names in os.walk(inputs)
+        for file_name in file_names
+    )
+
+
+def should_run_locally(mode, inputs, output_path, tool_args, run_locally=False, is_async=False,
+                       unsupported_arguments=()):
+    """Returns whether to run a humann3 utility mode locally instead of on Toolchest.
+
+    :param run_locally: True to always run locally (raising an error if the mode can't), False to never,
+        or None to run locally if the mode can, and its inputs are at most LOCAL_MAX_INPUT_BYTES.
+    :param unsupported_arguments: Names of the arguments given to humann3 that local runs don't support.
+    """
+    if run_locally is False:
+        return False
+    blocker = get_local_run_blocker(mode, inputs, output_path, tool_args, is_async, unsupported_arguments)
+    if run_locally:
+        if blocker:
+            raise ToolchestException(f"Cannot run {mode.value[0]} locally: {blocker}.")
+        return True
+    if blocker or get_input_size(inputs) > LOCAL_MAX_INPUT_BYTES:
+        return False
+    logger.warning(f"Running {mode.value[0]} locally instead of on Toolchest, as its inputs are local and small. "
+                   "Output values are written with up to 10 significant digits. Pass run_locally=False to run it on "
+                   "Toolchest.")
+    return True
+
+
+def run_locally(mode, inputs, output_path, output_primary_name, tool_args):
+    """Runs a humann3 utility mode locally. Returns an Output, like a run on Toolchest.
+
+    :param mode: One of LOCAL_HUMANN3_MODES.
+    :param inputs: Path to the input table, or directory of tables.
+    :param output_path: Path to the output directory.
+    :param output_primary_name: Name of the output file, for modes that output one.
+    :param tool_args: Arguments of the utility.
+    """
+    from toolchest_client.files import humann_tables
+
+    args = _get_local_tool_args_parser(mode).parse_args(shlex.split(tool_args))
+    output_path = os.path.abspath(os.path.expanduser(output_path))
+    inputs = os.path.abspath(os.path.expanduser(inputs))
+    output_file_path = os.path.join(output_path, output_primary_name or "")
+    logger.info(f"Running {mode.value[0]} locally...")
+    if mode == HUMAnN3Mode.HUMANN_JOIN_TABLES:
+        output_file_paths = humann_tables.join_tables(
+            inputs,
+            output_file_path,
+            file_name=args.file_name,
+            search_subdirectories=args.search_subdirectories,
+        )
+    elif mode == HUMAnN3Mode.HUMANN_RENORM_TABLE:
+        output_file_paths = humann_tables.renorm_table(
+            inputs,
+            output_file_path,
+            units=args.units,
+            mode=args.mode,
+            special=args.special == "y",
+            update_sample_names=args.update_snames,
+        )
+    elif mode == HUMAnN3Mode.HUMANN_REDUCE_TABLE:
+        output_file_paths = humann_tables.reduce_table(
+            inputs,
+            output_file_path,
+            function=args.function,
+            sort_by=args.sort_by,
+        )
+    else:
+        output_file_paths = humann_tables.split_stratified_table(inputs, output_path)
+
+    output = Output(output_path=output_path)
+    output.set_output_path(output_path, output_file_paths)
+    output.set_tool(tool_name="humann3", tool_version=HUMANN3_VERSION)
+    return output
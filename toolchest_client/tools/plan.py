@@ -0,0 +1,83 @@
+"""
+toolchest_client.tools.plan
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides a RunPlan object, returned by dry runs of Toolchest tools.
+A plan describes what a run would do, without uploading or running anything.
+"""
+
+# Assumed upload throughput, used to estimate upload time (50 MiB/s).
+DEFAULT_UPLOAD_BYTES_PER_SECOND = 50 * 1024 * 1024
+
+
+class PlannedInput:
+    """An input file that a run would use.
+
+    `size_bytes` is None for remote inputs, as their sizes aren't looked up in a dry run.
+    For archives of compressed inputs, it is the total size of the archived files, an upper-bound
+    estimate of the archive's size, which isn't checked against the per-file size limit.
+    """
+
+    def __init__(self, path, location, size_bytes=None, prefix=None, order=None, is_archive=False):
+        self.path = path
+        self.location = location
+        self.size_bytes = size_bytes
+        self.prefix = prefix
+        self.order = order
+        self.is_archive = is_archive
+
+    def __repr__(self):
+        return str(self.__dict__)
+
+    def __str__(self):
+        return str(self.__dict__)
+
+    @property
+    def is_uploaded(self):
+        """Whether the file would be uploaded from this machine (as opposed to being read remotely)."""
+        return self.location == "local"
+
+
+class RunPlan:
+    """A plan of what a Toolchest run would do.
+
+    Provides the sanitized tool_args, the input files and their sizes, and whether
+    inputs would be compressed or split, along with the estimated upload size and time.
+
+    """
+
+    def __init__(self, tool_name, tool_version, tool_args, inputs, output_path, output_type,
+                 compress_inputs, parallel_enabled, parallel_split_triggered, upload_bytes_per_second):
+        self.tool_name = tool_name
+        self.tool_version = tool_version
+        self.tool_args = tool_args
+        self.inputs = inputs
+        self.output_path = output_path
+        self.output_type = output_type
+        self.compress_inputs = compress_inputs
+        self.parallel_enabled = parallel_enabled
+        self.parallel_split_triggered = parallel_split_triggered
+        self.upload_bytes = sum(planned_input.size_bytes or 0 for planned_input in inputs
+                                if planned_input.is_uploaded)
+        self.estimated_upload_seconds = self.upload_bytes / upload_bytes_per_second
+
+    def __repr__(self):
+        return str(self.__dict__)
+
+    def __str__(self):
+        return str(self.__dict__)
+
+    @property
+    def input_prefix_mapping(self):
+        """Mapping of input file paths to their prefix tags, in the same shape as a Tool's input_prefix_mapping."""
+        return {
+            planned_input.path: {"prefix": planned_input.prefix, "order": planned_input.order}
+            for planned_input in self.inputs if planned_input.prefix is not None
+        }
+
+    def to_dict(self):
+        """Returns the plan as a dict of plain values, e.g. for serializing as JSON."""
+        plan_dict = dict(self.__dict__)
+        plan_dict["inputs"] = [dict(planned_input.__dict__) for planned_input in self.inputs]
+        plan_dict["output_type"] = self.output_type.name if self.output_type else None
+        return plan_dict
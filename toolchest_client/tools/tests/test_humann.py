@@ -0,0 +1,62 @@
+import pytest
+
+from toolchest_client.api.exceptions import ToolchestException
+from toolchest_client.tools import humann
+from toolchest_client.tools.api import humann3
+from toolchest_client.tools.humann import HUMAnN3Mode, should_run_locally
+
+pytest.importorskip("numpy")
+
+TABLE = "# Gene Family\tsample1_Abundance-RPKs\nUniRef90_A\t3\nUniRef90_A|g__Bacteroides\t3\nUniRef90_B\t1\n"
+
+
+@pytest.fixture
+def table_path(tmp_path):
+    path = tmp_path / "genefamilies.tsv"
+    path.write_text(TABLE)
+    return str(path)
+
+
+def test_humann3_runs_table_utilities_locally(table_path, tmp_path, monkeypatch):
+    def run_remotely(*args, **kwargs):
+        raise AssertionError("Expected a local run")
+    monkeypatch.setattr(humann.HUMAnN3, "run", run_remotely)
+
+    output = humann3(
+        inputs=table_path,
+        output_path=str(tmp_path / "output"),
+        mode=HUMAnN3Mode.HUMANN_RENORM_TABLE,
+        tool_args="--units relab",
+        output_primary_name="relab.tsv",
+        run_locally=True,
+    )
+    assert output.tool_name == "humann3"
+    assert output.run_id is None
+    with open(output.get_output_file_path("relab.tsv")) as output_file:
+        assert output_file.read().splitlines()[1] == "UniRef90_A\t0.75"
+
+
+def test_should_run_locally(table_path, tmp_path):
+    output_path = str(tmp_path)
+    join_tables, renorm_table = HUMAnN3Mode.HUMANN_JOIN_TABLES, HUMAnN3Mode.HUMANN_RENORM_TABLE
+    assert should_run_locally(join_tables, str(tmp_path), output_path, "--file_name genefamilies", run_locally=None)
+    # Utilities run on Toolchest unless running locally is asked for
+    assert not should_run_locally(renorm_table, table_path, output_path, "")
+    # Modes that need HUMAnN's databases, unsupported arguments, and remote outputs run on Toolchest
+    assert not should_run_locally(HUMAnN3Mode.HUMANN_REGROUP_TABLE, table_path, output_path, "", run_locally=None)
+    assert not should_run_locally(renorm_table, table_path, output_path, "--units rpk", run_locally=None)
+    assert not should_run_locally(renorm_table, table_path, "s3://bucket/output", "", run_locally=None)
+    assert not should_run_locally(renorm_table, table_path, output_path, "", run_locally=None, is_async=True)
+    assert not should_run_locally(renorm_table, table_path, output_path, "", run_locally=None,
+                                  unsupported_arguments=["instance_type"])
+    with pytest.raises(ToolchestException):
+        should_run_locally(HUMAnN3Mode.HUMANN_REDUCE_TABLE, table_path, output_path, "", run_locally=True)
+    with pytest.raises(ToolchestException, match="instance_type"):
+        should_run_locally(renorm_table, table_path, output_path, "", run_locally=True,
+                           unsupported_arguments=["instance_type"])
+
+
+def test_should_run_locally_checks_input_size(table_path, tmp_path, monkeypatch):
+    monkeypatch.setattr(humann, "LOCAL_MAX_INPUT_BYTES", 10)
+    assert not should_run_locally(HUMAnN3Mode.HUMANN_RENORM_TABLE, table_path, str(tmp_path), "", run_locally=None)
+    assert should_run_locally(HUMAnN3Mode.HUMANN_RENORM_TABLE, table_path, str(tmp_path), "", run_locally=True)
@@ -0,0 +1,83 @@
+import os
+
+import pytest
+import requests
+
+from ..kraken2 import Kraken2
+from ..test import Test
+
+THIS_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+
+
+@pytest.fixture(autouse=True)
+def no_network(monkeypatch):
+    def fail_on_request(*args, **kwargs):
+        raise AssertionError("Dry runs should not use the network")
+
+    for method in ["get", "head", "post", "put"]:
+        monkeypatch.setattr(requests, method, fail_on_request)
+
+
+def test_dry_run_plan():
+    kraken_instance = Kraken2(
+        tool_args="--confidence 0.1  --paired",
+        inputs=[f"{THIS_DIRECTORY}/test_plan.py", "s3://toolchest-fake-bucket/reads.fastq"],
+        output_path=f"{THIS_DIRECTORY}/output",
+        database_name="standard",
+        database_version=1,
+        remote_database_path=None,
+        dry_run=True,
+    )
+    plan = kraken_instance.run()
+
+    local_input_size = os.stat(f"{THIS_DIRECTORY}/test_plan.py").st_size
+    assert plan.tool_args == "--confidence 0.1 --paired"
+    assert [(planned_input.location, planned_input.size_bytes) for planned_input in plan.inputs] == [
+        ("local", local_input_size),
+        ("s3", None),
+    ]
+    assert plan.upload_bytes == local_input_size
+    assert not plan.parallel_split_triggered
+    assert plan.to_dict()["output_type"] == "GZ_TAR"
+    assert not os.path.exists(f"{THIS_DIRECTORY}/output")
+
+
+def test_dry_run_does_not_write_archives():
+    test_instance = Test(
+        tool_args="",
+        inputs=THIS_DIRECTORY,
+        output_path=None,
+        compress_inputs=True,
+    )
+    plan = test_instance.plan()
+
+    assert len(plan.inputs) == 1
+    assert plan.inputs[0].is_archive
+    assert plan.inputs[0].size_bytes > 0
+    assert not os.path.exists(plan.inputs[0].path)
+
+
+def test_dry_run_file_too_large():
+    test_instance = Test(
+        tool_args="",
+        inputs=f"{THIS_DIRECTORY}/test_plan.py",
+        output_path=None,
+    )
+    test_instance.max_input_bytes_per_file = 10
+    with pytest.raises(ValueError):
+        test_instance.plan()
+
+
+def test_dry_run_large_archive_is_not_too_large():
+    test_instance = Test(
+        tool_args="",
+        inputs=THIS_DIRECTORY,
+        output_path=None,
+        compress_inputs=True,
+    )
+    # The files to be archived total more than the limit, but the compressed archive may not
+    test_instance.max_input_bytes_per_file = 10
+    plan = test_instance.plan()
+
+    assert plan.inputs[0].is_archive
+    assert plan.inputs[0].size_bytes > 10
@@ -0,0 +1,66 @@
+from ..tool_args_validator import get_minimal_tag, get_tool_args_validator, ToolArgsValidator
+from ..tool_args import VARIABLE_ARGS
+
+
+def test_minimal_tag():
+    assert get_minimal_tag("--arg=a") == "--arg"
+    assert get_minimal_tag("--arg=a=b") == "--arg"
+    assert get_minimal_tag("--arg=") == "--arg="
+    assert get_minimal_tag("=a") == "=a"
+    assert get_minimal_tag("--arg") == "--arg"
+
+
+def test_fixed_and_variable_arity():
+    validator = ToolArgsValidator(
+        whitelist={"--one": 1, "--many": VARIABLE_ARGS, "--flag": 0},
+        dangerlist=["--flag"],
+        blacklist=["--bad"],
+    )
+    result = validator.validate("--one -5 --many a b c --flag")
+    assert result.sanitized_args == ["--one", "-5", "--many", "a", "b", "c", "--flag"]
+    assert result.dangerous_args == ["--flag"]
+    assert not result.unknown_args and not result.blacklisted_args
+
+
+def test_blacklisted_tag_within_variable_args():
+    validator = get_tool_args_validator("STAR")
+    result = validator.validate("--quantMode GeneCounts --runThreadN 4")
+    assert result.blacklisted_args == ["--runThreadN"]
+
+
+def test_dangerous_tag_after_variable_args():
+    validator = get_tool_args_validator("STAR")
+    result = validator.validate("--quantMode GeneCounts --outSAMtype BAM Unsorted")
+    assert result.dangerous_args == ["--outSAMtype"]
+
+
+def test_quoted_values():
+    validator = get_tool_args_validator("blastn")
+    result = validator.validate('-outfmt "6 qseqid sseqid" -evalue 1e-5')
+    assert result.sanitized_args == ["-outfmt", "6 qseqid sseqid", "-evalue", "1e-5"]
+    # Sanitized args are re-joined as written, so their quoting reaches the tool unchanged
+    assert result.tool_args == '-outfmt "6 qseqid sseqid" -evalue 1e-5'
+    result = validator.validate("-outfmt 6\\ qseqid    -evalue '1e-5'")
+    assert result.sanitized_args == ["-outfmt", "6 qseqid", "-evalue", "1e-5"]
+    assert result.tool_args == "-outfmt 6\\ qseqid -evalue '1e-5'"
+
+
+def test_unbalanced_quotes_are_split_on_whitespace():
+    validator = get_tool_args_validator("blastn")
+    result = validator.validate('-outfmt "6 qseqid')
+    # As before tool_args were parsed with quoting rules
+    assert result.sanitized_args == ["-outfmt", '"6', "qseqid"]
+    assert result.tool_args == '-outfmt "6 qseqid'
+
+
+def test_wildcard_tools_split_on_whitespace():
+    validator = get_tool_args_validator("python3")
+    result = validator.validate("--name O'Brien --greeting \"hello world\"")
+    assert result.unknown_args == ["--name", "O'Brien", "--greeting", '"hello', 'world"']
+    assert not result.blacklisted_args
+
+
+def test_validators_are_compiled_once():
+    assert get_tool_args_validator("kraken2") is get_tool_args_validator("kraken2")
+    assert get_tool_args_validator("python3").allows_all_args
+    assert not get_tool_args_validator("kraken2").allows_all_args
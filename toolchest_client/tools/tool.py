@@ -6,17 +6,21 @@ This is the base class from which all tools descend.
 Tool must be extended by an implementation (see kraken2.py) to be functional.
 """
 import asyncio
+import json
 from loguru import logger
 import os
-import re
 
 from toolchest_client.api.auth import validate_key
+from toolchest_client.api.metrics import RunMetrics
 from toolchest_client.api.status import Status
 from toolchest_client.api.query import Query
-from toolchest_client.files import files_in_path, sanity_check, check_file_size, compress_files_in_path, OutputType
+from toolchest_client.files import files_and_sizes_in_path, sanity_check, check_file_size, compress_files_in_path, \
+    get_archive_path, InputLocation, InputResolver, OutputType
 from toolchest_client.files.s3 import path_is_s3_uri
 from toolchest_client.logging import setup_logging
-from toolchest_client.tools.tool_args import TOOL_ARG_LISTS, VARIABLE_ARGS
+from toolchest_client.tools.plan import DEFAULT_UPLOAD_BYTES_PER_SECOND, PlannedInput, RunPlan
+from toolchest_client.tools.tool_args_validator import get_tool_args_validator
+from toolchest_client.tracing import set_attributes, span
 
 FOUR_POINT_FIVE_GIGABYTES = int(4.5 * 1024 * 1024 * 1024)
 
@@ -35,7 +39,8 @@ class Tool:
                  skip_decompression=False, custom_docker_image_id=None, instance_type=None,
                  volume_size=None, streaming_enabled=False, retain_base_directory=False,
                  provider="aws", log_level=None, universal_volume_name=None,
-                 universal_name=None):
+                 universal_name=None, dry_run=False, log_metrics=False, progress=None,
+                 stream_to=None):
         self.tool_name = tool_name
         self.tool_version = tool_version
         self.tool_args = tool_args
@@ -54,6 +59,8 @@ class Tool:
         # }
         self.input_prefix_mapping = input_prefix_mapping or dict()
         self.input_files = None
+        self.input_file_sizes = dict()  # sizes (in bytes) of input files, found while preparing inputs
+        self.input_resolver = InputResolver()  # caches input classification and remote metadata for the run
         self.num_input_files = None
         self.min_inputs = min_inputs
         self.max_inputs = max_inputs
@@ -79,32 +86,55 @@ class Tool:
         self.volume_size = volume_size
         # auto-disable streaming if job is async
         self.streaming_enabled = False if self.is_async else streaming_enabled
+        # where streamed output is written (see toolchest_client.api.stream_sinks); defaults to the console
+        self.stream_to = stream_to
         self.elapsed_seconds = 0
+        self.metrics = None  # RunMetrics of the latest run
+        # if set, the run's metrics are logged as a JSON line once it finishes
+        self.log_metrics = log_metrics
+        # how transfer progress and job status are reported (see toolchest_client.progress)
+        self.progress = progress
         self.retain_base_directory = retain_base_directory
         self.provider = provider
         self.universal_volume_name = universal_volume_name
         self.universal_name = universal_name
+        # if set, run() returns a RunPlan instead of running anything
+        self.dry_run = dry_run
         setup_logging(log_level)
 
-    def _prepare_inputs(self):
-        """Prepares the input files."""
+    def _prepare_inputs(self, write_archives=True, resolver=None):
+        """Prepares the input files.
+
+        :param write_archives: If false, compressed inputs are not archived. The archive paths are
+            still listed, with sizes estimated as the total size of the files to be archived.
+        :param resolver: (optional) InputResolver to use instead of the run's resolver.
+        """
+        resolver = resolver or self.input_resolver
         if self.compress_inputs:
-            self.input_files = []
+            files_and_sizes = []
             if isinstance(self.inputs, str):
                 self.inputs = [self.inputs]
             for input_path in self.inputs:
                 if os.path.exists(input_path):
                     # Local input files are all .tar.gz'd together, preserving directory structure
-                    self.input_files += [
-                        compress_files_in_path(os.path.expanduser(input_path), self.retain_base_directory)
-                    ]
+                    local_path = os.path.expanduser(input_path)
+                    if write_archives:
+                        archive_path = compress_files_in_path(local_path, self.retain_base_directory)
+                        archive_size = os.stat(archive_path).st_size
+                    else:
+                        archive_path = get_archive_path(local_path)
+                        archive_size = sum(size for _, size in files_and_sizes_in_path(local_path, resolver=resolver))
+                    resolver.add(archive_path, InputLocation.LOCAL, archive_size)
+                    files_and_sizes.append((archive_path, archive_size))
                 else:
-                    self.input_files += files_in_path(input_path)
-            self.num_input_files = len(self.input_files)
+                    files_and_sizes += files_and_sizes_in_path(input_path, resolver=resolver)
         else:
             # Non compressed files are handled individually, destroying directory structure
-            self.input_files = files_in_path(self.inputs)  # expands ~ in filepath if local
-            self.num_input_files = len(self.input_files)
+            # expands ~ in filepath if local
+            files_and_sizes = files_and_sizes_in_path(self.inputs, resolver=resolver)
+        self.input_files = [file_path for file_path, _ in files_and_sizes]
+        self.input_file_sizes = dict(files_and_sizes)
+        self.num_input_files = len(self.input_files)
 
         if self.num_input_files < self.min_inputs:
             raise ValueError(f"Not enough input files submitted. "
@@ -131,51 +161,13 @@ class Tool:
         """
 
         tool_category = self.tool_name.replace("_parallel", "")
-        whitelist = TOOL_ARG_LISTS[tool_category]["whitelist"]  # all tools have a whitelist
-        dangerlist = TOOL_ARG_LISTS[tool_category].get("dangerlist", [])  # some tools have a dangerlist
-        blacklist = TOOL_ARG_LISTS[tool_category].get("blacklist", [])  # some tools have a blacklist
-
-        sanitized_args = []  # arguments that are explicitly allowed
-        unknown_args = []  # all arguments that were not included
-        blacklisted_args = []  # arguments that are known to not work
-        dangerous_args = []  # arguments that significantly change the function of the program
-
-        num_args_remaining_after_tag = 0
-
-        # process arguments individually
-        for arg in self.tool_args.split():
-            # the minimal_tag for "--arg=a" is "--arg"
-            # this allows matching args assigned via an "=" to match on the whitelist
-            minimal_tag = re.sub(r"([^=]+)(=[^\s]+)", r"\1", arg)
-            tag_in_whitelist = minimal_tag in whitelist
-            if num_args_remaining_after_tag == 0 and tag_in_whitelist:
-                # if the arg is a tag in the whitelist, add it
-                sanitized_args.append(arg)
-                num_args_remaining_after_tag = whitelist[minimal_tag]
-                # if the arg is a tag in the dangerlist, note so can adjust accordingly
-                if minimal_tag in dangerlist:
-                    dangerous_args.append(arg)
-            elif num_args_remaining_after_tag == VARIABLE_ARGS:
-                # if previous tag has additional args (unknown/variable amount),
-                # append args until another tag is found
-                # TODO: filter out non-escaped bash command-line characters
-                # TODO: handle variable arguments better; this allows passing of undesired args
-                sanitized_args.append(arg)
-                if tag_in_whitelist:
-                    num_args_remaining_after_tag = whitelist[minimal_tag]
-            elif num_args_remaining_after_tag > 0:
-                # append remaining args if previous tag has additional args
-                # TODO: filter out non-escaped bash command-line characters
-                sanitized_args.append(arg)
-                num_args_remaining_after_tag -= 1
-            else:
-                # Instead of stopping and throwing an error immediately, we wait and collect all undesired args
-                if minimal_tag in blacklist:
-                    blacklisted_args.append(arg)
-                else:
-                    unknown_args.append(arg)
+        validator = get_tool_args_validator(tool_category)  # compiled once per tool
+        validated_args = validator.validate(self.tool_args)
+        blacklisted_args = validated_args.blacklisted_args
+        unknown_args = validated_args.unknown_args
+        dangerous_args = validated_args.dangerous_args
 
-        if blacklisted_args or (unknown_args and not (len(whitelist.keys()) == 1 and "*" in whitelist.keys())):
+        if blacklisted_args or (unknown_args and not validator.allows_all_args):
             logger.error("Non-allowed arguments found in tool_args:")
             logger.error(
                 f"Blacklisted arguments (these are known to cause Toolchest to fail): \
@@ -188,7 +180,7 @@ class Tool:
             raise ValueError("Unknown or blacklisted arguments present in tool_args. See above for details.")
 
         # Don't change tool args with * whitelist in order to preserve ordering
-        if len(whitelist.keys()) == 1 and "*" in whitelist.keys():
+        if validator.allows_all_args:
             return
 
         if dangerous_args:
@@ -199,7 +191,7 @@ class Tool:
             self.parallel_enabled = False
             self.output_type = OutputType.GZ_TAR
 
-        sanitized_args = " ".join(sanitized_args)
+        sanitized_args = validated_args.tool_args
         if sanitized_args != self.tool_args:
             self.tool_args = sanitized_args
         logger.debug("Processing tool_args as:")
@@ -260,10 +252,98 @@ class Tool:
                     output_file_path = f"{self.output_path}/{output_file_name}"
                     sanity_check(output_file_path)
 
+    def _finish_metrics(self, output):
+        """Attaches the run's metrics to its output, and logs them if enabled."""
+        self.metrics.finish()
+        self.elapsed_seconds = self.metrics.total_seconds
+        metrics = self.metrics.to_dict()
+        output.set_metrics(metrics)
+        if self.log_metrics:
+            logger.info(json.dumps({
+                "event": "toolchest_run_metrics",
+                "run_id": output.run_id,
+                "tool_name": self.tool_name,
+                "tool_version": self.tool_version,
+                **metrics,
+            }))
+
+    def plan(self, upload_bytes_per_second=DEFAULT_UPLOAD_BYTES_PER_SECOND):
+        """Returns a RunPlan describing what `run` would do, without any network calls, uploads,
+        or archive writes.
+
+        Raises the same errors as `run` for invalid tool_args, missing inputs, or inputs
+        above the per-file size limit. Sizes of remote inputs are not checked. Archives of
+        compressed inputs aren't written, so their sizes are upper-bound estimates (the total
+        size of the archived files), and a warning is logged instead of raising if one is above
+        the limit. The tool's preflight checks (`_preflight`, e.g. validating the API key or
+        database) are skipped, as they need network calls.
+
+        :param upload_bytes_per_second: Assumed upload throughput, used to estimate upload time.
+        """
+        self._validate_args()
+
+        if self._output_path_is_local() and os.path.isfile(self.output_path):
+            raise ValueError(f"{self.output_path} is a file. Please pass a directory instead of an output file.")
+
+        offline_resolver = InputResolver(offline=True)
+        self._prepare_inputs(write_archives=False, resolver=offline_resolver)
+
+        planned_inputs = []
+        for file_path in self.input_files:
+            file_size = self.input_file_sizes.get(file_path)
+            input_location = offline_resolver.get(file_path).location
+            # when compressing, every local input is archived
+            is_archive = self.compress_inputs and input_location == InputLocation.LOCAL
+            if is_archive and file_size is not None and file_size > self.max_input_bytes_per_file:
+                # The archive is compressed, so it may still be within the limit when written
+                logger.warning(
+                    f"Files to be archived into {file_path} total {file_size} bytes, above the per-file limit of "
+                    f"{self.max_input_bytes_per_file} bytes. The run fails if the compressed archive is too."
+                )
+            elif file_size is not None:
+                check_file_size(file_path, max_size_bytes=self.max_input_bytes_per_file, file_size_bytes=file_size)
+            input_prefix_details = self.input_prefix_mapping.get(file_path) or dict()
+            planned_inputs.append(PlannedInput(
+                path=file_path,
+                location=input_location.value,
+                size_bytes=file_size,
+                prefix=input_prefix_details.get("prefix"),
+                order=input_prefix_details.get("order"),
+                is_archive=is_archive,
+            ))
+
+        parallel_split_triggered = self.parallel_enabled and any(
+            planned_input.is_uploaded and (planned_input.size_bytes or 0) > self.max_input_bytes_per_file_parallel
+            for planned_input in planned_inputs
+        )
+        return RunPlan(
+            tool_name=self.tool_name,
+            tool_version=self.tool_version,
+            tool_args=self.tool_args,
+            inputs=planned_inputs,
+            output_path=self.output_path,
+            output_type=self.output_type,
+            compress_inputs=self.compress_inputs,
+            parallel_enabled=self.parallel_enabled,
+            parallel_split_triggered=parallel_split_triggered,
+            upload_bytes_per_second=upload_bytes_per_second,
+        )
+
     def run(self):
-        """Constructs and runs a Toolchest query."""
+        """Constructs and runs a Toolchest query.
+        If the tool was created with `dry_run=True`, returns a RunPlan instead (see `plan`).
+        """
+        if self.dry_run:
+            return self.plan()
+
+        run_span_attributes = {"toolchest.tool_name": self.tool_name, "toolchest.tool_version": self.tool_version}
+        with span("toolchest.run", run_span_attributes):
+            return self._run()
+
+    def _run(self):
         # mark: quiet
         logger.debug("Beginning Toolchest analysis run.")
+        self.metrics = RunMetrics()
 
         self._validate_args()
 
@@ -271,7 +351,13 @@ class Tool:
         self._preflight()
 
         # Prepare input files (expand paths, compress, etc)
-        self._prepare_inputs()
+        with self.metrics.phase("prepare_inputs") as prepare_inputs_phase:
+            self._prepare_inputs()
+            prepare_inputs_phase.add_bytes(sum(file_size or 0 for file_size in self.input_file_sizes.values()))
+        set_attributes({
+            "toolchest.bytes": prepare_inputs_phase.num_bytes,
+            "toolchest.num_input_files": self.num_input_files,
+        })
 
         logger.debug(f"Found {self.num_input_files} files to upload.")
         logger.info('Packaging and uploading run now. This might take a while.')
@@ -279,10 +365,18 @@ class Tool:
         query = Query(
             is_async=self.is_async,
             streaming_enabled=self.streaming_enabled,
+            input_resolver=self.input_resolver,
+            metrics=self.metrics,
+            progress=self.progress,
+            stream_to=self.stream_to,
         )
 
         for file_path in self.input_files:
-            check_file_size(file_path, max_size_bytes=self.max_input_bytes_per_file)
+            check_file_size(
+                file_path,
+                max_size_bytes=self.max_input_bytes_per_file,
+                file_size_bytes=self.input_file_sizes.get(file_path),
+            )
 
         query_output = query.run_query(
             remote_database_path=self.remote_database_path,
@@ -323,10 +417,13 @@ class Tool:
                 "For support, contact Toolchest with the error log (above) and the following details:\n\n"
                 f"run_id: {query.pipeline_segment_instance_id}\n"
             )
+            self._finish_metrics(query_output)
             return query_output
 
         # Do basic check for completion, merge output files
-        self._postflight(query_output)
+        with self.metrics.phase("postflight"):
+            self._postflight(query_output)
+        self._finish_metrics(query_output)
         run_id = query_output.run_id
         # Print initial completion message
         if self.is_async:
@@ -0,0 +1,176 @@
+"""
+toolchest_client.tools.tool_args_validator
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Validation of custom tool_args against the lists in tool_args.py.
+
+Each tool's lists are compiled once into frozensets and an arity table.
+Arguments are then tokenized with shell quoting rules and run through a small
+state machine: a tag from the whitelist is followed by a fixed number of values,
+or by a variable number of values that ends at the next whitelisted tag.
+
+Sanitized arguments are re-joined as they were written, so the tool_args sent
+to Toolchest keep the user's quoting.
+"""
+import functools
+import re
+import shlex
+
+from toolchest_client.tools.tool_args import TOOL_ARG_LISTS, VARIABLE_ARGS
+
+WILDCARD_TAG = "*"
+
+
+# Parser states
+EXPECTING_TAG = 0
+EXPECTING_VALUES = 1  # a fixed number of values follows the previous tag
+EXPECTING_VARIABLE_VALUES = 2  # values follow until the next whitelisted tag
+
+# Kinds of tokens
+WHITELISTED_TAG = 0
+BLACKLISTED_TAG = 1
+UNKNOWN_TOKEN = 2
+
+# Actions taken on a token
+ACCEPT_TAG = 0
+ACCEPT_VALUE = 1
+REJECT_BLACKLISTED = 2
+REJECT_UNKNOWN = 3
+
+# Transition table, indexed as TRANSITIONS[state][kind of token] -> action taken on the token
+TRANSITIONS = (
+    # EXPECTING_TAG
+    (ACCEPT_TAG, REJECT_BLACKLISTED, REJECT_UNKNOWN),
+    # EXPECTING_VALUES: values of fixed-arity tags are taken as-is, even if they look like tags
+    (ACCEPT_VALUE, ACCEPT_VALUE, ACCEPT_VALUE),
+    # EXPECTING_VARIABLE_VALUES: values end at the next whitelisted tag, and blacklisted tags can't be slipped in
+    (ACCEPT_TAG, REJECT_BLACKLISTED, ACCEPT_VALUE),
+)
+
+# Characters that need shell-style parsing; anything else is split on whitespace
+_SHELL_SYNTAX = re.compile(r"[\"'\\]|[^\S \t\r\n]")
+# A shell word: unquoted or escaped characters and quoted strings, up to unquoted whitespace
+_SHELL_WORD = re.compile(r"""(?:[^\s'"\\]|\\.|'[^']*'|"(?:[^"\\]|\\.)*")+""", re.DOTALL)
+
+
+def get_minimal_tag(arg):
+    """Returns the tag of an argument assigned with "=" (e.g. "--arg" for "--arg=a"), or the argument itself.
+
+    :param arg: A single tool_args token.
+    """
+    tag, separator, value = arg.partition("=")
+    if tag and separator and value:
+        return tag
+    return arg
+
+
+class ValidatedToolArgs:
+    """The result of validating tool_args."""
+
+    def __init__(self):
+        self.sanitized_args = []  # arguments that are explicitly allowed
+        self.raw_sanitized_args = []  # sanitized arguments as written in tool_args, with their quoting
+        self.unknown_args = []  # all arguments that were not included
+        self.blacklisted_args = []  # arguments that are known to not work
+        self.dangerous_args = []  # arguments that significantly change the function of the program
+
+    @property
+    def tool_args(self):
+        """The sanitized arguments, joined with spaces as written (quotes included)."""
+        return " ".join(self.raw_sanitized_args)
+
+
+class ToolArgsValidator:
+    """Validates tool_args for one tool. Use get_tool_args_validator() to reuse compiled validators.
+
+    :param whitelist: Dict of accepted tags to the number of values following each tag.
+    :param dangerlist: Tags that change the function or structure of the tool.
+    :param blacklist: Tags that are known to not work with Toolchest.
+    """
+
+    def __init__(self, whitelist, dangerlist=None, blacklist=None):
+        self.arity_by_tag = dict(whitelist)
+        self.whitelist = frozenset(whitelist)
+        self.dangerlist = frozenset(dangerlist or [])
+        self.blacklist = frozenset(blacklist or [])
+        # If the wildcard is the only whitelisted tag, all args that are not in the blacklist are allowed
+        self.allows_all_args = self.whitelist == frozenset([WILDCARD_TAG])
+
+    def tokenize(self, tool_args):
+        """Splits tool_args into tokens, following shell quoting rules. Returns a list of (token, raw token) pairs,
+        where the raw token is the token as written, quotes included.
+
+        tool_args of tools that allow all args, or with unbalanced quotes, are split on whitespace.
+
+        :param tool_args: A string of tool arguments.
+        """
+        tool_args = tool_args or ""
+        if self.allows_all_args or not _SHELL_SYNTAX.search(tool_args):
+            return [(arg, arg) for arg in tool_args.split()]
+        try:
+            shlex.split(tool_args)
+        except ValueError:
+            return [(arg, arg) for arg in tool_args.split()]
+        raw_args = _SHELL_WORD.findall(tool_args)
+        return [(shlex.split(raw_arg)[0], raw_arg) for raw_arg in raw_args]
+
+    def validate(self, tool_args):
+        """Returns a ValidatedToolArgs. Does not raise on disallowed args; check `unknown_args`
+        and `blacklisted_args` on the result.
+
+        :param tool_args: A string of tool arguments.
+        """
+        result = ValidatedToolArgs()
+        state = EXPECTING_TAG
+        num_values_remaining = 0
+
+        for arg, raw_arg in self.tokenize(tool_args):
+            minimal_tag = get_minimal_tag(arg) if "=" in arg else arg
+            if minimal_tag in self.whitelist:
+                token_kind = WHITELISTED_TAG
+            elif minimal_tag in self.blacklist:
+                token_kind = BLACKLISTED_TAG
+            else:
+                token_kind = UNKNOWN_TOKEN
+
+            action = TRANSITIONS[state][token_kind]
+            if action == ACCEPT_TAG:
+                result.sanitized_args.append(arg)
+                result.raw_sanitized_args.append(raw_arg)
+                if minimal_tag in self.dangerlist:
+                    result.dangerous_args.append(arg)
+                arity = self.arity_by_tag[minimal_tag]
+                if arity == VARIABLE_ARGS:
+                    state = EXPECTING_VARIABLE_VALUES
+                elif arity > 0:
+                    state = EXPECTING_VALUES
+                    num_values_remaining = arity
+                else:
+                    state = EXPECTING_TAG
+            elif action == ACCEPT_VALUE:
+                result.sanitized_args.append(arg)
+                result.raw_sanitized_args.append(raw_arg)
+                if state == EXPECTING_VALUES:
+                    num_values_remaining -= 1
+                    if num_values_remaining == 0:
+                        state = EXPECTING_TAG
+            elif action == REJECT_BLACKLISTED:
+                result.blacklisted_args.append(arg)
+            else:
+                result.unknown_args.append(arg)
+
+        return result
+
+
+@functools.lru_cache(maxsize=None)
+def get_tool_args_validator(tool_category):
+    """Returns the compiled ToolArgsValidator for a tool, creating it on first use.
+
+    :param tool_category: Key of the tool in TOOL_ARG_LISTS (e.g. "kraken2").
+    """
+    tool_arg_lists = TOOL_ARG_LISTS[tool_category]
+    return ToolArgsValidator(
+        whitelist=tool_arg_lists["whitelist"],  # all tools have a whitelist
+        dangerlist=tool_arg_lists.get("dangerlist"),  # some tools have a dangerlist
+        blacklist=tool_arg_lists.get("blacklist"),  # some tools have a blacklist
+    )
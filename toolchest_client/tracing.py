@@ -0,0 +1,140 @@
+"""
+toolchest_client.tracing
+~~~~~~~~~~~~~~~~~~~~~~~~
+
+Optional tracing of the client with OpenTelemetry.
+
+Spans are only recorded if `opentelemetry-api` is installed (e.g. with the `tracing`
+extra), and are exported by
+whichever tracer provider the application configures. Otherwise, or if the
+TOOLCHEST_TRACING_DISABLED environment variable is set, every function here is a no-op.
+"""
+import contextlib
+import os
+
+TRACER_NAME = "toolchest_client"
+
+_tracer = None
+# Whether opentelemetry is importable. None until the first span.
+_tracing_available = None
+
+
+class _NoOpSpan:
+    """Stands in for a span when tracing isn't available."""
+
+    def is_recording(self):
+        return False
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, attributes):
+        pass
+
+    def add_event(self, name, attributes=None):
+        pass
+
+    def record_exception(self, exception):
+        pass
+
+
+NO_OP_SPAN = _NoOpSpan()
+
+
+def get_tracer():
+    """Returns the OpenTelemetry tracer for the client, or None if opentelemetry isn't installed."""
+    global _tracer, _tracing_available
+    if _tracing_available is None:
+        if os.environ.get("TOOLCHEST_TRACING_DISABLED"):
+            _tracing_available = False
+            return None
+        try:
+            # Only import opentelemetry – an optional dependency – if it's installed
+            from opentelemetry import trace
+        except ImportError:
+            _tracing_available = False
+        else:
+            from toolchest_client import __version__
+            _tracer = trace.get_tracer(TRACER_NAME, __version__)
+            _tracing_available = True
+    return _tracer
+
+
+def get_span_attributes(attributes):
+    """Returns attributes that can be set on a span: None values are dropped,
+    and values that aren't strings, numbers, or booleans are converted to strings.
+
+    :param attributes: A dict of attribute names to values.
+    """
+    span_attributes = dict()
+    for key, value in (attributes or dict()).items():
+        if value is None:
+            continue
+        if not isinstance(value, (str, bool, int, float)):
+            value = str(value)
+        span_attributes[key] = value
+    return span_attributes
+
+
+@contextlib.contextmanager
+def span(name, attributes=None, set_current=True):
+    """Opens a span for the duration of the context. Errors raised in the context are recorded on the span.
+
+    :param name: Name of the span (e.g. "toolchest.run").
+    :param attributes: (optional) Dict of attributes to set on the span.
+    :param set_current: Whether the span becomes the current span, i.e. the parent of spans opened
+        in the context. Use False for spans that are held open across generator yields.
+    """
+    tracer = get_tracer()
+    if tracer is None:
+        yield NO_OP_SPAN
+        return
+
+    if set_current:
+        with tracer.start_as_current_span(name, attributes=get_span_attributes(attributes)) as current_span:
+            yield current_span
+        return
+
+    from opentelemetry.trace import Status, StatusCode
+
+    detached_span = tracer.start_span(name, attributes=get_span_attributes(attributes))
+    try:
+        yield detached_span
+    except Exception as err:
+        detached_span.record_exception(err)
+        detached_span.set_status(Status(StatusCode.ERROR, str(err)))
+        raise
+    finally:
+        detached_span.end()
+
+
+def set_attributes(attributes, current_span=None):
+    """Sets attributes on a span, by default the current span.
+
+    :param attributes: Dict of attributes to set.
+    :param current_span: (optional) Span on which to set the attributes.
+    """
+    if current_span is None:
+        if get_tracer() is None:
+            return
+        from opentelemetry import trace
+        current_span = trace.get_current_span()
+    current_span.set_attributes(get_span_attributes(attributes))
+
+
+def traced_request(request_function, url, **kwargs):
+    """Calls a `requests` function (e.g. `requests.get`) inside an HTTP client span.
+    Returns the response.
+
+    :param request_function: The `requests` function to call, e.g. `requests.post`.
+    :param url: URL of the request.
+    :param kwargs: Keyword arguments passed to `request_function`.
+    """
+    if get_tracer() is None:
+        return request_function(url, **kwargs)
+
+    method = request_function.__name__.upper()
+    with span(f"HTTP {method}", {"http.method": method, "http.url": url}) as http_span:
+        response = request_function(url, **kwargs)
+        http_span.set_attribute("http.status_code", response.status_code)
+        return response